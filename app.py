@@ -4,12 +4,18 @@ from dotenv import load_dotenv
 from src.utils.helper import *
 from src.generator.question_generator import QuestionGenerator
 from src.models.auth import AuthManager
-from src.models.simple_session import SimpleSessionManager
-from src.components.quiz_history_sidebar import show_quiz_history_right_sidebar, render_history_content, show_revision_view
+from src.config.settings import settings
+from src.models.repository import get_repository
+from src.models.dashboard import score_series, topic_frame, weak_topics
+from src.models.export import FORMATS, UI_MAX_BYTES, export_bytes, export_filename
+from src.components.quiz_history_sidebar import show_quiz_history_right_sidebar, render_history_content, show_revision_view, reset_history
 import pandas as pd
 from src.components.analytics_charts import plot_performance_over_time, plot_performance_by_topic
 import time
 
+# Most recent quizzes plotted on the dashboard
+DASHBOARD_RECENT_SESSIONS = 5
+
 load_dotenv()
 
 def show_login_signup():
@@ -98,29 +104,10 @@ def check_auto_suggestions():
         
         user_id = st.session_state.user['id']
         
-        recent_questions = quiz_manager.question_logger.get_recent_questions(user_id, 10)
-        
-        if len(recent_questions) >= 5:
-            topic_performance = {}
-            for q in recent_questions:
-                topic_key = q['topic']
-                if q.get('sub_topic'):
-                    topic_key = f"{q['topic']} - {q['sub_topic']}"
-                if topic_key not in topic_performance:
-                    topic_performance[topic_key] = {'correct': 0, 'total': 0}
-                topic_performance[topic_key]['total'] += 1
-                if q['is_correct']:
-                    topic_performance[topic_key]['correct'] += 1
-            
-            weak_topics = []
-            for topic, perf in topic_performance.items():
-                if perf['total'] >= 3:
-                    accuracy = (perf['correct'] / perf['total']) * 100
-                    if accuracy < 50:
-                        weak_topics.append({'topic': topic, 'accuracy': accuracy, 'attempts': perf['total']})
-            
-            if weak_topics:
-                return weak_topics  # <-- FIX: Return the entire list of weak topics
+        # Kept current as answers are logged (src/models/recommendations.py)
+        alerts = quiz_manager.question_logger.get_recommendation_state(user_id)['alerts']
+        if alerts:
+            return alerts
     
     except Exception as e:
         print(f"Auto suggestion check error: {e}")
@@ -225,6 +212,27 @@ def show_smart_recommendations():
     
     return None, None
 
+def show_due_reviews():
+    """Offer a quiz of the user's logged questions that are due for review; no generation needed"""
+    if 'user' not in st.session_state or not st.session_state.user:
+        return None
+    if st.session_state.get('quiz_generated', False) and not st.session_state.get('quiz_submitted', False):
+        return None
+    
+    try:
+        quiz_manager = st.session_state.quiz_manager
+        if not getattr(quiz_manager, 'question_logger', None):
+            return None
+        limit = settings.REVIEW_QUIZ_QUESTIONS
+        due = quiz_manager.question_logger.get_due_reviews(st.session_state.user['id'], limit)
+        if due and st.button(f"🔁 Review due questions ({len(due)}{'+' if len(due) == limit else ''})",
+                             help="Questions you answered before, brought back as they are due (spaced repetition)"):
+            return due
+    except Exception as e:
+        print(f"Due reviews error: {e}")
+    
+    return None
+
 def handle_personalized_prep(topic_name: str):
     """
     Handles the RAG-based personalized quiz generation and trial usage.
@@ -265,72 +273,78 @@ def handle_personalized_prep(topic_name: str):
 def show_dashboard():
     """Show user dashboard with analytics and visualizations."""
     user = st.session_state.user
-    session_manager = SimpleSessionManager()
+    repository = get_repository()
     
     st.header(f"Welcome back, {user['username']}! 👋")
     
-    user_sessions = session_manager.get_user_sessions(user['id'], limit=1000)
-    if not user_sessions:
+    overview = repository.get_overview(user['id'])
+    if not overview['total_quizzes']:
         st.info("Your dashboard will be populated once you complete a quiz!"); return
+    user_sessions = repository.get_user_sessions(user['id'], limit=DASHBOARD_RECENT_SESSIONS)
+    # Built from the rollups once per change of the user's data; the series is bounded however long the history
+    (series, bucket), topics = repository.memoize(user['id'], 'dashboard_frames', lambda: (
+        score_series(repository, user['id']), topic_frame(repository.get_topic_scores(user['id']))))
 
-    total_quizzes, avg_score = len(user_sessions), sum(s['score'] for s in user_sessions) / len(user_sessions) if user_sessions else 0
-    from datetime import datetime, timedelta
-    seven_days_ago = datetime.now() - timedelta(days=7)
-    recent_sessions_count = sum(1 for s in user_sessions if datetime.strptime(s['created_at'], '%Y-%m-%d %H:%M:%S') >= seven_days_ago)
-
-    col1, col2, col3 = st.columns(3); col1.metric("Total Quizzes", total_quizzes); col2.metric("Average Score", f"{avg_score:.1f}%"); col3.metric("Quizzes This Week", recent_sessions_count)
+    col1, col2, col3 = st.columns(3); col1.metric("Total Quizzes", overview['total_quizzes']); col2.metric("Average Score", f"{overview['avg_score']:.1f}%"); col3.metric("Quizzes This Week", overview['recent_quizzes'])
     st.markdown("---")
 
     st.subheader("📊 Your Performance Visualized")
-    df = pd.DataFrame(user_sessions)
-    plot_performance_over_time(df); plot_performance_by_topic(df)
+    plot_performance_over_time(series, bucket); plot_performance_by_topic(topics)
     st.markdown("---")
 
     st.subheader("🎯 Areas for Improvement")
-    topic_performance = {}
-    for session in user_sessions:
-        topic_key = session['display_title']
-        if topic_key not in topic_performance:
-            topic_performance[topic_key] = {'scores': [], 'count': 0}
-        topic_performance[topic_key]['scores'].append(session['score']); topic_performance[topic_key]['count'] += 1
-        
-    weak_topics = []
     pass_score = st.session_state.get('pass_score', 70)
-    for topic, data in topic_performance.items():
-        avg_score = sum(data['scores']) / len(data['scores'])
-        if avg_score < pass_score:
-            weak_topics.append({"topic": topic, "avg_score": avg_score, "count": data['count']})
+    weak = weak_topics(topics, pass_score)
 
-    if weak_topics:
+    if not weak.empty:
         st.warning(f"AI has identified topics below your {pass_score}% goal. Focus here!")
-        for topic_data in sorted(weak_topics, key=lambda x: x['avg_score']):
+        for topic_data in weak.itertuples():
             with st.container(border=True):
                 col1, col2 = st.columns([2, 1])
                 with col1:
-                    st.markdown(f"**{topic_data['topic']}**"); st.caption(f"Avg Score: {topic_data['avg_score']:.1f}% ({topic_data['count']} quizzes)")
+                    st.markdown(f"**{topic_data.display_title}**"); st.caption(f"Avg Score: {topic_data.avg_score:.1f}% ({topic_data.count} quizzes)")
                 with col2:
                     if not user.get('has_used_rag_trial', False):
-                        if st.button("🚀 Prep (Free Trial)", key=f"prep_{topic_data['topic']}", use_container_width=True):
-                            handle_personalized_prep(topic_data['topic'])
+                        if st.button("🚀 Prep (Free Trial)", key=f"prep_{topic_data.display_title}", use_container_width=True):
+                            handle_personalized_prep(topic_data.display_title)
                     else:
-                        st.button("✨ Upgrade to Prep", key=f"prep_{topic_data['topic']}", disabled=True, use_container_width=True)
+                        st.button("✨ Upgrade to Prep", key=f"prep_{topic_data.display_title}", disabled=True, use_container_width=True)
     else:
         st.success("🎉 Great job! You're meeting your pass score in all topics.")
     st.markdown("---")
 
     st.subheader("📖 Recent Quiz History")
-    for session in user_sessions[:5]:
+    for session in user_sessions:
         with st.expander(f"**{session['display_title']}** - Score: {session['score']:.1f}% ({session['short_date']})"):
             c1, c2, c3 = st.columns(3)
             c1.write(f"**Type:** {session['question_type']}"); c1.write(f"**Difficulty:** {session['difficulty']}")
             c2.write(f"**Questions:** {session['num_questions']}"); c2.write(f"**Score:** {session['score']:.1f}%")
             if c3.button(f"📖 Review Quiz", key=f"review_{session['id']}"):
                 st.session_state.viewing_quiz_id, st.session_state.view_mode = session['id'], 'revision'; st.rerun()
+    st.markdown("---")
+
+    st.subheader("📥 Export Your History")
+    c1, c2, c3 = st.columns([2, 2, 1])
+    kind = c1.radio("Data", ["questions", "sessions"], horizontal=True, key="export_kind",
+                    format_func=lambda k: "Every answered question" if k == "questions" else "Quiz sessions")
+    fmt = c2.radio("Format", list(FORMATS), horizontal=True, key="export_format", format_func=str.upper)
+    # Built in memory when asked for (the download button needs the whole file), up to UI_MAX_BYTES;
+    # longer histories export from the shell, which streams to disk
+    if c3.button("📦 Prepare", key="export_prepare", use_container_width=True):
+        data = export_bytes(repository, user['id'], kind, fmt)
+        if data is None:
+            st.warning(f"This export is larger than {UI_MAX_BYTES // 2**20} MB. Ask an administrator to run "
+                       f"`python -m src.models.export {kind} --user {user['id']} --format {fmt}`.")
+        else:
+            st.download_button("⬇️ Download", data=data, file_name=export_filename(kind, fmt), mime=FORMATS[fmt],
+                               on_click="ignore")
 
 def clear_quiz_states():
     st.session_state.quiz_generated, st.session_state.quiz_submitted = False, False
     if hasattr(st.session_state.get('quiz_manager'), 'questions'):
         st.session_state.quiz_manager.questions, st.session_state.quiz_manager.user_answers, st.session_state.quiz_manager.results = [], [], []
+        st.session_state.quiz_manager.submission_id = None
+        st.session_state.quiz_manager.review_items = []
 
 def main():
     st.set_page_config(page_title="SmartPrepAI", layout="wide")
@@ -385,6 +399,12 @@ def main():
                     if action == "GENERATE_DIRECT":
                         generate_quiz_from_suggestion(data); st.rerun()
             
+            due_reviews = show_due_reviews()
+            if due_reviews:
+                clear_quiz_states()
+                st.session_state.quiz_generated = st.session_state.quiz_manager.start_review(due_reviews)
+                st.rerun()
+            
             with st.sidebar:
                 st.header("Quiz Settings")
                 question_type = st.selectbox("Select Question Type", ["Multiple Choice", "Fill in the Blank"])
@@ -420,6 +440,7 @@ def main():
                         with st.spinner("🔍 Evaluating your answers..."):
                             st.session_state.quiz_manager.evaluate_quiz()
                             st.session_state.quiz_submitted = True
+                            reset_history()
                         st.rerun()
             
             elif st.session_state.quiz_submitted:
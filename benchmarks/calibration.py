@@ -0,0 +1,93 @@
+"""
+Calibrating item difficulty and user ability over a large synthetic studyai.db, from
+the per-day counts the write path keeps and from the raw answers.
+
+    python -m benchmarks.calibration [--users 2000] [--sessions 100] [--questions 5] [--iterations 50]
+
+Builds users * sessions * questions question_log rows (and their rollups) with
+benchmarks.history_queries, then times:
+
+    counts + fit    load_counts over question_stats_daily, then the NumPy fit
+    rows + fit      the same fit, grouping every question_log row in pandas first
+    Python Elo      one Elo step per question_log row in a Python loop, no item fit
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+
+import pandas as pd
+
+from benchmarks.history_queries import build
+from src.models import calibration
+from src.models.database import get_database
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def from_counts(path: str, iterations: int):
+    with get_database(path).connection() as conn:
+        counts = calibration.load_counts(conn)
+    return calibration.fit(counts, iterations)
+
+
+def from_rows(path: str, iterations: int):
+    conn = sqlite3.connect(path)
+    rows = pd.read_sql_query('SELECT user_id, topic, difficulty, is_correct FROM question_log', conn)
+    conn.close()
+    counts = rows.groupby(['user_id', 'topic', 'difficulty'], sort=False)['is_correct'].agg(['size', 'sum'])
+    counts = counts.reset_index().rename(columns={'size': 'questions', 'sum': 'correct'})
+    return calibration.fit(counts, iterations)
+
+
+def python_elo(path: str):
+    conn = sqlite3.connect(path)
+    abilities = {}
+    for user_id, topic, difficulty, is_correct in conn.execute(
+            'SELECT user_id, topic, difficulty, is_correct FROM question_log ORDER BY created_at, id'):
+        theta, answers = abilities.get((user_id, topic), (0.0, 0))
+        abilities[(user_id, topic)] = (
+            calibration.elo_step(theta, answers, calibration.label_prior(difficulty), bool(is_correct)), answers + 1
+        )
+    conn.close()
+    return abilities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "studyai.db")
+        build(path, args.users, args.sessions, args.questions)
+        with get_database(path).connection() as conn:
+            logged = conn.execute('SELECT COUNT(*) FROM question_log').fetchone()[0]
+            daily = conn.execute('SELECT COUNT(*) FROM question_stats_daily').fetchone()[0]
+
+        (abilities, items), counts_time = timed(lambda: from_counts(path, args.iterations))
+        (row_abilities, row_items), rows_time = timed(lambda: from_rows(path, args.iterations))
+        elo, elo_time = timed(lambda: python_elo(path))
+        get_database(path).close_all()
+
+    merged = items.merge(row_items, on=['topic', 'difficulty'])
+    assert len(merged) == len(items) and (merged['beta_x'] - merged['beta_y']).abs().max() < 1e-6
+    assert len(row_abilities) == len(abilities) == len(elo)
+
+    print(f"{logged} logged answers, {daily} question_stats_daily rows, "
+          f"{len(abilities)} abilities, {len(items)} items\n")
+    print(f"{'counts + fit':<14} {counts_time:>8.2f}s")
+    print(f"{'rows + fit':<14} {rows_time:>8.2f}s")
+    print(f"{'Python Elo':<14} {elo_time:>8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Dashboard metrics for users with long histories: Python loops over session dicts
+against the rollups the dashboard reads (src.models.dashboard).
+
+    python -m benchmarks.dashboard_metrics [--users 3] [--sessions 20000] [--runs 20]
+
+Each user gets ``--sessions`` quiz sessions. "loops" is the dashboard as it was: every
+session as a dict, one strptime per session for "Quizzes This Week" and a dict of
+score lists per topic. "rollups" is get_overview and get_topic_scores, framed for the
+weak-area table. Times are medians over ``--runs``.
+
+It then compares the score-over-time chart sent to the browser: one point per session
+against score_series (rollups bucketed in SQL, then LTTB down to CHART_POINTS).
+"""
+import os
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from benchmarks.history_queries import build
+from src.models import dashboard
+from src.models.database import get_database
+from src.models.sqlite_repository import SQLiteRepository
+
+
+def loop_metrics(user_sessions, pass_score=70):
+    """The metrics as show_dashboard used to compute them"""
+    total_quizzes, avg_score = len(user_sessions), sum(s['score'] for s in user_sessions) / len(user_sessions)
+    seven_days_ago = datetime.now() - timedelta(days=7)
+    recent = sum(1 for s in user_sessions if datetime.strptime(s['created_at'], '%Y-%m-%d %H:%M:%S') >= seven_days_ago)
+    topic_performance = {}
+    for session in user_sessions:
+        data = topic_performance.setdefault(session['display_title'], {'scores': [], 'count': 0})
+        data['scores'].append(session['score']); data['count'] += 1
+    weak_topics = []
+    for topic, data in topic_performance.items():
+        topic_avg = sum(data['scores']) / len(data['scores'])
+        if topic_avg < pass_score:
+            weak_topics.append({'topic': topic, 'avg_score': topic_avg, 'count': data['count']})
+    return total_quizzes, avg_score, recent, sorted(weak_topics, key=lambda x: x['avg_score'])
+
+
+def _median_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=20000, help="Quiz sessions per user")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "studyai.db")
+        build(path, args.users, args.sessions, questions=1)
+        repository = SQLiteRepository(path)
+        user_id = 1
+
+        load_dicts = lambda: repository.get_user_sessions(user_id, limit=args.sessions)
+        user_sessions = load_dicts()
+        assert len(user_sessions) == args.sessions
+        rollups = lambda: (repository.get_overview(user_id),
+                           dashboard.weak_topics(dashboard.topic_frame(repository.get_topic_scores(user_id)), 70))
+
+        def chart(frame, x, y):
+            # Altair refuses data over 5000 rows by default, which one point per session soon reaches
+            with alt.data_transformers.disable_max_rows():
+                return len(alt.Chart(frame).mark_line().encode(x=x, y=y).to_json())
+
+        every = pd.DataFrame.from_records(user_sessions, columns=['created_at', 'score'])
+        charts = [
+            ('every session', len(every), chart(every, 'created_at:T', 'score:Q'),
+             _median_ms(load_dicts, max(1, args.runs // 4))),
+        ]
+        series, bucket = dashboard.score_series(repository, user_id)
+        charts.append((f'score_series ({bucket})', len(series), chart(series, 'period:T', 'avg_score:Q'),
+                       _median_ms(lambda: dashboard.score_series(repository, user_id), args.runs)))
+
+        rows = [
+            ('loops', _median_ms(load_dicts, args.runs), _median_ms(lambda: loop_metrics(user_sessions), args.runs)),
+            ('rollups', _median_ms(rollups, args.runs), 0.0),
+        ]
+        get_database(path).close_all()
+
+    print(f"{args.sessions} sessions per user\n")
+    print(f"{'metrics':<10} {'load':>10} {'compute':>10} {'total':>10}")
+    for name, load, compute in rows:
+        print(f"{name:<10} {load:>8.1f}ms {compute:>8.1f}ms {load + compute:>8.1f}ms")
+
+    print(f"\n{'score chart':<22} {'points':>8} {'spec':>10} {'read':>10}")
+    for name, points, size, took in charts:
+        print(f"{name:<22} {points:>8} {size / 1024:>8.0f}KB {took:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
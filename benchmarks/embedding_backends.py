@@ -0,0 +1,108 @@
+"""
+Compare the embedding backends on the shapes of text the prep pipeline embeds.
+
+    python -m benchmarks.embedding_backends [--docs 512] [--queries 200] [--backends torch onnx onnx-int8]
+
+Each backend runs in its own process so peak memory is measured in isolation. Cosine
+agreement is measured per document against the torch (HuggingFaceEmbeddings) vectors.
+"""
+import time
+import random
+import argparse
+import resource
+import multiprocessing as mp
+
+import numpy as np
+
+TOPICS = ["Operating Systems - Paging", "Computer Networks - TCP/IP", "DBMS - Normalization",
+          "DSA - Graphs", "OOPs", "Machine Learning", "Python", "Java"]
+WORDS = ("process thread memory page table cache socket packet index join key tree graph heap "
+         "stack queue class object inheritance gradient model loss function variable scope").split()
+
+
+def make_corpus(n: int, seed: int = 7):
+    rng = random.Random(seed)
+
+    def sentence(length):
+        return " ".join(rng.choice(WORDS) for _ in range(length))
+
+    return [
+        f"Question on {rng.choice(TOPICS)}: {sentence(rng.randint(8, 25))}?\n"
+        f"My incorrect answer: {sentence(3)}\n"
+        f"The correct answer: {sentence(3)}\n"
+        f"Explanation: {sentence(rng.randint(15, 40))}."
+        for _ in range(n)
+    ]
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # KiB on Linux
+
+
+def _run_backend(backend: str, docs, queries, queue):
+    from src.models.embeddings import get_embeddings
+
+    rss_before = _peak_rss_mb()
+    load_start = time.perf_counter()
+    embeddings = get_embeddings(backend=backend)
+    embeddings.embed_query("warm up")
+    load_seconds = time.perf_counter() - load_start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(docs), dtype=np.float32)
+    throughput = len(docs) / (time.perf_counter() - start)
+
+    queue.put({
+        'backend': backend,
+        'class': type(embeddings).__name__,
+        'load_s': load_seconds,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'docs_per_s': throughput,
+        'rss_mb': _peak_rss_mb() - rss_before,
+        'vectors': vectors,
+    })
+
+
+def run(backends, n_docs: int, n_queries: int):
+    docs = make_corpus(n_docs)
+    queries = [f"Questions and explanations about {topic}" for topic in TOPICS] * (n_queries // len(TOPICS) + 1)
+    queries = queries[:n_queries]
+
+    ctx = mp.get_context("spawn")
+    results = []
+    for backend in backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_backend, args=(backend, docs, queries, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+
+    reference = next((r['vectors'] for r in results if r['backend'] == 'torch'), None)
+    print(f"{'backend':<10} {'served by':<22} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'docs/s':>8} {'RSS MB':>8} {'cos mean':>9} {'cos min':>8}")
+    for r in results:
+        cos_mean = cos_min = float('nan')
+        if reference is not None:
+            a = r['vectors'] / np.linalg.norm(r['vectors'], axis=1, keepdims=True)
+            b = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+            cosines = (a * b).sum(axis=1)
+            cos_mean, cos_min = float(cosines.mean()), float(cosines.min())
+        print(f"{r['backend']:<10} {r['class']:<22} {r['load_s']:>7.2f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['docs_per_s']:>8.1f} {r['rss_mb']:>8.1f} {cos_mean:>9.4f} {cos_min:>8.4f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    args = parser.parse_args()
+    run(args.backends, args.docs, args.queries)
@@ -0,0 +1,127 @@
+"""
+Dashboard and sidebar queries on a large synthetic studyai.db, with and without the
+history indices from migration 2.
+
+    python -m benchmarks.history_queries [--users 2000] [--sessions 50] [--questions 5] [--runs 200]
+
+Builds users * sessions quiz sessions (with realistic JSON payloads) and
+users * sessions * questions question_log rows, then times the manager methods for
+random users (the search runs against the FTS5 history index from migration 8). The
+same database is measured again after dropping the indices.
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from src.models.database import get_database
+from src.models.question_log import QuestionLogger
+from src.models.rollups import rebuild_all
+from src.models.simple_session import SimpleSessionManager
+
+TOPICS = {
+    'DSA': ['Arrays', 'Graphs', 'Trees', 'Dynamic Programming'],
+    'Operating Systems': ['Scheduling', 'Memory', 'Deadlocks'],
+    'DBMS': ['Normalization', 'Indexing', 'Transactions'],
+    'Computer Networks': ['TCP', 'Routing', 'DNS'],
+}
+DIFFICULTIES = ['Easy', 'Medium', 'Hard']
+INDICES = ['idx_quiz_sessions_user_created', 'idx_question_log_user_created']
+
+
+def build(path: str, users: int, sessions: int, questions: int, seed: int = 0):
+    get_database(path)  # applies the migrations
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=90)
+    payload = json.dumps([{'question': 'x' * 300, 'options': ['a' * 40] * 4, 'answer': 'a'}] * questions)
+
+    conn = sqlite3.connect(path)
+    session_id = 0
+    for user_id in range(1, users + 1):
+        session_rows, question_rows = [], []
+        for _ in range(sessions):
+            session_id += 1
+            topic = rng.choice(list(TOPICS))
+            sub_topic = rng.choice(TOPICS[topic])
+            difficulty = rng.choice(DIFFICULTIES)
+            created_at = (start + timedelta(seconds=rng.randrange(90 * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+            correct = [rng.random() < 0.65 for _ in range(questions)]
+            session_rows.append((session_id, user_id, topic, sub_topic, 'Multiple Choice', difficulty, questions,
+                                 100.0 * sum(correct) / questions, created_at, payload, '[]', '[]'))
+            question_rows.extend((user_id, session_id, topic, sub_topic, difficulty, 'Multiple Choice',
+                                  'x' * 300, '[]', 'a', 'a' if ok else 'b', ok, 30, 'y' * 200, created_at)
+                                 for ok in correct)
+        conn.executemany('''
+            INSERT INTO quiz_sessions (id, user_id, topic, sub_topic, question_type, difficulty, num_questions,
+                                       score, created_at, questions_data, user_answers, results_data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', session_rows)
+        conn.executemany('''
+            INSERT INTO question_log (user_id, session_id, topic, sub_topic, difficulty, question_type, question_text,
+                                      options, correct_answer, user_answer, is_correct, time_taken, explanation, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', question_rows)
+        conn.commit()
+    conn.close()
+
+    # Raw inserts bypass the write path that keeps the rollups current
+    with get_database(path).transaction() as conn:
+        rebuild_all(conn)
+
+
+def measure(path: str, users: int, runs: int, seed: int = 1) -> dict:
+    sessions, logger = SimpleSessionManager(path), QuestionLogger(path)
+    cases = {
+        'get_user_sessions(15)': lambda user_id: sessions.get_user_sessions(user_id, 15),
+        'search_sessions(15)': lambda user_id: sessions.search_sessions(user_id, 'graphs', 15),
+        'get_recent_questions(10)': lambda user_id: logger.get_recent_questions(user_id, 10),
+        'analyze_weak_topics(14d)': lambda user_id: logger.analyze_weak_topics(user_id, days=14),
+    }
+    results = {}
+    for name, case in cases.items():
+        user_ids = np.random.default_rng(seed).integers(1, users + 1, size=runs)
+        latencies = []
+        for user_id in user_ids:
+            started = time.perf_counter()
+            case(int(user_id))
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[name] = (float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=50, help="Quiz sessions per user")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per session")
+    parser.add_argument("--runs", type=int, default=200, help="Timed calls per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "studyai.db")
+        started = time.perf_counter()
+        build(path, args.users, args.sessions, args.questions)
+        print(f"Built {args.users * args.sessions} sessions / {args.users * args.sessions * args.questions} "
+              f"logged questions ({os.path.getsize(path) / 2**20:.0f} MB) in {time.perf_counter() - started:.1f}s\n")
+
+        indexed = measure(path, args.users, args.runs)
+        with get_database(path).transaction() as conn:
+            for index in INDICES:
+                conn.execute(f'DROP INDEX {index}')
+        scanned = measure(path, args.users, args.runs)
+        get_database(path).close_all()
+
+    print(f"{'query':<26} {'indexed p50':>12} {'p99':>9} {'no index p50':>13} {'p99':>9}")
+    for name in indexed:
+        (i50, i99), (s50, s99) = indexed[name], scanned[name]
+        print(f"{name:<26} {i50:>10.2f}ms {i99:>7.2f}ms {s50:>11.2f}ms {s99:>7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+"Next questions due" for users with more and more review items, with and without the
+(user_id, due_at) index from migration 14.
+
+    python -m benchmarks.review_queue [--items 1000 10000 100000 500000] [--limit 10] [--runs 200]
+
+One user per ``--items`` size gets that many review items, due from 30 days ago to a
+year from now, on one database. ``get_due_reviews`` (the next ``--limit`` due, with
+their questions from question_bank) is timed for each, then again after dropping the
+index. Times are medians over ``--runs``.
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from src.models.database import get_database
+from src.models.review import ReviewQueue, TIME_FORMAT
+
+
+def build(path: str, sizes, seed: int = 0):
+    get_database(path)  # applies the migrations
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO question_bank (id, hash, body) VALUES (?, ?, ?)', [
+        (i, f'{i:032x}', json.dumps({'type': 'MCQ', 'question': f'Question {i}?', 'options': ['a', 'b', 'c', 'd'],
+                                     'correct_answer': 'a', 'explanation': 'x' * 120}))
+        for i in range(1, max(sizes) + 1)
+    ])
+    for user_id, size in enumerate(sizes, start=1):
+        rows = []
+        for question_id in range(1, size + 1):
+            due_at = now + timedelta(seconds=rng.randrange(-30 * 86400, 365 * 86400))
+            rows.append((user_id, question_id, 'DSA', 'Graphs', 'Medium', 2, 6, 2.5, 0,
+                         (due_at - timedelta(days=6)).strftime(TIME_FORMAT), due_at.strftime(TIME_FORMAT)))
+        conn.executemany('''
+            INSERT INTO review_items (user_id, question_id, topic, sub_topic, difficulty, repetitions,
+                                      interval_days, ease, lapses, reviewed_at, due_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+
+def measure(path: str, sizes, limit: int, runs: int) -> list:
+    queue = ReviewQueue(path)
+    results = []
+    for user_id, _ in enumerate(sizes, start=1):
+        assert len(queue.get_due_reviews(user_id, limit)) == limit
+        times = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            queue.get_due_reviews(user_id, limit)
+            times.append((time.perf_counter() - started) * 1000)
+        results.append(float(np.median(times)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs='+', default=[1000, 10000, 100000, 500000],
+                        help="Review items per user, one user per size")
+    parser.add_argument("--limit", type=int, default=10, help="Questions per review quiz")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "studyai.db")
+        build(path, args.items)
+        indexed = measure(path, args.items, args.limit, args.runs)
+        with get_database(path).transaction() as conn:
+            conn.execute('DROP INDEX idx_review_items_due')
+        scanned = measure(path, args.items, args.limit, max(1, args.runs // 20))
+        get_database(path).close_all()
+
+    print(f"next {args.limit} due reviews\n")
+    print(f"{'items':>10} {'indexed':>10} {'no index':>10}")
+    for size, with_index, without in zip(args.items, indexed, scanned):
+        print(f"{size:>10} {with_index:>8.2f}ms {without:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Database size and revision-load cost of legacy JSON sessions versus the packed format
+from ``src.models.session_storage``.
+
+    python -m benchmarks.session_storage [--sessions 20000] [--questions 5] [--pool 3000] [--loads 500]
+
+Writes sessions the way the app did before (three JSON columns per session and full
+question text in question_log), drawing questions from a pool so some repeat, as
+regenerated and personalized quizzes do. Measures file size, stored bytes per session
+and ``get_complete_session`` latency, then migrates online, vacuums and measures again.
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+import numpy as np
+
+from src.models import session_storage
+from src.models.database import get_database
+from src.models.simple_session import SimpleSessionManager
+
+
+def _question(rng: random.Random, i: int) -> dict:
+    words = ' '.join(rng.choice(['graph', 'tree', 'heap', 'stack', 'queue', 'hash', 'sort', 'node', 'edge'])
+                     for _ in range(20))
+    if i % 3:
+        return {'type': 'MCQ', 'question': f"Q{i}: which {words}?", 'options': [f"{words[:40]} {k}" for k in range(4)],
+                'correct_answer': f"{words[:40]} 0", 'explanation': f"Because {words} " * 3}
+    return {'type': 'Fill in the blank', 'question': f"Q{i}: ___ {words}", 'correct_answer': words.split()[0],
+            'explanation': f"Because {words} " * 3}
+
+
+def build_legacy(path: str, sessions: int, questions: int, pool: int, seed: int = 0):
+    get_database(path)  # schema
+    rng = random.Random(seed)
+    bank = [_question(rng, i) for i in range(pool)]
+    conn = sqlite3.connect(path)
+    for session_id in range(1, sessions + 1):
+        quiz = rng.sample(bank, questions)
+        answers = [q['correct_answer'] if rng.random() < 0.6 else 'wrong' for q in quiz]
+        results = [{
+            'question_number': i + 1, 'question': q['question'], 'question_type': q['type'],
+            'user_answer': a, 'correct_answer': q['correct_answer'], 'explanation': q['explanation'],
+            'time_taken': rng.randrange(5, 90), 'is_correct': a == q['correct_answer'], 'options': q.get('options', []),
+        } for i, (q, a) in enumerate(zip(quiz, answers))]
+        conn.execute('''
+            INSERT INTO quiz_sessions (id, user_id, topic, sub_topic, question_type, difficulty, num_questions, score,
+                                       questions_data, user_answers, results_data)
+            VALUES (?, ?, 'DSA', 'Graphs', 'MCQ', 'Medium', ?, 60.0, ?, ?, ?)
+        ''', [session_id, session_id % 500 + 1, questions, json.dumps(quiz), json.dumps(answers), json.dumps(results)])
+        conn.executemany('''
+            INSERT INTO question_log (user_id, session_id, topic, sub_topic, difficulty, question_type, question_text,
+                                      options, correct_answer, user_answer, is_correct, time_taken, explanation)
+            VALUES (?, ?, 'DSA', 'Graphs', 'Medium', ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(session_id % 500 + 1, session_id, q['type'], q['question'], json.dumps(q.get('options', [])),
+               q['correct_answer'], r['user_answer'], r['is_correct'], r['time_taken'], q['explanation'])
+              for q, r in zip(quiz, results)])
+        if session_id % 1000 == 0:
+            conn.commit()
+    conn.commit()
+    conn.close()
+
+
+def measure(path: str, sessions: int, loads: int) -> dict:
+    with get_database(path).connection() as conn:
+        stored = conn.execute('''
+            SELECT AVG(COALESCE(LENGTH(payload), 0) + COALESCE(LENGTH(questions_data), 0)
+                       + COALESCE(LENGTH(user_answers), 0) + COALESCE(LENGTH(results_data), 0))
+            FROM quiz_sessions
+        ''').fetchone()[0]
+    manager = SimpleSessionManager(path)
+    latencies = []
+    for session_id in np.random.default_rng(1).integers(1, sessions + 1, size=loads):
+        started = time.perf_counter()
+        manager.get_complete_session(int(session_id))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        'size_mb': os.path.getsize(path) / 2**20,
+        'bytes_per_session': stored,
+        'load_p50': float(np.percentile(latencies, 50)),
+        'load_p99': float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--questions", type=int, default=5, help="Questions per session")
+    parser.add_argument("--pool", type=int, default=3000, help="Distinct questions sessions draw from")
+    parser.add_argument("--loads", type=int, default=500, help="Timed revision loads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "studyai.db")
+        build_legacy(path, args.sessions, args.questions, args.pool)
+        legacy = measure(path, args.sessions, args.loads)
+
+        started = time.perf_counter()
+        session_storage.migrate(path)
+        migrate_seconds = time.perf_counter() - started
+        with get_database(path).connection() as conn:
+            conn.execute('VACUUM')
+        packed = measure(path, args.sessions, args.loads)
+        get_database(path).close_all()
+
+    print(f"Migrated {args.sessions} sessions in {migrate_seconds:.1f}s\n")
+    print(f"{'format':<8} {'file MB':>8} {'bytes/session':>14} {'load p50':>9} {'load p99':>9}")
+    for name, m in (("legacy", legacy), ("packed", packed)):
+        print(f"{name:<8} {m['size_mb']:>8.1f} {m['bytes_per_session']:>14.0f} "
+              f"{m['load_p50']:>7.3f}ms {m['load_p99']:>7.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
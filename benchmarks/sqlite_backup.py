@@ -0,0 +1,134 @@
+"""
+Quiz submit latency while online backups of studyai.db run (see src.models.backup).
+
+    python -m benchmarks.sqlite_backup [--rows 400000] [--writers 4] [--seconds 10]
+                                       [--pages 256] [--sleep-ms 5]
+
+The database is seeded with ``--rows`` question_log rows, then ``--writers`` threads
+submit quizzes through SQLiteRepository while a backup process runs one backup: copying
+``--pages`` pages per step with ``--sleep-ms`` pauses, or the whole database in one step
+without pauses. A baseline runs the writers alone for ``--seconds``. Latencies are those
+of the submits made while the backup ran. Backups read from a WAL snapshot and take no
+lock a writer waits on; what they cost the writers is the disk and CPU they use, which
+the page steps spread over a longer backup.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+import numpy as np
+
+from src.config.settings import settings
+from src.models import backup
+from src.models import database
+from src.models.quiz_submission import new_submission_id
+from src.models.sqlite_repository import SQLiteRepository
+
+TOPICS = ['Arrays', 'Graphs', 'Trees', 'Scheduling', 'Paging', 'Indexing', 'TCP', 'DNS']
+
+
+def _seed(db_path: str, rows: int, users: int):
+    repository = SQLiteRepository(db_path)
+    for user in range(users):
+        repository.create_user(f'user{user}', f'user{user}@example.com', 'hash')
+    rng = random.Random(0)
+    # Answers logged before the question bank, with their text inline: bulk history fast to seed
+    with database.get_database(db_path).transaction() as conn:
+        conn.executemany('''
+            INSERT INTO question_log (user_id, session_id, topic, sub_topic, difficulty, question_type,
+                                      question_text, options, correct_answer, user_answer, is_correct,
+                                      time_taken, explanation)
+            VALUES (?, NULL, 'DSA', ?, 'Medium', 'MCQ', ?, '["a","b","c","d"]', 'a', ?, ?, ?, ?)
+        ''', ((rng.randrange(users) + 1, rng.choice(TOPICS), f'Question {i}: ' + 'x' * 120, rng.choice('abcd'),
+               rng.random() < 0.6, rng.randrange(5, 60), 'y' * 80) for i in range(rows)))
+    database.get_database(db_path).close_all()
+
+
+def _backup(db_path: str, directory: str, pages: int, sleep_ms: int, ready, go):
+    ready.set()  # imports done; only the backup itself is timed
+    go.wait()
+    backup.create_backup(db_path, os.path.join(directory, 'no-vector-store'), directory, pages, sleep_ms)
+
+
+def run(db_path: str, mode: str, writers: int, users: int, seconds: float, pages: int, sleep_ms: int):
+    """Submit latencies (ms) during one backup in ``mode`` (or ``seconds`` without one), and its duration."""
+    repository = SQLiteRepository(db_path)
+    latencies, stop = [], threading.Event()
+
+    def submit(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            sub_topic = rng.choice(TOPICS)
+            questions = [{'type': 'MCQ', 'question': f'{sub_topic} {rng.randrange(500)}?', 'options': ['a', 'b'],
+                          'correct_answer': 'a', 'explanation': 'z' * 100} for _ in range(5)]
+            answers = [rng.choice('ab') for _ in questions]
+            results = [{'is_correct': a == 'a', 'time_taken': 10} for a in answers]
+            quiz_data = {'topic': 'DSA', 'sub_topic': sub_topic, 'question_type': 'MCQ', 'difficulty': 'Medium',
+                         'num_questions': 5, 'score': 20.0 * sum(r['is_correct'] for r in results),
+                         'questions_data': questions, 'user_answers': answers, 'results_data': results}
+            entries = [{'topic': 'DSA', 'sub_topic': sub_topic, 'difficulty': 'Medium', 'question_type': 'MCQ',
+                        'question_text': q['question'], 'options': q['options'], 'correct_answer': 'a',
+                        'user_answer': a, 'is_correct': r['is_correct'], 'time_taken': 10,
+                        'explanation': q['explanation']} for q, a, r in zip(questions, answers, results)]
+            started = time.perf_counter()
+            repository.submit_quiz(rng.randrange(users) + 1, new_submission_id(), quiz_data, entries)
+            latencies.append((started, (time.perf_counter() - started) * 1000))
+
+    process = None
+    if mode != 'none':
+        # A separate process, like the scheduled `python -m src.models.backup run`
+        context = multiprocessing.get_context('spawn')
+        ready, go = context.Event(), context.Event()
+        directory = tempfile.mkdtemp(prefix='backups-', dir=os.path.dirname(db_path))
+        process = context.Process(target=_backup, args=(
+            db_path, directory, pages if mode == 'stepped' else -1, sleep_ms if mode == 'stepped' else 0, ready, go))
+        process.start()
+        ready.wait()
+
+    threads = [threading.Thread(target=submit, args=(seed,)) for seed in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)  # writers warmed up
+
+    started = time.perf_counter()
+    if process is None:
+        time.sleep(seconds)
+    else:
+        go.set()
+        process.join()
+    finished = time.perf_counter()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return [ms for at, ms in latencies if started <= at < finished], finished - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=400000, help="question_log rows seeded")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the run without a backup")
+    parser.add_argument("--pages", type=int, default=settings.BACKUP_STEP_PAGES)
+    parser.add_argument("--sleep-ms", type=int, default=settings.BACKUP_STEP_SLEEP_MS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'studyai.db')
+        _seed(db_path, args.rows, args.users)
+        print(f"{os.path.getsize(db_path) / 1e6:.0f} MB database, {args.writers} writers, {os.cpu_count()} CPU(s)")
+        print(f"{'backup':>22} {'took':>7} {'submits/s':>10} {'p50':>9} {'p99':>9} {'max':>9}")
+        for mode, label in (('none', 'none'), ('stepped', f'{args.pages} pages/{args.sleep_ms}ms'),
+                            ('single', 'one step, no pauses')):
+            latencies, took = run(db_path, mode, args.writers, args.users, args.seconds, args.pages, args.sleep_ms)
+            print(f"{label:>22} {took:>6.1f}s {len(latencies) / took:>10.0f} {np.percentile(latencies, 50):>7.2f}ms "
+                  f"{np.percentile(latencies, 99):>7.2f}ms {max(latencies):>7.1f}ms")
+            database.get_database(db_path).close_all()
+
+
+if __name__ == "__main__":
+    main()
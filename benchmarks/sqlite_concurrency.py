@@ -0,0 +1,170 @@
+"""
+Concurrent reads and writes against studyai.db-shaped data: the old connect-per-call
+rollback-journal pattern, the pooled WAL connections from ``src.models.database``, and
+the same pool with writes group-committed by the write queue (``Database.write``).
+
+    python -m benchmarks.sqlite_concurrency [--readers 8] [--writers 4] [--seconds 5] [--synchronous FULL]
+
+Readers run the history-sidebar query while writers save quiz sessions. With the
+rollback journal a commit locks readers out, so read latency tracks write traffic;
+in WAL mode reads proceed next to the writer. Pooled writers still commit one at a
+time; queued writers share commits, which is where write throughput comes from.
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+from src.config.settings import settings
+from src.models import database
+from src.models.database import Database
+from src.models.migrations import apply_migrations
+from src.models.write_queue import write_op
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS quiz_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        topic TEXT NOT NULL,
+        sub_topic TEXT,
+        question_type TEXT NOT NULL,
+        difficulty TEXT NOT NULL,
+        num_questions INTEGER NOT NULL,
+        score REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        questions_data TEXT,
+        user_answers TEXT,
+        results_data TEXT
+    )
+'''
+INSERT = '''
+    INSERT INTO quiz_sessions (user_id, topic, sub_topic, question_type, difficulty,
+                               num_questions, score, questions_data, user_answers, results_data)
+    VALUES (?, 'DSA', 'Graphs', 'MCQ', 'Medium', 5, ?, ?, '[]', '[]')
+'''
+READ = '''
+    SELECT id, topic, sub_topic, question_type, difficulty, num_questions, score, created_at
+    FROM quiz_sessions WHERE user_id = ? ORDER BY created_at DESC LIMIT 15
+'''
+PAYLOAD = '[' + ','.join(['{"question": "%s"}' % ('x' * 200)] * 5) + ']'
+
+
+class LegacyAccess:
+    """The pre-pool pattern: a fresh rollback-journal connection for every call."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.execute(SCHEMA)
+        conn.commit()
+        conn.close()
+
+    def write(self, user_id):
+        conn = sqlite3.connect(self.path)
+        conn.execute(INSERT, [user_id, 50.0, PAYLOAD])
+        conn.commit()
+        conn.close()
+
+    def read(self, user_id):
+        conn = sqlite3.connect(self.path)
+        conn.execute(READ, [user_id]).fetchall()
+        conn.close()
+
+
+@write_op('benchmark_insert_session')
+def _insert_session(conn, payload):
+    conn.execute(INSERT, [payload['user_id'], 50.0, PAYLOAD])
+
+
+class PooledAccess:
+    def __init__(self, path):
+        self.db = Database(path)
+        with self.db.transaction() as conn:
+            conn.execute(SCHEMA)
+
+    def write(self, user_id):
+        with self.db.transaction() as conn:
+            conn.execute(INSERT, [user_id, 50.0, PAYLOAD])
+
+    def read(self, user_id):
+        with self.db.connection() as conn:
+            conn.execute(READ, [user_id]).fetchall()
+
+
+class QueuedAccess(PooledAccess):
+    def __init__(self, path):
+        settings.WRITE_QUEUE_ENABLED = True  # opt-in; the pooled mode uses transaction() directly
+        super().__init__(path)
+        with self.db.connection() as conn:
+            apply_migrations(conn)  # the queue keeps its journal state in write_journal
+
+    def write(self, user_id):
+        self.db.write('benchmark_insert_session', {'user_id': user_id}).result()
+
+
+def run(access, readers: int, writers: int, seconds: float, users: int = 50):
+    stop = time.perf_counter() + seconds
+    read_latencies, write_latencies, errors = [], [], []
+    lock = threading.Lock()
+
+    def loop(op, latencies, seed):
+        rng = np.random.default_rng(seed)
+        local, local_errors = [], 0
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                op(int(rng.integers(users)))
+                local.append((time.perf_counter() - start) * 1000)
+            except sqlite3.OperationalError:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=loop, args=(access.read, read_latencies, i)) for i in range(readers)]
+    threads += [threading.Thread(target=loop, args=(access.write, write_latencies, 1000 + i)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    def summary(latencies):
+        if not latencies:
+            return 0.0, float('nan'), float('nan')
+        return len(latencies) / seconds, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+    return summary(read_latencies), summary(write_latencies), sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--synchronous", default=database.PRAGMAS['synchronous'],
+                        help="synchronous pragma for the pooled and queued modes (FULL fsyncs every commit)")
+    args = parser.parse_args()
+    database.PRAGMAS['synchronous'] = args.synchronous
+
+    print(f"{'mode':<8} {'reads/s':>9} {'read p50':>9} {'read p99':>9} {'writes/s':>9} "
+          f"{'write p50':>10} {'write p99':>10} {'locked':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, access in (("legacy", LegacyAccess(os.path.join(tmp, "legacy.db"))),
+                             ("pooled", PooledAccess(os.path.join(tmp, "pooled.db"))),
+                             ("queued", QueuedAccess(os.path.join(tmp, "queued.db")))):
+            (rps, r50, r99), (wps, w50, w99), locked = run(access, args.readers, args.writers, args.seconds)
+            print(f"{name:<8} {rps:>9.0f} {r50:>8.2f}ms {r99:>8.2f}ms {wps:>9.0f} {w50:>9.2f}ms {w99:>9.2f}ms {locked:>7}")
+            if isinstance(access, QueuedAccess):
+                metrics = access.db.write_metrics()
+                print(f"{'':<8} write queue: {metrics['batches']} commits, "
+                      f"avg batch {metrics['avg_batch_size']:.1f}, max depth {metrics['max_queue_depth']}")
+                access.db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Quiz submit throughput with the history split over 1, 2, 4 and 8 SQLite shard files
+(``SHARD_COUNT``, see src.models.shards).
+
+    python -m benchmarks.sqlite_sharding [--processes 4] [--writers 8] [--users 400]
+                                         [--seconds 5] [--shards 1,2,4,8] [--synchronous FULL]
+
+Each of ``--processes`` app processes runs ``--writers`` threads submitting quizzes for
+random users through SQLiteRepository. Within a process every shard has its own writer
+thread, and across processes every shard has its own file lock, so writes of users on
+different shards commit side by side instead of queueing for the one lock of studyai.db.
+The gain is largest where commits wait on the disk (``--synchronous FULL`` fsyncs every
+commit) and with more cores than processes; on a single core with cheap commits the
+extra writer threads mostly add switching overhead.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+import numpy as np
+
+from src.config.settings import settings
+from src.models import database
+from src.models.quiz_submission import new_submission_id
+from src.models.sqlite_repository import SQLiteRepository
+
+TOPICS = ['Arrays', 'Graphs', 'Trees', 'Scheduling', 'Paging', 'Indexing', 'TCP', 'DNS']
+
+
+def _quiz(rng: random.Random):
+    sub_topic = rng.choice(TOPICS)
+    questions = [{
+        'type': 'MCQ', 'question': f'{sub_topic} question {rng.randrange(500)}: ' + 'x' * 200,
+        'options': ['a' * 40, 'b' * 40, 'c' * 40, 'd' * 40], 'correct_answer': 'a' * 40,
+        'explanation': 'y' * 200,
+    } for _ in range(5)]
+    answers = [rng.choice(q['options']) for q in questions]
+    results = [{'question_number': i + 1, 'is_correct': a == q['correct_answer'], 'time_taken': 20}
+               for i, (q, a) in enumerate(zip(questions, answers))]
+    quiz_data = {
+        'topic': 'CS', 'sub_topic': sub_topic, 'question_type': 'MCQ', 'difficulty': 'Medium',
+        'num_questions': 5, 'score': 20.0 * sum(r['is_correct'] for r in results),
+        'questions_data': questions, 'user_answers': answers, 'results_data': results,
+    }
+    entries = [{
+        'topic': 'CS', 'sub_topic': sub_topic, 'difficulty': 'Medium', 'question_type': 'MCQ',
+        'question_text': q['question'], 'options': q['options'], 'correct_answer': q['correct_answer'],
+        'user_answer': a, 'is_correct': r['is_correct'], 'time_taken': 20, 'explanation': q['explanation'],
+    } for q, a, r in zip(questions, answers, results)]
+    return quiz_data, entries
+
+
+def _process(db_path: str, shard_count: int, synchronous: str, writers: int, users: int,
+             start_at: float, seconds: float, seed: int):
+    """One app process: ``writers`` threads submitting until the deadline; returns latencies in ms."""
+    settings.SHARD_COUNT = shard_count
+    database.PRAGMAS['synchronous'] = synchronous
+    repository = SQLiteRepository(db_path)
+    latencies, lock = [], threading.Lock()
+
+    def loop(thread_seed):
+        rng = random.Random(thread_seed)
+        quizzes = [_quiz(rng) for _ in range(20)]
+        local = []
+        while time.time() < start_at:
+            time.sleep(0.001)
+        while time.time() < start_at + seconds:
+            quiz_data, entries = rng.choice(quizzes)
+            started = time.perf_counter()
+            session_id, created = repository.submit_quiz(rng.randrange(1, users + 1), new_submission_id(),
+                                                         quiz_data, entries)
+            if created:
+                local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=loop, args=(seed * 1000 + i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for db in repository.sessions.router.shards:
+        db.close_all()
+    return latencies
+
+
+def run(shard_count: int, processes: int, writers: int, users: int, seconds: float, synchronous: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'studyai.db')
+        settings.SHARD_COUNT = shard_count
+        repository = SQLiteRepository(db_path)
+        for i in range(users):
+            repository.create_user(f'user{i}', f'user{i}@example.com', 'hash')
+        for db in repository.sessions.router.shards:
+            database.close_database(db.db_path)
+
+        start_at = time.time() + 1.0  # let every process open its shards first
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(processes) as pool:
+            results = pool.starmap(_process, [
+                (db_path, shard_count, synchronous, writers, users, start_at, seconds, p) for p in range(processes)
+            ])
+        latencies = [ms for result in results for ms in result]
+        return len(latencies) / seconds, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=8, help="submitting threads per process")
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--shards", default="1,2,4,8")
+    parser.add_argument("--synchronous", default=database.PRAGMAS['synchronous'],
+                        help="synchronous pragma of every shard (FULL fsyncs every commit)")
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.writers} writers, {args.users} users, "
+          f"synchronous={args.synchronous}, {os.cpu_count()} CPU(s)")
+    print(f"{'shards':>6} {'submits/s':>10} {'p50':>9} {'p99':>9} {'speedup':>8}")
+    baseline = None
+    for shard_count in [int(n) for n in args.shards.split(',')]:
+        rate, p50, p99 = run(shard_count, args.processes, args.writers, args.users, args.seconds, args.synchronous)
+        baseline = baseline or rate
+        print(f"{shard_count:>6} {rate:>10.0f} {p50:>7.2f}ms {p99:>7.2f}ms {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
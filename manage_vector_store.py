@@ -0,0 +1,221 @@
+"""
+Inspection and maintenance tool for the per-user vector stores.
+
+    python manage_vector_store.py stats                  # sizes and counts for every user
+    python manage_vector_store.py list --user 1          # print a user's stored mistakes
+    python manage_vector_store.py check --all            # integrity checks, users in parallel
+    python manage_vector_store.py compact --user 1       # drop duplicates and uncommitted tails
+    python manage_vector_store.py reindex --all -j 4     # re-embed every store with the configured model
+    python manage_vector_store.py migrate --all          # convert legacy FAISS pickles
+
+Only ``reindex`` loads the embedding model; everything else reads the store files directly.
+``reindex`` records finished users in a checkpoint file next to the stores, and each
+user's partial progress is kept in ``store.next``, so an interrupted run resumes where it
+stopped when started again with the same model. The app keeps serving each user's old
+store (with its old model) until that user's new store is swapped in.
+"""
+import os
+import re
+import sys
+import json
+import glob
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.config.settings import settings
+from src.models.vector_store import (
+    VECTOR_STORE_PATH, NATIVE_STORE_DIR, LEGACY_INDEX_DIR,
+    MmapVectorStore, compact_store, reembed_store, migrate_faiss_store
+)
+
+CHECKPOINT_FILE = "reindex_checkpoint.json"
+
+
+def user_dirs(root: str):
+    """Map user id -> directory for every user store under ``root``."""
+    dirs = {}
+    for path in glob.glob(os.path.join(root, "user_*")):
+        match = re.fullmatch(r"user_(\d+)", os.path.basename(path))
+        if match and os.path.isdir(path):
+            dirs[int(match.group(1))] = path
+    return dict(sorted(dirs.items()))
+
+
+def _stats(user_dir: str) -> dict:
+    store = MmapVectorStore(os.path.join(user_dir, NATIVE_STORE_DIR))
+    stats = store.stats()
+    stats['legacy'] = os.path.exists(os.path.join(user_dir, LEGACY_INDEX_DIR))
+    return stats
+
+
+def _check(user_dir: str) -> list:
+    store_path = os.path.join(user_dir, NATIVE_STORE_DIR)
+    if not MmapVectorStore.exists(store_path):
+        if os.path.exists(os.path.join(user_dir, LEGACY_INDEX_DIR)):
+            return ["only a legacy FAISS index exists (run 'migrate')"]
+        return []
+    return MmapVectorStore(store_path).check_integrity()
+
+
+def _compact(user_dir: str) -> str:
+    store_path = os.path.join(user_dir, NATIVE_STORE_DIR)
+    if not MmapVectorStore.exists(store_path):
+        return "no store"
+    result = compact_store(store_path)
+    return f"{result['before']} -> {result['after']} documents"
+
+
+def _reindex(user_dir: str, model: str = None, revision: str = None) -> str:
+    model = model or settings.EMBEDDING_MODEL_NAME
+    revision = revision or settings.EMBEDDING_MODEL_REVISION
+    if not MmapVectorStore.exists(os.path.join(user_dir, NATIVE_STORE_DIR)):
+        return "no store"
+    from src.models.embeddings import get_embeddings
+    count = reembed_store(user_dir, get_embeddings(model, revision), model, revision)
+    return f"re-embedded {count} documents with {model}@{revision}"
+
+
+def _migrate(user_dir: str) -> str:
+    migrated = migrate_faiss_store(user_dir)
+    return f"migrated {migrated} documents" if migrated is not None else "nothing to migrate"
+
+
+COMMANDS = {'check': _check, 'compact': _compact, 'reindex': _reindex, 'migrate': _migrate}
+
+
+def run_for_users(func, dirs: dict, workers: int, on_done=None):
+    """Run a maintenance function for each user, in parallel when ``workers`` > 1."""
+    results = {}
+
+    def finish(user_id, result):
+        results[user_id] = result
+        if on_done:
+            on_done(user_id, result)
+
+    if workers <= 1 or len(dirs) <= 1:
+        for user_id, path in dirs.items():
+            try:
+                finish(user_id, func(path))
+            except Exception as e:
+                finish(user_id, e)
+        return dict(sorted(results.items()))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, path): user_id for user_id, path in dirs.items()}
+        for future in as_completed(futures):
+            try:
+                finish(futures[future], future.result())
+            except Exception as e:
+                finish(futures[future], e)
+    return dict(sorted(results.items()))
+
+
+def reindex_users(root: str, dirs: dict, workers: int, model: str, revision: str) -> dict:
+    """Re-embed every user's store, skipping users a previous run already finished."""
+    target = f"{model}@{revision}"
+    checkpoint_path = os.path.join(root, CHECKPOINT_FILE)
+    checkpoint = {'target': target, 'done': []}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('target') == target:
+            checkpoint = saved
+
+    done = set(checkpoint['done'])
+    pending = {}
+    for user_id, path in dirs.items():
+        store = MmapVectorStore(os.path.join(path, NATIVE_STORE_DIR))
+        if user_id in done or (store.embedding_model, store.embedding_revision) == (model, revision):
+            done.add(user_id)
+        else:
+            pending[user_id] = path
+    print(f"Re-embedding {len(pending)} users with {target} ({len(done)} already done)")
+
+    def save_checkpoint(user_id, result):
+        if not isinstance(result, Exception):
+            done.add(user_id)
+        checkpoint['done'] = sorted(done)
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    return run_for_users(partial(_reindex, model=model, revision=revision), pending, workers, save_checkpoint)
+
+
+def show_stats(dirs: dict):
+    total_docs = total_bytes = 0
+    print(f"{'user':>8}  {'docs':>8}  {'dim':>5}  {'vectors':>10}  {'docstore':>10}  {'model':<28}  legacy")
+    for user_id, path in dirs.items():
+        stats = _stats(path)
+        total_docs += stats['documents']
+        total_bytes += stats['vectors_bytes'] + stats['docs_bytes']
+        print(f"{user_id:>8}  {stats['documents']:>8}  {stats['dim']:>5}  "
+              f"{stats['vectors_bytes']:>10}  {stats['docs_bytes']:>10}  "
+              f"{stats['embedding_model'] + '@' + stats['embedding_revision']:<28}  {'yes' if stats['legacy'] else ''}")
+    print(f"\n{len(dirs)} users, {total_docs} documents, {total_bytes} bytes on disk")
+
+
+def list_documents(user_dir: str, limit: int = None):
+    store = MmapVectorStore(os.path.join(user_dir, NATIVE_STORE_DIR))
+    print(f"Total entries (mistakes) stored: {store.count}\n")
+    for shown, (doc_id, doc) in enumerate(store.iter_documents()):
+        if limit is not None and shown >= limit:
+            break
+        print(f"📌 Document {doc_id + 1}:")
+        print(doc.page_content)
+        print("-" * 20)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect and maintain per-user vector stores.")
+    parser.add_argument("command", choices=["stats", "list"] + list(COMMANDS))
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--user", type=int, help="Only operate on this user id")
+    target.add_argument("--all", action="store_true", help="Operate on every user (default for stats)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="Users processed in parallel")
+    parser.add_argument("--limit", type=int, help="Maximum documents to print with 'list'")
+    parser.add_argument("--root", default=VECTOR_STORE_PATH, help="Vector store root directory")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME, help="Target embedding model for 'reindex'")
+    parser.add_argument("--revision", default=settings.EMBEDDING_MODEL_REVISION, help="Target model revision for 'reindex'")
+    args = parser.parse_args(argv)
+
+    dirs = user_dirs(args.root)
+    if args.user is not None:
+        if args.user not in dirs:
+            print(f"❌ No vector store found for user {args.user}.")
+            return 1
+        dirs = {args.user: dirs[args.user]}
+    elif args.command not in ("stats",) and not args.all:
+        parser.error(f"'{args.command}' needs --user ID or --all")
+
+    if args.command == "stats":
+        show_stats(dirs)
+        return 0
+    if args.command == "list":
+        for user_id, path in dirs.items():
+            print(f"🔍 User {user_id} ({path})")
+            list_documents(path, args.limit)
+        return 0
+
+    if args.command == "reindex":
+        results = reindex_users(args.root, dirs, args.workers, args.model, args.revision)
+    else:
+        results = run_for_users(COMMANDS[args.command], dirs, args.workers)
+
+    failed = False
+    for user_id, result in results.items():
+        if isinstance(result, Exception):
+            failed = True
+            print(f"❌ user {user_id}: {result}")
+        elif args.command == "check":
+            failed = failed or bool(result)
+            print(f"{'❌' if result else '✅'} user {user_id}: {'; '.join(result) if result else 'ok'}")
+        else:
+            print(f"✅ user {user_id}: {result}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
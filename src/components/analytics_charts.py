@@ -2,27 +2,28 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 
-def plot_performance_over_time(df: pd.DataFrame):
+from src.models.dashboard import topic_averages
+
+def plot_performance_over_time(df: pd.DataFrame, bucket: str = 'day'):
     """
-    Plots user's quiz scores over time.
+    Plots user's average quiz score over time, one point per ``bucket``
+    (the frame from src.models.dashboard.score_series).
     """
-    if df.empty or 'created_at' not in df.columns or 'score' not in df.columns:
+    if df.empty or 'period' not in df.columns or 'avg_score' not in df.columns:
         st.info("Take more quizzes to see your performance over time!")
         return
 
-    df['created_at'] = pd.to_datetime(df['created_at'])
-
+    label = {'day': 'Date', 'week': 'Week of', 'month': 'Month'}[bucket]
     chart = alt.Chart(df).mark_line(
         point=alt.OverlayMarkDef(color="blue", size=50),
         color='blue'
     ).encode(
-        x=alt.X('created_at:T', title='Date', axis=alt.Axis(format='%b %d, %Y')),
-        y=alt.Y('score:Q', title='Score (%)', scale=alt.Scale(domain=[0, 100])),
+        x=alt.X('period:T', title=label, axis=alt.Axis(format='%b %Y' if bucket == 'month' else '%b %d, %Y')),
+        y=alt.Y('avg_score:Q', title='Score (%)', scale=alt.Scale(domain=[0, 100])),
         tooltip=[
-            alt.Tooltip('created_at:T', title='Date', format='%Y-%m-%d'),
-            alt.Tooltip('topic:N', title='Topic'),
-            alt.Tooltip('score:Q', title='Score', format='.1f'),
-            alt.Tooltip('difficulty:N', title='Difficulty')
+            alt.Tooltip('period:T', title=label, format='%Y-%m' if bucket == 'month' else '%Y-%m-%d'),
+            alt.Tooltip('avg_score:Q', title='Average Score', format='.1f'),
+            alt.Tooltip('quizzes:Q', title='Quizzes')
         ]
     ).properties(
         title='Your Quiz Performance Over Time'
@@ -32,14 +33,14 @@ def plot_performance_over_time(df: pd.DataFrame):
 
 def plot_performance_by_topic(df: pd.DataFrame):
     """
-    Plots user's average score by topic.
+    Plots user's average score by topic, from per topic / sub-topic averages
+    (a topic frame from src.models.dashboard.topic_frame).
     """
-    if df.empty or 'topic' not in df.columns or 'score' not in df.columns:
+    if df.empty or 'topic' not in df.columns or 'avg_score' not in df.columns:
         st.info("Your topic performance will appear here after you take some quizzes.")
         return
 
-    avg_scores = df.groupby('topic')['score'].mean().reset_index()
-    avg_scores = avg_scores.sort_values(by='score', ascending=False)
+    avg_scores = topic_averages(df)
 
     chart = alt.Chart(avg_scores).mark_bar().encode(
         x=alt.X('score:Q', title='Average Score (%)', scale=alt.Scale(domain=[0, 100])),
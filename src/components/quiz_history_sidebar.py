@@ -1,7 +1,10 @@
 import streamlit as st
-from src.models.simple_session import SimpleSessionManager
+from src.models.repository import get_repository
 import urllib.parse
 
+# Sessions fetched per "Load more"
+HISTORY_PAGE_SIZE = 15
+
 def show_quiz_history_right_sidebar():
     """Display quiz history in a collapsible right sidebar"""
     if 'user' not in st.session_state or not st.session_state.user:
@@ -13,10 +16,80 @@ def show_quiz_history_right_sidebar():
     
     return st.session_state.get('show_history', False)
 
+def reset_history():
+    """Forget the loaded history pages, e.g. after a quiz was saved"""
+    st.session_state.pop('history', None)
+    st.session_state.pop('history_search_results', None)
+
+def _loaded_history(user_id: int) -> dict:
+    """History pages loaded so far, kept in session state so reruns don't re-read them"""
+    history = st.session_state.get('history')
+    if not history or history['user_id'] != user_id:
+        sessions, cursor = get_repository().get_session_page(user_id, HISTORY_PAGE_SIZE)
+        # A copy: later pages are appended to it, and the repository's result may be cached
+        history = {'user_id': user_id, 'sessions': list(sessions), 'cursor': cursor}
+        st.session_state.history = history
+    return history
+
+def _load_more_history(history: dict):
+    sessions, cursor = get_repository().get_session_page(history['user_id'], HISTORY_PAGE_SIZE, history['cursor'])
+    history['sessions'].extend(sessions)
+    history['cursor'] = cursor
+
+def _search_results(user_id: int, search_term: str) -> dict:
+    """Search result pages loaded so far for the current search term"""
+    results = st.session_state.get('history_search_results')
+    if not results or results['user_id'] != user_id or results['term'] != search_term:
+        sessions, has_more = get_repository().search_sessions(user_id, search_term, HISTORY_PAGE_SIZE)
+        results = {'user_id': user_id, 'term': search_term, 'sessions': list(sessions), 'has_more': has_more}
+        st.session_state.history_search_results = results
+    return results
+
+def _load_more_results(results: dict):
+    sessions, has_more = get_repository().search_sessions(
+        results['user_id'], results['term'], HISTORY_PAGE_SIZE, offset=len(results['sessions']))
+    results['sessions'].extend(sessions)
+    results['has_more'] = has_more
+
+def _render_session(session: dict):
+    """One quiz in the history list, with its review button"""
+    # Score indicator
+    score = session.get('score', 0)
+    if score >= 80:
+        score_icon = "🟢"
+    elif score >= 60:
+        score_icon = "🟡" 
+    else:
+        score_icon = "🔴"
+    
+    # Create a container for each quiz
+    with st.container():
+        col1, col2 = st.columns([3, 1])
+        
+        with col1:
+            # Quiz title and info
+            title = session['display_title']
+            if len(title) > 25:
+                title = title[:25] + "..."
+            
+            st.markdown(f"**{score_icon} {title}**")
+            st.caption(f"{score:.0f}% • {session['difficulty']} • {session['num_questions']}Q • {session['short_date']}")
+            if session.get('match', '').strip():
+                st.caption(session['match'])
+        
+        with col2:
+            if st.button("👁️", key=f"view_{session['id']}", help="Review quiz"):
+                st.session_state.viewing_quiz_id = session['id']
+                st.session_state.view_mode = 'revision'
+                st.rerun()
+        
+        st.markdown("---")
+
 def render_history_content():
     """Render the actual history content"""
-    session_manager = SimpleSessionManager()
-    user_sessions = session_manager.get_user_sessions(st.session_state.user['id'], 15)
+    user_id = st.session_state.user['id']
+    history = _loaded_history(user_id)
+    user_sessions = history['sessions']
     
     st.markdown("### 📚 Quiz History")
     
@@ -24,22 +97,22 @@ def render_history_content():
         st.write("No previous quizzes")
         return
     
-    # Search/filter functionality
-    search_term = st.text_input("🔍 Search quizzes...", placeholder="Search by topic or date", key="history_search")
-    
-    # Filter sessions based on search
-    if search_term:
-        filtered_sessions = [
-            session for session in user_sessions 
-            if search_term.lower() in session['display_title'].lower() or 
-               search_term.lower() in session['created_at'].lower()
-        ]
-    else:
-        filtered_sessions = user_sessions
+    # Search across the whole history (topics, dates and question text), best match first
+    search_term = st.text_input("🔍 Search quizzes...", placeholder="Search by topic, question or date", key="history_search")
+    if search_term.strip():
+        results = _search_results(user_id, search_term.strip())
+        if not results['sessions']:
+            st.write("No matching quizzes")
+        for session in results['sessions']:
+            _render_session(session)
+        if results['has_more']:
+            st.button("Load more", key="history_search_more", on_click=_load_more_results, args=(results,),
+                      use_container_width=True)
+        return
     
     # Group by date
     grouped_sessions = {}
-    for session in filtered_sessions:
+    for session in user_sessions:
         date_key = session['short_date'] if session['short_date'] else "Unknown"
         if date_key not in grouped_sessions:
             grouped_sessions[date_key] = []
@@ -51,40 +124,16 @@ def render_history_content():
             st.markdown(f"**{date}**")
         
         for session in sessions:
-            # Score indicator
-            score = session.get('score', 0)
-            if score >= 80:
-                score_icon = "🟢"
-            elif score >= 60:
-                score_icon = "🟡" 
-            else:
-                score_icon = "🔴"
-            
-            # Create a container for each quiz
-            with st.container():
-                col1, col2 = st.columns([3, 1])
-                
-                with col1:
-                    # Quiz title and info
-                    title = session['display_title']
-                    if len(title) > 25:
-                        title = title[:25] + "..."
-                    
-                    st.markdown(f"**{score_icon} {title}**")
-                    st.caption(f"{score:.0f}% • {session['difficulty']} • {session['num_questions']}Q")
-                
-                with col2:
-                    if st.button("👁️", key=f"view_{session['id']}", help="Review quiz"):
-                        st.session_state.viewing_quiz_id = session['id']
-                        st.session_state.view_mode = 'revision'
-                        st.rerun()
-                
-                st.markdown("---")
+            _render_session(session)
+    
+    if history['cursor'] is not None:
+        st.button("Load more", key="history_load_more", on_click=_load_more_history, args=(history,),
+                  use_container_width=True)
 
 def show_revision_view(session_id: int):
     """Display quiz in read-only revision mode with backward compatibility"""
-    session_manager = SimpleSessionManager()
-    session_data = session_manager.get_complete_session(session_id)
+    repository = get_repository()
+    session_data = repository.get_complete_session(session_id)
     
     if not session_data:
         st.error("Quiz session not found!")
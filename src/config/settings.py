@@ -20,5 +20,67 @@ class Settings():
 
     MAX_RETRIES = 3
 
+    # Embedding model for the personalized prep vector stores. Each store records the
+    # model it was built with; changing this needs `manage_vector_store.py reindex --all`.
+    EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+    EMBEDDING_MODEL_REVISION = os.getenv("EMBEDDING_MODEL_REVISION", "main")
+
+    # "torch" (sentence-transformers), "onnx" or "onnx-int8" (needs `python -m src.models.embeddings export`)
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+    ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+    ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "1"))
+
+    # Opt-in: writes from all sessions of a process go through one writer thread per database
+    # that group-commits up to WRITE_BATCH_MAX of them. Off, each session commits its own
+    # writes on a pooled connection, which benchmarks/sqlite_concurrency.py measured as
+    # faster; measure there before turning it on. Writes arriving during a commit form the
+    # next batch, so a write waits at most for one commit in flight plus its own; a non-zero
+    # WRITE_BATCH_LATENCY_MS additionally holds a batch open that long to let it fill.
+    # WRITE_JOURNAL_FSYNC also survives OS crashes, at one fsync per write.
+    WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "false").lower() == "true"
+    WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "64"))
+    WRITE_BATCH_LATENCY_MS = float(os.getenv("WRITE_BATCH_LATENCY_MS", "0"))
+    WRITE_JOURNAL_FSYNC = os.getenv("WRITE_JOURNAL_FSYNC", "false").lower() == "true"
+
+    # Compression of stored quiz payloads: "zstd" (falls back to zlib without zstandard) or "zlib"
+    PAYLOAD_COMPRESSION = os.getenv("PAYLOAD_COMPRESSION", "zstd")
+
+    # Where users and quiz history live: "sqlite" (a local studyai.db per process / pod) or
+    # "postgres" (DATABASE_URL, shared by every replica; needs psycopg[binary,pool])
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+    DATABASE_URL = os.getenv("DATABASE_URL", "")
+    PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+    PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+
+    # SQLite only: spread per-user history over this many files by user id, each with its
+    # own write lock and writer thread (1 = everything in studyai.db). Changing it on a
+    # database with history needs `python -m src.models.shards reshard --shards N` first.
+    SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+
+    # question_log rows older than this many days (from the start of that month) are moved
+    # to Parquet files by `python -m src.models.archive run`; ARCHIVE_DIR defaults to
+    # "<db name>-archive" next to the database
+    ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "180"))
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+
+    # Online backups (`python -m src.models.backup run`) go to BACKUP_DIR, by default
+    # "<db name>-backups" next to the database; point it at a mounted volume in production.
+    # The database is copied BACKUP_STEP_PAGES pages at a time with a BACKUP_STEP_SLEEP_MS
+    # pause in between, and the latest BACKUP_KEEP backups are kept.
+    BACKUP_DIR = os.getenv("BACKUP_DIR", "")
+    BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+    BACKUP_STEP_SLEEP_MS = int(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))
+    BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
+
+    # Per-user reads (dashboard, history, recommendations) are cached in the process for up
+    # to READ_CACHE_USERS users (0 disables it) until the user's data changes. Writes made
+    # by other processes or replicas are noticed within READ_CACHE_RECHECK_SECONDS.
+    READ_CACHE_USERS = int(os.getenv("READ_CACHE_USERS", "1000"))
+    READ_CACHE_RECHECK_SECONDS = float(os.getenv("READ_CACHE_RECHECK_SECONDS", "10"))
+
+    # Questions in a "Review due questions" quiz, taken from the user's logged questions as
+    # they fall due (spaced repetition, src/models/review.py)
+    REVIEW_QUIZ_QUESTIONS = int(os.getenv("REVIEW_QUIZ_QUESTIONS", "10"))
+
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""
+Hot/cold tiering of question_log.
+
+Rows older than ARCHIVE_HORIZON_DAYS, counted from the start of that month, move out of
+SQLite into Parquet files. question_log and its index then only hold recent answers
+and stay in the page cache:
+
+    <archive dir>/question_log/month=2024-05/shard=0/part-000000001234-000000051233.parquet
+
+Each file holds one batch of one shard's rows of one month, sorted by user, with the
+question text resolved from question_bank. A batch moves in two steps:
+- its files are written;
+- one transaction deletes its rows and adds them to archived_question_stats.
+A rerun after a crash rewrites the same files, so no row is archived twice.
+
+Dashboards and weak-topic analysis never read the files. question_stats_daily keeps the
+totals of archived days, and the rollups leave those days alone on rebuilds. Readers
+that need the archived rows themselves read both tiers as one history, e.g.
+QuestionLogger.get_recent_questions and get_question_history.
+
+    python -m src.models.archive run [--db studyai.db] [--horizon-days 180] [--batch-size 50000] [--vacuum]
+    python -m src.models.archive status [--db studyai.db]
+"""
+import os
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+from src.config.settings import settings
+from src.models.database import DEFAULT_DB_PATH
+from src.models.rollups import archived_before, raise_archive_watermark
+from src.models.session_storage import legacy_log_question
+from src.models.shards import get_router
+
+# Columns of an archived row, also the keys of the dicts the readers return
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('user_id', pa.int64()),
+    ('session_id', pa.int64()),
+    ('topic', pa.string()),
+    ('sub_topic', pa.string()),
+    ('difficulty', pa.string()),
+    ('question_type', pa.string()),
+    ('question_text', pa.string()),
+    ('options', pa.list_(pa.string())),
+    ('correct_answer', pa.string()),
+    ('explanation', pa.string()),
+    ('user_answer', pa.string()),
+    ('is_correct', pa.bool_()),
+    ('time_taken', pa.int32()),
+    ('created_at', pa.string()),  # UTC 'YYYY-MM-DD HH:MM:SS', as in question_log
+]) if pa else None
+
+# question_log joined with the bank, as logged_question() expects it
+LOGGED_QUESTION_SQL = '''
+    SELECT l.id, l.user_id, l.session_id, l.topic, l.sub_topic, l.difficulty, l.question_type,
+           l.question_text, l.options, l.correct_answer, l.explanation, l.user_answer,
+           l.is_correct, l.time_taken, l.created_at, b.body
+    FROM question_log l LEFT JOIN question_bank b ON b.id = l.question_id
+'''
+
+
+def archive_dir(db_path: str = DEFAULT_DB_PATH) -> str:
+    if settings.ARCHIVE_DIR:
+        return settings.ARCHIVE_DIR
+    return os.path.splitext(db_path)[0] + "-archive"
+
+
+@contextmanager
+def archive_lock(directory: str):
+    """
+    Exclusive cross-process lock on an archive directory, held by each archive batch from
+    writing its files to deleting its rows, and by backups while they copy the archive.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows dev machines: single process, nothing to coordinate
+        yield
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(directory)), exist_ok=True)
+    with open(os.path.abspath(directory) + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def archive_cutoff(horizon_days: int, now: Optional[datetime] = None) -> str:
+    """Start of the month ``horizon_days`` ago (UTC); rows created before it get archived."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    start = (now - timedelta(days=horizon_days)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return start.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def logged_question(row) -> Dict:
+    """A question_log row (from LOGGED_QUESTION_SQL) with its question resolved."""
+    question = json.loads(row['body']) if row['body'] else legacy_log_question(row)
+    return {
+        'id': row['id'],
+        'user_id': row['user_id'],
+        'session_id': row['session_id'],
+        'topic': row['topic'] or '',
+        'sub_topic': row['sub_topic'] or '',
+        'difficulty': row['difficulty'] or '',
+        'question_type': row['question_type'] or '',
+        'question_text': question.get('question', ''),
+        'options': [str(option) for option in question.get('options') or []],
+        'correct_answer': str(question.get('correct_answer', '')),
+        'explanation': question.get('explanation', ''),
+        'user_answer': '' if row['user_answer'] is None else str(row['user_answer']),
+        'is_correct': bool(row['is_correct']),
+        'time_taken': int(row['time_taken'] or 0),
+        'created_at': row['created_at'],
+    }
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("The question_log archive needs pyarrow (pip install pyarrow)")
+
+
+def _write_part(directory: str, entries: List[Dict]):
+    """
+    Write one month's rows of a batch, replacing files a crashed run left for the same
+    rows (their id ranges overlap, which committed batches of one month never do).
+    """
+    first, last = entries[0]['id'], entries[-1]['id']
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith('part-') and name.endswith('.parquet'):
+            low, high = (int(part) for part in name[5:-8].split('-'))
+            if low <= last and first <= high:
+                os.remove(os.path.join(directory, name))
+
+    entries = sorted(entries, key=lambda e: (e['user_id'], e['created_at'], e['id']))
+    table = pa.Table.from_pylist(entries, schema=SCHEMA)
+    name = f'part-{first:012d}-{last:012d}.parquet'
+    # Dot files are skipped by dataset discovery, so a half-written file is never read
+    temporary = os.path.join(directory, f'.{name}.tmp')
+    with open(temporary, 'wb') as f:
+        pq.write_table(table, f, compression='zstd')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, os.path.join(directory, name))
+
+
+def _archive_shard(db, index: int, directory: str, cutoff: str, batch_size: int) -> int:
+    # Raised first, so a rebuild running meanwhile already keeps the days being archived
+    with db.transaction() as conn:
+        raise_archive_watermark(conn, cutoff)
+
+    archived, after = 0, 0
+    while True:
+        with db.connection() as conn:
+            rows = conn.execute(LOGGED_QUESTION_SQL + '''
+                WHERE l.id > ? AND l.created_at < ?
+                ORDER BY l.id
+                LIMIT ?
+            ''', [after, cutoff, batch_size]).fetchall()
+        if not rows:
+            return archived
+
+        entries = [logged_question(row) for row in rows]
+        months: Dict[str, List[Dict]] = {}
+        for entry in entries:
+            months.setdefault(entry['created_at'][:7], []).append(entry)
+        totals: Dict[int, List[int]] = {}
+        for entry in entries:
+            total = totals.setdefault(entry['user_id'], [0, 0, 0])
+            total[0] += 1
+            total[1] += entry['is_correct']
+            total[2] += entry['time_taken']
+
+        # A backup never sees a batch's files without its rows deleted, or the reverse
+        with archive_lock(directory):
+            for month, month_entries in months.items():
+                _write_part(os.path.join(directory, 'question_log', f'month={month}', f'shard={index}'), month_entries)
+            with db.transaction() as conn:
+                conn.executemany('DELETE FROM question_log WHERE id = ?', [(entry['id'],) for entry in entries])
+                conn.executemany('''
+                    INSERT INTO archived_question_stats (user_id, questions, correct, time_sum) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        questions = questions + excluded.questions, correct = correct + excluded.correct,
+                        time_sum = time_sum + excluded.time_sum
+                ''', [(user_id, *total) for user_id, total in totals.items() if user_id is not None])
+
+        archived += len(entries)
+        after = entries[-1]['id']
+
+
+def archive_question_log(db_path: str = DEFAULT_DB_PATH, horizon_days: Optional[int] = None,
+                         batch_size: int = 50000) -> Dict[str, int]:
+    """
+    Move question_log rows older than the horizon of every shard to the archive. Safe to
+    run while the app is serving: each batch commits in one short write transaction.
+    """
+    _require_pyarrow()
+    horizon_days = settings.ARCHIVE_HORIZON_DAYS if horizon_days is None else horizon_days
+    cutoff = archive_cutoff(horizon_days)
+    directory = archive_dir(db_path)
+
+    counts = {'cutoff': cutoff, 'rows': 0}
+    for index, db in enumerate(get_router(db_path).shards):
+        counts['rows'] += _archive_shard(db, index, directory, cutoff, batch_size)
+    return counts
+
+
+def iter_archived_questions(db_path: str, user_id: int, since: Optional[str] = None,
+                            newest_first: bool = False) -> Iterator[List[Dict]]:
+    """
+    A user's archived question_log rows (created at or after ``since``), one month at a
+    time, oldest first or newest first.
+    """
+    root = os.path.join(archive_dir(db_path), 'question_log')
+    if not os.path.isdir(root):
+        return
+    _require_pyarrow()
+
+    months = sorted((name for name in os.listdir(root) if name.startswith('month=')), reverse=newest_first)
+    if since:
+        months = [name for name in months if name[6:] >= since[:7]]
+
+    for month in months:
+        condition = ds.field('user_id') == int(user_id)
+        if since:
+            condition &= ds.field('created_at') >= since
+        # Every shard partition of the month is read: a user's rows may have been archived
+        # from a shard they no longer live on after a reshard
+        table = ds.dataset(os.path.join(root, month), format='parquet', schema=SCHEMA).to_table(filter=condition)
+        rows = sorted(table.to_pylist(), key=lambda r: (r['created_at'], r['id']), reverse=newest_first)
+        if rows:
+            yield rows
+
+
+def archived_questions(db_path: str, user_id: int, since: Optional[str] = None,
+                       newest_first: bool = False, limit: Optional[int] = None) -> List[Dict]:
+    """
+    A user's archived question_log rows (created at or after ``since``), oldest first or
+    newest first, reading month by month until ``limit`` rows are found.
+    """
+    found = []
+    for rows in iter_archived_questions(db_path, user_id, since, newest_first):
+        found.extend(rows)
+        if limit is not None and len(found) >= limit:
+            return found[:limit]
+    return found
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move old question_log rows to Parquet files.")
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--horizon-days", type=int, default=None, help="Defaults to ARCHIVE_HORIZON_DAYS")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--vacuum", action="store_true", help="Rebuild the files afterwards to return freed pages to the OS")
+    args = parser.parse_args()
+
+    router = get_router(args.db)
+    if args.command == "run":
+        counts = archive_question_log(args.db, args.horizon_days, args.batch_size)
+        print(f"Archived {counts['rows']} question_log rows created before {counts['cutoff']} to {archive_dir(args.db)}")
+        if args.vacuum:
+            for db in router.shards:
+                with db.connection() as conn:
+                    conn.execute('VACUUM')
+            print("Vacuumed")
+    else:
+        for db in router.shards:
+            with db.connection() as conn:
+                before = archived_before(conn) or "nothing archived"
+                hot = conn.execute('SELECT COUNT(*) FROM question_log').fetchone()[0]
+                cold = conn.execute('SELECT COALESCE(SUM(questions), 0) FROM archived_question_stats').fetchone()[0]
+            print(f"{db.db_path}: {hot} hot rows, {cold} archived (before {before})")
@@ -1,48 +1,18 @@
 import streamlit as st
-import sqlite3
 import hashlib
 from typing import Optional, Dict
 import jwt
 from datetime import datetime, timedelta, timezone
 from src.config.settings import settings
+from src.models.database import DEFAULT_DB_PATH
+from src.models.repository import get_repository
+
 
 class AuthManager:
-    def __init__(self, db_path: str = "studyai.db"):
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
         self.db_path = db_path
-        self.init_database()
-
-    def _add_column_safe(self, cursor, column_name: str, column_type: str):
-        """Safely add a column to the users table if it doesn't exist."""
-        try:
-            cursor.execute(f'ALTER TABLE users ADD COLUMN {column_name} {column_type}')
-        except sqlite3.OperationalError as e:
-            if f"duplicate column name: {column_name}" not in str(e):
-                raise e # Re-raise error if it's not about a duplicate column
+        self.repository = get_repository(db_path)
 
-    def init_database(self):
-        """Initialize the database and add new columns safely."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP,
-                total_quizzes INTEGER DEFAULT 0,
-                total_score REAL DEFAULT 0.0
-            )
-        ''')
-        
-        # Safely add the new column for the SaaS feature
-        self._add_column_safe(cursor, "has_used_rag_trial", "BOOLEAN DEFAULT 0")
-        
-        conn.commit()
-        conn.close()
-    
     def _generate_jwt_token(self, user_id: int) -> str:
         """Generate JWT token"""
         payload = {
@@ -71,15 +41,8 @@ class AuthManager:
     def register_user(self, username: str, email: str, password: str) -> bool:
         """Register a new user"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
             password_hash = self.hash_password(password)
-            cursor.execute(
-                "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
-                (username, email, password_hash)
-            )
-            conn.commit()
-            conn.close()
+            self.repository.create_user(username, email, password_hash)
             return True
         except Exception as e:
             print(f"Registration error: {e}")
@@ -88,16 +51,7 @@ class AuthManager:
     def login_user(self, username: str, password: str) -> Optional[Dict]:
         """Login user and return user data including RAG trial status."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT id, username, email, password_hash, has_used_rag_trial FROM users WHERE username = ?",
-                (username,)
-            )
-            
-            user_row = cursor.fetchone()
+            user_row = self.repository.find_user(username)
             
             if user_row and self.verify_password(password, user_row['password_hash']):
                 user_id = user_row['id']
@@ -109,10 +63,8 @@ class AuthManager:
                     'has_used_rag_trial': user_row['has_used_rag_trial'],
                     'token': token
                 }
-                conn.close()
                 return user_data
             
-            conn.close()
             return None
             
         except Exception as e:
@@ -122,11 +74,7 @@ class AuthManager:
     def mark_rag_trial_as_used(self, user_id: int):
         """Update the database to mark the user's RAG trial as used."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET has_used_rag_trial = 1 WHERE id = ?", (user_id,))
-            conn.commit()
-            conn.close()
+            self.repository.mark_rag_trial_used(user_id)
             return True
         except Exception as e:
             print(f"Error updating RAG trial status: {e}")
@@ -0,0 +1,424 @@
+"""
+Online backups of studyai.db (every shard), the question_log archive and the vector
+stores, taken while the app keeps serving.
+
+- Each database file is copied with SQLite's online backup API, BACKUP_STEP_PAGES pages
+  per step with a BACKUP_STEP_SLEEP_MS pause in between (the copy's chunks are stored
+  with the same pause), from a read transaction opened before the first step. In WAL mode that snapshot blocks no writer, and because it stays
+  open the copy is not restarted by the writes committed meanwhile.
+- The shards' snapshots are opened together, the main database last, so the users of
+  every copied session are in the copied main database. The archive is copied under its
+  lock at that moment, so no row is both in a copied part file and in a copied question_log.
+- Each vector store is copied under its own lock: its manifest, the committed part of
+  vectors.f32 and docs.sqlite.
+
+Backups are incremental. Every file is split into 1 MiB chunks stored once by content
+hash, so a backup only writes the chunks that changed since the previous one: a SQLite
+copy keeps unchanged pages at the same offsets, and vector files only grow. A backup is a
+manifest of its files' chunks written last, so an interrupted backup leaves only
+unreferenced chunks behind, which the next prune removes.
+
+    <backup dir>/chunks/3f/3fa2...              file contents by sha256
+    <backup dir>/backups/20261019T031500123Z.json
+
+    python -m src.models.backup run [--db studyai.db] [--vector-store vector_store] [--keep 14]
+    python -m src.models.backup list
+    python -m src.models.backup prune [--keep 14]
+    python -m src.models.backup restore NAME [--to-db studyai.db] [--to-vector-store vector_store] [--force]
+"""
+import os
+import glob
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from src.config.settings import settings
+from src.models.archive import archive_dir, archive_lock
+from src.models.database import DEFAULT_DB_PATH, PRAGMAS
+from src.models.shards import shard_path
+from src.models.vector_store import (DOCS_FILE, MANIFEST_FILE, NATIVE_STORE_DIR, VECTOR_STORE_PATH, VECTORS_FILE,
+                                     MmapVectorStore, store_lock)
+
+CHUNK_SIZE = 1 << 20
+
+FORMAT_VERSION = 1
+
+
+def backup_dir(db_path: str = DEFAULT_DB_PATH) -> str:
+    if settings.BACKUP_DIR:
+        return settings.BACKUP_DIR
+    return os.path.splitext(db_path)[0] + "-backups"
+
+
+@contextmanager
+def _backup_lock(directory: str):
+    """One backup or prune at a time per backup directory."""
+    try:
+        import fcntl
+    except ImportError:  # Windows dev machines: single process, nothing to coordinate
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _write_atomic(path: str, data: bytes):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def _chunk_path(directory: str, digest: str) -> str:
+    return os.path.join(directory, 'chunks', digest[:2], digest)
+
+
+def _open_snapshot(path: str) -> sqlite3.Connection:
+    """A connection holding a read transaction on ``path``, i.e. a fixed snapshot of it."""
+    conn = sqlite3.connect(path, isolation_level=None, timeout=PRAGMAS['busy_timeout'] / 1000)
+    conn.execute('BEGIN')
+    conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    return conn
+
+
+class _BackupWriter:
+    """Stores the chunks of one backup's files and records them for its manifest."""
+
+    def __init__(self, directory: str, sleep_ms: int = 0):
+        self.directory = directory
+        self.sleep_ms = sleep_ms
+        self.files: Dict[str, Dict] = {}
+        self.bytes = 0
+        self.new_bytes = 0
+
+    def _put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = _chunk_path(self.directory, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, data)
+            self.new_bytes += len(data)
+        self.bytes += len(data)
+        return digest
+
+    def add_bytes(self, name: str, data: bytes):
+        self.files[name] = {
+            'size': len(data),
+            'chunks': [self._put(data[start:start + CHUNK_SIZE]) for start in range(0, len(data), CHUNK_SIZE)],
+        }
+
+    def add_file(self, name: str, path: str, size: Optional[int] = None):
+        """The first ``size`` bytes of a file (all of it by default)."""
+        chunks = []
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size if size is None else size
+            remaining = size
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise RuntimeError(f"{path} is shorter than the {size} bytes expected")
+                chunks.append(self._put(data))
+                remaining -= len(data)
+                # Paced like the copy: about one page step of data per pause
+                if self.sleep_ms:
+                    time.sleep(self.sleep_ms / 1000)
+        self.files[name] = {'size': size, 'chunks': chunks}
+
+    def add_database(self, name: str, source: sqlite3.Connection, pages: int, keep_ids_below=None):
+        """
+        A copy of ``source`` made with the online backup API. ``keep_ids_below`` drops
+        uncommitted documents from a vector store's docstore copy.
+        """
+        temporary = os.path.join(self.directory, '.copy.sqlite')
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        target = sqlite3.connect(temporary, isolation_level=None)
+        try:
+            source.backup(target, pages=pages, sleep=self.sleep_ms / 1000)
+            if keep_ids_below is not None:
+                target.execute('DELETE FROM documents WHERE id >= ?', [keep_ids_below])
+        finally:
+            target.close()
+        try:
+            self.add_file(name, temporary)
+        finally:
+            os.remove(temporary)
+
+
+def _shard_count(db_path: str) -> int:
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=PRAGMAS['busy_timeout'] / 1000)
+    try:
+        return conn.execute('SELECT shard_count FROM shard_layout WHERE id = 1').fetchone()[0]
+    except sqlite3.OperationalError:  # not migrated to shard layouts yet: one file
+        return 1
+    finally:
+        conn.close()
+
+
+def _add_archive(writer: _BackupWriter, directory: str):
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.join(root, name)
+                writer.add_file('archive/' + os.path.relpath(path, directory).replace(os.sep, '/'), path)
+
+
+def _add_vector_stores(writer: _BackupWriter, vector_root: str, pages: int):
+    for user_dir in sorted(glob.glob(os.path.join(vector_root, '*'))):
+        path = os.path.join(user_dir, NATIVE_STORE_DIR)
+        if not MmapVectorStore.exists(path):
+            continue
+        prefix = f"vector_store/{os.path.basename(user_dir)}/{NATIVE_STORE_DIR}/"
+        with store_lock(path):
+            with open(os.path.join(path, MANIFEST_FILE), 'rb') as f:
+                manifest_bytes = f.read()
+            manifest = json.loads(manifest_bytes)
+            count, dim = int(manifest.get('count', 0)), int(manifest.get('dim', 0))
+            writer.add_bytes(prefix + MANIFEST_FILE, manifest_bytes)
+            if count:
+                # Only the committed vectors; anything past them is an interrupted append
+                writer.add_file(prefix + VECTORS_FILE, os.path.join(path, VECTORS_FILE), size=count * dim * 4)
+            if os.path.exists(os.path.join(path, DOCS_FILE)):
+                source = _open_snapshot(os.path.join(path, DOCS_FILE))
+                try:
+                    writer.add_database(prefix + DOCS_FILE, source, pages, keep_ids_below=count)
+                finally:
+                    source.close()
+
+
+def create_backup(db_path: str = DEFAULT_DB_PATH, vector_root: str = VECTOR_STORE_PATH,
+                  directory: Optional[str] = None, pages: Optional[int] = None,
+                  sleep_ms: Optional[int] = None) -> Dict:
+    """
+    Back up the database, its archive and the vector stores under ``vector_root``; returns
+    the backup's name, file count, size and the bytes it added to the backup directory.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"No database at {db_path}")
+    directory = directory or backup_dir(db_path)
+    pages = settings.BACKUP_STEP_PAGES if pages is None else pages
+    sleep_ms = settings.BACKUP_STEP_SLEEP_MS if sleep_ms is None else sleep_ms
+
+    now = datetime.now(timezone.utc)
+    name = f"{now:%Y%m%dT%H%M%S}{now.microsecond // 1000:03d}Z"
+    with _backup_lock(directory):
+        writer = _BackupWriter(directory, sleep_ms)
+        snapshots = []
+        try:
+            with archive_lock(archive_dir(db_path)):
+                # Shards first, the main database last: users are only ever added to it,
+                # so every session in a shard copy has its user in the main copy
+                for index in reversed(range(_shard_count(db_path))):
+                    snapshots.append((index, _open_snapshot(shard_path(db_path, index))))
+                _add_archive(writer, archive_dir(db_path))
+            # The archive may move on now; the snapshots stay where it was
+            for index, source in reversed(snapshots):
+                writer.add_database(f'db/shard={index}', source, pages)
+        finally:
+            for _, source in snapshots:
+                source.close()
+        _add_vector_stores(writer, vector_root, pages)
+
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'name': name,
+            'created_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'files': writer.files,
+        }
+        os.makedirs(os.path.join(directory, 'backups'), exist_ok=True)
+        _write_atomic(os.path.join(directory, 'backups', f'{name}.json'), json.dumps(manifest).encode())
+    return {'name': name, 'files': len(writer.files), 'bytes': writer.bytes, 'new_bytes': writer.new_bytes}
+
+
+def _backup_names(directory: str) -> List[str]:
+    path = os.path.join(directory, 'backups')
+    if not os.path.isdir(path):
+        return []
+    return sorted(name[:-5] for name in os.listdir(path) if name.endswith('.json'))
+
+
+def _read_manifest(directory: str, name: str) -> Dict:
+    with open(os.path.join(directory, 'backups', f'{name}.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_backups(directory: str) -> List[Dict]:
+    """Name, creation time, file count and size of every backup, oldest first."""
+    backups = []
+    for name in _backup_names(directory):
+        manifest = _read_manifest(directory, name)
+        backups.append({
+            'name': name,
+            'created_at': manifest['created_at'],
+            'files': len(manifest['files']),
+            'bytes': sum(entry['size'] for entry in manifest['files'].values()),
+        })
+    return backups
+
+
+def prune_backups(directory: str, keep: Optional[int] = None) -> Dict[str, int]:
+    """Delete all but the latest ``keep`` backups and the chunks no remaining backup uses."""
+    keep = settings.BACKUP_KEEP if keep is None else keep
+    if keep < 1:
+        raise ValueError("At least one backup has to be kept")
+
+    with _backup_lock(directory):
+        names = _backup_names(directory)
+        removed = names[:-keep]
+        for name in removed:
+            os.remove(os.path.join(directory, 'backups', f'{name}.json'))
+
+        used = {digest for name in names[-keep:]
+                for entry in _read_manifest(directory, name)['files'].values() for digest in entry['chunks']}
+        chunks, freed = 0, 0
+        for path in glob.glob(os.path.join(directory, 'chunks', '*', '*')):
+            if os.path.basename(path) not in used:
+                freed += os.path.getsize(path)
+                os.remove(path)
+                chunks += 1
+    return {'backups': len(removed), 'chunks': chunks, 'bytes': freed}
+
+
+def _restore_file(directory: str, entry: Dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as out:
+        for digest in entry['chunks']:
+            with open(_chunk_path(directory, digest), 'rb') as f:
+                data = f.read()
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise RuntimeError(f"Backup chunk {digest} is corrupt")
+            out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    if os.path.getsize(path) != entry['size']:
+        raise RuntimeError(f"Restored {path} has {os.path.getsize(path)} bytes, expected {entry['size']}")
+
+
+def _fresh_directory(path: str) -> str:
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def _move_aside(path: str):
+    if os.path.lexists(path):
+        aside = path + '.pre-restore'
+        if os.path.isdir(aside):
+            shutil.rmtree(aside)
+        elif os.path.lexists(aside):
+            os.remove(aside)
+        os.replace(path, aside)
+
+
+def restore_backup(name: str, db_path: str = DEFAULT_DB_PATH, vector_root: str = VECTOR_STORE_PATH,
+                   directory: Optional[str] = None, force: bool = False) -> Dict[str, int]:
+    """
+    Restore a backup to ``db_path`` (with its shards and archive) and ``vector_root``. The
+    app must be stopped. Everything is rebuilt and checked next to its target first; with
+    ``force`` whatever is in the way is then kept as "<path>.pre-restore".
+    """
+    directory = directory or backup_dir(db_path)
+    manifest = _read_manifest(directory, name)
+    db_files = {name: int(name.split('=')[1]) for name in manifest['files'] if name.startswith('db/shard=')}
+    archive_root = archive_dir(db_path)
+
+    root, ext = os.path.splitext(db_path)
+    in_the_way = [path for path in [db_path, *glob.glob(f"{glob.escape(root)}.shard*{ext or '.db'}")]
+                  for path in (path, path + '-wal', path + '-shm', path + '-writes.journal')
+                  if os.path.lexists(path)]
+    in_the_way += [path for path in (archive_root, vector_root) if os.path.lexists(path)]
+    if in_the_way and not force:
+        raise RuntimeError(f"{', '.join(in_the_way)} already exist(s); stop the app and restore with force "
+                           f"(--force) to replace them")
+
+    staged = {}
+    try:
+        for file_name, entry in manifest['files'].items():
+            if file_name in db_files:
+                target = shard_path(db_path, db_files[file_name])
+                staged[target] = target + '.restoring'
+                _restore_file(directory, entry, staged[target])
+            else:
+                prefix, rest = file_name.split('/', 1)
+                target = {'archive': archive_root, 'vector_store': vector_root}[prefix]
+                if target not in staged:
+                    staged[target] = _fresh_directory(target + '.restoring')
+                _restore_file(directory, entry, os.path.join(staged[target], rest))
+
+        for target, path in staged.items():
+            if target == vector_root:
+                for store in glob.glob(os.path.join(path, '*', NATIVE_STORE_DIR)):
+                    problems = MmapVectorStore(store).check_integrity()
+                    if problems:
+                        raise RuntimeError(f"Restored vector store {store} is damaged: {'; '.join(problems)}")
+            elif target != archive_root:
+                conn = sqlite3.connect(path)
+                try:
+                    result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+                finally:
+                    conn.close()
+                if result != 'ok':
+                    raise RuntimeError(f"Restored database {target} failed its integrity check: {result}")
+    except Exception:
+        for path in staged.values():
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        raise
+
+    for path in in_the_way:
+        _move_aside(path)
+    for target, path in staged.items():
+        os.replace(path, target)
+    return {'databases': len(db_files), 'files': len(manifest['files']), 'replaced': len(in_the_way)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Online backups of the database, its archive and the vector stores.")
+    parser.add_argument("command", choices=["run", "list", "prune", "restore"])
+    parser.add_argument("name", nargs="?", help="Backup to restore (see `list`)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--vector-store", default=VECTOR_STORE_PATH)
+    parser.add_argument("--keep", type=int, default=None, help="Backups kept by run / prune; defaults to BACKUP_KEEP")
+    parser.add_argument("--to-db", help="Restore to this database instead of --db")
+    parser.add_argument("--to-vector-store", help="Restore to this directory instead of --vector-store")
+    parser.add_argument("--force", action="store_true", help="Replace existing files (kept as *.pre-restore)")
+    args = parser.parse_args()
+
+    directory = backup_dir(args.db)
+    if args.command == "run":
+        result = create_backup(args.db, args.vector_store, directory)
+        print(f"Backup {result['name']}: {result['files']} files, {result['bytes'] / 1e6:.1f} MB, "
+              f"{result['new_bytes'] / 1e6:.1f} MB new, in {directory}")
+        pruned = prune_backups(directory, args.keep)
+        if pruned['backups']:
+            print(f"Pruned {pruned['backups']} old backup(s), freeing {pruned['bytes'] / 1e6:.1f} MB")
+    elif args.command == "list":
+        for backup in list_backups(directory):
+            print(f"{backup['name']}  {backup['created_at']}  {backup['files']} files  {backup['bytes'] / 1e6:.1f} MB")
+    elif args.command == "prune":
+        pruned = prune_backups(directory, args.keep)
+        print(f"Pruned {pruned['backups']} backup(s) and {pruned['chunks']} chunks, freeing {pruned['bytes'] / 1e6:.1f} MB")
+    else:
+        if not args.name:
+            parser.error("restore needs the name of a backup")
+        result = restore_backup(args.name, args.to_db or args.db, args.to_vector_store or args.vector_store,
+                                directory, args.force)
+        print(f"Restored {args.name}: {result['databases']} database file(s), {result['files']} files in all")
@@ -0,0 +1,247 @@
+"""
+Item difficulty and user ability, calibrated over the whole answer history.
+
+The model is a Rasch (1PL IRT) one: a user with ability ``theta`` on a topic answers a
+question of that topic at a difficulty label with item difficulty ``beta`` right with
+probability sigmoid(theta - beta). Items are (topic, difficulty label) pairs, so
+"Hard" means as hard as Hard DSA questions turned out to be, not what the label says.
+
+    item_calibration  per topic / difficulty label: beta, and the answers it was fitted on
+    user_ability      per user / topic: theta, and the answers it rests on
+
+``fit`` estimates both at once from per (user, topic, difficulty) answer counts:
+alternating Newton steps over NumPy arrays of those counts, with Gaussian priors (beta
+centred on its label's LABEL_PRIOR) so topics with few answers stay near their label.
+The counts come from question_stats_daily, which keeps the days already archived, so
+the fit covers every answer ever logged without reading question_log. Run it from time
+to time (after a reshard too: new shard files start without item parameters):
+
+    python -m src.models.calibration fit [--db studyai.db] [--iterations 50]
+
+Between runs every logged answer moves the user's ability by an Elo step (``elo_step``)
+in the writing transaction; abilities that moved while a fit ran keep those steps rather
+than the fitted theta, and the next fit takes their answers in. Item difficulties only change with ``fit``: they describe
+every user's answers, and updating them from each one would make all submits write the
+same rows. The recommendation engine reads a user's ability and the topic's items
+(``recommended_difficulty``) instead of re-deriving accuracy per difficulty; cached
+reads (src/models/read_cache.py) see a new fit after the user's next answer or UTC day.
+
+    python -m benchmarks.calibration
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.models.database import DEFAULT_DB_PATH
+from src.models.shards import get_router, shard_of
+
+# beta of a topic's difficulty label before it is fitted, and the mean of its prior
+LABEL_PRIOR = {'Easy': -1.0, 'Medium': 0.0, 'Hard': 1.0}
+# Precision of the priors on theta (mean 0) and beta (mean LABEL_PRIOR)
+PRIOR_PRECISION = 1.0
+# Elo step size a / (1 + b * answers): large for new users, settling as answers add up
+ELO_A, ELO_B = 0.8, 0.05
+# Recommend the difficulty whose predicted success rate is closest to this...
+TARGET_SUCCESS = 0.7
+# ...once the user's ability on the topic rests on at least this many answers
+MIN_ANSWERS = 10
+
+COUNT_COLUMNS = ['user_id', 'topic', 'difficulty', 'questions', 'correct']
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def label_prior(difficulty: str) -> float:
+    return LABEL_PRIOR.get(difficulty, 0.0)
+
+
+def elo_step(theta: float, answers: int, beta: float, correct: bool) -> float:
+    """``theta`` after one more answer to an item of difficulty ``beta``"""
+    k = ELO_A / (1.0 + ELO_B * answers)
+    return theta + k * (float(correct) - float(sigmoid(theta - beta)))
+
+
+def fit_arrays(user: np.ndarray, item: np.ndarray, n: np.ndarray, k: np.ndarray, item_prior: np.ndarray,
+               iterations: int = 50, tol: float = 1e-6) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    MAP estimates ``(theta, beta, iterations run)`` from answer counts: row j says that
+    ability ``user[j]`` answered ``n[j]`` questions of item ``item[j]``, ``k[j]`` right.
+    Items have a N(item_prior, 1 / PRIOR_PRECISION) prior, abilities a N(0, ...) one.
+    """
+    n, k = n.astype(np.float64), k.astype(np.float64)
+    theta = np.zeros(int(user.max()) + 1 if len(user) else 0)
+    beta = item_prior.astype(np.float64).copy()
+    for iteration in range(1, iterations + 1):
+        p = sigmoid(theta[user] - beta[item])
+        residual, weight = k - n * p, n * p * (1.0 - p)
+        step_theta = ((np.bincount(user, residual, len(theta)) - PRIOR_PRECISION * theta)
+                      / (np.bincount(user, weight, len(theta)) + PRIOR_PRECISION))
+        theta += step_theta
+
+        p = sigmoid(theta[user] - beta[item])
+        residual, weight = k - n * p, n * p * (1.0 - p)
+        step_beta = ((-np.bincount(item, residual, len(beta)) - PRIOR_PRECISION * (beta - item_prior))
+                     / (np.bincount(item, weight, len(beta)) + PRIOR_PRECISION))
+        beta += step_beta
+        if max(np.abs(step_theta).max(initial=0.0), np.abs(step_beta).max(initial=0.0)) < tol:
+            break
+    return theta, beta, iteration if len(n) else 0
+
+
+def fit(counts: pd.DataFrame, iterations: int = 50) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    ``(abilities, items)`` from a frame of COUNT_COLUMNS: abilities with user_id,
+    topic, theta and answers; items with topic, difficulty, beta and answers.
+    """
+    counts = counts[counts['questions'] > 0]
+    user, abilities = pd.factorize(pd.MultiIndex.from_arrays([counts['user_id'], counts['topic']]))
+    item, items = pd.factorize(pd.MultiIndex.from_arrays([counts['topic'], counts['difficulty']]))
+    item_prior = np.array([label_prior(difficulty) for _, difficulty in items], dtype=np.float64)
+    n, k = counts['questions'].to_numpy(np.float64), counts['correct'].to_numpy(np.float64)
+    theta, beta, _ = fit_arrays(user, item, n, k, item_prior, iterations)
+
+    ability_frame = abilities.to_frame(index=False, name=['user_id', 'topic'])
+    ability_frame['theta'] = theta
+    ability_frame['answers'] = np.bincount(user, n, len(abilities)).astype(np.int64)
+    item_frame = items.to_frame(index=False, name=['topic', 'difficulty'])
+    item_frame['beta'] = beta
+    item_frame['answers'] = np.bincount(item, n, len(items)).astype(np.int64)
+    return ability_frame, item_frame
+
+
+def recommended_difficulty(calibration: Optional[Dict]) -> Optional[str]:
+    """
+    The difficulty label the user is predicted to answer right closest to
+    TARGET_SUCCESS of the time, from ``get_topic_calibration``; None until the ability
+    rests on MIN_ANSWERS answers.
+    """
+    if not calibration or calibration['answers'] < MIN_ANSWERS:
+        return None
+    betas = {label: calibration['items'].get(label, prior) for label, prior in LABEL_PRIOR.items()}
+    return min(betas, key=lambda label: abs(float(sigmoid(calibration['theta'] - betas[label])) - TARGET_SUCCESS))
+
+
+def advance_abilities(abilities: Dict[str, Tuple[float, int]], betas: Dict[Tuple[str, str], float],
+                      entries: List[Dict]) -> Dict[str, Tuple[float, int]]:
+    """``abilities`` (topic -> (theta, answers)) after Elo steps for logged ``entries``; returns the changed ones"""
+    changed = {}
+    for question_data in entries:
+        topic, difficulty = question_data.get('topic') or '', question_data.get('difficulty') or ''
+        theta, answers = abilities.get(topic, (0.0, 0))
+        beta = betas.get((topic, difficulty), label_prior(difficulty))
+        abilities[topic] = changed[topic] = (
+            elo_step(theta, answers, beta, bool(question_data.get('is_correct', False))), answers + 1
+        )
+    return changed
+
+
+# -- SQLite ----------------------------------------------------------------------------
+
+def update_abilities(conn, user_id: int, entries: List[Dict]):
+    """Elo steps for the logged ``entries``; runs inside the writing transaction."""
+    if not entries:
+        return
+    topics = list(dict.fromkeys(question_data.get('topic') or '' for question_data in entries))
+    placeholders = ','.join('?' * len(topics))
+    abilities = {row['topic']: (row['theta'], row['answers']) for row in conn.execute(
+        f'SELECT topic, theta, answers FROM user_ability WHERE user_id = ? AND topic IN ({placeholders})',
+        [user_id, *topics]
+    )}
+    betas = {(row['topic'], row['difficulty']): row['beta'] for row in conn.execute(
+        f'SELECT topic, difficulty, beta FROM item_calibration WHERE topic IN ({placeholders})', topics
+    )}
+    conn.executemany('''
+        INSERT INTO user_ability (user_id, topic, theta, answers) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, topic) DO UPDATE SET theta = excluded.theta, answers = excluded.answers
+    ''', [(user_id, topic, theta, answers)
+          for topic, (theta, answers) in advance_abilities(abilities, betas, entries).items()])
+
+
+def topic_calibration(conn, user_id: int, topic: str) -> Optional[Dict]:
+    row = conn.execute('SELECT theta, answers FROM user_ability WHERE user_id = ? AND topic = ?',
+                       [user_id, topic]).fetchone()
+    if row is None:
+        return None
+    items = {r['difficulty']: r['beta'] for r in conn.execute(
+        'SELECT difficulty, beta FROM item_calibration WHERE topic = ?', [topic])}
+    return {'theta': row['theta'], 'answers': row['answers'], 'items': items}
+
+
+def load_counts(conn) -> pd.DataFrame:
+    """Answers and right answers per user / topic / difficulty, over every day kept"""
+    rows = conn.execute('''
+        SELECT user_id, topic, difficulty, SUM(questions) AS questions, SUM(correct) AS correct
+        FROM question_stats_daily GROUP BY user_id, topic, difficulty
+    ''').fetchall()
+    counts = pd.DataFrame.from_records([tuple(row) for row in rows], columns=COUNT_COLUMNS)
+    return counts.astype({'user_id': np.int64, 'questions': np.int64, 'correct': np.int64})
+
+
+def load_abilities(conn) -> Dict[Tuple[int, str], int]:
+    """The answers each stored ability rests on, to see at save time which ones Elo has moved since"""
+    return {(row['user_id'], row['topic']): row['answers']
+            for row in conn.execute('SELECT user_id, topic, answers FROM user_ability')}
+
+
+def save_calibration(conn, abilities: pd.DataFrame, items: pd.DataFrame, loaded: Dict[Tuple[int, str], int]):
+    """
+    Store the shard's fitted abilities (of its own users) and item parameters (all of
+    them). ``loaded`` is ``load_abilities`` as of the counts that were fitted: abilities
+    Elo moved since keep their newer theta, the next fit takes their answers in.
+    """
+    fitted = {(user_id, topic): (theta, answers) for user_id, topic, theta, answers
+              in abilities[['user_id', 'topic', 'theta', 'answers']].itertuples(index=False, name=None)}
+    conn.executemany('DELETE FROM user_ability WHERE user_id = ? AND topic = ? AND answers = ?', [
+        (*key, answers) for key, answers in loaded.items() if key not in fitted])
+    conn.executemany('UPDATE user_ability SET theta = ?, answers = ? WHERE user_id = ? AND topic = ? AND answers = ?', [
+        (*row, *key, loaded[key]) for key, row in fitted.items() if key in loaded])
+    conn.executemany('INSERT INTO user_ability (user_id, topic, theta, answers) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING', [
+        (*key, *row) for key, row in fitted.items() if key not in loaded])
+    conn.execute('DELETE FROM item_calibration')
+    conn.executemany('INSERT INTO item_calibration (topic, difficulty, beta, answers) VALUES (?, ?, ?, ?)',
+                     items[['topic', 'difficulty', 'beta', 'answers']].itertuples(index=False, name=None))
+
+
+def calibrate(db_path: str = DEFAULT_DB_PATH, iterations: int = 50) -> Dict[str, int]:
+    """
+    Fit every shard's answers together and store the results in every shard. Each
+    shard's counts and abilities are read from one snapshot, so answers logged while
+    the fit runs show up as abilities that moved (see ``save_calibration``).
+    """
+    router = get_router(db_path)
+    frames, loaded = [], []
+    for db in router.shards:
+        with db.connection() as conn:
+            # A deferred read transaction: one snapshot without taking the write lock
+            conn.execute('BEGIN')
+            try:
+                frames.append(load_counts(conn))
+                loaded.append(load_abilities(conn))
+            finally:
+                conn.execute('COMMIT')
+    counts = pd.concat(frames, ignore_index=True)
+    abilities, items = fit(counts, iterations)
+
+    shards = np.array([shard_of(int(user_id), router.shard_count) for user_id in abilities['user_id']], dtype=np.int64)
+    for index, db in enumerate(router.shards):
+        with db.transaction() as conn:
+            save_calibration(conn, abilities[shards == index], items, loaded[index])
+    return {'users': int(abilities['user_id'].nunique()), 'abilities': len(abilities), 'items': len(items),
+            'answers': int(counts['questions'].sum())}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibrate item difficulty and user ability over the answer history.")
+    parser.add_argument("command", choices=["fit"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    counts = calibrate(args.db, args.iterations)
+    print(f"Calibrated {counts['items']} items and {counts['abilities']} abilities of {counts['users']} users "
+          f"from {counts['answers']} answers")
@@ -0,0 +1,95 @@
+"""
+Dashboard frames over the rollups (src.models.rollups), which hold the totals and
+per topic / sub-topic averages however long the history is.
+
+``topic_frame`` types the get_topic_scores rows once, with topics as categoricals and
+numeric scores, so the weak-topic table (``weak_topics``) and the per-topic chart
+(``topic_averages``) are vectorized pandas operations over its columns. The
+score-over-time chart comes from ``score_series``: the rollups aggregated per day,
+week or month in SQL, then downsampled with LTTB, so the chart never has more than
+CHART_POINTS points however long the history is.
+
+    python -m benchmarks.dashboard_metrics
+"""
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+from src.models.repository import StudyRepository
+
+TOPIC_COLUMNS = ['topic', 'sub_topic', 'display_title', 'avg_score', 'count']
+
+# Most points the score-over-time chart gets
+CHART_POINTS = 200
+
+
+def topic_frame(topic_scores: Iterable[Dict]) -> pd.DataFrame:
+    """Per topic / sub-topic rows from get_topic_scores as a typed frame with TOPIC_COLUMNS"""
+    frame = pd.DataFrame.from_records(topic_scores, columns=TOPIC_COLUMNS)
+    frame[['topic', 'sub_topic']] = frame[['topic', 'sub_topic']].fillna('').astype('category')
+    frame['avg_score'] = frame['avg_score'].astype('float64')
+    frame['count'] = frame['count'].astype('int64')
+    return frame
+
+
+def weak_topics(topics: pd.DataFrame, pass_score: float) -> pd.DataFrame:
+    """Rows of a topic frame averaging under ``pass_score``, weakest first"""
+    return topics[topics['avg_score'].to_numpy() < pass_score].sort_values('avg_score', kind='stable')
+
+
+def topic_averages(topics: pd.DataFrame) -> pd.DataFrame:
+    """Average score per main topic (``topic``, ``score``) from a topic frame, best first"""
+    weighted = topics.assign(score_sum=topics['avg_score'] * topics['count'])
+    averages = weighted.groupby('topic', observed=True)[['score_sum', 'count']].sum().reset_index()
+    averages['topic'] = averages['topic'].astype(str)
+    averages['score'] = averages['score_sum'] / averages['count']
+    return averages.sort_values('score', ascending=False, kind='stable')[['topic', 'score']]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Indices of at most ``points`` of the (x, y) points (x ascending) that keep the
+    shape of the line: Largest-Triangle-Three-Buckets, which always keeps the first and
+    last point and from each bucket in between the one spanning the largest triangle
+    with the point kept before it and the mean of the next bucket.
+    """
+    n = len(x)
+    if n <= points or n <= 2:
+        return np.arange(n)
+    if points < 3:
+        return np.array([0, n - 1])[:max(points, 0)]
+
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    edges = np.floor(np.linspace(1, n - 1, points - 1)).astype(np.int64)
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        cx, cy = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def score_series(repository: StudyRepository, user_id: int, points: int = CHART_POINTS):
+    """
+    ``(frame, bucket)``: the user's average score over time as at most ``points`` rows
+    of ``period`` (UTC datetime), ``quizzes`` and ``avg_score``, from the finest of
+    day / week / month buckets that fits, downsampled with LTTB if none does.
+    """
+    for bucket in ('day', 'week', 'month'):
+        rows = repository.get_score_series(user_id, bucket)
+        if len(rows) <= points:
+            break
+    frame = pd.DataFrame.from_records(rows, columns=['period', 'quizzes', 'avg_score'])
+    frame['period'] = pd.to_datetime(frame['period'], format='%Y-%m-%d', utc=True)
+    frame['quizzes'] = frame['quizzes'].astype('int64')
+    frame['avg_score'] = frame['avg_score'].astype('float64')
+    if len(frame) > points:
+        seconds = (frame['period'] - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+        frame = frame.iloc[lttb(seconds, frame['avg_score'].to_numpy(), points)].reset_index(drop=True)
+    return frame, bucket
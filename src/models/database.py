@@ -0,0 +1,189 @@
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict
+
+from src.config.settings import settings
+
+DEFAULT_DB_PATH = "studyai.db"
+
+# Applied to every pooled connection. WAL lets readers run alongside the single writer,
+# synchronous=NORMAL is durable across application crashes in WAL mode, and
+# busy_timeout makes writers wait for the lock instead of failing with "database is locked".
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,       # KiB, i.e. ~16 MB page cache per connection
+    'mmap_size': 268435456,     # 256 MB of the file read through mmap
+    'busy_timeout': 10000,      # ms
+    'temp_store': 'MEMORY',
+}
+
+# Compiled statements kept per connection, so repeated queries skip parsing and planning
+STATEMENT_CACHE_SIZE = 256
+
+
+class Database:
+    """
+    Shared access to one SQLite file through a pool of tuned connections.
+
+    A connection is checked out for the duration of a ``connection()`` or
+    ``transaction()`` block and bound to the calling thread, so nested blocks in the
+    same thread reuse it. Streamlit runs each rerun on a fresh thread, so idle
+    connections are returned to the pool rather than kept per thread forever.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_idle: int = 8):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._local = threading.local()
+        self._write_queue = None
+        self._write_queue_lock = threading.Lock()
+        # Writes queued for the writer thread, see src.models.write_queue
+        self.journal_path = db_path + "-writes.journal"
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=PRAGMAS['busy_timeout'] / 1000,
+            isolation_level=None,  # transactions are explicit, see transaction()
+            check_same_thread=False,  # connections move between threads through the pool
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Check out a pooled connection (autocommit unless inside ``transaction()``)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run a block as one write transaction; nested blocks become savepoints."""
+        with self.connection() as conn:
+            if conn.in_transaction:
+                conn.execute('SAVEPOINT nested')
+                try:
+                    yield conn
+                except Exception:
+                    conn.execute('ROLLBACK TO nested')
+                    conn.execute('RELEASE nested')
+                    raise
+                conn.execute('RELEASE nested')
+                return
+
+            # Take the write lock up front so WAL readers never have to be upgraded mid-transaction
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def write(self, op: str, payload: dict) -> Future:
+        """
+        Run a registered write operation (see ``src.models.write_queue``) and return a
+        future for its result.
+
+        With the write queue enabled the operation is group-committed by the writer
+        thread; otherwise, or when this thread already holds a transaction (waiting on
+        the writer would deadlock), it runs inline in its own transaction.
+        """
+        from src.models.write_queue import run_write_op
+
+        conn = getattr(self._local, 'conn', None)
+        if settings.WRITE_QUEUE_ENABLED and not (conn is not None and conn.in_transaction):
+            return self._start_write_queue().submit(op, payload)
+
+        future = Future()
+        try:
+            with self.transaction() as conn:
+                future.set_result(run_write_op(conn, op, payload))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _start_write_queue(self):
+        from src.models.write_queue import WriteQueue
+
+        with self._write_queue_lock:
+            if self._write_queue is None:
+                self._write_queue = WriteQueue(self)
+            return self._write_queue
+
+    def write_metrics(self) -> dict:
+        """Metrics of the write queue, empty until the first queued write."""
+        return self._write_queue.metrics() if self._write_queue else {}
+
+    def close_all(self):
+        """Stop the writer and close idle pooled connections (checked-out ones close when returned to a full pool)."""
+        with self._write_queue_lock:
+            if self._write_queue is not None:
+                self._write_queue.stop()
+                self._write_queue = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_databases: Dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path: str = DEFAULT_DB_PATH) -> Database:
+    """
+    Return the process-wide Database for a file, creating it on first use.
+
+    Pending schema migrations are applied at that point, once per process, and writes
+    journaled by a process that died before committing them are replayed.
+    """
+    with _databases_lock:
+        database = _databases.get(db_path)
+        if database is None:
+            from src.models.migrations import apply_migrations
+
+            database = Database(db_path)
+            with database.connection() as conn:
+                apply_migrations(conn)
+            # Replayed even with the queue since turned off, so no journaled write is lost
+            if os.path.exists(database.journal_path) and os.path.getsize(database.journal_path):
+                database._start_write_queue()
+            _databases[db_path] = database
+        return database
+
+
+def close_database(db_path: str):
+    """Close the process-wide Database for a file, e.g. before the file is removed."""
+    with _databases_lock:
+        database = _databases.pop(db_path, None)
+    if database is not None:
+        database.close_all()
@@ -0,0 +1,161 @@
+import os
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.config.settings import settings
+
+# Backends that can serve the configured embedding model
+TORCH_BACKEND = "torch"
+ONNX_BACKEND = "onnx"
+ONNX_INT8_BACKEND = "onnx-int8"
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_quantized.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def onnx_model_dir(model_name: str, revision: str = None) -> str:
+    """Directory the exported ONNX files for a model revision live in."""
+    revision = revision or settings.EMBEDDING_MODEL_REVISION
+    return os.path.join(settings.ONNX_MODEL_DIR, model_name.replace("/", "__"), revision.replace("/", "__"))
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence-transformers compatible embeddings served by ONNX Runtime on CPU.
+
+    Runs the exported (optionally int8-quantized) transformer and applies the same
+    mean pooling and L2 normalization as the sentence-transformers pipeline, so the
+    vectors stay interchangeable with stores built through ``HuggingFaceEmbeddings``.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, batch_size: int = 32,
+                 num_threads: int = None, max_length: int = 256):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found, run 'python -m src.models.embeddings export' first")
+
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or settings.ONNX_NUM_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+            feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in self.input_names:
+                feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real tokens, then L2 normalization
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        return np.vstack(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model_name: str = None, revision: str = None, backend: str = None):
+    """Return the embeddings client for a model, loaded once per process."""
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    backend = backend or settings.EMBEDDING_BACKEND
+
+    if backend in (ONNX_BACKEND, ONNX_INT8_BACKEND):
+        try:
+            return OnnxEmbeddings(onnx_model_dir(model_name, revision), quantized=backend == ONNX_INT8_BACKEND)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"ONNX embeddings unavailable ({e}). Falling back to {TORCH_BACKEND}.")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'revision': revision or settings.EMBEDDING_MODEL_REVISION},
+    )
+
+
+def export_onnx_model(model_name: str = None, revision: str = None, quantize: bool = True) -> str:
+    """
+    Export the embedding model's transformer to ONNX (plus an int8 copy) for the CPU backends.
+
+    Uses torch and transformers, which sentence-transformers already installs, so it
+    can run as a build step of the image. ``model_name`` may also be a local directory.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    revision = revision or settings.EMBEDDING_MODEL_REVISION
+    source = model_name if os.path.isdir(model_name) or "/" in model_name else f"sentence-transformers/{model_name}"
+    output_dir = onnx_model_dir(model_name, revision)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(source, revision=revision)
+    model = AutoModel.from_pretrained(source, revision=revision).eval()
+    sample = tokenizer(["export sample", "a somewhat longer export sample"], padding=True, return_tensors="pt")
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    class TokenEmbeddings(torch.nn.Module):
+        """Pins the exported signature to the tokenizer outputs, returning only the hidden states."""
+
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs))).last_hidden_state
+
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(model), tuple(sample[name] for name in input_names), os.path.join(output_dir, ONNX_MODEL_FILE),
+            input_names=input_names, output_names=['last_hidden_state'], dynamic_axes=dynamic_axes,
+            opset_version=17, dynamo=False,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(
+            os.path.join(output_dir, ONNX_MODEL_FILE),
+            os.path.join(output_dir, ONNX_INT8_MODEL_FILE),
+            weight_type=QuantType.QInt8,
+        )
+    return output_dir
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the embedding model for the ONNX backends.")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--revision", default=settings.EMBEDDING_MODEL_REVISION)
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 copy")
+    args = parser.parse_args()
+    print(f"Exported to {export_onnx_model(args.model, args.revision, quantize=not args.no_quantize)}")
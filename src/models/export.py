@@ -0,0 +1,170 @@
+"""
+Streaming export of a user's whole history: their quiz sessions, or every question they
+answered (archived ones included), as CSV, JSONL or Parquet.
+
+``export_history`` yields the file as byte chunks while it reads the history in keyset
+chunks, so memory stays flat however long the history is and nothing is written to the
+server's disk. Parquet gets one row group per chunk. Only the command line streams to
+its output file: Streamlit's download button needs the whole file in memory, so the
+dashboard builds it with ``export_bytes``, which gives up past UI_MAX_BYTES.
+
+    python -m src.models.export questions --user 1 [--format parquet] [--output history.parquet] [--db studyai.db]
+"""
+import io
+import csv
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from src.models.archive import SCHEMA as QUESTION_SCHEMA
+from src.models.database import DEFAULT_DB_PATH
+from src.models.repository import StudyRepository
+
+# File format -> MIME type
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Rows read from the database per chunk (and per Parquet row group)
+CHUNK_ROWS = 5000
+# Largest export the dashboard builds in memory for its download button
+UI_MAX_BYTES = 50 * 1024 * 1024
+
+SESSION_COLUMNS = ['id', 'topic', 'sub_topic', 'question_type', 'difficulty', 'num_questions', 'score', 'created_at']
+QUESTION_COLUMNS = ['id', 'user_id', 'session_id', 'topic', 'sub_topic', 'difficulty', 'question_type',
+                    'question_text', 'options', 'correct_answer', 'explanation', 'user_answer', 'is_correct',
+                    'time_taken', 'created_at']
+
+SESSION_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('topic', pa.string()),
+    ('sub_topic', pa.string()),
+    ('question_type', pa.string()),
+    ('difficulty', pa.string()),
+    ('num_questions', pa.int32()),
+    ('score', pa.float64()),
+    ('created_at', pa.string()),  # UTC 'YYYY-MM-DD HH:MM:SS'
+]) if pa else None
+
+
+def _csv(chunks: Iterable[List[Dict]], columns: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for rows in chunks:
+        # Lists (a question's options) go in one cell as JSON
+        writer.writerows({key: json.dumps(value) if isinstance(value, list) else value for key, value in row.items()}
+                         for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _jsonl(chunks: Iterable[List[Dict]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode()
+
+
+class _Drain(io.RawIOBase):
+    """A write-only file whose bytes are taken out as they arrive, keeping its position."""
+
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+        self.pending = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data, self.pending = b''.join(self.pending), []
+        return data
+
+
+def _parquet(chunks: Iterable[List[Dict]], schema) -> Iterator[bytes]:
+    if pa is None:
+        raise RuntimeError("Parquet exports need pyarrow (pip install pyarrow)")
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_history(repository: StudyRepository, user_id: int, kind: str = 'questions', fmt: str = 'csv',
+                   chunk_size: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    The user's ``kind`` ('sessions' or 'questions') history, oldest first, as ``fmt``
+    ('csv', 'jsonl' or 'parquet') file contents in chunks.
+    """
+    if kind == 'sessions':
+        chunks, columns, schema = repository.iter_session_history(user_id, chunk_size), SESSION_COLUMNS, SESSION_SCHEMA
+    elif kind == 'questions':
+        chunks, columns, schema = repository.iter_question_history(user_id, chunk_size), QUESTION_COLUMNS, QUESTION_SCHEMA
+    else:
+        raise ValueError(f"Unknown export '{kind}' (expected 'sessions' or 'questions')")
+
+    if fmt == 'csv':
+        return _csv(chunks, columns)
+    if fmt == 'jsonl':
+        return _jsonl(chunks)
+    if fmt == 'parquet':
+        return _parquet(chunks, schema)
+    raise ValueError(f"Unknown export format '{fmt}' (expected one of {', '.join(FORMATS)})")
+
+
+def export_bytes(repository: StudyRepository, user_id: int, kind: str = 'questions', fmt: str = 'csv',
+                 max_bytes: int = UI_MAX_BYTES) -> Optional[bytes]:
+    """``export_history`` as one bytes object, or None once it grows past ``max_bytes``"""
+    data, size = [], 0
+    for chunk in export_history(repository, user_id, kind, fmt):
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        data.append(chunk)
+    return b''.join(data)
+
+
+def export_filename(kind: str, fmt: str) -> str:
+    return f"smartprep-{kind}-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from src.models.repository import get_repository
+
+    parser = argparse.ArgumentParser(description="Export a user's whole history to a file.")
+    parser.add_argument("kind", choices=["sessions", "questions"])
+    parser.add_argument("--user", type=int, required=True)
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--output", help="Defaults to smartprep-<kind>-<date>.<format>")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args()
+
+    output = args.output or export_filename(args.kind, args.format)
+    with open(output, 'wb') as f:
+        for chunk in export_history(get_repository(args.db), args.user, args.kind, args.format):
+            f.write(chunk)
+    print(f"Exported user {args.user}'s {args.kind} to {output}")
@@ -0,0 +1,492 @@
+"""
+Versioned schema migrations for studyai.db.
+
+The applied version is stored in ``PRAGMA user_version``. ``apply_migrations`` runs once
+per process when the Database for a file is first created (see ``get_database``), so the
+managers themselves never issue DDL. To change the schema, append a new migration to
+``MIGRATIONS``; never edit one that has already shipped.
+"""
+import sqlite3
+from typing import Callable, List, Tuple
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, column_type: str):
+    """Add a column unless a database created before migrations already has it."""
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+
+def _m001_base_schema(conn: sqlite3.Connection):
+    """Tables as the managers used to create them on every construction."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            total_quizzes INTEGER DEFAULT 0,
+            total_score REAL DEFAULT 0.0
+        )
+    ''')
+    _add_column(conn, 'users', 'has_used_rag_trial', 'BOOLEAN DEFAULT 0')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            topic TEXT NOT NULL,
+            sub_topic TEXT,
+            question_type TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            num_questions INTEGER NOT NULL,
+            score REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _add_column(conn, 'quiz_sessions', 'questions_data', 'TEXT')
+    _add_column(conn, 'quiz_sessions', 'user_answers', 'TEXT')
+    _add_column(conn, 'quiz_sessions', 'results_data', 'TEXT')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_id INTEGER,
+            topic TEXT NOT NULL,
+            sub_topic TEXT,
+            difficulty TEXT,
+            question_type TEXT,
+            question_text TEXT,
+            options TEXT, -- JSON for MCQ options
+            correct_answer TEXT,
+            user_answer TEXT,
+            is_correct BOOLEAN,
+            time_taken INTEGER, -- seconds
+            explanation TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (session_id) REFERENCES quiz_sessions (id)
+        )
+    ''')
+
+
+def _m002_history_indices(conn: sqlite3.Connection):
+    """
+    Indices for the per-user history reads (checked by test_query_plans.py).
+
+    Both lead with (user_id, created_at), so "latest N for a user" is an index range read
+    in order with no sort. The trailing columns make them covering: the sidebar list and
+    the weak-topic aggregation are answered from the index without touching the table,
+    which keeps the wide JSON columns of quiz_sessions out of those reads.
+    """
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quiz_sessions_user_created
+        ON quiz_sessions (user_id, created_at, topic, sub_topic, question_type, difficulty, num_questions, score)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_question_log_user_created
+        ON question_log (user_id, created_at, topic, sub_topic, difficulty, is_correct)
+    ''')
+
+
+def _m003_submission_ids(conn: sqlite3.Connection):
+    """Client-generated id per quiz submission, so a retried submit is recognised."""
+    _add_column(conn, 'quiz_sessions', 'submission_id', 'TEXT')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_quiz_sessions_submission
+        ON quiz_sessions (submission_id) WHERE submission_id IS NOT NULL
+    ''')
+
+
+def _m004_write_journal(conn: sqlite3.Connection):
+    """Last journal entry committed by each write queue, updated in the same transaction."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS write_journal (
+            name TEXT PRIMARY KEY,
+            committed_seq INTEGER NOT NULL
+        )
+    ''')
+
+
+def _m005_question_bank(conn: sqlite3.Connection):
+    """Questions stored once; sessions and question_log reference them (see session_storage)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_bank (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT UNIQUE NOT NULL,
+            body TEXT NOT NULL -- canonical JSON of the question
+        )
+    ''')
+    _add_column(conn, 'quiz_sessions', 'payload', 'BLOB')
+    _add_column(conn, 'question_log', 'question_id', 'INTEGER REFERENCES question_bank (id)')
+
+
+def _m006_rollups(conn: sqlite3.Connection):
+    """Per-user performance rollups (see src/models/rollups.py), backfilled from history."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            quizzes INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            questions INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            time_sum INTEGER NOT NULL DEFAULT 0,
+            recent TEXT -- JSON [[topic, sub_topic, is_correct], ...], newest first
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_stats (
+            user_id INTEGER NOT NULL,
+            topic TEXT NOT NULL,
+            sub_topic TEXT NOT NULL,
+            quizzes INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, topic, sub_topic)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_stats_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL, -- UTC date, like created_at
+            topic TEXT NOT NULL,
+            sub_topic TEXT NOT NULL,
+            quizzes INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, topic, sub_topic)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_stats_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            sub_topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            questions INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            time_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, topic, sub_topic, difficulty)
+        ) WITHOUT ROWID
+    ''')
+
+    # Backfilled from history by migration 16, which runs today's rollups code after the
+    # tables it reads exist
+
+
+def _m007_history_keyset(conn: sqlite3.Connection):
+    """
+    Rebuild the session history index with ``id`` right after ``created_at``, so pages
+    ordered and bounded by (created_at, id) are still a single in-order index range.
+    """
+    conn.execute('DROP INDEX IF EXISTS idx_quiz_sessions_user_created')
+    conn.execute('''
+        CREATE INDEX idx_quiz_sessions_user_created
+        ON quiz_sessions (user_id, created_at, id, topic, sub_topic, question_type, difficulty, num_questions, score)
+    ''')
+
+def _m008_session_search(conn: sqlite3.Connection):
+    """
+    Full-text index of quiz history: one row per session (rowid = session id) with its
+    topic, sub-topic, day and the text and explanations of its logged questions.
+
+    Triggers keep it in step with quiz_sessions and question_log. ``user_tag`` holds a
+    single ``u<user_id>`` token so a search is restricted to one user inside FTS5.
+    """
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS session_fts USING fts5(
+            user_tag, topic, sub_topic, day, questions, tokenize = 'porter unicode61'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS quiz_sessions_fts_insert AFTER INSERT ON quiz_sessions
+        BEGIN
+            INSERT INTO session_fts (rowid, user_tag, topic, sub_topic, day, questions)
+            VALUES (new.id, 'u' || new.user_id, new.topic, new.sub_topic, date(new.created_at), '');
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS quiz_sessions_fts_delete AFTER DELETE ON quiz_sessions
+        BEGIN
+            DELETE FROM session_fts WHERE rowid = old.id;
+        END
+    ''')
+    # Question text lives in question_bank once a row has a question_id (see session_storage)
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS question_log_fts_insert AFTER INSERT ON question_log
+        WHEN new.session_id IS NOT NULL
+        BEGIN
+            UPDATE session_fts SET questions = questions || ' ' || COALESCE(
+                new.question_text || ' ' || COALESCE(new.explanation, ''),
+                (SELECT json_extract(body, '$.question') || ' ' || COALESCE(json_extract(body, '$.explanation'), '')
+                 FROM question_bank WHERE id = new.question_id),
+                '')
+            WHERE rowid = new.session_id;
+        END
+    ''')
+
+    conn.execute('DELETE FROM session_fts')
+    conn.execute('''
+        WITH logged AS (
+            SELECT l.session_id, group_concat(COALESCE(
+                l.question_text || ' ' || COALESCE(l.explanation, ''),
+                json_extract(b.body, '$.question') || ' ' || COALESCE(json_extract(b.body, '$.explanation'), ''),
+                ''), ' ') AS questions
+            FROM question_log l LEFT JOIN question_bank b ON b.id = l.question_id
+            WHERE l.session_id IS NOT NULL
+            GROUP BY l.session_id
+        )
+        INSERT INTO session_fts (rowid, user_tag, topic, sub_topic, day, questions)
+        SELECT s.id, 'u' || s.user_id, s.topic, s.sub_topic, date(s.created_at), COALESCE(logged.questions, '')
+        FROM quiz_sessions s LEFT JOIN logged ON logged.session_id = s.id
+    ''')
+
+
+def _m009_question_log_keyset(conn: sqlite3.Connection):
+    """Same as migration 7 for question_log, so "latest answers" break ties by id like PostgreSQL."""
+    conn.execute('DROP INDEX IF EXISTS idx_question_log_user_created')
+    conn.execute('''
+        CREATE INDEX idx_question_log_user_created
+        ON question_log (user_id, created_at, id, topic, sub_topic, difficulty, is_correct)
+    ''')
+
+
+def _m010_shard_layout(conn: sqlite3.Connection):
+    """
+    How many files the quiz history is split over (see src.models.shards). Existing
+    databases keep all of it in this file, i.e. one shard.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS shard_layout (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            shard_count INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO shard_layout (id, shard_count) VALUES (1, 1)')
+
+
+def _m011_question_log_archive(conn: sqlite3.Connection):
+    """
+    State of the question_log archive (see src/models/archive.py): how far it reaches and
+    the per-user totals of the rows moved out, which the rollups keep counting.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_watermarks (
+            table_name TEXT PRIMARY KEY,
+            archived_before TEXT NOT NULL -- rows created before this UTC time are archived
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_question_stats (
+            user_id INTEGER PRIMARY KEY,
+            questions INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            time_sum INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def _m012_user_data_versions(conn: sqlite3.Connection):
+    """
+    A per-user counter bumped by every write to the user's history, so cached reads
+    (src/models/read_cache.py) know when they are stale.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_data_version (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def _m013_recommendation_state(conn: sqlite3.Connection):
+    """
+    Per-user recommendation and alert state, advanced as answers are logged
+    (src/models/recommendations.py); users without one get it built on their next answer.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_state (
+            user_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL
+        )
+    ''')
+
+
+def _m014_review_items(conn: sqlite3.Connection):
+    """
+    Spaced-repetition state per (user, question) (src/models/review.py) with the due
+    queue index, replayed from the questions logged so far.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS review_items (
+            user_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL REFERENCES question_bank (id),
+            topic TEXT NOT NULL DEFAULT '',
+            sub_topic TEXT NOT NULL DEFAULT '',
+            difficulty TEXT NOT NULL DEFAULT '',
+            repetitions INTEGER NOT NULL,
+            interval_days INTEGER NOT NULL,
+            ease REAL NOT NULL,
+            lapses INTEGER NOT NULL,
+            reviewed_at TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, question_id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_review_items_due ON review_items (user_id, due_at)')
+
+    from src.models.review import rebuild_all_items
+    rebuild_all_items(conn)
+
+
+def _m015_calibration(conn: sqlite3.Connection):
+    """
+    Item difficulty per topic / difficulty label and ability per user / topic
+    (src/models/calibration.py), filled by its fit job and kept up by every answer.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS item_calibration (
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            beta REAL NOT NULL,
+            answers INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (topic, difficulty)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_ability (
+            user_id INTEGER NOT NULL,
+            topic TEXT NOT NULL,
+            theta REAL NOT NULL,
+            answers INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, topic)
+        )
+    ''')
+
+
+def _m016_rollup_backfill(conn: sqlite3.Connection):
+    """
+    The rollups of migration 6 recomputed from history, for databases that had history
+    before they existed. Kept last because ``rebuild_all`` also reads the archive state
+    (migration 11) and writes the recommendation state (migration 13).
+    """
+    if conn.execute('SELECT 1 FROM user_stats LIMIT 1').fetchone() is None:
+        from src.models.rollups import rebuild_all
+        # rebuild_all is today's code, which also reads the review flag of migration 19
+        _flag_review_sessions(conn)
+        rebuild_all(conn)
+
+
+def _m017_recommendation_state_backfill(conn: sqlite3.Connection):
+    """
+    Recommendation state (migration 13) for users with history who have none yet, built
+    from their rollups, so the first read after an upgrade needs no computing.
+    """
+    from src.models.recommendations import rebuild_state
+    from src.models.rollups import users_with_history
+    for user_id in users_with_history(conn):
+        if conn.execute('SELECT 1 FROM recommendation_state WHERE user_id = ?', [user_id]).fetchone() is None:
+            rebuild_state(conn, user_id)
+
+
+def _m018_legacy_review_items(conn: sqlite3.Connection):
+    """
+    Review items for answers logged before the question bank (migration 5). Migration
+    14's replay skips them for want of a bank id; here each such user's rows are
+    banked and their items replayed again.
+    """
+    from src.models.review import rebuild_items
+    for row in conn.execute('''
+        SELECT DISTINCT user_id FROM question_log WHERE user_id IS NOT NULL AND question_id IS NULL
+    ''').fetchall():
+        rebuild_items(conn, row[0], bank_legacy=True)
+
+
+def _flag_review_sessions(conn: sqlite3.Connection):
+    """
+    The is_review flag on quiz_sessions, set on the review quizzes saved so far: they were
+    saved under REVIEW_TOPIC with no sub-topic or difficulty, while a user's own quiz on a
+    topic of that name has both.
+    """
+    from src.models.review import REVIEW_TOPIC
+    _add_column(conn, 'quiz_sessions', 'is_review', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''
+        UPDATE quiz_sessions SET is_review = 1
+        WHERE topic = ? AND COALESCE(sub_topic, '') = '' AND COALESCE(difficulty, '') = ''
+    ''', [REVIEW_TOPIC])
+
+
+def _m019_review_sessions(conn: sqlite3.Connection):
+    """
+    Review quiz sessions, which the per-topic rollups leave out, told apart by a flag
+    instead of by their topic name, which a user can choose too. The rollups of users
+    with quizzes of their own on that topic are rebuilt to count them.
+    """
+    from src.models.review import REVIEW_TOPIC
+    from src.models.rollups import rebuild_user
+    _flag_review_sessions(conn)
+    for row in conn.execute('''
+        SELECT DISTINCT user_id FROM quiz_sessions WHERE user_id IS NOT NULL AND topic = ? AND is_review = 0
+    ''', [REVIEW_TOPIC]).fetchall():
+        rebuild_user(conn, row[0])
+
+
+# (version, description, migration) in the order they must be applied
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "base schema: users, quiz_sessions, question_log", _m001_base_schema),
+    (2, "covering indices for session history and question log", _m002_history_indices),
+    (3, "unique submission id on quiz_sessions", _m003_submission_ids),
+    (4, "write queue journal state", _m004_write_journal),
+    (5, "question bank and compressed session payloads", _m005_question_bank),
+    (6, "per-user performance rollups", _m006_rollups),
+    (7, "session history index ordered by (created_at, id)", _m007_history_keyset),
+    (8, "full-text search over quiz history", _m008_session_search),
+    (9, "question log index ordered by (created_at, id)", _m009_question_log_keyset),
+    (10, "shard layout of the quiz history", _m010_shard_layout),
+    (11, "question log archive state", _m011_question_log_archive),
+    (12, "per-user data versions", _m012_user_data_versions),
+    (13, "per-user recommendation state", _m013_recommendation_state),
+    (14, "spaced-repetition review items", _m014_review_items),
+    (15, "item difficulty and user ability calibration", _m015_calibration),
+    (16, "per-user rollups backfilled from history", _m016_rollup_backfill),
+    (17, "recommendation state backfilled for users without one", _m017_recommendation_state_backfill),
+    (18, "review items for questions logged before the question bank", _m018_legacy_review_items),
+    (19, "review quiz sessions flagged instead of told apart by topic", _m019_review_sessions),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Apply every pending migration, each in its own write transaction.
+
+    Safe to race between processes: the version is re-read after taking the write
+    lock, so a migration another process just applied is skipped. Expects an
+    autocommit connection. Returns the resulting schema version.
+    """
+    for version, description, migrate in MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) < version:
+                migrate(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                print(f"Applied database migration {version}: {description}")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    return schema_version(conn)
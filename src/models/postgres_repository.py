@@ -0,0 +1,821 @@
+"""
+PostgreSQL implementation of ``StudyRepository``, so several app replicas share one
+database instead of each writing its own studyai.db.
+
+Needs ``psycopg`` and ``psycopg_pool`` (``pip install "psycopg[binary,pool]"``) and
+``STORAGE_BACKEND=postgres`` with ``DATABASE_URL`` pointing at the database. Connections
+come from a pool (PG_POOL_MIN_SIZE..PG_POOL_MAX_SIZE per process); each method runs in
+one transaction of one pooled connection. The schema mirrors the SQLite one after all
+its migrations: payloads compressed with the same codec, questions once in
+question_bank, rollups updated in the writing transaction, and a weighted tsvector per
+session for history search. Timestamps are UTC, truncated to the second like SQLite's
+CURRENT_TIMESTAMP.
+"""
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+from src.config.settings import settings
+from src.models.archive import logged_question
+from src.models.calibration import COUNT_COLUMNS, advance_abilities, fit
+from src.models.recommendations import (WINDOW_DAYS, advance_state, current_state, recommend, recommendation_view,
+                                        state_from_rollups, summarize_weak_topics, window_start)
+from src.models.repository import StudyRepository
+from src.models.review import ITEM_COLUMNS as REVIEW_COLUMNS, REVIEW_TOPIC, advance_items, review_question
+from src.models.rollups import merge_recent
+from src.models.session_storage import (bank_question, build_payload, canonical_question, decompress_payload,
+                                        expand_payload, question_hash)
+from src.models.simple_session import session_export_row, session_summary
+
+NOW = "date_trunc('second', now() AT TIME ZONE 'utc')"
+TODAY = "(now() AT TIME ZONE 'utc')::date"
+CREATED_AT = "to_char(created_at, 'YYYY-MM-DD HH24:MI:SS') AS created_at"
+
+# Score-over-time buckets, as rollups.SERIES_BUCKETS (date_trunc weeks start on Monday)
+SERIES_BUCKETS = {
+    'day': "day",
+    'week': "date_trunc('week', day)",
+    'month': "date_trunc('month', day)",
+}
+
+# (version, description, statements) applied in order, tracked in schema_version
+SCHEMA = [
+    (1, "users, quiz history, question bank, rollups and search", [
+        f'''
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGSERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT {NOW},
+            has_used_rag_trial INTEGER NOT NULL DEFAULT 0
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS question_bank (
+            id BIGSERIAL PRIMARY KEY,
+            hash TEXT UNIQUE NOT NULL,
+            body TEXT NOT NULL
+        )''',
+        f'''
+        CREATE TABLE IF NOT EXISTS quiz_sessions (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users (id),
+            topic TEXT NOT NULL,
+            sub_topic TEXT,
+            question_type TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            num_questions INTEGER NOT NULL,
+            score DOUBLE PRECISION NOT NULL,
+            payload BYTEA,
+            submission_id TEXT UNIQUE,
+            search_text TEXT NOT NULL DEFAULT '',
+            search TSVECTOR NOT NULL DEFAULT ''::tsvector,
+            created_at TIMESTAMP NOT NULL DEFAULT {NOW}
+        )''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_quiz_sessions_user_created
+        ON quiz_sessions (user_id, created_at DESC, id DESC)
+        INCLUDE (topic, sub_topic, question_type, difficulty, num_questions, score)''',
+        'CREATE INDEX IF NOT EXISTS idx_quiz_sessions_search ON quiz_sessions USING GIN (search)',
+        f'''
+        CREATE TABLE IF NOT EXISTS question_log (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users (id),
+            session_id BIGINT REFERENCES quiz_sessions (id),
+            topic TEXT NOT NULL,
+            sub_topic TEXT,
+            difficulty TEXT,
+            question_type TEXT,
+            question_id BIGINT REFERENCES question_bank (id),
+            user_answer TEXT,
+            is_correct BOOLEAN,
+            time_taken INTEGER,
+            created_at TIMESTAMP NOT NULL DEFAULT {NOW}
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_question_log_user_created ON question_log (user_id, created_at DESC, id DESC)',
+        '''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id BIGINT PRIMARY KEY,
+            quizzes INTEGER NOT NULL DEFAULT 0,
+            score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            questions INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            time_sum BIGINT NOT NULL DEFAULT 0,
+            recent JSONB NOT NULL DEFAULT '[]'
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS session_stats (
+            user_id BIGINT NOT NULL,
+            topic TEXT NOT NULL,
+            sub_topic TEXT NOT NULL,
+            quizzes INTEGER NOT NULL DEFAULT 0,
+            score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, topic, sub_topic)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS session_stats_daily (
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            topic TEXT NOT NULL,
+            sub_topic TEXT NOT NULL,
+            quizzes INTEGER NOT NULL DEFAULT 0,
+            score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, topic, sub_topic)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS question_stats_daily (
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            topic TEXT NOT NULL,
+            sub_topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            questions INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            time_sum BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, topic, sub_topic, difficulty)
+        )''',
+    ]),
+    (2, "per-user data versions, bumped by every write to a user's history", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_data_version (
+            user_id BIGINT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )''',
+    ]),
+    (3, "per-user recommendation state (src/models/recommendations.py)", [
+        '''
+        CREATE TABLE IF NOT EXISTS recommendation_state (
+            user_id BIGINT PRIMARY KEY,
+            state JSONB NOT NULL
+        )''',
+    ]),
+    (4, "spaced-repetition review items (src/models/review.py)", [
+        '''
+        CREATE TABLE IF NOT EXISTS review_items (
+            user_id BIGINT NOT NULL,
+            question_id BIGINT NOT NULL REFERENCES question_bank (id),
+            topic TEXT NOT NULL DEFAULT '',
+            sub_topic TEXT NOT NULL DEFAULT '',
+            difficulty TEXT NOT NULL DEFAULT '',
+            repetitions INTEGER NOT NULL,
+            interval_days INTEGER NOT NULL,
+            ease DOUBLE PRECISION NOT NULL,
+            lapses INTEGER NOT NULL,
+            reviewed_at TIMESTAMP NOT NULL,
+            due_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, question_id)
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_review_items_due ON review_items (user_id, due_at)',
+    ]),
+    (5, "item difficulty and user ability calibration (src/models/calibration.py)", [
+        '''
+        CREATE TABLE IF NOT EXISTS item_calibration (
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            beta DOUBLE PRECISION NOT NULL,
+            answers BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (topic, difficulty)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_ability (
+            user_id BIGINT NOT NULL,
+            topic TEXT NOT NULL,
+            theta DOUBLE PRECISION NOT NULL,
+            answers BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, topic)
+        )''',
+    ]),
+    (6, "review quiz sessions flagged instead of told apart by topic", [
+        'ALTER TABLE quiz_sessions ADD COLUMN IF NOT EXISTS is_review BOOLEAN NOT NULL DEFAULT FALSE',
+        f'''
+        UPDATE quiz_sessions SET is_review = TRUE
+        WHERE topic = '{REVIEW_TOPIC}' AND COALESCE(sub_topic, '') = '' AND difficulty = ''
+        ''',
+        # A user's own quizzes on that topic were left out of session_stats until now
+        f'''
+        INSERT INTO session_stats (user_id, topic, sub_topic, quizzes, score_sum)
+        SELECT user_id, topic, COALESCE(sub_topic, ''), COUNT(*), SUM(score) FROM quiz_sessions
+        WHERE topic = '{REVIEW_TOPIC}' AND NOT is_review
+        GROUP BY user_id, topic, COALESCE(sub_topic, '')
+        ON CONFLICT (user_id, topic, sub_topic) DO UPDATE SET
+            quizzes = session_stats.quizzes + excluded.quizzes, score_sum = session_stats.score_sum + excluded.score_sum
+        ''',
+    ]),
+]
+
+# Serializes schema changes between replicas starting at the same time
+SCHEMA_LOCK_ID = 0x53747564
+
+
+def _question_search_text(question_data: Dict) -> str:
+    return f"{question_data.get('question_text', '')} {question_data.get('explanation', '')}".strip()
+
+
+class PostgresRepository(StudyRepository):
+    """Users and quiz history in a shared PostgreSQL database."""
+
+    def __init__(self, database_url: str, min_size: int = None, max_size: int = None):
+        if ConnectionPool is None:
+            raise RuntimeError('STORAGE_BACKEND=postgres needs psycopg and psycopg_pool: pip install "psycopg[binary,pool]"')
+        if not database_url:
+            raise RuntimeError("STORAGE_BACKEND=postgres needs DATABASE_URL")
+        self.pool = ConnectionPool(
+            database_url,
+            min_size=min_size or settings.PG_POOL_MIN_SIZE,
+            max_size=max_size or settings.PG_POOL_MAX_SIZE,
+            kwargs={'row_factory': dict_row},
+            open=True,
+        )
+        self.apply_schema()
+
+    def apply_schema(self) -> int:
+        """Apply pending schema versions (once, whichever replica gets the lock first)."""
+        with self.pool.connection() as conn:
+            conn.execute('SELECT pg_advisory_xact_lock(%s)', [SCHEMA_LOCK_ID])
+            conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+            current = conn.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version').fetchone()['version']
+            for version, description, statements in SCHEMA:
+                if version <= current:
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute('INSERT INTO schema_version (version) VALUES (%s)', [version])
+                current = version
+                print(f"Applied PostgreSQL schema {version}: {description}")
+            return current
+
+    def close(self):
+        self.pool.close()
+
+    # -- users -----------------------------------------------------------------------
+
+    def create_user(self, username: str, email: str, password_hash: str):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                [username, email, password_hash]
+            )
+
+    def find_user(self, username: str) -> Optional[Dict]:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT id, username, email, password_hash, has_used_rag_trial FROM users WHERE username = %s",
+                [username]
+            ).fetchone()
+
+    def mark_rag_trial_used(self, user_id: int):
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE users SET has_used_rag_trial = 1 WHERE id = %s", [int(user_id)])
+
+    # -- writes ----------------------------------------------------------------------
+
+    @staticmethod
+    def _question_ids(conn, questions: List[Dict]) -> List[int]:
+        bodies = [canonical_question(question) for question in questions]
+        hashes = [question_hash(body) for body in bodies]
+        if not hashes:
+            return []
+        # Inserting in hash order keeps concurrent submits from deadlocking on shared questions
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO question_bank (hash, body) VALUES (%s, %s) ON CONFLICT (hash) DO NOTHING',
+                sorted(set(zip(hashes, bodies)))
+            )
+        ids = {row['hash']: row['id'] for row in conn.execute(
+            'SELECT hash, id FROM question_bank WHERE hash = ANY(%s)', [list(set(hashes))]
+        )}
+        return [ids[h] for h in hashes]
+
+    def _insert_session(self, conn, user_id: int, quiz_data: Dict, submission_id: str = None) -> Optional[int]:
+        """Session row plus its rollups; None if ``submission_id`` was already saved."""
+        payload = build_payload(quiz_data, self._question_ids(conn, quiz_data.get('questions_data') or []))
+        topic, sub_topic = str(quiz_data.get('topic', '')), str(quiz_data.get('sub_topic', ''))
+        score = float(quiz_data.get('score', 0.0))
+        row = conn.execute(f'''
+            INSERT INTO quiz_sessions (
+                user_id, topic, sub_topic, question_type, difficulty, num_questions, score, payload, submission_id,
+                is_review, search
+            ) VALUES (
+                %(user_id)s, %(topic)s, %(sub_topic)s, %(question_type)s, %(difficulty)s, %(num_questions)s,
+                %(score)s, %(payload)s, %(submission_id)s, %(is_review)s,
+                setweight(to_tsvector('english', %(topic)s), 'A') || setweight(to_tsvector('english', %(sub_topic)s), 'A')
+                || setweight(to_tsvector('simple', to_char({NOW}, 'YYYY MM DD')), 'D')
+            )
+            ON CONFLICT (submission_id) DO NOTHING
+            RETURNING id
+        ''', {
+            'user_id': user_id, 'topic': topic, 'sub_topic': sub_topic,
+            'question_type': str(quiz_data.get('question_type', '')),
+            'difficulty': str(quiz_data.get('difficulty', '')),
+            'num_questions': int(quiz_data.get('num_questions', 0)),
+            'score': score, 'payload': payload, 'submission_id': submission_id,
+            'is_review': bool(quiz_data.get('is_review', False)),
+        }).fetchone()
+        if row is None:
+            return None
+
+        self._bump_data_version(conn, user_id)
+        conn.execute('''
+            INSERT INTO user_stats (user_id, quizzes, score_sum) VALUES (%s, 1, %s)
+            ON CONFLICT (user_id) DO UPDATE SET
+                quizzes = user_stats.quizzes + 1, score_sum = user_stats.score_sum + excluded.score_sum
+        ''', [user_id, score])
+        if not quiz_data.get('is_review'):
+            conn.execute('''
+                INSERT INTO session_stats (user_id, topic, sub_topic, quizzes, score_sum) VALUES (%s, %s, %s, 1, %s)
+                ON CONFLICT (user_id, topic, sub_topic) DO UPDATE SET
+                    quizzes = session_stats.quizzes + 1, score_sum = session_stats.score_sum + excluded.score_sum
+            ''', [user_id, topic, sub_topic, score])
+        conn.execute(f'''
+            INSERT INTO session_stats_daily (user_id, day, topic, sub_topic, quizzes, score_sum)
+            VALUES (%s, {TODAY}, %s, %s, 1, %s)
+            ON CONFLICT (user_id, day, topic, sub_topic) DO UPDATE SET
+                quizzes = session_stats_daily.quizzes + 1,
+                score_sum = session_stats_daily.score_sum + excluded.score_sum
+        ''', [user_id, topic, sub_topic, score])
+        return row['id']
+
+    @staticmethod
+    def _bump_data_version(conn, user_id: int):
+        conn.execute('''
+            INSERT INTO user_data_version (user_id, version) VALUES (%s, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = user_data_version.version + 1
+        ''', [user_id])
+
+    def _insert_questions(self, conn, user_id: int, session_id: int, entries: List[Dict]):
+        """question_log rows, the session's search text and the question rollups."""
+        if not entries:
+            return
+        self._bump_data_version(conn, user_id)
+        ids = self._question_ids(conn, [bank_question(question_data) for question_data in entries])
+        with conn.cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO question_log (
+                    user_id, session_id, topic, sub_topic, difficulty, question_type,
+                    question_id, user_answer, is_correct, time_taken
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', [[
+                user_id,
+                session_id,
+                question_data.get('topic', ''),
+                question_data.get('sub_topic', ''),
+                question_data.get('difficulty', ''),
+                question_data.get('question_type', ''),
+                question_id,
+                question_data.get('user_answer', ''),
+                bool(question_data.get('is_correct', False)),
+                int(question_data.get('time_taken', 0))
+            ] for question_id, question_data in zip(ids, entries)])
+            cursor.executemany(f'''
+                INSERT INTO question_stats_daily (user_id, day, topic, sub_topic, difficulty, questions, correct, time_sum)
+                VALUES (%s, {TODAY}, %s, %s, %s, 1, %s, %s)
+                ON CONFLICT (user_id, day, topic, sub_topic, difficulty) DO UPDATE SET
+                    questions = question_stats_daily.questions + 1,
+                    correct = question_stats_daily.correct + excluded.correct,
+                    time_sum = question_stats_daily.time_sum + excluded.time_sum
+            ''', sorted((
+                user_id,
+                question_data.get('topic', ''),
+                question_data.get('sub_topic', ''),
+                question_data.get('difficulty', ''),
+                int(bool(question_data.get('is_correct', False))),
+                int(question_data.get('time_taken', 0))
+            ) for question_data in entries))
+
+        text = ' '.join(_question_search_text(question_data) for question_data in entries)
+        conn.execute('''
+            UPDATE quiz_sessions
+            SET search_text = search_text || ' ' || %(text)s,
+                search = search || setweight(to_tsvector('english', %(text)s), 'C')
+            WHERE id = %(session_id)s
+        ''', {'text': text, 'session_id': session_id})
+
+        # Lock the user's row so concurrent submits do not lose each other's recent answers
+        conn.execute('INSERT INTO user_stats (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING', [user_id])
+        recent = conn.execute('SELECT recent FROM user_stats WHERE user_id = %s FOR UPDATE', [user_id]).fetchone()['recent']
+        recent = merge_recent(recent, entries)
+        conn.execute('''
+            UPDATE user_stats SET questions = questions + %s, correct = correct + %s, time_sum = time_sum + %s,
+                                  recent = %s::jsonb
+            WHERE user_id = %s
+        ''', [
+            len(entries),
+            sum(1 for e in entries if e.get('is_correct')),
+            sum(int(e.get('time_taken', 0)) for e in entries),
+            json.dumps(recent),
+            user_id,
+        ])
+
+        # Under the same row lock, so concurrent submits advance the state one after the other
+        today = self._today(conn)
+        row = conn.execute('SELECT state FROM recommendation_state WHERE user_id = %s', [user_id]).fetchone()
+        state = (advance_state(row['state'], entries, recent, today) if row
+                 else self._state_from_rollups(conn, user_id, today))
+        conn.execute('''
+            INSERT INTO recommendation_state (user_id, state) VALUES (%s, %s::jsonb)
+            ON CONFLICT (user_id) DO UPDATE SET state = excluded.state
+        ''', [user_id, json.dumps(state)])
+
+        now = conn.execute(f"SELECT to_char({NOW}, 'YYYY-MM-DD HH24:MI:SS') AS now").fetchone()['now']
+        items = {row['question_id']: row for row in conn.execute('''
+            SELECT question_id, repetitions, interval_days, ease, lapses FROM review_items
+            WHERE user_id = %s AND question_id = ANY(%s)
+        ''', [user_id, list(set(ids))])}
+        changed = advance_items(items, zip(ids, entries), now)
+        with conn.cursor() as cursor:
+            cursor.executemany(f'''
+                INSERT INTO review_items (user_id, question_id, {', '.join(REVIEW_COLUMNS)})
+                VALUES (%s, %s, {', '.join(['%s'] * len(REVIEW_COLUMNS))})
+                ON CONFLICT (user_id, question_id) DO UPDATE SET
+                    {', '.join(f'{column} = excluded.{column}' for column in REVIEW_COLUMNS)}
+            ''', [(user_id, question_id, *(item[column] for column in REVIEW_COLUMNS))
+                  for question_id, item in sorted(changed.items())])
+
+        topics = list({question_data.get('topic') or '' for question_data in entries})
+        abilities = {row['topic']: (row['theta'], row['answers']) for row in conn.execute(
+            'SELECT topic, theta, answers FROM user_ability WHERE user_id = %s AND topic = ANY(%s)', [user_id, topics]
+        )}
+        betas = {(row['topic'], row['difficulty']): row['beta'] for row in conn.execute(
+            'SELECT topic, difficulty, beta FROM item_calibration WHERE topic = ANY(%s)', [topics]
+        )}
+        with conn.cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO user_ability (user_id, topic, theta, answers) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (user_id, topic) DO UPDATE SET theta = excluded.theta, answers = excluded.answers
+            ''', [(user_id, topic, theta, answers)
+                  for topic, (theta, answers) in sorted(advance_abilities(abilities, betas, entries).items())])
+
+    @staticmethod
+    def _today(conn) -> str:
+        return conn.execute(f"SELECT to_char({TODAY}, 'YYYY-MM-DD') AS today").fetchone()['today']
+
+    @staticmethod
+    def _state_from_rollups(conn, user_id: int, today: str) -> Dict:
+        """A recommendation state from question_stats_daily and user_stats.recent"""
+        rows = conn.execute('''
+            SELECT to_char(day, 'YYYY-MM-DD') AS day, topic, sub_topic, difficulty, questions, correct
+            FROM question_stats_daily WHERE user_id = %s AND day >= %s::date
+        ''', [user_id, window_start(today)]).fetchall()
+        row = conn.execute('SELECT recent FROM user_stats WHERE user_id = %s', [user_id]).fetchone()
+        return state_from_rollups(rows, row['recent'] if row else [], today)
+
+    def submit_quiz(self, user_id: int, submission_id: str, quiz_data: Dict,
+                    questions: List[Dict]) -> Tuple[Optional[int], bool]:
+        try:
+            with self.pool.connection() as conn:
+                session_id = self._insert_session(conn, int(user_id), quiz_data, submission_id)
+                if session_id is None:
+                    # Already saved by an earlier (or concurrent, now committed) submit of this attempt
+                    row = conn.execute('SELECT id FROM quiz_sessions WHERE submission_id = %s', [submission_id]).fetchone()
+                    return row['id'], False
+                self._insert_questions(conn, int(user_id), session_id, questions)
+                return session_id, True
+
+        except Exception as e:
+            print(f"Quiz submission error: {e}")
+            return None, False
+
+    def save_quiz_session(self, user_id: int, quiz_data: Dict) -> Optional[int]:
+        try:
+            with self.pool.connection() as conn:
+                return self._insert_session(conn, int(user_id), quiz_data)
+        except Exception as e:
+            print(f"Session save error: {e}")
+            return None
+
+    def log_question(self, user_id: int, session_id: int, question_data: Dict) -> bool:
+        try:
+            with self.pool.connection() as conn:
+                self._insert_questions(conn, int(user_id), int(session_id), [question_data])
+            return True
+        except Exception as e:
+            print(f"Question logging error: {e}")
+            return False
+
+    # -- history ---------------------------------------------------------------------
+
+    def get_session_page(self, user_id: int, limit: int = 15,
+                         cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+        try:
+            with self.pool.connection() as conn:
+                if cursor is None:
+                    rows = conn.execute(f'''
+                        SELECT id, topic, sub_topic, question_type, difficulty, num_questions, score, {CREATED_AT}
+                        FROM quiz_sessions
+                        WHERE user_id = %s
+                        ORDER BY quiz_sessions.created_at DESC, id DESC
+                        LIMIT %s
+                    ''', [int(user_id), int(limit) + 1]).fetchall()
+                else:
+                    rows = conn.execute(f'''
+                        SELECT id, topic, sub_topic, question_type, difficulty, num_questions, score, {CREATED_AT}
+                        FROM quiz_sessions
+                        WHERE user_id = %s AND (quiz_sessions.created_at, id) < (%s::timestamp, %s)
+                        ORDER BY quiz_sessions.created_at DESC, id DESC
+                        LIMIT %s
+                    ''', [int(user_id), cursor[0], int(cursor[1]), int(limit) + 1]).fetchall()
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+            return [session_summary(row) for row in rows], next_cursor
+
+        except Exception as e:
+            print(f"Get session page error: {e}")
+            return [], None
+
+    def search_sessions(self, user_id: int, query: str, limit: int = 15,
+                        offset: int = 0) -> Tuple[List[Dict], bool]:
+        terms = [term for term in ''.join(c if c.isalnum() else ' ' for c in query or '').split()]
+        if not terms:
+            return [], False
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, topic, sub_topic, question_type, difficulty, num_questions, score, {CREATED_AT},
+                           ts_headline('english', search_text, q, 'StartSel=**, StopSel=**, MaxWords=12, MinWords=4') AS match
+                    FROM quiz_sessions, to_tsquery('english', %s) AS q
+                    WHERE user_id = %s AND search @@ q
+                    ORDER BY ts_rank(search, q) DESC, id DESC
+                    LIMIT %s OFFSET %s
+                ''', [tsquery, int(user_id), int(limit) + 1, int(offset)]).fetchall()
+
+            sessions = []
+            for row in rows[:limit]:
+                session = session_summary(row)
+                session['match'] = row['match']
+                sessions.append(session)
+            return sessions, len(rows) > limit
+
+        except Exception as e:
+            print(f"Session search error: {e}")
+            return [], False
+
+    def get_complete_session(self, session_id) -> Optional[Dict]:
+        try:
+            if isinstance(session_id, (tuple, list)):
+                session_id = session_id[0]
+
+            with self.pool.connection() as conn:
+                row = conn.execute(f'''
+                    SELECT id, user_id, topic, sub_topic, question_type, difficulty, num_questions, score,
+                           payload, {CREATED_AT}
+                    FROM quiz_sessions WHERE id = %s
+                ''', [int(session_id)]).fetchone()
+                if not row:
+                    return None
+                payload = decompress_payload(bytes(row['payload'])) if row['payload'] else None
+                bank = {r['id']: json.loads(r['body']) for r in conn.execute(
+                    'SELECT id, body FROM question_bank WHERE id = ANY(%s)', [payload['questions']]
+                )} if payload else {}
+
+            result = {
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'topic': row['topic'] if row['topic'] else "General",
+                'sub_topic': row['sub_topic'] if row['sub_topic'] else "",
+                'question_type': row['question_type'] if row['question_type'] else "Multiple Choice",
+                'difficulty': row['difficulty'] if row['difficulty'] else "Medium",
+                'num_questions': row['num_questions'] if row['num_questions'] else 1,
+                'score': float(row['score']) if row['score'] is not None else 0.0,
+                'created_at': row['created_at'] if row['created_at'] else "",
+                'questions_data': [],
+                'user_answers': [],
+                'results_data': []
+            }
+            if payload:
+                result['questions_data'], result['user_answers'], result['results_data'] = expand_payload(payload, bank)
+            return result
+
+        except Exception as e:
+            print(f"Get complete session error: {e}")
+            return None
+
+    # -- export ----------------------------------------------------------------------
+
+    def iter_session_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        cursor = ('-infinity', 0)
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, topic, sub_topic, question_type, difficulty, num_questions, score, {CREATED_AT},
+                           quiz_sessions.created_at AS cursor
+                    FROM quiz_sessions
+                    WHERE user_id = %s AND (quiz_sessions.created_at, id) > (%s::timestamp, %s)
+                    ORDER BY quiz_sessions.created_at, id
+                    LIMIT %s
+                ''', [int(user_id), cursor[0], cursor[1], int(chunk_size)]).fetchall()
+            if not rows:
+                return
+            yield [session_export_row(row) for row in rows]
+            cursor = (rows[-1]['cursor'], rows[-1]['id'])
+
+    def iter_question_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        cursor = ('-infinity', 0)
+        while True:
+            with self.pool.connection() as conn:
+                # The text columns are SQLite's pre-bank legacy; here every row has a bank question
+                rows = conn.execute('''
+                    SELECT l.id, l.user_id, l.session_id, l.topic, l.sub_topic, l.difficulty, l.question_type,
+                           NULL AS question_text, NULL AS options, NULL AS correct_answer, NULL AS explanation,
+                           l.user_answer, l.is_correct, l.time_taken,
+                           to_char(l.created_at, 'YYYY-MM-DD HH24:MI:SS') AS created_at, b.body,
+                           l.created_at AS cursor
+                    FROM question_log l
+                    LEFT JOIN question_bank b ON b.id = l.question_id
+                    WHERE l.user_id = %s AND (l.created_at, l.id) > (%s::timestamp, %s)
+                    ORDER BY l.created_at, l.id
+                    LIMIT %s
+                ''', [int(user_id), cursor[0], cursor[1], int(chunk_size)]).fetchall()
+            if not rows:
+                return
+            yield [logged_question(row) for row in rows]
+            cursor = (rows[-1]['cursor'], rows[-1]['id'])
+
+    # -- analysis --------------------------------------------------------------------
+
+    def get_recent_questions(self, user_id: int, limit: int = 10) -> List[Dict]:
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute('''
+                    SELECT l.id, l.topic, l.sub_topic, l.difficulty, l.question_type,
+                           b.body::json ->> 'question' AS question_text,
+                           l.is_correct, to_char(l.created_at, 'YYYY-MM-DD HH24:MI:SS') AS created_at
+                    FROM question_log l
+                    LEFT JOIN question_bank b ON b.id = l.question_id
+                    WHERE l.user_id = %s
+                    ORDER BY l.created_at DESC, l.id DESC
+                    LIMIT %s
+                ''', [int(user_id), int(limit)]).fetchall()
+            return [dict(row, is_correct=bool(row['is_correct'])) for row in rows]
+
+        except Exception as e:
+            print(f"Get recent questions error: {e}")
+            return []
+
+    def get_recent_outcomes(self, user_id: int) -> List[Dict]:
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT recent FROM user_stats WHERE user_id = %s', [int(user_id)]).fetchone()
+            return [{'topic': topic, 'sub_topic': sub_topic, 'is_correct': is_correct}
+                    for topic, sub_topic, is_correct in (row['recent'] if row else [])]
+        except Exception as e:
+            print(f"Get recent outcomes error: {e}")
+            return []
+
+    def analyze_weak_topics(self, user_id: int, days: int = 7) -> Dict[str, Dict]:
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT topic, sub_topic, difficulty, SUM(questions) AS questions, SUM(correct) AS correct
+                    FROM question_stats_daily
+                    WHERE user_id = %s AND day >= {TODAY} - %s::integer
+                    GROUP BY topic, sub_topic, difficulty
+                    ORDER BY topic, sub_topic
+                ''', [int(user_id), int(days)]).fetchall()
+            return summarize_weak_topics(rows, days)
+
+        except Exception as e:
+            print(f"Weak topic analysis error: {e}")
+            return {'all_topics': {}, 'weak_topics': {}, 'analysis_period_days': days}
+
+    def get_recommendation_state(self, user_id: int) -> Dict:
+        try:
+            with self.pool.connection() as conn:
+                today = self._today(conn)
+                row = conn.execute('SELECT state FROM recommendation_state WHERE user_id = %s', [int(user_id)]).fetchone()
+                state = (current_state(row['state'], today) if row
+                         else self._state_from_rollups(conn, int(user_id), today))
+            return recommendation_view(state)
+        except Exception as e:
+            print(f"Recommendation state error: {e}")
+            return {'day': None, 'recommendations': recommend(summarize_weak_topics([], WINDOW_DAYS)), 'alerts': []}
+
+    def get_topic_calibration(self, user_id: int, topic: str) -> Optional[Dict]:
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT theta, answers FROM user_ability WHERE user_id = %s AND topic = %s',
+                                   [int(user_id), topic]).fetchone()
+                if row is None:
+                    return None
+                items = {r['difficulty']: r['beta'] for r in conn.execute(
+                    'SELECT difficulty, beta FROM item_calibration WHERE topic = %s', [topic])}
+            return {'theta': row['theta'], 'answers': row['answers'], 'items': items}
+        except Exception as e:
+            print(f"Topic calibration error: {e}")
+            return None
+
+    def calibrate(self, iterations: int = 50) -> Dict[str, int]:
+        """Fit item difficulty and user ability over every answer (see calibration.calibrate)"""
+        with self.pool.connection() as conn:
+            # The counts and the answers behind each stored ability from one snapshot
+            conn.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            rows = conn.execute('''
+                SELECT user_id, topic, difficulty, SUM(questions) AS questions, SUM(correct) AS correct
+                FROM question_stats_daily GROUP BY user_id, topic, difficulty
+            ''').fetchall()
+            loaded = {(row['user_id'], row['topic']): row['answers']
+                      for row in conn.execute('SELECT user_id, topic, answers FROM user_ability')}
+        counts = pd.DataFrame.from_records([[row[c] for c in COUNT_COLUMNS] for row in rows], columns=COUNT_COLUMNS)
+        counts = counts.astype({'user_id': 'int64', 'questions': 'int64', 'correct': 'int64'})
+        abilities, items = fit(counts, iterations)
+        fitted = {(int(r.user_id), r.topic): (float(r.theta), int(r.answers)) for r in abilities.itertuples()}
+        with self.pool.connection() as conn:
+            # Abilities Elo moved since the snapshot keep their theta (see calibration.save_calibration)
+            with conn.cursor() as cursor:
+                cursor.executemany('DELETE FROM user_ability WHERE user_id = %s AND topic = %s AND answers = %s', [
+                    (*key, answers) for key, answers in loaded.items() if key not in fitted])
+                cursor.executemany('''
+                    UPDATE user_ability SET theta = %s, answers = %s WHERE user_id = %s AND topic = %s AND answers = %s
+                ''', [(*row, *key, loaded[key]) for key, row in fitted.items() if key in loaded])
+                cursor.executemany('''
+                    INSERT INTO user_ability (user_id, topic, theta, answers) VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (user_id, topic) DO NOTHING
+                ''', [(*key, *row) for key, row in fitted.items() if key not in loaded])
+            conn.execute('TRUNCATE item_calibration')
+            with conn.cursor() as cursor:
+                cursor.executemany('INSERT INTO item_calibration (topic, difficulty, beta, answers) VALUES (%s, %s, %s, %s)', [
+                    (r.topic, r.difficulty, float(r.beta), int(r.answers)) for r in items.itertuples()])
+        return {'users': int(abilities['user_id'].nunique()), 'abilities': len(abilities), 'items': len(items),
+                'answers': int(counts['questions'].sum())}
+
+    def get_due_reviews(self, user_id: int, limit: int = 10) -> List[Dict]:
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT r.question_id, r.topic, r.sub_topic, r.difficulty, r.repetitions, b.body,
+                           to_char(r.due_at, 'YYYY-MM-DD HH24:MI:SS') AS due_at
+                    FROM review_items r JOIN question_bank b ON b.id = r.question_id
+                    WHERE r.user_id = %s AND r.due_at <= {NOW}
+                    ORDER BY r.due_at
+                    LIMIT %s
+                ''', [int(user_id), int(limit)]).fetchall()
+            return [review_question(row) for row in rows]
+        except Exception as e:
+            print(f"Get due reviews error: {e}")
+            return []
+
+    def get_overview(self, user_id: int, days: int = 7) -> Dict:
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT quizzes, score_sum FROM user_stats WHERE user_id = %s', [int(user_id)]).fetchone()
+                recent = conn.execute(f'''
+                    SELECT COALESCE(SUM(quizzes), 0) AS quizzes FROM session_stats_daily
+                    WHERE user_id = %s AND day >= {TODAY} - %s::integer
+                ''', [int(user_id), int(days)]).fetchone()['quizzes']
+            quizzes = row['quizzes'] if row else 0
+            return {
+                'total_quizzes': quizzes,
+                'avg_score': row['score_sum'] / quizzes if quizzes else 0.0,
+                'recent_quizzes': int(recent),
+            }
+        except Exception as e:
+            print(f"Get overview error: {e}")
+            return {'total_quizzes': 0, 'avg_score': 0.0, 'recent_quizzes': 0}
+
+    def get_topic_scores(self, user_id: int) -> List[Dict]:
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute('''
+                    SELECT topic, sub_topic, quizzes, score_sum FROM session_stats WHERE user_id = %s
+                    ORDER BY topic, sub_topic
+                ''', [int(user_id)]).fetchall()
+            return [{
+                'topic': row['topic'] or "Quiz",
+                'sub_topic': row['sub_topic'],
+                'display_title': f"{row['topic'] or 'Quiz'} - {row['sub_topic']}" if row['sub_topic'] else (row['topic'] or "Quiz"),
+                'avg_score': row['score_sum'] / row['quizzes'],
+                'count': row['quizzes'],
+            } for row in rows if row['quizzes']]
+        except Exception as e:
+            print(f"Get topic scores error: {e}")
+            return []
+
+    def get_score_series(self, user_id: int, bucket: str = 'day') -> List[Dict]:
+        period = SERIES_BUCKETS[bucket]
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT to_char({period}, 'YYYY-MM-DD') AS period, SUM(quizzes) AS quizzes, SUM(score_sum) AS score_sum
+                    FROM session_stats_daily WHERE user_id = %s
+                    GROUP BY 1 ORDER BY 1
+                ''', [int(user_id)]).fetchall()
+            return [{'period': row['period'], 'quizzes': int(row['quizzes']), 'avg_score': row['score_sum'] / row['quizzes']}
+                    for row in rows if row['quizzes']]
+        except Exception as e:
+            print(f"Get score series error: {e}")
+            return []
+
+    def get_data_version(self, user_id: int) -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT version FROM user_data_version WHERE user_id = %s', [int(user_id)]).fetchone()
+        return row['version'] if row else 0
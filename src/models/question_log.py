@@ -1,73 +1,59 @@
-import sqlite3
 import json
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from datetime import datetime, timedelta
+from src.models.archive import LOGGED_QUESTION_SQL, archived_questions, iter_archived_questions, logged_question
+from src.models.calibration import recommended_difficulty, topic_calibration, update_abilities
+from src.models.database import DEFAULT_DB_PATH
+from src.models.recommendations import (WINDOW_DAYS, load_state, recommend, recommendation_view,
+                                        summarize_weak_topics)
+from src.models.review import record_reviews
+from src.models.rollups import archived_before, record_questions
+from src.models.session_storage import bank_question, question_ids
+from src.models.shards import get_router
+from src.models.write_queue import write_op
+
+
+@write_op('log_question')
+def _insert_question(conn, payload: Dict):
+    QuestionLogger.insert_questions(conn, payload['user_id'], payload['session_id'], [payload['question_data']])
+
 
 class QuestionLogger:
-    def __init__(self, db_path: str = "studyai.db"):
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
         self.db_path = db_path
-        self.init_tables()
-    
-    def init_tables(self):
-        """Initialize question logging table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS question_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                session_id INTEGER,
-                topic TEXT NOT NULL,
-                sub_topic TEXT,
-                difficulty TEXT,
-                question_type TEXT,
-                question_text TEXT,
-                options TEXT, -- JSON for MCQ options
-                correct_answer TEXT,
-                user_answer TEXT,
-                is_correct BOOLEAN,
-                time_taken INTEGER, -- seconds
-                explanation TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (session_id) REFERENCES quiz_sessions (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        self.router = get_router(db_path)
     
+    @staticmethod
+    def insert_questions(conn, user_id: int, session_id: int, entries: List[Dict]):
+        """Log questions with the text kept once in question_bank; runs inside a write transaction"""
+        ids = question_ids(conn, [bank_question(question_data) for question_data in entries])
+        conn.executemany('''
+            INSERT INTO question_log (
+                user_id, session_id, topic, sub_topic, difficulty, question_type,
+                question_id, user_answer, is_correct, time_taken
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [[
+            int(user_id),
+            int(session_id),
+            question_data.get('topic', ''),
+            question_data.get('sub_topic', ''),
+            question_data.get('difficulty', ''),
+            question_data.get('question_type', ''),
+            question_id,
+            question_data.get('user_answer', ''),
+            bool(question_data.get('is_correct', False)),
+            int(question_data.get('time_taken', 0))
+        ] for question_id, question_data in zip(ids, entries)])
+        record_questions(conn, int(user_id), entries)
+        record_reviews(conn, int(user_id), ids, entries)
+        update_abilities(conn, int(user_id), entries)
+
     def log_question(self, user_id: int, session_id: int, question_data: Dict):
         """Log individual question with user performance"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO question_log (
-                    user_id, session_id, topic, sub_topic, difficulty, question_type,
-                    question_text, options, correct_answer, user_answer, is_correct,
-                    time_taken, explanation
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', [
-                int(user_id),
-                int(session_id),
-                question_data.get('topic', ''),
-                question_data.get('sub_topic', ''),
-                question_data.get('difficulty', ''),
-                question_data.get('question_type', ''),
-                question_data.get('question_text', ''),
-                json.dumps(question_data.get('options', [])),
-                question_data.get('correct_answer', ''),
-                question_data.get('user_answer', ''),
-                bool(question_data.get('is_correct', False)),
-                int(question_data.get('time_taken', 0)),
-                question_data.get('explanation', '')
-            ])
-            
-            conn.commit()
-            conn.close()
+            self.router.for_user(user_id).write('log_question', {
+                'user_id': int(user_id), 'session_id': int(session_id), 'question_data': question_data
+            }).result()
             return True
             
         except Exception as e:
@@ -77,19 +63,27 @@ class QuestionLogger:
     def get_recent_questions(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Get user's recent questions for analysis"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM question_log 
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-            ''', [int(user_id), int(limit)])
+            with self.router.for_user(user_id).connection() as conn:
+                rows = conn.execute('''
+                    SELECT l.id, l.topic, l.sub_topic, l.difficulty, l.question_type,
+                           COALESCE(l.question_text, json_extract(b.body, '$.question')) AS question_text,
+                           l.is_correct, l.created_at
+                    FROM question_log l
+                    LEFT JOIN question_bank b ON b.id = l.question_id
+                    WHERE l.user_id = ?
+                    ORDER BY l.created_at DESC, l.id DESC
+                    LIMIT ?
+                ''', [int(user_id), int(limit)]).fetchall()
+            
+                # Users whose recent answers were archived continue in the cold tier
+                archived = None
+                if len(rows) < limit:
+                    archived = conn.execute(
+                        'SELECT questions FROM archived_question_stats WHERE user_id = ?', [int(user_id)]
+                    ).fetchone()
             
             questions = []
-            for row in cursor.fetchall():
+            for row in rows:
                 questions.append({
                     'id': row['id'],
                     'topic': row['topic'],
@@ -101,149 +95,137 @@ class QuestionLogger:
                     'created_at': row['created_at']
                 })
             
-            conn.close()
+            if archived and archived['questions']:
+                for row in archived_questions(self.db_path, user_id, newest_first=True, limit=limit - len(questions)):
+                    questions.append({key: row[key] for key in (
+                        'id', 'topic', 'sub_topic', 'difficulty', 'question_type', 'question_text',
+                        'is_correct', 'created_at'
+                    )})
+            
             return questions
             
         except Exception as e:
             print(f"Get recent questions error: {e}")
             return []
     
+    def get_question_history(self, user_id: int, since: Optional[str] = None) -> List[Dict]:
+        """
+        Every logged question of the user (created at or after ``since``, a UTC
+        'YYYY-MM-DD[ HH:MM:SS]'), oldest first, from the archive and question_log alike.
+        """
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                rows = conn.execute(LOGGED_QUESTION_SQL + '''
+                    WHERE l.user_id = ? AND l.created_at >= ?
+                    ORDER BY l.created_at, l.id
+                ''', [int(user_id), since or '']).fetchall()
+                archived = conn.execute(
+                    'SELECT questions FROM archived_question_stats WHERE user_id = ?', [int(user_id)]
+                ).fetchone()
+                reaches_archive = not since or since < archived_before(conn)
+            
+            history = []
+            if archived and archived['questions'] and reaches_archive:
+                history = archived_questions(self.db_path, user_id, since=since)
+            return history + [logged_question(row) for row in rows]
+            
+        except Exception as e:
+            print(f"Get question history error: {e}")
+            return []
+    
+    def iter_question_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """
+        The rows of get_question_history, oldest first, in chunks of at most
+        ``chunk_size``, for exports of any length. Errors are raised rather than ending
+        the history early, so an export is never silently cut short.
+        """
+        db = self.router.for_user(user_id)
+        with db.connection() as conn:
+            archived = conn.execute(
+                'SELECT questions FROM archived_question_stats WHERE user_id = ?', [int(user_id)]
+            ).fetchone()
+        if archived and archived['questions']:
+            for rows in iter_archived_questions(self.db_path, user_id):
+                for start in range(0, len(rows), chunk_size):
+                    yield rows[start:start + chunk_size]
+        
+        # Keyset pages, each on a connection of its own, so a slow consumer holds no connection
+        cursor = ('', 0)
+        while True:
+            with db.connection() as conn:
+                rows = conn.execute(LOGGED_QUESTION_SQL + '''
+                    WHERE l.user_id = ? AND (l.created_at, l.id) > (?, ?)
+                    ORDER BY l.created_at, l.id
+                    LIMIT ?
+                ''', [int(user_id), cursor[0], cursor[1], int(chunk_size)]).fetchall()
+            if not rows:
+                return
+            yield [logged_question(row) for row in rows]
+            cursor = (rows[-1]['created_at'], rows[-1]['id'])
+    
+    def get_recent_outcomes(self, user_id: int) -> List[Dict]:
+        """Topic and correctness of the user's last answers, newest first (from user_stats)"""
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                row = conn.execute('SELECT recent FROM user_stats WHERE user_id = ?', [int(user_id)]).fetchone()
+            recent = json.loads(row['recent']) if row and row['recent'] else []
+            return [{'topic': topic, 'sub_topic': sub_topic, 'is_correct': is_correct}
+                    for topic, sub_topic, is_correct in recent]
+        except Exception as e:
+            print(f"Get recent outcomes error: {e}")
+            return []
+    
     def analyze_weak_topics(self, user_id: int, days: int = 7) -> Dict[str, Dict]:
         """Analyze user's weak topics from recent performance"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Get questions from last N days
-            cursor.execute('''
-                SELECT topic, sub_topic, difficulty, is_correct, COUNT(*) as question_count
-                FROM question_log 
-                WHERE user_id = ? AND created_at >= datetime('now', '-{} days')
-                GROUP BY topic, sub_topic, difficulty, is_correct
-                ORDER BY topic, sub_topic
-            '''.format(days), [int(user_id)])
-            
-            # Analyze performance by topic
-            topic_analysis = {}
-            for row in cursor.fetchall():
-                topic_key = row['topic']
-                if row['sub_topic']:
-                    topic_key = f"{row['topic']} - {row['sub_topic']}"
-                
-                if topic_key not in topic_analysis:
-                    topic_analysis[topic_key] = {
-                        'total_questions': 0,
-                        'correct_answers': 0,
-                        'wrong_answers': 0,
-                        'accuracy': 0.0,
-                        'difficulty_breakdown': {},
-                        'needs_practice': False
-                    }
-                
-                # Update counts
-                topic_analysis[topic_key]['total_questions'] += row['question_count']
-                if row['is_correct']:
-                    topic_analysis[topic_key]['correct_answers'] += row['question_count']
-                else:
-                    topic_analysis[topic_key]['wrong_answers'] += row['question_count']
-                
-                # Track difficulty breakdown
-                diff = row['difficulty']
-                if diff not in topic_analysis[topic_key]['difficulty_breakdown']:
-                    topic_analysis[topic_key]['difficulty_breakdown'][diff] = {'correct': 0, 'total': 0}
-                
-                topic_analysis[topic_key]['difficulty_breakdown'][diff]['total'] += row['question_count']
-                if row['is_correct']:
-                    topic_analysis[topic_key]['difficulty_breakdown'][diff]['correct'] += row['question_count']
-            
-            # Calculate accuracy and identify weak topics
-            weak_topics = {}
-            for topic, data in topic_analysis.items():
-                if data['total_questions'] > 0:
-                    data['accuracy'] = (data['correct_answers'] / data['total_questions']) * 100
-                    
-                    # Mark as weak if accuracy < 70% and at least 2 questions attempted
-                    if data['accuracy'] < 70 and data['total_questions'] >= 2:
-                        data['needs_practice'] = True
-                        weak_topics[topic] = data
-            
-            conn.close()
-            return {
-                'all_topics': topic_analysis,
-                'weak_topics': weak_topics,
-                'analysis_period_days': days
-            }
+            with self.router.for_user(user_id).connection() as conn:
+                # Daily rollups of the last N days (whole UTC days)
+                rows = conn.execute('''
+                    SELECT topic, sub_topic, difficulty, SUM(questions) AS questions, SUM(correct) AS correct
+                    FROM question_stats_daily
+                    WHERE user_id = ? AND day >= date('now', ?)
+                    GROUP BY topic, sub_topic, difficulty
+                    ORDER BY topic, sub_topic
+                ''', [int(user_id), f'-{int(days)} days']).fetchall()
+            
+            return summarize_weak_topics(rows, days)
             
         except Exception as e:
             print(f"Weak topic analysis error: {e}")
             return {'all_topics': {}, 'weak_topics': {}, 'analysis_period_days': days}
+    
+    def get_recommendation_state(self, user_id: int) -> Dict:
+        """The user's quiz recommendations and performance alerts, kept as answers are logged"""
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                return recommendation_view(load_state(conn, int(user_id)))
+        except Exception as e:
+            print(f"Recommendation state error: {e}")
+            return {'day': None, 'recommendations': recommend(summarize_weak_topics([], WINDOW_DAYS)), 'alerts': []}
+
+    def get_topic_calibration(self, user_id: int, topic: str) -> Optional[Dict]:
+        """The user's ability on ``topic`` and its item difficulties, None if they have none yet"""
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                return topic_calibration(conn, int(user_id), topic)
+        except Exception as e:
+            print(f"Topic calibration error: {e}")
+            return None
 
 class SmartRecommendationEngine:
     def __init__(self, question_logger: QuestionLogger):
         self.logger = question_logger
     
     def get_personalized_recommendations(self, user_id: int) -> Dict:
-        """Generate personalized quiz recommendations based on user performance"""
-        analysis = self.logger.analyze_weak_topics(user_id, days=14)
-        weak_topics = analysis['weak_topics']
-        
-        recommendations = {
-            'has_recommendations': len(weak_topics) > 0,
-            'weak_topics': list(weak_topics.keys()),
-            'suggested_quiz': None,
-            'focus_areas': [],
-            'motivation_message': ""
-        }
-        
-        if weak_topics:
-            # Find the weakest topic
-            weakest_topic = min(weak_topics.items(), key=lambda x: x[1]['accuracy'])
-            topic_name, topic_data = weakest_topic
-            
-            # Extract main topic and sub-topic
-            if ' - ' in topic_name:
-                main_topic, sub_topic = topic_name.split(' - ', 1)
-            else:
-                main_topic, sub_topic = topic_name, ""
-            
-            # Determine recommended difficulty
-            difficulty_breakdown = topic_data['difficulty_breakdown']
-            recommended_difficulty = "Easy"  # Start with easier questions for weak topics
-            
-            for diff in ['Easy', 'Medium', 'Hard']:
-                if diff in difficulty_breakdown:
-                    if difficulty_breakdown[diff]['correct'] / difficulty_breakdown[diff]['total'] < 0.5:
-                        recommended_difficulty = diff
-                        break
-            
-            recommendations['suggested_quiz'] = {
-                'main_topic': main_topic,
-                'sub_topic': sub_topic,
-                'difficulty': recommended_difficulty,
-                'question_type': 'Multiple Choice',  # Default
-                'num_questions': min(5, max(3, topic_data['wrong_answers'])),
-                'reason': f"You have {topic_data['accuracy']:.0f}% accuracy in this topic"
-            }
-            
-            recommendations['focus_areas'] = [
-                f"{topic}: {data['accuracy']:.0f}% accuracy" 
-                for topic, data in list(weak_topics.items())[:3]
-            ]
-            
-            recommendations['motivation_message'] = self._generate_motivation_message(topic_data['accuracy'])
-        else:
-            recommendations['motivation_message'] = "Great job! You're performing well across all topics. Try exploring new areas or increasing difficulty!"
-        
+        """
+        Personalized quiz recommendations from the user's last WINDOW_DAYS days of answers,
+        at the difficulty their calibrated ability on the topic suggests once it has one
+        """
+        recommendations = self.logger.get_recommendation_state(user_id)['recommendations']
+        suggested = recommendations['suggested_quiz']
+        if suggested:
+            difficulty = recommended_difficulty(self.logger.get_topic_calibration(user_id, suggested['main_topic']))
+            if difficulty and difficulty != suggested['difficulty']:
+                # Cached reads are shared: change a copy
+                recommendations = {**recommendations, 'suggested_quiz': {**suggested, 'difficulty': difficulty}}
         return recommendations
-    
-    def _generate_motivation_message(self, accuracy: float) -> str:
-        """Generate motivational message based on accuracy"""
-        if accuracy < 40:
-            return "🎯 Focus time! Let's strengthen your foundation with some targeted practice."
-        elif accuracy < 60:
-            return "📈 You're improving! A few more practice sessions will boost your confidence."
-        elif accuracy < 80:
-            return "💪 Almost there! Fine-tune your knowledge with focused practice."
-        else:
-            return "🌟 Excellent progress! Ready to tackle more challenging questions?"
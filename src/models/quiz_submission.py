@@ -0,0 +1,59 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+from src.models.database import DEFAULT_DB_PATH
+from src.models.question_log import QuestionLogger
+from src.models.shards import get_router
+from src.models.simple_session import SimpleSessionManager
+from src.models.write_queue import write_op
+
+
+def new_submission_id() -> str:
+    """Id the client keeps for one quiz attempt and sends with every submit of it"""
+    return uuid.uuid4().hex
+
+
+@write_op('submit_quiz')
+def _insert_submission(conn, payload: Dict) -> Tuple[int, bool]:
+    """Session row plus question_log rows; runs inside the caller's write transaction."""
+    user_id, submission_id = payload['user_id'], payload['submission_id']
+
+    # Runs under the write lock, so no other submit can slip in between check and insert
+    existing = conn.execute(
+        'SELECT id FROM quiz_sessions WHERE submission_id = ?', [submission_id]
+    ).fetchone()
+    if existing:
+        return existing['id'], False
+
+    session_id = SimpleSessionManager.insert_session(conn, user_id, payload['quiz_data'], submission_id)
+    QuestionLogger.insert_questions(conn, user_id, session_id, payload['questions'])
+    return session_id, True
+
+
+class QuizSubmissionManager:
+    """
+    Writes a submitted quiz as one unit: the session row and its question_log rows
+    commit together (one transaction, one commit) or not at all.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.router = get_router(db_path)
+
+    def submit_quiz(self, user_id: int, submission_id: str, quiz_data: Dict,
+                    questions: List[Dict]) -> Tuple[Optional[int], bool]:
+        """
+        Save a quiz session with its per-question log.
+
+        Idempotent on ``submission_id``: submitting the same attempt again returns the
+        session saved the first time and writes nothing. Returns ``(session_id, created)``,
+        or ``(None, False)`` if the write failed.
+        """
+        try:
+            return self.router.for_user(user_id).write('submit_quiz', {
+                'user_id': int(user_id), 'submission_id': submission_id,
+                'quiz_data': quiz_data, 'questions': questions,
+            }).result()
+
+        except Exception as e:
+            print(f"Quiz submission error: {e}")
+            return None, False
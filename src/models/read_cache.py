@@ -0,0 +1,219 @@
+"""
+Process-wide cache of per-user reads, invalidated by the user's data version.
+
+Streamlit reruns the whole script on every interaction, and the dashboard, the history
+sidebar and the recommendations read the same user data each time, though it only
+changes when a quiz is saved. ``CachedRepository`` wraps the configured repository
+(``get_repository`` returns it when READ_CACHE_USERS > 0) and keeps the results of the
+user-scoped reads, plus whatever is built from them with ``memoize`` (the dashboard's
+frames), per (user, data version).
+
+The data version is a counter bumped in the transaction of every write to a user's
+history (user_data_version). A write through this process drops the user's cached
+reads at once; writes from other processes (another replica, a CLI) are noticed when
+the version is re-read from the database, at most every READ_CACHE_RECHECK_SECONDS.
+Until then a rerun with no new data does no SQL. Reads over a time window (quizzes
+this week, weak topics of the last days) are also dropped when the UTC day changes.
+
+Cached values are shared between sessions: callers must not modify them.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from src.models.repository import StudyRepository
+
+# Reads kept per user; the oldest go first (search terms and history pages add up)
+MAX_VALUES_PER_USER = 64
+
+
+class _UserEntry:
+    __slots__ = ('version', 'checked_at', 'day', 'values')
+
+    def __init__(self, version: int, checked_at: float, day: str):
+        self.version = version
+        self.checked_at = checked_at
+        self.day = day
+        self.values = {}
+
+
+class ReadCache:
+    """Values per (user, data version), for up to ``max_users`` users, least recently used first out."""
+
+    def __init__(self, load_version: Callable[[int], int], max_users: int = 1000, recheck_seconds: float = 10.0):
+        self.load_version = load_version
+        self.max_users = max_users
+        self.recheck_seconds = recheck_seconds
+        self.hits = self.misses = 0
+        self._users: 'OrderedDict[int, _UserEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, user_id: int) -> _UserEntry:
+        """The user's entry, re-validated against the database when it is due"""
+        now, day = time.monotonic(), datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+                if entry.day == day and now - entry.checked_at < self.recheck_seconds:
+                    return entry
+
+        # Read before the values are, so they are at least as new as the version
+        version = self.load_version(user_id)
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is not entry:
+                entry = current  # re-validated or dropped meanwhile
+            if entry is not None and entry.version == version and entry.day == day:
+                entry.checked_at = now
+                return entry
+            entry = _UserEntry(version, now, day)
+            self._users[user_id] = entry
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            return entry
+
+    def get(self, user_id: int, key: Hashable, compute: Callable):
+        """The cached value of ``key`` for the user, or ``compute()`` (then cached)"""
+        user_id = int(user_id)
+        try:
+            entry = self._entry(user_id)
+        except Exception as e:
+            print(f"Read cache error: {e}")
+            return compute()
+        with self._lock:
+            if key in entry.values:
+                self.hits += 1
+                return entry.values[key]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            # Not if the user's data changed while computing: the entry was replaced then
+            if self._users.get(user_id) is entry:
+                if len(entry.values) >= MAX_VALUES_PER_USER:
+                    entry.values.pop(next(iter(entry.values)))
+                entry.values[key] = value
+        return value
+
+    def invalidate(self, user_id: int):
+        """Drop the user's values, after a write to their history"""
+        with self._lock:
+            self._users.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+class CachedRepository(StudyRepository):
+    """
+    A repository whose per-user reads are served from a ReadCache. Writes go straight
+    to ``backend`` and invalidate the user; everything else is passed through.
+    """
+
+    def __init__(self, backend: StudyRepository, max_users: int = 1000, recheck_seconds: float = 10.0):
+        self.backend = backend
+        self.cache = ReadCache(backend.get_data_version, max_users, recheck_seconds)
+
+    def __getattr__(self, name):
+        # Backend-specific attributes (db_path, pool, close, ...)
+        return getattr(self.backend, name)
+
+    def memoize(self, user_id: int, name: Hashable, compute: Callable):
+        """``compute()`` cached with the user's reads, for values derived from them"""
+        return self.cache.get(user_id, ('memo', name), compute)
+
+    # -- users -----------------------------------------------------------------------
+
+    def create_user(self, username: str, email: str, password_hash: str):
+        return self.backend.create_user(username, email, password_hash)
+
+    def find_user(self, username: str) -> Optional[Dict]:
+        return self.backend.find_user(username)
+
+    def mark_rag_trial_used(self, user_id: int):
+        return self.backend.mark_rag_trial_used(user_id)
+
+    # -- writes ----------------------------------------------------------------------
+
+    def submit_quiz(self, user_id: int, submission_id: str, quiz_data: Dict,
+                    questions: List[Dict]) -> Tuple[Optional[int], bool]:
+        try:
+            return self.backend.submit_quiz(user_id, submission_id, quiz_data, questions)
+        finally:
+            self.cache.invalidate(user_id)
+
+    def save_quiz_session(self, user_id: int, quiz_data: Dict) -> Optional[int]:
+        try:
+            return self.backend.save_quiz_session(user_id, quiz_data)
+        finally:
+            self.cache.invalidate(user_id)
+
+    def log_question(self, user_id: int, session_id: int, question_data: Dict) -> bool:
+        try:
+            return self.backend.log_question(user_id, session_id, question_data)
+        finally:
+            self.cache.invalidate(user_id)
+
+    # -- history ---------------------------------------------------------------------
+
+    def get_session_page(self, user_id: int, limit: int = 15,
+                         cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+        return self.cache.get(user_id, ('get_session_page', limit, cursor),
+                              lambda: self.backend.get_session_page(user_id, limit, cursor))
+
+    def search_sessions(self, user_id: int, query: str, limit: int = 15,
+                        offset: int = 0) -> Tuple[List[Dict], bool]:
+        return self.cache.get(user_id, ('search_sessions', query, limit, offset),
+                              lambda: self.backend.search_sessions(user_id, query, limit, offset))
+
+    def get_complete_session(self, session_id) -> Optional[Dict]:
+        return self.backend.get_complete_session(session_id)
+
+    # -- export ----------------------------------------------------------------------
+
+    def iter_session_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        return self.backend.iter_session_history(user_id, chunk_size)
+
+    def iter_question_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        return self.backend.iter_question_history(user_id, chunk_size)
+
+    # -- analysis --------------------------------------------------------------------
+
+    def get_recent_questions(self, user_id: int, limit: int = 10) -> List[Dict]:
+        return self.cache.get(user_id, ('get_recent_questions', limit),
+                              lambda: self.backend.get_recent_questions(user_id, limit))
+
+    def get_recent_outcomes(self, user_id: int) -> List[Dict]:
+        return self.cache.get(user_id, 'get_recent_outcomes', lambda: self.backend.get_recent_outcomes(user_id))
+
+    def analyze_weak_topics(self, user_id: int, days: int = 7) -> Dict[str, Dict]:
+        return self.cache.get(user_id, ('analyze_weak_topics', days),
+                              lambda: self.backend.analyze_weak_topics(user_id, days))
+
+    def get_recommendation_state(self, user_id: int) -> Dict:
+        return self.cache.get(user_id, 'get_recommendation_state', lambda: self.backend.get_recommendation_state(user_id))
+
+    def get_topic_calibration(self, user_id: int, topic: str) -> Optional[Dict]:
+        return self.cache.get(user_id, ('get_topic_calibration', topic),
+                              lambda: self.backend.get_topic_calibration(user_id, topic))
+
+    def get_due_reviews(self, user_id: int, limit: int = 10) -> List[Dict]:
+        # Questions fall due as time passes, not only when the data version changes
+        return self.backend.get_due_reviews(user_id, limit)
+
+    def get_overview(self, user_id: int, days: int = 7) -> Dict:
+        return self.cache.get(user_id, ('get_overview', days), lambda: self.backend.get_overview(user_id, days))
+
+    def get_topic_scores(self, user_id: int) -> List[Dict]:
+        return self.cache.get(user_id, 'get_topic_scores', lambda: self.backend.get_topic_scores(user_id))
+
+    def get_score_series(self, user_id: int, bucket: str = 'day') -> List[Dict]:
+        return self.cache.get(user_id, ('get_score_series', bucket),
+                              lambda: self.backend.get_score_series(user_id, bucket))
+
+    def get_data_version(self, user_id: int) -> int:
+        return self.backend.get_data_version(user_id)
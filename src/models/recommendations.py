@@ -0,0 +1,298 @@
+"""
+Per-user recommendation state, kept current as answers are logged.
+
+On every rerun the New Quiz tab shows quiz recommendations from the last WINDOW_DAYS
+days of answers (SmartRecommendationEngine) and a performance alert from the last
+answers (check_auto_suggestions). Both come from a small state per user, stored as
+JSON in recommendation_state:
+
+    day               the UTC day it was last brought up to date
+    window            answers per day of the rolling window, as
+                      [topic, sub_topic, difficulty, questions, correct] rows
+    recent            the last answers, as in user_stats.recent
+    recommendations   ``recommend`` over the window
+    alerts            ``performance_alerts`` over the recent answers
+
+``record_answers`` advances it in the transaction that logs the answers: they are
+added to today's counts, days that left the window are dropped and the rest is
+derived again from the window, which is bounded by days x topics, not by history.
+Reading it is one primary-key lookup (kept in memory by src/models/read_cache.py);
+a state last advanced on an earlier day is rolled forward as it is read. Users
+without a state yet get one built from the daily rollups.
+
+The derived fields are exactly what the batch computation gives: ``recommend`` over
+``summarize_weak_topics`` of the window's rows, and ``performance_alerts`` over the
+recent answers (see test_recommendations.py).
+"""
+import json
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+# Days of answers (before today) the recommendations look at
+WINDOW_DAYS = 14
+
+
+def summarize_weak_topics(rows, days: int) -> Dict[str, Dict]:
+    """
+    Per-topic accuracy from (topic, sub_topic, difficulty, questions, correct) rows,
+    flagging the weak ones; shared by every storage backend.
+    """
+    # Analyze performance by topic
+    topic_analysis = {}
+    for row in rows:
+        topic_key = row['topic']
+        if row['sub_topic']:
+            topic_key = f"{row['topic']} - {row['sub_topic']}"
+        
+        if topic_key not in topic_analysis:
+            topic_analysis[topic_key] = {
+                'total_questions': 0,
+                'correct_answers': 0,
+                'wrong_answers': 0,
+                'accuracy': 0.0,
+                'difficulty_breakdown': {},
+                'needs_practice': False
+            }
+        
+        # Update counts
+        topic_analysis[topic_key]['total_questions'] += row['questions']
+        topic_analysis[topic_key]['correct_answers'] += row['correct']
+        topic_analysis[topic_key]['wrong_answers'] += row['questions'] - row['correct']
+        
+        # Track difficulty breakdown
+        diff = row['difficulty']
+        if diff not in topic_analysis[topic_key]['difficulty_breakdown']:
+            topic_analysis[topic_key]['difficulty_breakdown'][diff] = {'correct': 0, 'total': 0}
+        
+        topic_analysis[topic_key]['difficulty_breakdown'][diff]['total'] += row['questions']
+        topic_analysis[topic_key]['difficulty_breakdown'][diff]['correct'] += row['correct']
+    
+    # Calculate accuracy and identify weak topics
+    weak_topics = {}
+    for topic, data in topic_analysis.items():
+        if data['total_questions'] > 0:
+            data['accuracy'] = (data['correct_answers'] / data['total_questions']) * 100
+            
+            # Mark as weak if accuracy < 70% and at least 2 questions attempted
+            if data['accuracy'] < 70 and data['total_questions'] >= 2:
+                data['needs_practice'] = True
+                weak_topics[topic] = data
+    
+    return {
+        'all_topics': topic_analysis,
+        'weak_topics': weak_topics,
+        'analysis_period_days': days
+    }
+
+
+def motivation_message(accuracy: float) -> str:
+    """Generate motivational message based on accuracy"""
+    if accuracy < 40:
+        return "🎯 Focus time! Let's strengthen your foundation with some targeted practice."
+    elif accuracy < 60:
+        return "📈 You're improving! A few more practice sessions will boost your confidence."
+    elif accuracy < 80:
+        return "💪 Almost there! Fine-tune your knowledge with focused practice."
+    else:
+        return "🌟 Excellent progress! Ready to tackle more challenging questions?"
+
+
+def recommend(analysis: Dict) -> Dict:
+    """Quiz recommendations from a weak-topic analysis (see summarize_weak_topics)"""
+    weak_topics = analysis['weak_topics']
+
+    recommendations = {
+        'has_recommendations': len(weak_topics) > 0,
+        'weak_topics': list(weak_topics.keys()),
+        'suggested_quiz': None,
+        'focus_areas': [],
+        'motivation_message': ""
+    }
+
+    if weak_topics:
+        # Find the weakest topic
+        weakest_topic = min(weak_topics.items(), key=lambda x: x[1]['accuracy'])
+        topic_name, topic_data = weakest_topic
+
+        # Extract main topic and sub-topic
+        if ' - ' in topic_name:
+            main_topic, sub_topic = topic_name.split(' - ', 1)
+        else:
+            main_topic, sub_topic = topic_name, ""
+
+        # Determine recommended difficulty
+        difficulty_breakdown = topic_data['difficulty_breakdown']
+        recommended_difficulty = "Easy"  # Start with easier questions for weak topics
+
+        for diff in ['Easy', 'Medium', 'Hard']:
+            if diff in difficulty_breakdown:
+                if difficulty_breakdown[diff]['correct'] / difficulty_breakdown[diff]['total'] < 0.5:
+                    recommended_difficulty = diff
+                    break
+
+        recommendations['suggested_quiz'] = {
+            'main_topic': main_topic,
+            'sub_topic': sub_topic,
+            'difficulty': recommended_difficulty,
+            'question_type': 'Multiple Choice',  # Default
+            'num_questions': min(5, max(3, topic_data['wrong_answers'])),
+            'reason': f"You have {topic_data['accuracy']:.0f}% accuracy in this topic"
+        }
+
+        recommendations['focus_areas'] = [
+            f"{topic}: {data['accuracy']:.0f}% accuracy" 
+            for topic, data in list(weak_topics.items())[:3]
+        ]
+
+        recommendations['motivation_message'] = motivation_message(topic_data['accuracy'])
+    else:
+        recommendations['motivation_message'] = "Great job! You're performing well across all topics. Try exploring new areas or increasing difficulty!"
+
+    return recommendations
+
+
+def performance_alerts(recent_outcomes: List[Dict]) -> List[Dict]:
+    """
+    Topics the user is struggling with right now: under 50% of at least 3 of their last
+    answers (``recent_outcomes`` as get_recent_outcomes returns them), needing 5 answers.
+    """
+    weak_topics = []
+    if len(recent_outcomes) >= 5:
+        topic_performance = {}
+        for q in recent_outcomes:
+            topic_key = q['topic']
+            if q.get('sub_topic'):
+                topic_key = f"{q['topic']} - {q['sub_topic']}"
+            if topic_key not in topic_performance:
+                topic_performance[topic_key] = {'correct': 0, 'total': 0}
+            topic_performance[topic_key]['total'] += 1
+            if q['is_correct']:
+                topic_performance[topic_key]['correct'] += 1
+
+        for topic, perf in topic_performance.items():
+            if perf['total'] >= 3:
+                accuracy = (perf['correct'] / perf['total']) * 100
+                if accuracy < 50:
+                    weak_topics.append({'topic': topic, 'accuracy': accuracy, 'attempts': perf['total']})
+    return weak_topics
+
+
+def window_start(today: str) -> str:
+    """First day ('YYYY-MM-DD') of the window ending ``today``, as ``date(today, '-14 days')``"""
+    return (date.fromisoformat(today) - timedelta(days=WINDOW_DAYS)).isoformat()
+
+
+def recent_outcomes(recent: List) -> List[Dict]:
+    """user_stats.recent entries as get_recent_outcomes returns them"""
+    return [{'topic': topic, 'sub_topic': sub_topic, 'is_correct': is_correct} for topic, sub_topic, is_correct in recent]
+
+
+def _derive(state: Dict, today: str) -> Dict:
+    """``state`` with expired days dropped and the derived fields recomputed, as of ``today``"""
+    start = window_start(today)
+    window = {day: rows for day, rows in state['window'].items() if day >= start}
+    totals = {}
+    for rows in window.values():
+        for topic, sub_topic, difficulty, questions, correct in rows:
+            counts = totals.setdefault((topic, sub_topic, difficulty), [0, 0])
+            counts[0] += questions
+            counts[1] += correct
+    # In the order analyze_weak_topics reads them, which decides ties and list order
+    analysis = summarize_weak_topics([
+        {'topic': topic, 'sub_topic': sub_topic, 'difficulty': difficulty, 'questions': questions, 'correct': correct}
+        for (topic, sub_topic, difficulty), (questions, correct) in sorted(totals.items())
+    ], WINDOW_DAYS)
+    return {
+        'day': today,
+        'window': window,
+        'recent': state['recent'],
+        'recommendations': recommend(analysis),
+        'alerts': performance_alerts(recent_outcomes(state['recent'])),
+    }
+
+
+def state_from_rollups(rows: Iterable, recent: List, today: str) -> Dict:
+    """A state from question_stats_daily rows (day, topic, sub_topic, difficulty, questions, correct)"""
+    window = {}
+    for row in rows:
+        window.setdefault(str(row['day']), []).append(
+            [row['topic'], row['sub_topic'], row['difficulty'], int(row['questions']), int(row['correct'])])
+    return _derive({'window': window, 'recent': recent}, today)
+
+
+def advance_state(state: Dict, entries: List[Dict], recent: List, today: str) -> Dict:
+    """``state`` with newly logged ``entries`` counted on ``today`` and ``recent`` as the last answers"""
+    counts = {(topic, sub_topic, difficulty): [questions, correct]
+              for topic, sub_topic, difficulty, questions, correct in state['window'].get(today, [])}
+    for question_data in entries:
+        # The same keys and values as the question_stats_daily rollup
+        key = (question_data.get('topic', ''), question_data.get('sub_topic', ''), question_data.get('difficulty', ''))
+        row = counts.setdefault(key, [0, 0])
+        row[0] += 1
+        row[1] += int(bool(question_data.get('is_correct', False)))
+    window = dict(state['window'])
+    window[today] = [[*key, questions, correct] for key, (questions, correct) in counts.items()]
+    return _derive({'window': window, 'recent': recent}, today)
+
+
+def current_state(state: Optional[Dict], today: str) -> Dict:
+    """``state`` as of ``today`` (rolled forward if it was last advanced earlier)"""
+    if state is None:
+        return _derive({'window': {}, 'recent': []}, today)
+    return state if state['day'] == today else _derive(state, today)
+
+
+def recommendation_view(state: Dict) -> Dict:
+    """What readers get: the ``day`` it is current for, ``recommendations`` and ``alerts``"""
+    return {'day': state['day'], 'recommendations': state['recommendations'], 'alerts': state['alerts']}
+
+
+# -- SQLite ----------------------------------------------------------------------------
+
+def _today(conn) -> str:
+    return conn.execute("SELECT date('now')").fetchone()[0]
+
+
+def _state_from_rollups(conn, user_id: int, today: str) -> Dict:
+    rows = conn.execute('''
+        SELECT day, topic, sub_topic, difficulty, questions, correct FROM question_stats_daily
+        WHERE user_id = ? AND day >= ?
+    ''', [user_id, window_start(today)]).fetchall()
+    row = conn.execute('SELECT recent FROM user_stats WHERE user_id = ?', [user_id]).fetchone()
+    return state_from_rollups(rows, json.loads(row['recent']) if row and row['recent'] else [], today)
+
+
+def _save_state(conn, user_id: int, state: Dict):
+    conn.execute('''
+        INSERT INTO recommendation_state (user_id, state) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET state = excluded.state
+    ''', [user_id, json.dumps(state)])
+
+
+def record_answers(conn, user_id: int, entries: List[Dict], recent: List):
+    """
+    Advance the user's state by logged ``entries`` (already in question_stats_daily) and
+    their new ``recent`` answers; runs inside the writing transaction.
+    """
+    today = _today(conn)
+    row = conn.execute('SELECT state FROM recommendation_state WHERE user_id = ?', [user_id]).fetchone()
+    if row is None:
+        # The rollups already count the entries
+        state = _state_from_rollups(conn, user_id, today)
+    else:
+        state = advance_state(json.loads(row['state']), entries, recent, today)
+    _save_state(conn, user_id, state)
+
+
+def rebuild_state(conn, user_id: int):
+    """Recompute the user's state from the rollups (after rollups.rebuild_user)."""
+    _save_state(conn, user_id, _state_from_rollups(conn, user_id, _today(conn)))
+
+
+def load_state(conn, user_id: int) -> Dict:
+    """The user's state as of today (built from the rollups, not stored, if they have none yet)."""
+    today = _today(conn)
+    row = conn.execute('SELECT state FROM recommendation_state WHERE user_id = ?', [user_id]).fetchone()
+    if row is None:
+        return _state_from_rollups(conn, user_id, today)
+    return current_state(json.loads(row['state']), today)
@@ -0,0 +1,158 @@
+"""
+Storage backends for users and quiz history.
+
+The app reads and writes through a ``StudyRepository``; ``get_repository`` returns the
+one configured by ``STORAGE_BACKEND``:
+
+    sqlite     a local studyai.db (SQLiteRepository), one per process / pod
+    postgres   a shared PostgreSQL database at DATABASE_URL (PostgresRepository), so
+               every replica sees the same users and history
+
+Both return the same shapes for every method.
+"""
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.config.settings import settings
+from src.models.database import DEFAULT_DB_PATH
+
+
+class StudyRepository(ABC):
+    """Users, quiz sessions, logged questions and their rollups."""
+
+    # -- users -----------------------------------------------------------------------
+
+    @abstractmethod
+    def create_user(self, username: str, email: str, password_hash: str):
+        """Insert a user; raises if the username or email is taken."""
+
+    @abstractmethod
+    def find_user(self, username: str) -> Optional[Dict]:
+        """id, username, email, password_hash and has_used_rag_trial of a user, or None."""
+
+    @abstractmethod
+    def mark_rag_trial_used(self, user_id: int):
+        """Record that the user has used their personalized-prep trial."""
+
+    # -- writes ----------------------------------------------------------------------
+
+    @abstractmethod
+    def submit_quiz(self, user_id: int, submission_id: str, quiz_data: Dict,
+                    questions: List[Dict]) -> Tuple[Optional[int], bool]:
+        """Session plus question log in one transaction, idempotent on submission_id."""
+
+    @abstractmethod
+    def save_quiz_session(self, user_id: int, quiz_data: Dict) -> Optional[int]:
+        """Save a session without a question log; returns its id or None."""
+
+    @abstractmethod
+    def log_question(self, user_id: int, session_id: int, question_data: Dict) -> bool:
+        """Log one answered question of a saved session."""
+
+    # -- history ---------------------------------------------------------------------
+
+    @abstractmethod
+    def get_session_page(self, user_id: int, limit: int = 15,
+                         cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+        """Summary rows newest first, plus the cursor of the next page (None after the last)."""
+
+    def get_user_sessions(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """The latest ``limit`` summary rows."""
+        return self.get_session_page(user_id, limit)[0]
+
+    @abstractmethod
+    def search_sessions(self, user_id: int, query: str, limit: int = 15,
+                        offset: int = 0) -> Tuple[List[Dict], bool]:
+        """Ranked full-text search over the user's history: ``(sessions, has_more)``."""
+
+    @abstractmethod
+    def get_complete_session(self, session_id) -> Optional[Dict]:
+        """A session with its questions, answers and results, for the revision view."""
+
+    # -- export ----------------------------------------------------------------------
+
+    @abstractmethod
+    def iter_session_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """Every session as export rows, oldest first, in chunks; raises on errors."""
+
+    @abstractmethod
+    def iter_question_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """Every logged question (see archive.logged_question), oldest first, in chunks; raises on errors."""
+
+    # -- analysis --------------------------------------------------------------------
+
+    @abstractmethod
+    def get_recent_questions(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """The user's last logged questions, newest first."""
+
+    @abstractmethod
+    def get_recent_outcomes(self, user_id: int) -> List[Dict]:
+        """Topic and correctness of the user's last answers, newest first."""
+
+    @abstractmethod
+    def analyze_weak_topics(self, user_id: int, days: int = 7) -> Dict[str, Dict]:
+        """Per-topic accuracy over the last ``days`` days (see recommendations.summarize_weak_topics)."""
+
+    @abstractmethod
+    def get_recommendation_state(self, user_id: int) -> Dict:
+        """``day``, quiz ``recommendations`` and performance ``alerts`` (see src/models/recommendations.py)."""
+
+    @abstractmethod
+    def get_topic_calibration(self, user_id: int, topic: str) -> Optional[Dict]:
+        """``theta``, ``answers`` and the topic's item ``beta`` per difficulty (see src/models/calibration.py)."""
+
+    @abstractmethod
+    def get_due_reviews(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """Up to ``limit`` logged questions due for review now, longest overdue first (see src/models/review.py)."""
+
+    @abstractmethod
+    def get_overview(self, user_id: int, days: int = 7) -> Dict:
+        """total_quizzes, avg_score and recent_quizzes (in the last ``days`` days)."""
+
+    @abstractmethod
+    def get_topic_scores(self, user_id: int) -> List[Dict]:
+        """Average score and quiz count per topic / sub-topic."""
+
+    @abstractmethod
+    def get_score_series(self, user_id: int, bucket: str = 'day') -> List[Dict]:
+        """Quizzes and average score per UTC ``bucket`` (see rollups.SERIES_BUCKETS), oldest first."""
+
+    @abstractmethod
+    def get_data_version(self, user_id: int) -> int:
+        """A counter bumped by every write to the user's history; raises on errors."""
+
+    def memoize(self, user_id: int, name, compute):
+        """``compute()``, which derives a value from the user's reads; cached by CachedRepository."""
+        return compute()
+
+
+_repositories: Dict[Tuple, StudyRepository] = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(db_path: str = DEFAULT_DB_PATH) -> StudyRepository:
+    """
+    The process-wide repository of the configured backend (``db_path`` is the SQLite
+    file and is ignored for PostgreSQL), behind the per-user read cache
+    (src/models/read_cache.py) unless READ_CACHE_USERS is 0.
+    """
+    backend = settings.STORAGE_BACKEND
+    key = (backend, settings.DATABASE_URL if backend == 'postgres' else db_path)
+    with _repositories_lock:
+        repository = _repositories.get(key)
+        if repository is None:
+            if backend == 'postgres':
+                from src.models.postgres_repository import PostgresRepository
+                repository = PostgresRepository(settings.DATABASE_URL)
+            elif backend == 'sqlite':
+                from src.models.sqlite_repository import SQLiteRepository
+                repository = SQLiteRepository(db_path)
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected 'sqlite' or 'postgres')")
+            if settings.READ_CACHE_USERS > 0:
+                from src.models.read_cache import CachedRepository
+                repository = CachedRepository(repository, settings.READ_CACHE_USERS,
+                                              settings.READ_CACHE_RECHECK_SECONDS)
+            _repositories[key] = repository
+        return repository
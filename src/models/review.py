@@ -0,0 +1,209 @@
+"""
+Spaced repetition over logged questions: a due queue per user, scheduled with SM-2.
+
+Every question a user answers becomes a review item, one row per (user, question bank
+id) in review_items, updated in the transaction that logs the answer:
+
+    repetitions   correct answers in a row
+    interval_days days until the question is due again
+    ease          SM-2 ease factor, START_EASE at first, never under MIN_EASE
+    lapses        times it was answered wrong after having been learnt
+    due_at        when it is due, UTC 'YYYY-MM-DD HH:MM:SS' like question_log.created_at
+
+Answers carry no self-graded quality, so a correct answer counts as SM-2 quality 4 and a
+wrong one as 1: correct answers space the question out (1 day, 6 days, then the last
+interval times the ease, up to MAX_INTERVAL_DAYS), a wrong one brings it back the next
+day with a lower ease.
+
+``ReviewQueue.get_due_reviews`` reads the next due items through the (user_id, due_at) index, one
+index seek plus one row per item returned however many items the user has, with the
+question from question_bank, so a "Review due questions" quiz needs no generation. Such
+a quiz is saved as a session flagged is_review (shown under REVIEW_TOPIC), which the
+per-topic rollups leave out; its answers are logged under their own items' topics.
+Answers logged before review items existed are replayed by migration 14, those logged
+before the question bank by migration 18 once it has banked them, or by
+
+    python -m src.models.review rebuild [--db studyai.db] [--user ID]
+
+which recomputes items from question_log (answers already archived are not replayed),
+moving the text of rows logged before the question bank into it first.
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from src.models.database import DEFAULT_DB_PATH
+from src.models.session_storage import bank_user_questions
+from src.models.shards import get_router
+
+START_EASE = 2.5
+MIN_EASE = 1.3
+# Longest gap between reviews; intervals grow by the ease with every right answer
+MAX_INTERVAL_DAYS = 365
+CORRECT_QUALITY, WRONG_QUALITY = 4, 1
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'  # question_log.created_at, UTC
+# Topic a review quiz's session is shown under; its is_review flag, not this name, marks it
+REVIEW_TOPIC = 'Review'
+
+ITEM_COLUMNS = ['topic', 'sub_topic', 'difficulty', 'repetitions', 'interval_days', 'ease', 'lapses',
+                'reviewed_at', 'due_at']
+
+
+def schedule(item: Optional[Dict], correct: bool, reviewed_at: str) -> Dict:
+    """
+    The SM-2 state of an item (``None`` for a new one) after an answer at
+    ``reviewed_at``: repetitions, interval_days, ease, lapses, reviewed_at and due_at.
+    """
+    repetitions, interval, ease, lapses = (
+        (item['repetitions'], item['interval_days'], item['ease'], item['lapses']) if item else (0, 0, START_EASE, 0)
+    )
+    quality = CORRECT_QUALITY if correct else WRONG_QUALITY
+    if quality >= 3:
+        repetitions += 1
+        if repetitions <= 2:
+            interval = 1 if repetitions == 1 else 6
+        else:
+            interval = min(MAX_INTERVAL_DAYS, max(1, round(interval * ease)))
+    else:
+        lapses += 1 if repetitions else 0
+        repetitions, interval = 0, 1
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    due_at = datetime.strptime(reviewed_at, TIME_FORMAT) + timedelta(days=interval)
+    return {
+        'repetitions': repetitions, 'interval_days': interval, 'ease': ease, 'lapses': lapses,
+        'reviewed_at': reviewed_at, 'due_at': due_at.strftime(TIME_FORMAT),
+    }
+
+
+def _load_items(conn, user_id: int, question_ids: List[int]) -> Dict[int, Dict]:
+    unique = list(dict.fromkeys(question_ids))
+    placeholders = ','.join('?' * len(unique))
+    return {row['question_id']: dict(row) for row in conn.execute(f'''
+        SELECT question_id, {', '.join(ITEM_COLUMNS)} FROM review_items
+        WHERE user_id = ? AND question_id IN ({placeholders})
+    ''', [user_id, *unique])}
+
+
+def _save_items(conn, user_id: int, items: Dict[int, Dict]):
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO review_items (user_id, question_id, {', '.join(ITEM_COLUMNS)})
+        VALUES (?, ?, {', '.join('?' * len(ITEM_COLUMNS))})
+    ''', [(user_id, question_id, *(item[column] for column in ITEM_COLUMNS)) for question_id, item in items.items()])
+
+
+def advance_items(items: Dict[int, Dict], answers, reviewed_at: Optional[str] = None) -> Dict[int, Dict]:
+    """
+    ``items`` (by question id) after ``answers``, (question id, question_log entry)
+    pairs in the order given; each at its ``created_at`` unless ``reviewed_at`` is set.
+    Returns the items that changed.
+    """
+    changed = {}
+    for question_id, question_data in answers:
+        if question_id is None:
+            continue
+        item = schedule(items.get(question_id), bool(question_data.get('is_correct', False)),
+                        reviewed_at or question_data['created_at'])
+        item.update({key: question_data.get(key) or '' for key in ('topic', 'sub_topic', 'difficulty')})
+        items[question_id] = changed[question_id] = item
+    return changed
+
+
+def record_reviews(conn, user_id: int, question_ids: List[int], entries: List[Dict]):
+    """Schedule the logged ``entries`` (asked from bank ``question_ids``); runs inside the writing transaction."""
+    if not entries:
+        return
+    now = conn.execute("SELECT datetime('now')").fetchone()[0]
+    items = _load_items(conn, user_id, question_ids)
+    _save_items(conn, user_id, advance_items(items, zip(question_ids, entries), now))
+
+
+def rebuild_items(conn, user_id: int, bank_legacy: bool = False):
+    """
+    Recompute the user's review items by replaying their question_log.
+
+    Items are keyed by bank id, so rows logged before the question bank are skipped
+    unless ``bank_legacy`` is set, which moves their text into the bank first.
+    """
+    if bank_legacy:
+        bank_user_questions(conn, user_id)
+    conn.execute('DELETE FROM review_items WHERE user_id = ?', [user_id])
+    rows = conn.execute('''
+        SELECT question_id, topic, sub_topic, difficulty, is_correct, created_at FROM question_log
+        WHERE user_id = ? AND question_id IS NOT NULL ORDER BY created_at, id
+    ''', [user_id])
+    items = {}
+    advance_items(items, ((row['question_id'], dict(row)) for row in rows))
+    _save_items(conn, user_id, items)
+
+
+def rebuild_all_items(conn) -> int:
+    """Recompute the review items of every user with logged questions; returns the number of users."""
+    user_ids = [row[0] for row in conn.execute('SELECT DISTINCT user_id FROM question_log WHERE user_id IS NOT NULL')]
+    for user_id in user_ids:
+        rebuild_items(conn, user_id)
+    return len(user_ids)
+
+
+def review_question(row) -> Dict:
+    """A due item as a quiz question, with what its answer is logged under"""
+    return {
+        'question_id': row['question_id'],
+        'question': json.loads(row['body']) if isinstance(row['body'], str) else row['body'],
+        'topic': row['topic'],
+        'sub_topic': row['sub_topic'],
+        'difficulty': row['difficulty'],
+        'due_at': str(row['due_at']),
+        'repetitions': row['repetitions'],
+    }
+
+
+class ReviewQueue:
+    """The questions a user has due for review."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.router = get_router(db_path)
+
+    def get_due_reviews(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """Up to ``limit`` of the user's questions due now, longest overdue first"""
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                rows = conn.execute('''
+                    SELECT r.question_id, r.topic, r.sub_topic, r.difficulty, r.due_at, r.repetitions, b.body
+                    FROM review_items r JOIN question_bank b ON b.id = r.question_id
+                    WHERE r.user_id = ? AND r.due_at <= datetime('now')
+                    ORDER BY r.due_at
+                    LIMIT ?
+                ''', [int(user_id), int(limit)]).fetchall()
+            return [review_question(row) for row in rows]
+        except Exception as e:
+            print(f"Get due reviews error: {e}")
+            return []
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the spaced-repetition review items from question_log.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--user", type=int, help="Only rebuild this user")
+    args = parser.parse_args()
+
+    router = get_router(args.db)
+    if args.user is not None:
+        with router.for_user(args.user).transaction() as conn:
+            rebuild_items(conn, args.user, bank_legacy=True)
+        print(f"Rebuilt review items for user {args.user}")
+    else:
+        # One short transaction per user, so the app keeps writing while this runs
+        rebuilt = 0
+        for db in router.shards:
+            with db.connection() as conn:
+                user_ids = [row[0] for row in conn.execute(
+                    'SELECT DISTINCT user_id FROM question_log WHERE user_id IS NOT NULL')]
+            for user_id in user_ids:
+                with db.transaction() as conn:
+                    rebuild_items(conn, user_id, bank_legacy=True)
+            rebuilt += len(user_ids)
+        print(f"Rebuilt review items for {rebuilt} users")
@@ -0,0 +1,281 @@
+"""
+Per-user performance rollups, kept current in the same transaction as every write to
+quiz_sessions / question_log, so dashboards read O(#topics) rows instead of
+re-aggregating history.
+
+    user_stats            one row per user: quiz and question totals, last answers
+    session_stats         per user/topic/sub-topic: quiz count and score sum (all time),
+                          without review quizzes, whose questions span topics
+    session_stats_daily   the same per UTC day
+    question_stats_daily  per user/day/topic/sub-topic/difficulty: questions, correct, time
+    user_data_version     per user: a counter bumped by every write, for cached reads
+    recommendation_state  per user: quiz recommendations and alerts (src/models/recommendations.py)
+
+Once question_log rows are archived (src/models/archive.py) the rollups keep counting
+them: their days stay in question_stats_daily, which rebuilds leave alone before the
+archive watermark, and their totals in archived_question_stats.
+
+    python -m src.models.rollups rebuild [--db studyai.db] [--user ID]
+"""
+import json
+from typing import Dict, List
+from src.models.database import DEFAULT_DB_PATH
+from src.models.recommendations import rebuild_state, record_answers
+from src.models.shards import get_router
+
+# Answers kept in user_stats.recent for the quick "struggling right now" check
+RECENT_ANSWERS = 10
+
+# Score-over-time buckets: the first day of each, from a session_stats_daily day (weeks start on Monday)
+SERIES_BUCKETS = {
+    'day': "day",
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m-01', day)",
+}
+
+
+def merge_recent(recent: List, entries: List[Dict]) -> List:
+    """``recent`` with ``entries`` (oldest first) pushed on, newest first, capped at RECENT_ANSWERS"""
+    return ([[e.get('topic', ''), e.get('sub_topic', ''), bool(e.get('is_correct', False))] for e in reversed(entries)]
+            + recent)[:RECENT_ANSWERS]
+
+
+def bump_data_version(conn, user_id: int):
+    """Mark the user's history as changed; runs inside the writing transaction."""
+    conn.execute('''
+        INSERT INTO user_data_version (user_id, version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    ''', [user_id])
+
+
+def record_session(conn, user_id: int, quiz_data: Dict):
+    """Add one saved quiz session to the rollups; runs inside the writing transaction."""
+    bump_data_version(conn, user_id)
+    topic, sub_topic = str(quiz_data.get('topic', '')), str(quiz_data.get('sub_topic', ''))
+    score = float(quiz_data.get('score', 0.0))
+    conn.execute('''
+        INSERT INTO user_stats (user_id, quizzes, score_sum) VALUES (?, 1, ?)
+        ON CONFLICT(user_id) DO UPDATE SET quizzes = quizzes + 1, score_sum = score_sum + excluded.score_sum
+    ''', [user_id, score])
+    if not quiz_data.get('is_review'):
+        conn.execute('''
+            INSERT INTO session_stats (user_id, topic, sub_topic, quizzes, score_sum) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT(user_id, topic, sub_topic) DO UPDATE SET
+                quizzes = quizzes + 1, score_sum = score_sum + excluded.score_sum
+        ''', [user_id, topic, sub_topic, score])
+    conn.execute('''
+        INSERT INTO session_stats_daily (user_id, day, topic, sub_topic, quizzes, score_sum)
+        VALUES (?, date('now'), ?, ?, 1, ?)
+        ON CONFLICT(user_id, day, topic, sub_topic) DO UPDATE SET
+            quizzes = quizzes + 1, score_sum = score_sum + excluded.score_sum
+    ''', [user_id, topic, sub_topic, score])
+
+
+def record_questions(conn, user_id: int, entries: List[Dict]):
+    """Add logged questions to the rollups; runs inside the writing transaction."""
+    if not entries:
+        return
+    bump_data_version(conn, user_id)
+    conn.executemany('''
+        INSERT INTO question_stats_daily (user_id, day, topic, sub_topic, difficulty, questions, correct, time_sum)
+        VALUES (?, date('now'), ?, ?, ?, 1, ?, ?)
+        ON CONFLICT(user_id, day, topic, sub_topic, difficulty) DO UPDATE SET
+            questions = questions + 1, correct = correct + excluded.correct, time_sum = time_sum + excluded.time_sum
+    ''', [(
+        user_id,
+        question_data.get('topic', ''),
+        question_data.get('sub_topic', ''),
+        question_data.get('difficulty', ''),
+        int(bool(question_data.get('is_correct', False))),
+        int(question_data.get('time_taken', 0))
+    ) for question_data in entries])
+
+    row = conn.execute('SELECT recent FROM user_stats WHERE user_id = ?', [user_id]).fetchone()
+    recent = merge_recent(json.loads(row['recent']) if row and row['recent'] else [], entries)
+    correct = sum(1 for e in entries if e.get('is_correct'))
+    conn.execute('''
+        INSERT INTO user_stats (user_id, questions, correct, time_sum, recent) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            questions = questions + excluded.questions, correct = correct + excluded.correct,
+            time_sum = time_sum + excluded.time_sum, recent = excluded.recent
+    ''', [user_id, len(entries), correct, sum(int(e.get('time_taken', 0)) for e in entries), json.dumps(recent)])
+    record_answers(conn, user_id, entries, recent)
+
+
+def archived_before(conn) -> str:
+    """Rows of question_log created before this time are archived ('' if none are)."""
+    row = conn.execute(
+        "SELECT archived_before FROM archive_watermarks WHERE table_name = 'question_log'"
+    ).fetchone()
+    return row[0] if row else ''
+
+
+def raise_archive_watermark(conn, before: str):
+    conn.execute('''
+        INSERT INTO archive_watermarks (table_name, archived_before) VALUES ('question_log', ?)
+        ON CONFLICT(table_name) DO UPDATE SET archived_before = MAX(archived_before, excluded.archived_before)
+    ''', [before])
+
+
+def rebuild_user(conn, user_id: int):
+    """Recompute one user's rollups from quiz_sessions, question_log and the archive totals."""
+    previous = conn.execute('SELECT recent FROM user_stats WHERE user_id = ?', [user_id]).fetchone()
+    for table in ('user_stats', 'session_stats', 'session_stats_daily'):
+        conn.execute(f'DELETE FROM {table} WHERE user_id = ?', [user_id])
+    # Archived days have no rows left to recount, so they keep their totals
+    before = archived_before(conn)
+    conn.execute('DELETE FROM question_stats_daily WHERE user_id = ? AND day >= ?', [user_id, before[:10]])
+
+    conn.execute('''
+        INSERT INTO session_stats (user_id, topic, sub_topic, quizzes, score_sum)
+        SELECT user_id, COALESCE(topic, ''), COALESCE(sub_topic, ''), COUNT(*), SUM(COALESCE(score, 0))
+        FROM quiz_sessions WHERE user_id = ? AND is_review = 0
+        GROUP BY COALESCE(topic, ''), COALESCE(sub_topic, '')
+    ''', [user_id])
+    conn.execute('''
+        INSERT INTO session_stats_daily (user_id, day, topic, sub_topic, quizzes, score_sum)
+        SELECT user_id, date(created_at), COALESCE(topic, ''), COALESCE(sub_topic, ''), COUNT(*), SUM(COALESCE(score, 0))
+        FROM quiz_sessions WHERE user_id = ?
+        GROUP BY date(created_at), COALESCE(topic, ''), COALESCE(sub_topic, '')
+    ''', [user_id])
+    conn.execute('''
+        INSERT INTO question_stats_daily (user_id, day, topic, sub_topic, difficulty, questions, correct, time_sum)
+        SELECT user_id, date(created_at), COALESCE(topic, ''), COALESCE(sub_topic, ''), COALESCE(difficulty, ''),
+               COUNT(*), SUM(is_correct = 1), SUM(COALESCE(time_taken, 0))
+        FROM question_log WHERE user_id = ? AND created_at >= ?
+        GROUP BY date(created_at), COALESCE(topic, ''), COALESCE(sub_topic, ''), COALESCE(difficulty, '')
+    ''', [user_id, before[:10]])
+
+    archived = conn.execute(
+        'SELECT questions, correct, time_sum FROM archived_question_stats WHERE user_id = ?', [user_id]
+    ).fetchone()
+    archived = tuple(archived) if archived else (0, 0, 0)
+    recent = [[row['topic'] or '', row['sub_topic'] or '', bool(row['is_correct'])] for row in conn.execute('''
+        SELECT topic, sub_topic, is_correct FROM question_log
+        WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', [user_id, RECENT_ANSWERS])]
+    if len(recent) < RECENT_ANSWERS and archived[0] and previous and previous['recent']:
+        # The older of the last answers were archived; they are still the tail of the old list
+        recent += json.loads(previous['recent'])[len(recent):RECENT_ANSWERS]
+    conn.execute('''
+        INSERT INTO user_stats (user_id, quizzes, score_sum, questions, correct, time_sum, recent)
+        SELECT ?,
+               (SELECT COUNT(*) FROM quiz_sessions WHERE user_id = ?),
+               (SELECT COALESCE(SUM(score), 0) FROM quiz_sessions WHERE user_id = ?),
+               COUNT(*) + ?, COALESCE(SUM(is_correct = 1), 0) + ?, COALESCE(SUM(time_taken), 0) + ?, ?
+        FROM question_log WHERE user_id = ?
+    ''', [user_id, user_id, user_id, *archived, json.dumps(recent), user_id])
+    rebuild_state(conn, user_id)
+
+
+def users_with_history(conn) -> List[int]:
+    return [row[0] for row in conn.execute('''
+        SELECT user_id FROM quiz_sessions WHERE user_id IS NOT NULL
+        UNION SELECT user_id FROM question_log WHERE user_id IS NOT NULL
+    ''')]
+
+
+def rebuild_all(conn) -> int:
+    """Recompute the rollups of every user with history; returns the number of users."""
+    user_ids = users_with_history(conn)
+    for user_id in user_ids:
+        rebuild_user(conn, user_id)
+    return len(user_ids)
+
+
+class PerformanceStats:
+    """Dashboard numbers read from the rollups."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.router = get_router(db_path)
+
+    def get_overview(self, user_id: int, days: int = 7) -> Dict:
+        """Total quizzes, average score and quizzes in the last ``days`` days"""
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                row = conn.execute('SELECT quizzes, score_sum FROM user_stats WHERE user_id = ?', [int(user_id)]).fetchone()
+                recent = conn.execute('''
+                    SELECT COALESCE(SUM(quizzes), 0) FROM session_stats_daily
+                    WHERE user_id = ? AND day >= date('now', ?)
+                ''', [int(user_id), f'-{int(days)} days']).fetchone()[0]
+            quizzes = row['quizzes'] if row else 0
+            return {
+                'total_quizzes': quizzes,
+                'avg_score': row['score_sum'] / quizzes if quizzes else 0.0,
+                'recent_quizzes': recent,
+            }
+        except Exception as e:
+            print(f"Get overview error: {e}")
+            return {'total_quizzes': 0, 'avg_score': 0.0, 'recent_quizzes': 0}
+
+    def get_topic_scores(self, user_id: int) -> List[Dict]:
+        """Average score and quiz count per topic / sub-topic"""
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                rows = conn.execute('''
+                    SELECT topic, sub_topic, quizzes, score_sum FROM session_stats WHERE user_id = ?
+                ''', [int(user_id)]).fetchall()
+            return [{
+                'topic': row['topic'] or "Quiz",
+                'sub_topic': row['sub_topic'],
+                'display_title': f"{row['topic'] or 'Quiz'} - {row['sub_topic']}" if row['sub_topic'] else (row['topic'] or "Quiz"),
+                'avg_score': row['score_sum'] / row['quizzes'],
+                'count': row['quizzes'],
+            } for row in rows if row['quizzes']]
+        except Exception as e:
+            print(f"Get topic scores error: {e}")
+            return []
+
+    def get_score_series(self, user_id: int, bucket: str = 'day') -> List[Dict]:
+        """
+        ``period`` (first day of the bucket, 'YYYY-MM-DD'), ``quizzes`` and ``avg_score``
+        per UTC day, week or month with quizzes, oldest first; one row per bucket
+        however many quizzes it holds.
+        """
+        period = SERIES_BUCKETS[bucket]
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT {period} AS period, SUM(quizzes) AS quizzes, SUM(score_sum) AS score_sum
+                    FROM session_stats_daily WHERE user_id = ?
+                    GROUP BY 1 ORDER BY 1
+                ''', [int(user_id)]).fetchall()
+            return [{'period': row['period'], 'quizzes': row['quizzes'], 'avg_score': row['score_sum'] / row['quizzes']}
+                    for row in rows if row['quizzes']]
+        except Exception as e:
+            print(f"Get score series error: {e}")
+            return []
+
+    def get_data_version(self, user_id: int) -> int:
+        """How many times the user's history has been written to (0 if never)"""
+        with self.router.for_user(user_id).connection() as conn:
+            row = conn.execute('SELECT version FROM user_data_version WHERE user_id = ?', [int(user_id)]).fetchone()
+        return row['version'] if row else 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the performance rollups from the history tables.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--user", type=int, help="Only rebuild this user")
+    args = parser.parse_args()
+
+    router = get_router(args.db)
+    if args.user is not None:
+        with router.for_user(args.user).transaction() as conn:
+            rebuild_user(conn, args.user)
+        print(f"Rebuilt rollups for user {args.user}")
+    else:
+        # One short transaction per user, so the app keeps writing while this runs
+        rebuilt = 0
+        for db in router.shards:
+            with db.connection() as conn:
+                user_ids = users_with_history(conn)
+            for user_id in user_ids:
+                with db.transaction() as conn:
+                    rebuild_user(conn, user_id)
+            rebuilt += len(user_ids)
+        print(f"Rebuilt rollups for {rebuilt} users")
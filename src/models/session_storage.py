@@ -0,0 +1,287 @@
+"""
+Compact storage for quiz session payloads.
+
+Questions live once in ``question_bank``, keyed by a hash of their content. A session
+stores a single compressed ``payload`` blob holding the question ids, the user's answers
+and only those parts of each result that cannot be rebuilt from the question (time
+taken, correctness, anything unexpected). ``question_log`` rows reference the bank by
+``question_id`` instead of repeating the text. Sessions written before this format keep
+their JSON columns until ``migrate`` converts them; readers handle both.
+
+    python -m src.models.session_storage migrate [--db studyai.db] [--batch-size 200] [--vacuum]
+"""
+import json
+import zlib
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from src.config.settings import settings
+
+PAYLOAD_VERSION = 1
+
+# First byte of a payload blob names its compression
+ZLIB_CODEC = b'z'
+ZSTD_CODEC = b's'
+
+# Question keys rebuilt from the bank when a result is decoded
+_DERIVED_RESULT_KEYS = ('question_number', 'question', 'question_type', 'user_answer',
+                        'correct_answer', 'explanation', 'options')
+
+# zstandard (de)compressor objects must not be shared between threads, and readers plus
+# one writer thread per shard all pack and unpack payloads, so each thread gets its own
+_zstd = threading.local()
+
+
+def _zstd_compressor():
+    if not hasattr(_zstd, 'compressor'):
+        _zstd.compressor = zstandard.ZstdCompressor(level=3)
+    return _zstd.compressor
+
+
+def _zstd_decompressor():
+    if not hasattr(_zstd, 'decompressor'):
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return _zstd.decompressor
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def _loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def compress_payload(obj) -> bytes:
+    """Serialize and compress with the configured codec (zlib if zstandard is missing)."""
+    data = _dumps(obj)
+    if settings.PAYLOAD_COMPRESSION == 'zstd' and zstandard is not None:
+        return ZSTD_CODEC + _zstd_compressor().compress(data)
+    return ZLIB_CODEC + zlib.compress(data, 6)
+
+
+def decompress_payload(blob: bytes):
+    codec, body = bytes(blob[:1]), blob[1:]
+    if codec == ZSTD_CODEC:
+        if zstandard is None:
+            raise RuntimeError("Payload is zstd-compressed but the zstandard package is not installed")
+        return _loads(_zstd_decompressor().decompress(body))
+    if codec == ZLIB_CODEC:
+        return _loads(zlib.decompress(body))
+    raise ValueError(f"Unknown payload codec {codec!r}")
+
+
+def canonical_question(question: Dict) -> str:
+    return json.dumps(question, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def question_hash(body: str) -> str:
+    return hashlib.blake2b(body.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def bank_question(question_data: Dict) -> Dict:
+    """The question a question_log entry was asked from, in the shape quizzes store it."""
+    question = {
+        'type': question_data.get('question_type', ''),
+        'question': question_data.get('question_text', ''),
+        'correct_answer': question_data.get('correct_answer', ''),
+        'explanation': question_data.get('explanation', ''),
+    }
+    if question_data.get('options'):
+        question['options'] = question_data['options']
+    return question
+
+
+def legacy_log_question(row) -> Dict:
+    """Bank question of a question_log row saved with its text in its own columns."""
+    return bank_question({
+        'question_type': row['question_type'] or '',
+        'question_text': row['question_text'] or '',
+        'options': json.loads(row['options']) if row['options'] else [],
+        'correct_answer': row['correct_answer'] or '',
+        'explanation': row['explanation'] or '',
+    })
+
+
+def question_ids(conn, questions: List[Dict]) -> List[int]:
+    """Bank ids for ``questions``, adding the ones not stored yet (needs a write transaction)."""
+    bodies = [canonical_question(question) for question in questions]
+    hashes = [question_hash(body) for body in bodies]
+    if not hashes:
+        return []
+    conn.executemany('INSERT OR IGNORE INTO question_bank (hash, body) VALUES (?, ?)', list(zip(hashes, bodies)))
+
+    unique = list(dict.fromkeys(hashes))
+    placeholders = ','.join('?' * len(unique))
+    ids = {row[0]: row[1] for row in conn.execute(
+        f'SELECT hash, id FROM question_bank WHERE hash IN ({placeholders})', unique
+    )}
+    return [ids[h] for h in hashes]
+
+
+def load_questions(conn, ids: List[int]) -> Dict[int, Dict]:
+    unique = list(dict.fromkeys(int(i) for i in ids))
+    if not unique:
+        return {}
+    placeholders = ','.join('?' * len(unique))
+    return {row[0]: json.loads(row[1]) for row in conn.execute(
+        f'SELECT id, body FROM question_bank WHERE id IN ({placeholders})', unique
+    )}
+
+
+def _derived_result(question: Dict, index: int, user_answers: List) -> Dict:
+    return {
+        'question_number': index + 1,
+        'question': question.get('question', ''),
+        'question_type': question.get('type', ''),
+        'user_answer': user_answers[index] if index < len(user_answers) else None,
+        'correct_answer': question.get('correct_answer', ''),
+        'explanation': question.get('explanation', ''),
+        'options': question.get('options', []),
+    }
+
+
+def pack_session(conn, quiz_data: Dict) -> bytes:
+    """Compressed payload for a session's questions, answers and results."""
+    return build_payload(quiz_data, question_ids(conn, quiz_data.get('questions_data') or []))
+
+
+def build_payload(quiz_data: Dict, ids: List[int]) -> bytes:
+    """Payload of a session whose questions have the bank ids ``ids``."""
+    questions = quiz_data.get('questions_data') or []
+    user_answers = quiz_data.get('user_answers') or []
+
+    results = []
+    for i, result in enumerate(quiz_data.get('results_data') or []):
+        derived = _derived_result(questions[i], i, user_answers) if i < len(questions) else {}
+        results.append({key: value for key, value in result.items()
+                        if key not in derived or derived[key] != value})
+
+    return compress_payload({
+        'v': PAYLOAD_VERSION,
+        'questions': ids,
+        'user_answers': user_answers,
+        'results': results,
+    })
+
+
+def unpack_session(conn, blob: bytes) -> Tuple[List[Dict], List, List[Dict]]:
+    """``(questions_data, user_answers, results_data)`` from a packed payload."""
+    payload = decompress_payload(blob)
+    return expand_payload(payload, load_questions(conn, payload['questions']))
+
+
+def expand_payload(payload: Dict, bank: Dict[int, Dict]) -> Tuple[List[Dict], List, List[Dict]]:
+    """Rebuild a decompressed payload given its questions by bank id."""
+    questions = [bank[question_id] for question_id in payload['questions']]
+
+    results = []
+    for i, residual in enumerate(payload['results']):
+        result = {}
+        if i < len(questions):
+            derived = _derived_result(questions[i], i, payload['user_answers'])
+            result = {key: derived[key] for key in _DERIVED_RESULT_KEYS}
+        result.update(residual)
+        results.append(result)
+    return questions, payload['user_answers'], results
+
+
+def _migrate_sessions_batch(conn, after_id: int, batch_size: int) -> int:
+    rows = conn.execute('''
+        SELECT id, questions_data, user_answers, results_data FROM quiz_sessions
+        WHERE id > ? AND payload IS NULL ORDER BY id LIMIT ?
+    ''', [after_id, batch_size]).fetchall()
+    for row in rows:
+        quiz_data = {
+            key: json.loads(row[key]) if row[key] else []
+            for key in ('questions_data', 'user_answers', 'results_data')
+        }
+        conn.execute('''
+            UPDATE quiz_sessions SET payload = ?, questions_data = NULL, user_answers = NULL, results_data = NULL
+            WHERE id = ? AND payload IS NULL
+        ''', [pack_session(conn, quiz_data), row['id']])
+    return rows[-1]['id'] if rows else None
+
+
+def _bank_logged_questions(conn, rows):
+    """Move the text of legacy question_log ``rows`` into the bank."""
+    ids = question_ids(conn, [legacy_log_question(row) for row in rows])
+    conn.executemany('''
+        UPDATE question_log SET question_id = ?, question_text = NULL, options = NULL,
+                                correct_answer = NULL, explanation = NULL
+        WHERE id = ?
+    ''', [(question_id, row['id']) for question_id, row in zip(ids, rows)])
+
+
+def _migrate_questions_batch(conn, after_id: int, batch_size: int) -> int:
+    rows = conn.execute('''
+        SELECT id, question_type, question_text, options, correct_answer, explanation FROM question_log
+        WHERE id > ? AND question_id IS NULL ORDER BY id LIMIT ?
+    ''', [after_id, batch_size]).fetchall()
+    _bank_logged_questions(conn, rows)
+    return rows[-1]['id'] if rows else None
+
+
+def bank_user_questions(conn, user_id: int) -> int:
+    """Convert one user's legacy question_log rows (see ``migrate``); returns how many there were."""
+    rows = conn.execute('''
+        SELECT id, question_type, question_text, options, correct_answer, explanation FROM question_log
+        WHERE user_id = ? AND question_id IS NULL
+    ''', [user_id]).fetchall()
+    _bank_logged_questions(conn, rows)
+    return len(rows)
+
+
+def migrate(db_path: str, batch_size: int = 200) -> Dict[str, int]:
+    """
+    Convert legacy JSON sessions and question_log text in small transactions.
+
+    Safe to run while the app is serving: each batch is a short write transaction and
+    readers understand both formats. Rerunning continues with what is left.
+    """
+    from src.models.database import get_database
+
+    db = get_database(db_path)
+    counts = {}
+    for name, migrate_batch in (('sessions', _migrate_sessions_batch), ('questions', _migrate_questions_batch)):
+        last_id, batches = 0, 0
+        while True:
+            with db.transaction() as conn:
+                last_id = migrate_batch(conn, last_id, batch_size)
+            if last_id is None:
+                break
+            batches += 1
+        counts[name] = batches
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+    from src.models.database import DEFAULT_DB_PATH, get_database
+
+    parser = argparse.ArgumentParser(description="Convert quiz sessions to the compact payload format.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--vacuum", action="store_true", help="Rebuild the file afterwards to return freed pages to the OS")
+    args = parser.parse_args()
+
+    counts = migrate(args.db, args.batch_size)
+    print(f"Migrated {counts['sessions']} session batches and {counts['questions']} question_log batches")
+    if args.vacuum:
+        with get_database(args.db).connection() as conn:
+            conn.execute('VACUUM')
+        print("Vacuumed")
@@ -0,0 +1,303 @@
+"""
+Hash sharding of the quiz history over several SQLite files.
+
+With ``SHARD_COUNT`` > 1 each user's quiz_sessions, question_log, rollups, search index
+and the question_bank rows they use live in one of N files, picked by a hash of the user
+id. Every file has its own write lock and writer thread, so writes of users on different
+shards commit in parallel; a user's writes still touch a single file and stay one
+transaction.
+
+    studyai.db           users and the shard layout, plus shard 0
+    studyai.shard1.db    shard 1
+    ...
+
+Session ids are allocated from a separate range per shard (shard k counts up from
+k * SHARD_ID_SPAN), so a session id alone names its shard. The managers reach the
+files only through ``get_router``.
+
+Changing the shard count of a database with history moves users between files, which
+is done offline (app stopped) and can be rerun after an interruption:
+
+    python -m src.models.shards reshard --shards 4 [--db studyai.db]
+    python -m src.models.shards status [--db studyai.db]
+"""
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.config.settings import settings
+from src.models.database import DEFAULT_DB_PATH, Database, close_database, get_database
+
+# Width of each shard's session id range (2^40 sessions per shard)
+SHARD_ID_SPAN = 1 << 40
+
+# Tables holding per-user rows, in the order a user's rows are deleted
+USER_TABLES = ('question_log', 'quiz_sessions', 'user_stats', 'session_stats',
+               'session_stats_daily', 'question_stats_daily', 'archived_question_stats', 'user_data_version',
+               'recommendation_state', 'review_items', 'user_ability')
+
+
+def shard_path(db_path: str, index: int) -> str:
+    """File of shard ``index``; shard 0 is the main database itself."""
+    if index == 0:
+        return db_path
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.shard{index}{ext or '.db'}"
+
+
+def shard_of(user_id: int, shard_count: int) -> int:
+    """Shard of a user; stable across processes and Python versions (unlike hash())."""
+    if shard_count <= 1:
+        return 0
+    digest = hashlib.blake2b(str(int(user_id)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+
+def open_shard(db_path: str, index: int) -> Database:
+    """The Database of one shard, with its session ids starting in its own range."""
+    db = get_database(shard_path(db_path, index))
+    floor = index * SHARD_ID_SPAN
+    if floor:
+        with db.connection() as conn:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'quiz_sessions'").fetchone()
+        if row is None or row['seq'] < floor:
+            with db.transaction() as conn:
+                if row is None:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('quiz_sessions', ?)", [floor])
+                else:
+                    conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'quiz_sessions'", [floor])
+    return db
+
+
+def recorded_shard_count(main: Database) -> int:
+    with main.connection() as conn:
+        return conn.execute('SELECT shard_count FROM shard_layout WHERE id = 1').fetchone()[0]
+
+
+def _has_history(db: Database) -> bool:
+    with db.connection() as conn:
+        return any(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone()
+                   for table in ('quiz_sessions', 'question_log'))
+
+
+class ShardRouter:
+    """The shard files of one database; picks the file a user's or session's rows are in."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, shard_count: Optional[int] = None):
+        self.db_path = db_path
+        self.main = get_database(db_path)
+        configured = settings.SHARD_COUNT if shard_count is None else shard_count
+        if configured < 1:
+            raise ValueError(f"SHARD_COUNT must be at least 1, got {configured}")
+
+        recorded = recorded_shard_count(self.main)
+        if recorded != configured:
+            # A database without history can simply start out with the configured layout
+            if any(_has_history(open_shard(db_path, index)) for index in range(recorded)):
+                raise RuntimeError(
+                    f"{db_path} holds its history in {recorded} shard(s) but SHARD_COUNT is {configured}; "
+                    f"stop the app and run `python -m src.models.shards reshard --shards {configured}`"
+                )
+            with self.main.transaction() as conn:
+                conn.execute('UPDATE shard_layout SET shard_count = ? WHERE id = 1', [configured])
+
+        self.shard_count = configured
+        self.shards: List[Database] = [open_shard(db_path, index) for index in range(configured)]
+
+    def for_user(self, user_id: int) -> Database:
+        return self.shards[shard_of(user_id, self.shard_count)]
+
+    def for_session(self, session_id: int) -> Optional[Database]:
+        """Shard a session id was allocated by, or None for an id outside every shard."""
+        index = int(session_id) // SHARD_ID_SPAN
+        return self.shards[index] if 0 <= index < self.shard_count else None
+
+    def close_all(self):
+        for db in self.shards:
+            db.close_all()
+
+
+_routers: Dict[Tuple[str, int], ShardRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(db_path: str = DEFAULT_DB_PATH) -> ShardRouter:
+    """The process-wide router of a database with the configured SHARD_COUNT."""
+    key = (db_path, settings.SHARD_COUNT)
+    with _routers_lock:
+        router = _routers.get(key)
+        # Rebuilt if the main Database was closed and reopened since (tests, reshard)
+        if router is None or router.main is not get_database(db_path):
+            router = ShardRouter(db_path, settings.SHARD_COUNT)
+            _routers[key] = router
+        return router
+
+
+def _delete_user(conn, user_id: int):
+    for table in USER_TABLES:
+        conn.execute(f'DELETE FROM {table} WHERE user_id = ?', [user_id])
+
+
+def _move_user(source: Database, target: Database, user_id: int):
+    """
+    Copy one user's history into ``target``, then delete it from ``source``.
+
+    The copy replaces whatever an interrupted earlier run left for the user in
+    ``target``, so moving again after a crash is safe. Sessions get ids from the target's
+    range; question_log rows follow their session. The search index is filled by its
+    triggers and the rollups are rebuilt from the copied rows, except for what only the
+    rollups still know about archived rows (src.models.archive), which is copied as is.
+    Review items (src.models.review) are copied as well, pointing at the target's bank ids,
+    and so are abilities (src.models.calibration).
+    """
+    from src.models.review import ITEM_COLUMNS as REVIEW_COLUMNS
+    from src.models.rollups import archived_before, raise_archive_watermark, rebuild_user
+    from src.models.session_storage import legacy_log_question, pack_session, question_ids
+    from src.models.simple_session import session_contents
+
+    with source.connection() as conn:
+        sessions = conn.execute(
+            'SELECT * FROM quiz_sessions WHERE user_id = ? ORDER BY created_at, id', [user_id]
+        ).fetchall()
+        contents = [session_contents(conn, row) for row in sessions]
+        logged = conn.execute('''
+            SELECT l.*, b.body FROM question_log l LEFT JOIN question_bank b ON b.id = l.question_id
+            WHERE l.user_id = ? ORDER BY l.created_at, l.id
+        ''', [user_id]).fetchall()
+        watermark = archived_before(conn)
+        archived = conn.execute('SELECT * FROM archived_question_stats WHERE user_id = ?', [user_id]).fetchall()
+        stats = conn.execute('SELECT * FROM user_stats WHERE user_id = ?', [user_id]).fetchall()
+        version = conn.execute('SELECT * FROM user_data_version WHERE user_id = ?', [user_id]).fetchall()
+        ability = conn.execute('SELECT * FROM user_ability WHERE user_id = ?', [user_id]).fetchall()
+        reviews = conn.execute('''
+            SELECT r.*, b.body FROM review_items r JOIN question_bank b ON b.id = r.question_id WHERE r.user_id = ?
+        ''', [user_id]).fetchall()
+        daily = conn.execute('SELECT * FROM question_stats_daily WHERE user_id = ? AND day < ?',
+                             [user_id, watermark[:10]]).fetchall()
+
+    with target.transaction() as conn:
+        _delete_user(conn, user_id)
+
+        session_ids = {}
+        for row, (questions_data, user_answers, results_data) in zip(sessions, contents):
+            cursor = conn.execute('''
+                INSERT INTO quiz_sessions (
+                    user_id, topic, sub_topic, question_type, difficulty,
+                    num_questions, score, payload, submission_id, is_review, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                user_id, row['topic'], row['sub_topic'], row['question_type'], row['difficulty'],
+                row['num_questions'], row['score'],
+                pack_session(conn, {'questions_data': questions_data, 'user_answers': user_answers,
+                                    'results_data': results_data}),
+                row['submission_id'], row['is_review'], row['created_at'],
+            ])
+            session_ids[row['id']] = cursor.lastrowid
+
+        ids = question_ids(conn, [json.loads(row['body']) if row['body'] else legacy_log_question(row)
+                                  for row in logged])
+        conn.executemany('''
+            INSERT INTO question_log (
+                user_id, session_id, topic, sub_topic, difficulty, question_type,
+                question_id, user_answer, is_correct, time_taken, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [[
+            user_id, session_ids.get(row['session_id']), row['topic'], row['sub_topic'], row['difficulty'],
+            row['question_type'], question_id, row['user_answer'], row['is_correct'], row['time_taken'],
+            row['created_at'],
+        ] for question_id, row in zip(ids, logged)])
+
+        if watermark:
+            raise_archive_watermark(conn, watermark)
+        for table, rows in (('archived_question_stats', archived), ('question_stats_daily', daily),
+                            ('user_stats', stats), ('user_data_version', version), ('user_ability', ability)):
+            if rows:
+                columns = rows[0].keys()
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [tuple(row) for row in rows]
+                )
+        review_ids = question_ids(conn, [json.loads(row['body']) for row in reviews])
+        columns = ['user_id', 'question_id', *REVIEW_COLUMNS]
+        conn.executemany(
+            f"INSERT INTO review_items ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [(user_id, question_id, *(row[column] for column in REVIEW_COLUMNS)) for question_id, row in zip(review_ids, reviews)]
+        )
+        rebuild_user(conn, user_id)
+
+    with source.transaction() as conn:
+        _delete_user(conn, user_id)
+
+
+def reshard(db_path: str, shard_count: int) -> Dict[str, int]:
+    """
+    Move every user's history to its shard under ``shard_count`` and record the new
+    layout. Run with the app stopped; rerunning after an interruption finishes the job.
+
+    Shard files no longer used are removed. Question bank rows of users that moved
+    out stay behind in their old file (they are small and shared by other users there).
+    """
+    from src.models.rollups import users_with_history
+
+    if shard_count < 1:
+        raise ValueError(f"shard count must be at least 1, got {shard_count}")
+    main = get_database(db_path)
+    old_count = recorded_shard_count(main)
+    shards = [open_shard(db_path, index) for index in range(max(old_count, shard_count))]
+
+    moved = kept = 0
+    for index in range(old_count):
+        with shards[index].connection() as conn:
+            user_ids = users_with_history(conn)
+        for user_id in user_ids:
+            target = shard_of(user_id, shard_count)
+            if target == index:
+                kept += 1
+                continue
+            _move_user(shards[index], shards[target], user_id)
+            moved += 1
+
+    with main.transaction() as conn:
+        conn.execute('UPDATE shard_layout SET shard_count = ? WHERE id = 1', [shard_count])
+
+    removed = 0
+    for index in range(shard_count, old_count):
+        path = shard_path(db_path, index)
+        close_database(path)
+        for suffix in ('', '-wal', '-shm', '-writes.journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        removed += 1
+
+    with _routers_lock:
+        _routers.clear()
+    return {'moved': moved, 'kept': kept, 'removed': removed, 'from': old_count, 'to': shard_count}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or change how the quiz history is split over SQLite files.")
+    parser.add_argument("command", choices=["status", "reshard"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--shards", type=int, help="New shard count (reshard)")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        from src.models.rollups import users_with_history
+
+        shard_count = recorded_shard_count(get_database(args.db))
+        print(f"{args.db}: {shard_count} shard(s)")
+        for index in range(shard_count):
+            with open_shard(args.db, index).connection() as conn:
+                users = len(users_with_history(conn))
+                sessions = conn.execute('SELECT COUNT(*) FROM quiz_sessions').fetchone()[0]
+            print(f"  {shard_path(args.db, index)}: {users} users, {sessions} sessions")
+    else:
+        if args.shards is None:
+            parser.error("reshard needs --shards")
+        counts = reshard(args.db, args.shards)
+        print(f"Resharded {args.db} from {counts['from']} to {counts['to']} shard(s): "
+              f"moved {counts['moved']} users, kept {counts['kept']}, removed {counts['removed']} file(s)")
@@ -1,163 +1,236 @@
-import sqlite3
+import re
 import json
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.models.database import DEFAULT_DB_PATH
+from src.models.rollups import record_session
+from src.models.session_storage import pack_session, unpack_session
+from src.models.shards import get_router
+from src.models.write_queue import write_op
 
-class SimpleSessionManager:
-    def __init__(self, db_path: str = "studyai.db"):
-        self.db_path = db_path
-        self.init_tables()
+
+@write_op('save_quiz_session')
+def _insert_session(conn, payload: Dict) -> int:
+    return SimpleSessionManager.insert_session(conn, payload['user_id'], payload['quiz_data'])
+
+
+def session_summary(row) -> Dict:
+    """Sidebar / dashboard summary of one quiz_sessions row"""
+    topic = row['topic'] if row['topic'] else "Quiz"
+    sub_topic = row['sub_topic'] if row['sub_topic'] else ""
     
-    def init_tables(self):
-        """Initialize and update quiz sessions table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create base table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS quiz_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                topic TEXT NOT NULL,
-                sub_topic TEXT,
-                question_type TEXT NOT NULL,
-                difficulty TEXT NOT NULL,
-                num_questions INTEGER NOT NULL,
-                score REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Add new columns if they don't exist
-        self._add_column_safe(cursor, 'quiz_sessions', 'questions_data', 'TEXT')
-        self._add_column_safe(cursor, 'quiz_sessions', 'user_answers', 'TEXT')
-        self._add_column_safe(cursor, 'quiz_sessions', 'results_data', 'TEXT')
-        
-        conn.commit()
-        conn.close()
+    # Create display title
+    display_title = topic
+    if sub_topic:
+        display_title = f"{topic} - {sub_topic}"
     
-    def _add_column_safe(self, cursor, table_name: str, column_name: str, column_type: str):
-        """Safely add column if it doesn't exist"""
-        try:
-            cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}')
-        except sqlite3.OperationalError:
-            pass  # Column already exists
+    # Safe date formatting
+    created_at = row['created_at'] if row['created_at'] else ""
+    short_date = created_at[:10] if len(created_at) >= 10 else ""
+    
+    return {
+        'id': row['id'],
+        'display_title': display_title,
+        'topic': topic,
+        'sub_topic': sub_topic,
+        'question_type': row['question_type'] if row['question_type'] else "Multiple Choice",
+        'difficulty': row['difficulty'] if row['difficulty'] else "Medium",
+        'num_questions': row['num_questions'] if row['num_questions'] else 1,
+        'score': float(row['score']) if row['score'] is not None else 0.0,
+        'created_at': created_at,
+        'short_date': short_date
+    }
+
+
+def session_export_row(row) -> Dict:
+    """One quiz_sessions row as exported: the stored values, without display defaults"""
+    return {
+        'id': row['id'],
+        'topic': row['topic'] or '',
+        'sub_topic': row['sub_topic'] or '',
+        'question_type': row['question_type'] or '',
+        'difficulty': row['difficulty'] or '',
+        'num_questions': int(row['num_questions'] or 0),
+        'score': float(row['score'] or 0.0),
+        'created_at': row['created_at'] or '',
+    }
+
+
+def session_contents(conn, row) -> Tuple[List[Dict], List, List[Dict]]:
+    """``(questions_data, user_answers, results_data)`` of a full quiz_sessions row"""
+    if row['payload']:
+        return unpack_session(conn, row['payload'])
+
+    # Sessions saved before the packed format keep their JSON columns
+    try:
+        return tuple(json.loads(row[key]) if key in row.keys() and row[key] else []
+                     for key in ('questions_data', 'user_answers', 'results_data'))
+    except json.JSONDecodeError:
+        # Fallback to empty data if JSON parsing fails
+        return [], [], []
+
+
+class SimpleSessionManager:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.router = get_router(db_path)
     
+    @staticmethod
+    def insert_session(conn, user_id: int, quiz_data: Dict, submission_id: str = None) -> int:
+        """Insert a session row with its packed payload; runs inside a write transaction"""
+        cursor = conn.execute('''
+            INSERT INTO quiz_sessions (
+                user_id, topic, sub_topic, question_type, difficulty,
+                num_questions, score, payload, submission_id, is_review
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            int(user_id),
+            str(quiz_data.get('topic', '')),
+            str(quiz_data.get('sub_topic', '')),
+            str(quiz_data.get('question_type', '')),
+            str(quiz_data.get('difficulty', '')),
+            int(quiz_data.get('num_questions', 0)),
+            float(quiz_data.get('score', 0.0)),
+            pack_session(conn, quiz_data),
+            submission_id,
+            int(bool(quiz_data.get('is_review', False)))
+        ])
+        record_session(conn, int(user_id), quiz_data)
+        return cursor.lastrowid
+
     def save_quiz_session(self, user_id: int, quiz_data: Dict) -> int:
         """Save complete quiz session with all data for revision"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Use Row factory for safer access
-            cursor = conn.cursor()
-            
-            # Always save with new format
-            cursor.execute('''
-                INSERT INTO quiz_sessions (
-                    user_id, topic, sub_topic, question_type, difficulty, 
-                    num_questions, score, questions_data, user_answers, results_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', [
-                int(user_id),
-                str(quiz_data.get('topic', '')),
-                str(quiz_data.get('sub_topic', '')),
-                str(quiz_data.get('question_type', '')),
-                str(quiz_data.get('difficulty', '')),
-                int(quiz_data.get('num_questions', 0)),
-                float(quiz_data.get('score', 0.0)),
-                json.dumps(quiz_data.get('questions_data', [])),
-                json.dumps(quiz_data.get('user_answers', [])),
-                json.dumps(quiz_data.get('results_data', []))
-            ])
-            
-            session_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            return session_id
+            return self.router.for_user(user_id).write(
+                'save_quiz_session', {'user_id': int(user_id), 'quiz_data': quiz_data}
+            ).result()
             
         except Exception as e:
             print(f"Session save error: {e}")
             return None
     
-    def get_user_sessions(self, user_id: int, limit: int = 10) -> List[Dict]:
-        """Get user's quiz sessions for sidebar display with safe column access"""
+    def get_session_page(self, user_id: int, limit: int = 15,
+                         cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+        """
+        One page of the user's sessions, newest first, as summary rows.
+        
+        Pass the returned cursor back to get the next page; it is None after the last
+        page. Pages are bounded by (created_at, id) rather than an offset, so each page
+        costs the same however far back it is and sessions saved meanwhile do not shift it.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Use Row factory for safer access
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, topic, sub_topic, question_type, difficulty, 
-                       num_questions, score, created_at
-                FROM quiz_sessions 
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-            ''', [int(user_id), int(limit)])
+            with self.router.for_user(user_id).connection() as conn:
+                if cursor is None:
+                    rows = conn.execute('''
+                        SELECT id, topic, sub_topic, question_type, difficulty,
+                               num_questions, score, created_at
+                        FROM quiz_sessions
+                        WHERE user_id = ?
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT ?
+                    ''', [int(user_id), int(limit) + 1]).fetchall()
+                else:
+                    rows = conn.execute('''
+                        SELECT id, topic, sub_topic, question_type, difficulty,
+                               num_questions, score, created_at
+                        FROM quiz_sessions
+                        WHERE user_id = ? AND (created_at, id) < (?, ?)
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT ?
+                    ''', [int(user_id), cursor[0], int(cursor[1]), int(limit) + 1]).fetchall()
             
-            sessions = []
-            rows = cursor.fetchall()
+            # One extra row tells whether another page exists
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            next_cursor = (rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+            return [session_summary(row) for row in rows], next_cursor
             
-            for row in rows:
-                try:
-                    # Safe access using row names
-                    topic = row['topic'] if row['topic'] else "Quiz"
-                    sub_topic = row['sub_topic'] if row['sub_topic'] else ""
-                    
-                    # Create display title
-                    display_title = topic
-                    if sub_topic:
-                        display_title = f"{topic} - {sub_topic}"
-                    
-                    # Safe date formatting
-                    created_at = row['created_at'] if row['created_at'] else ""
-                    short_date = created_at[:10] if len(created_at) >= 10 else ""
-                    
-                    session_data = {
-                        'id': row['id'],
-                        'display_title': display_title,
-                        'topic': topic,
-                        'sub_topic': sub_topic,
-                        'question_type': row['question_type'] if row['question_type'] else "Multiple Choice",
-                        'difficulty': row['difficulty'] if row['difficulty'] else "Medium",
-                        'num_questions': row['num_questions'] if row['num_questions'] else 1,
-                        'score': float(row['score']) if row['score'] is not None else 0.0,
-                        'created_at': created_at,
-                        'short_date': short_date
-                    }
-                    
-                    sessions.append(session_data)
-                    
-                except Exception as row_error:
-                    print(f"Error processing row: {row_error}")
-                    continue  # Skip this row and continue with others
+        except Exception as e:
+            print(f"Get session page error: {e}")
+            return [], None
+    
+    def get_user_sessions(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """Get user's latest quiz sessions for sidebar display"""
+        return self.get_session_page(user_id, limit)[0]
+    
+    def iter_session_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """
+        Every session of the user as export rows (see session_export_row), oldest first,
+        in chunks of at most ``chunk_size``. Errors are raised, as for
+        QuestionLogger.iter_question_history.
+        """
+        db = self.router.for_user(user_id)
+        cursor = ('', 0)
+        while True:
+            with db.connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, topic, sub_topic, question_type, difficulty,
+                           num_questions, score, created_at
+                    FROM quiz_sessions
+                    WHERE user_id = ? AND (created_at, id) > (?, ?)
+                    ORDER BY created_at, id
+                    LIMIT ?
+                ''', [int(user_id), cursor[0], cursor[1], int(chunk_size)]).fetchall()
+            if not rows:
+                return
+            yield [session_export_row(row) for row in rows]
+            cursor = (rows[-1]['created_at'], rows[-1]['id'])
+    
+    def search_sessions(self, user_id: int, query: str, limit: int = 15,
+                        offset: int = 0) -> Tuple[List[Dict], bool]:
+        """
+        The user's sessions matching ``query``, best match first, as summary rows.
+        
+        Every word of the query must prefix-match the topic, sub-topic, date or the
+        text of the session's questions. Returns ``(sessions, has_more)``; ask for the
+        next page with ``offset`` advanced by ``limit``. Each row also carries a
+        ``match`` snippet of the question text.
+        """
+        terms = re.findall(r"\w+", query or "")
+        if not terms:
+            return [], False
+        match = f'user_tag:"u{int(user_id)}" AND ' + " ".join(f'"{term}"*' for term in terms)
+        
+        try:
+            with self.router.for_user(user_id).connection() as conn:
+                # ORDER BY rank (bm25 with these weights) is sorted inside FTS5, not in a temp b-tree
+                rows = conn.execute('''
+                    SELECT s.id, s.topic, s.sub_topic, s.question_type, s.difficulty,
+                           s.num_questions, s.score, s.created_at,
+                           snippet(session_fts, 4, '**', '**', '…', 12) AS match
+                    FROM session_fts f JOIN quiz_sessions s ON s.id = f.rowid
+                    WHERE session_fts MATCH ? AND rank MATCH 'bm25(0.0, 4.0, 4.0, 1.0, 1.0)'
+                    ORDER BY rank
+                    LIMIT ? OFFSET ?
+                ''', [match, int(limit) + 1, int(offset)]).fetchall()
             
-            conn.close()
-            print(f"Successfully retrieved {len(sessions)} sessions")  # Debug
-            return sessions
+            sessions = []
+            for row in rows[:limit]:
+                session = session_summary(row)
+                session['match'] = row['match']
+                sessions.append(session)
+            return sessions, len(rows) > limit
             
         except Exception as e:
-            print(f"Get sessions error: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            print(f"Session search error: {e}")
+            return [], False
     
     def get_complete_session(self, session_id) -> Optional[Dict]:
         """Get complete session data for revision view"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Use Row factory for safer access
-            cursor = conn.cursor()
-            
             # Handle session_id parameter properly
             if isinstance(session_id, (tuple, list)):
                 session_id = session_id[0]
             session_id = int(session_id)
             
-            cursor.execute('''
-                SELECT * FROM quiz_sessions WHERE id = ?
-            ''', [session_id])
-            
-            row = cursor.fetchone()
-            
+            db = self.router.for_session(session_id)
+            if db is None:
+                return None
+            with db.connection() as conn:
+                row = conn.execute('''
+                    SELECT * FROM quiz_sessions WHERE id = ?
+                ''', [session_id]).fetchone()
+                contents = session_contents(conn, row) if row else None
+
             if row:
                 # Safe access to all columns
                 result = {
@@ -170,27 +243,10 @@ class SimpleSessionManager:
                     'num_questions': row['num_questions'] if row['num_questions'] else 1,
                     'score': float(row['score']) if row['score'] is not None else 0.0,
                     'created_at': row['created_at'] if row['created_at'] else "",
-                    'questions_data': [],
-                    'user_answers': [],
-                    'results_data': []
                 }
-                
-                # Try to get detailed data if columns exist
-                try:
-                    if 'questions_data' in row.keys() and row['questions_data']:
-                        result['questions_data'] = json.loads(row['questions_data'])
-                    if 'user_answers' in row.keys() and row['user_answers']:
-                        result['user_answers'] = json.loads(row['user_answers'])
-                    if 'results_data' in row.keys() and row['results_data']:
-                        result['results_data'] = json.loads(row['results_data'])
-                except (json.JSONDecodeError, KeyError):
-                    # Fallback to empty data if JSON parsing fails
-                    pass
-                
-                conn.close()
+                result['questions_data'], result['user_answers'], result['results_data'] = contents
                 return result
             
-            conn.close()
             return None
             
         except Exception as e:
@@ -0,0 +1,111 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.models.database import DEFAULT_DB_PATH, get_database
+from src.models.question_log import QuestionLogger
+from src.models.quiz_submission import QuizSubmissionManager
+from src.models.repository import StudyRepository
+from src.models.review import ReviewQueue
+from src.models.rollups import PerformanceStats
+from src.models.simple_session import SimpleSessionManager
+from src.models.write_queue import write_op
+
+
+@write_op('register_user')
+def _insert_user(conn, payload: Dict):
+    conn.execute(
+        "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+        (payload['username'], payload['email'], payload['password_hash'])
+    )
+
+
+@write_op('mark_rag_trial_used')
+def _mark_rag_trial_used(conn, payload: Dict):
+    conn.execute("UPDATE users SET has_used_rag_trial = 1 WHERE id = ?", (payload['user_id'],))
+
+
+class SQLiteRepository(StudyRepository):
+    """
+    The local studyai.db, through the SQLite managers (pooled WAL connections, the
+    group-commit write queue, rollups and the FTS5 history index).
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.db = get_database(db_path)
+        self.sessions = SimpleSessionManager(db_path)
+        self.questions = QuestionLogger(db_path)
+        self.submissions = QuizSubmissionManager(db_path)
+        self.stats = PerformanceStats(db_path)
+        self.reviews = ReviewQueue(db_path)
+
+    def create_user(self, username: str, email: str, password_hash: str):
+        self.db.write('register_user', {
+            'username': username, 'email': email, 'password_hash': password_hash
+        }).result()
+
+    def find_user(self, username: str) -> Optional[Dict]:
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT id, username, email, password_hash, has_used_rag_trial FROM users WHERE username = ?",
+                (username,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def mark_rag_trial_used(self, user_id: int):
+        self.db.write('mark_rag_trial_used', {'user_id': int(user_id)}).result()
+
+    def submit_quiz(self, user_id: int, submission_id: str, quiz_data: Dict,
+                    questions: List[Dict]) -> Tuple[Optional[int], bool]:
+        return self.submissions.submit_quiz(user_id, submission_id, quiz_data, questions)
+
+    def save_quiz_session(self, user_id: int, quiz_data: Dict) -> Optional[int]:
+        return self.sessions.save_quiz_session(user_id, quiz_data)
+
+    def log_question(self, user_id: int, session_id: int, question_data: Dict) -> bool:
+        return self.questions.log_question(user_id, session_id, question_data)
+
+    def get_session_page(self, user_id: int, limit: int = 15,
+                         cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+        return self.sessions.get_session_page(user_id, limit, cursor)
+
+    def search_sessions(self, user_id: int, query: str, limit: int = 15,
+                        offset: int = 0) -> Tuple[List[Dict], bool]:
+        return self.sessions.search_sessions(user_id, query, limit, offset)
+
+    def get_complete_session(self, session_id) -> Optional[Dict]:
+        return self.sessions.get_complete_session(session_id)
+
+    def iter_session_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        return self.sessions.iter_session_history(user_id, chunk_size)
+
+    def iter_question_history(self, user_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        return self.questions.iter_question_history(user_id, chunk_size)
+
+    def get_recent_questions(self, user_id: int, limit: int = 10) -> List[Dict]:
+        return self.questions.get_recent_questions(user_id, limit)
+
+    def get_recent_outcomes(self, user_id: int) -> List[Dict]:
+        return self.questions.get_recent_outcomes(user_id)
+
+    def analyze_weak_topics(self, user_id: int, days: int = 7) -> Dict[str, Dict]:
+        return self.questions.analyze_weak_topics(user_id, days)
+
+    def get_recommendation_state(self, user_id: int) -> Dict:
+        return self.questions.get_recommendation_state(user_id)
+
+    def get_topic_calibration(self, user_id: int, topic: str) -> Optional[Dict]:
+        return self.questions.get_topic_calibration(user_id, topic)
+
+    def get_due_reviews(self, user_id: int, limit: int = 10) -> List[Dict]:
+        return self.reviews.get_due_reviews(user_id, limit)
+
+    def get_overview(self, user_id: int, days: int = 7) -> Dict:
+        return self.stats.get_overview(user_id, days)
+
+    def get_topic_scores(self, user_id: int) -> List[Dict]:
+        return self.stats.get_topic_scores(user_id)
+
+    def get_score_series(self, user_id: int, bucket: str = 'day') -> List[Dict]:
+        return self.stats.get_score_series(user_id, bucket)
+
+    def get_data_version(self, user_id: int) -> int:
+        return self.stats.get_data_version(user_id)
@@ -3,42 +3,62 @@ import streamlit as st
 from typing import List, Dict
 
 # LangChain components for RAG
-from langchain_community.vectorstores import FAISS
 from langchain.docstore.document import Document
-from langchain_huggingface import HuggingFaceEmbeddings
 
-# Define the path for the persistent vector store
-VECTOR_STORE_PATH = "vector_store"
+from src.config.settings import settings
+from src.models.embeddings import get_embeddings
+from src.models.vector_store import (
+    VECTOR_STORE_PATH, NATIVE_STORE_DIR, LEGACY_INDEX_DIR, MmapVectorStore, migrate_faiss_store
+)
 
 class VectorDBManager:
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
         self.vector_store = self._load_vector_store()
 
+    @property
+    def embeddings(self):
+        """
+        Embeddings matching the model the user's store was built with, loaded on first use.
+
+        While a re-embedding job is still rebuilding this user's store the old index
+        keeps being served with its own model; new stores use the configured model.
+        """
+        if self.vector_store and self.vector_store.count:
+            return get_embeddings(self.vector_store.embedding_model, self.vector_store.embedding_revision)
+        return get_embeddings(settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_MODEL_REVISION)
+
+    def _sync_store(self):
+        """Pick up appends from other processes and a store swapped in by a re-embedding job."""
+        if self.vector_store:
+            self.vector_store.refresh()
+
     def _get_user_db_path(self) -> str:
-        """Get the database path specific to the logged-in user."""
+        """Get the vector store directory specific to the logged-in user."""
         if 'user' not in st.session_state or not st.session_state.user:
             return None
         user_id = st.session_state.user['id']
         user_db_dir = os.path.join(VECTOR_STORE_PATH, f"user_{user_id}")
         os.makedirs(user_db_dir, exist_ok=True)
-        return os.path.join(user_db_dir, "faiss_index")
+        return user_db_dir
 
-    def _load_vector_store(self) -> FAISS:
-        """Loads the vector store from disk if it exists, otherwise creates a new one."""
-        db_path = self._get_user_db_path()
-        if db_path and os.path.exists(db_path):
+    def _load_vector_store(self) -> MmapVectorStore:
+        """Opens the user's memory-mapped store, migrating a legacy FAISS index on first use."""
+        user_db_dir = self._get_user_db_path()
+        if not user_db_dir:
+            return None
+
+        store_path = os.path.join(user_db_dir, NATIVE_STORE_DIR)
+        if not MmapVectorStore.exists(store_path) and os.path.exists(os.path.join(user_db_dir, LEGACY_INDEX_DIR)):
             try:
-                return FAISS.load_local(db_path, self.embeddings, allow_dangerous_deserialization=True)
+                migrate_faiss_store(user_db_dir)
             except Exception as e:
-                print(f"Error loading vector store: {e}. Creating a new one.")
-        
-        dummy_text = "initial document"
-        return FAISS.from_texts([dummy_text], self.embeddings)
+                print(f"Error migrating legacy vector store: {e}. Starting a new one.")
 
-    def add_quiz_results_to_db(self, results: List[Dict], topic: str):
-        """Formats quiz results and adds them to the vector database."""
-        if not results:
+        return MmapVectorStore(store_path)
+
+    def add_quiz_results_to_db(self, results: List[Dict], topic: str, difficulty: str = None):
+        """Formats quiz results and adds them to the vector database (difficulty defaults to the current quiz's)."""
+        if not results or not self.vector_store:
             return
 
         documents = []
@@ -52,33 +72,57 @@ class VectorDBManager:
                 )
                 metadata = {
                     "topic": topic,
-                    "difficulty": st.session_state.get('current_difficulty', 'Unknown'),
+                    "difficulty": difficulty or st.session_state.get('current_difficulty', 'Unknown'),
                     "question_type": result['question_type']
                 }
                 documents.append(Document(page_content=content, metadata=metadata))
         
         if documents:
-            self.vector_store.add_documents(documents)
-            self._save_vector_store()
+            self._sync_store()
+            embeddings = self.embeddings.embed_documents([doc.page_content for doc in documents])
+            self.vector_store.add(
+                embeddings, documents,
+                embedding_model=settings.EMBEDDING_MODEL_NAME,
+                embedding_revision=settings.EMBEDDING_MODEL_REVISION,
+            )
             st.toast(f"Saved {len(documents)} weak points to your personalized prep material!", icon="🧠")
 
-    def _save_vector_store(self):
-        """Saves the vector store to disk."""
-        db_path = self._get_user_db_path()
-        if db_path:
-            self.vector_store.save_local(db_path)
+    def retrieve_relevant_documents(self, topic: str, k: int = 3, rerank: bool = False) -> List[Document]:
+        """
+        Retrieves k most relevant documents for a given topic.
 
-    def retrieve_relevant_documents(self, topic: str, k: int = 3) -> List[Document]:
-        """Retrieves k most relevant documents for a given topic."""
-        if not self.vector_store:
+        Mistakes saved under exactly this topic answer the usual case with no model
+        inference. The embedding model is only used to fill up from dense search when
+        there are fewer than k of them, or, with ``rerank``, to re-rank them together
+        with BM25 matches on the topic's words.
+        """
+        self._sync_store()
+        if not self.vector_store or not self.vector_store.count:
             return []
+
+        doc_ids = self.vector_store.topic_documents(topic, k * 4 if rerank else k)
+        if len(doc_ids) >= k and not rerank:
+            return self.vector_store.get_documents(doc_ids[:k])
+
         # Use similarity search to find the most relevant past mistakes
-        retriever = self.vector_store.as_retriever(search_kwargs={"k": k})
-        return retriever.invoke(f"Questions and explanations about {topic}")
+        query_embedding = self.embeddings.embed_query(f"Questions and explanations about {topic}")
+        if rerank:
+            # Word matches are candidates only: the embedding decides which of them are relevant
+            candidates = list(dict.fromkeys(doc_ids + self.vector_store.lexical_search(topic, k * 4)))
+            if len(candidates) > k:
+                hits = self.vector_store.search(query_embedding, k, candidate_ids=candidates)
+                return self.vector_store.get_documents([doc_id for doc_id, _ in hits])
+
+        for doc_id, _ in self.vector_store.search(query_embedding, k + len(doc_ids)):
+            if len(doc_ids) >= k:
+                break
+            if doc_id not in doc_ids:
+                doc_ids.append(doc_id)
+        return self.vector_store.get_documents(doc_ids)
     
     def has_enough_context(self) -> bool:
-        """Checks if the vector store has more than just the initial dummy document."""
+        """Checks if the user has any saved mistakes to build a personalized quiz from."""
         if not self.vector_store:
             return False
-        # The index has 1 doc on creation, so > 1 means user data exists.
-        return self.vector_store.index.ntotal > 1
\ No newline at end of file
+        self.vector_store.refresh()
+        return self.vector_store.count > 0
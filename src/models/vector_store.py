@@ -0,0 +1,583 @@
+import os
+import re
+import json
+import glob
+import sqlite3
+import uuid
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+# Root directory holding one sub-directory per user
+VECTOR_STORE_PATH = "vector_store"
+
+# Layout of a user's directory
+NATIVE_STORE_DIR = "store"
+STAGING_STORE_DIR = "store.next"  # being re-embedded, swapped in when complete
+LEGACY_INDEX_DIR = "faiss_index"
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+DOCS_FILE = "docs.sqlite"
+FORMAT_VERSION = 1
+DOCS_SCHEMA_VERSION = 1
+
+# Placeholder text the old FAISS stores were seeded with
+LEGACY_DUMMY_TEXT = "initial document"
+
+# Words left out of lexical matches: they say nothing about what a topic is
+LEXICAL_STOPWORDS = frozenset("a an and as at by for from in into of on or the to with".split())
+
+# Model every store was built with before the manifest recorded it
+LEGACY_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+LEGACY_EMBEDDING_REVISION = "main"
+
+
+@contextmanager
+def store_lock(path: str):
+    """
+    Exclusive cross-process lock for appending to or replacing the store at ``path``,
+    also held by backups while they copy it.
+
+    The lock file sits next to the store directory so it survives the store being swapped.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows dev machines: single process, nothing to coordinate
+        yield
+        return
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    with open(os.path.abspath(path) + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class MmapVectorStore:
+    """
+    Pickle-free vector store for one user.
+
+    Vectors are appended to a raw float32 file that is memory-mapped read-only on
+    load, so opening a store costs no reads and its pages are shared through the OS
+    page cache by every process serving the same user. Documents and metadata live
+    in SQLite keyed by their row in the vector file. The manifest's ``count`` is the
+    commit point: anything past it is left over from an interrupted write and ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = self._read_manifest()
+        self._vectors = None
+        self._vectors_key = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """Check whether a native store has been written at this path."""
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    @property
+    def count(self) -> int:
+        return int(self.manifest.get('count', 0))
+
+    @property
+    def dim(self) -> int:
+        return int(self.manifest.get('dim', 0))
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest.get('embedding_model', LEGACY_EMBEDDING_MODEL)
+
+    @property
+    def embedding_revision(self) -> str:
+        return self.manifest.get('embedding_revision', LEGACY_EMBEDDING_REVISION)
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'format_version': FORMAT_VERSION, 'count': 0, 'dim': 0}
+
+    def _write_manifest(self, manifest: Dict):
+        """Atomically replace the manifest (this is what commits an append)."""
+        tmp_path = os.path.join(self.path, MANIFEST_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_FILE))
+        self.manifest = manifest
+
+    def _mapped_identity(self) -> Tuple:
+        """What the vector map was made from: a store swapped in (re-embedded, compacted) differs."""
+        try:
+            stat = os.stat(os.path.join(self.path, VECTORS_FILE))
+            file_id = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            file_id = None
+        return self.count, self.dim, self.embedding_model, self.embedding_revision, file_id
+
+    def refresh(self):
+        """Pick up appends made by other processes, and a store swapped in underneath this one."""
+        self.manifest = self._read_manifest()
+        if self._vectors is not None and self._mapped_identity() != self._vectors_key:
+            self._vectors = None
+
+    def _connect_docs(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(os.path.join(self.path, DOCS_FILE), isolation_level=None)
+        if conn.execute('PRAGMA user_version').fetchone()[0] < DOCS_SCHEMA_VERSION:
+            self._upgrade_docs_schema(conn)
+        return conn
+
+    @staticmethod
+    def _upgrade_docs_schema(conn: sqlite3.Connection):
+        """Create the docstore tables, adding the lexical index to stores that predate it."""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < DOCS_SCHEMA_VERSION:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS documents (
+                        id INTEGER PRIMARY KEY,
+                        content TEXT NOT NULL,
+                        metadata TEXT
+                    )
+                ''')
+                # Exact topic lookups, and BM25 over the text for looser matches
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_topic ON documents (json_extract(metadata, '$.topic'), id)")
+                conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(content, topic)')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+                        INSERT INTO documents_fts (rowid, content, topic)
+                        VALUES (new.id, new.content, json_extract(new.metadata, '$.topic'));
+                    END
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+                        DELETE FROM documents_fts WHERE rowid = old.id;
+                    END
+                ''')
+                conn.execute('DELETE FROM documents_fts')
+                conn.execute('''
+                    INSERT INTO documents_fts (rowid, content, topic)
+                    SELECT id, content, json_extract(metadata, '$.topic') FROM documents
+                ''')
+                conn.execute(f'PRAGMA user_version = {DOCS_SCHEMA_VERSION}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def vectors(self) -> np.ndarray:
+        """Return the committed vectors as a read-only memory map."""
+        count, dim = self.count, self.dim
+        if count == 0 or dim == 0:
+            return np.empty((0, dim), dtype=np.float32)
+        if self._vectors is None or self._vectors.shape != (count, dim):
+            self._vectors = np.memmap(
+                os.path.join(self.path, VECTORS_FILE), dtype=np.float32, mode='r', shape=(count, dim)
+            )
+            self._vectors_key = self._mapped_identity()
+        return self._vectors
+
+    def add(self, embeddings, documents: List[Document], **manifest_defaults) -> int:
+        """
+        Append vectors with their documents and return the new document count.
+
+        ``manifest_defaults`` (e.g. the embedding model) are recorded only if the
+        manifest does not have them yet, i.e. when this append creates the store.
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(documents):
+            raise ValueError("Expected one embedding row per document")
+        if len(documents) == 0:
+            return self.count
+
+        with store_lock(self.path):
+            os.makedirs(self.path, exist_ok=True)
+            self._append(vectors, documents, manifest_defaults)
+        return self.count
+
+    def _append(self, vectors: np.ndarray, documents: List[Document], manifest_defaults: Dict):
+        """Append under the store lock."""
+        conn = self._connect_docs()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            manifest = self._read_manifest()
+            start, dim = int(manifest.get('count', 0)), int(manifest.get('dim', 0)) or vectors.shape[1]
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {dim}")
+
+            with open(os.path.join(self.path, VECTORS_FILE), 'ab') as f:
+                f.truncate(start * dim * 4)  # drop any uncommitted tail
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            conn.execute('DELETE FROM documents WHERE id >= ?', [start])
+            conn.executemany(
+                'INSERT INTO documents (id, content, metadata) VALUES (?, ?, ?)',
+                [(start + i, doc.page_content, json.dumps(doc.metadata or {})) for i, doc in enumerate(documents)]
+            )
+
+            for key, value in manifest_defaults.items():
+                manifest.setdefault(key, value)
+            if not start:
+                manifest.setdefault('generation', uuid.uuid4().hex)
+            manifest.update({'format_version': FORMAT_VERSION, 'count': start + len(documents), 'dim': dim})
+            self._write_manifest(manifest)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self.refresh()
+            raise
+        finally:
+            conn.close()
+
+    def search(self, query_embedding, k: int = 3, candidate_ids: List[int] = None) -> List[Tuple[int, float]]:
+        """
+        Exact L2 search over the memory-mapped vectors, returns (doc_id, distance) pairs.
+
+        With ``candidate_ids`` only those rows are scored, which is how lexical hits are re-ranked.
+        """
+        vectors = self.vectors()
+        if len(vectors) == 0 or k <= 0:
+            return []
+
+        if candidate_ids is not None:
+            ids = np.asarray([i for i in candidate_ids if 0 <= i < len(vectors)], dtype=np.int64)
+            if len(ids) == 0:
+                return []
+            vectors = vectors[ids]
+        else:
+            ids = None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = np.einsum('ij,ij->i', vectors, vectors) - 2.0 * (vectors @ query) + float(query @ query)
+
+        k = min(k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(int(ids[i]) if ids is not None else int(i), float(distances[i])) for i in nearest]
+
+    def topic_documents(self, topic: str, k: int = 3) -> List[int]:
+        """Ids of up to ``k`` mistakes saved under exactly ``topic``, most recent first, without model inference."""
+        if k <= 0 or not self.count or not os.path.exists(os.path.join(self.path, DOCS_FILE)):
+            return []
+
+        conn = self._connect_docs()
+        try:
+            return [row[0] for row in conn.execute(
+                "SELECT id FROM documents WHERE json_extract(metadata, '$.topic') = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                [topic, self.count, k]
+            )]
+        finally:
+            conn.close()
+
+    def lexical_search(self, topic: str, k: int = 3) -> List[int]:
+        """
+        Ids of up to ``k`` documents containing every word of ``topic`` but its
+        stopwords, best BM25 match first. They share words with the topic, not
+        necessarily its meaning: callers re-rank them by embedding distance.
+        """
+        terms = [term for term in re.findall(r"\w+", topic or "") if term.lower() not in LEXICAL_STOPWORDS]
+        if k <= 0 or not terms or not self.count or not os.path.exists(os.path.join(self.path, DOCS_FILE)):
+            return []
+
+        conn = self._connect_docs()
+        try:
+            # ORDER BY rank (bm25 with these weights) is sorted inside FTS5, not in a temp b-tree
+            return [row[0] for row in conn.execute(
+                "SELECT rowid FROM documents_fts WHERE documents_fts MATCH ? AND rank MATCH 'bm25(1.0, 4.0)' "
+                "AND rowid < ? ORDER BY rank LIMIT ?",
+                [" ".join(f'"{term}"' for term in terms), self.count, k]
+            )]
+        finally:
+            conn.close()
+
+    def get_documents(self, doc_ids: List[int]) -> List[Document]:
+        """Fetch documents by id, preserving the order of ``doc_ids``."""
+        if not doc_ids or not os.path.exists(os.path.join(self.path, DOCS_FILE)):
+            return []
+
+        conn = self._connect_docs()
+        try:
+            placeholders = ','.join('?' for _ in doc_ids)
+            rows = conn.execute(
+                f'SELECT id, content, metadata FROM documents WHERE id IN ({placeholders}) AND id < ?',
+                [int(i) for i in doc_ids] + [self.count]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        by_id = {row[0]: Document(page_content=row[1], metadata=json.loads(row[2] or '{}')) for row in rows}
+        return [by_id[i] for i in doc_ids if i in by_id]
+
+    def iter_documents(self, batch_size: int = 500, start: int = 0) -> Iterator[Tuple[int, Document]]:
+        """Stream committed documents in id order without loading them all at once."""
+        if not os.path.exists(os.path.join(self.path, DOCS_FILE)):
+            return
+
+        conn = self._connect_docs()
+        try:
+            last_id, count = start - 1, self.count
+            while True:
+                rows = conn.execute(
+                    'SELECT id, content, metadata FROM documents WHERE id > ? AND id < ? ORDER BY id LIMIT ?',
+                    [last_id, count, batch_size]
+                ).fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[0], Document(page_content=row[1], metadata=json.loads(row[2] or '{}'))
+                last_id = rows[-1][0]
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """Sizes and counts read from the manifest and file sizes only."""
+        def file_size(name):
+            path = os.path.join(self.path, name)
+            return os.path.getsize(path) if os.path.exists(path) else 0
+
+        return {
+            'documents': self.count,
+            'dim': self.dim,
+            'vectors_bytes': file_size(VECTORS_FILE),
+            'docs_bytes': file_size(DOCS_FILE),
+            'embedding_model': self.embedding_model,
+            'embedding_revision': self.embedding_revision,
+        }
+
+    def check_integrity(self, chunk_rows: int = 65536) -> List[str]:
+        """Return a list of problems found in the store (empty if it is healthy)."""
+        problems = []
+        if not MmapVectorStore.exists(self.path):
+            return ["manifest is missing"]
+
+        count, dim = self.count, self.dim
+        if count and not dim:
+            problems.append("manifest has documents but no vector dimension")
+            return problems
+
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        vectors_bytes = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        expected_bytes = count * dim * 4
+        if vectors_bytes < expected_bytes:
+            problems.append(f"vector file is truncated ({vectors_bytes} of {expected_bytes} bytes)")
+            return problems
+        if vectors_bytes > expected_bytes:
+            problems.append(f"vector file has {vectors_bytes - expected_bytes} uncommitted trailing bytes")
+
+        vectors = self.vectors()
+        for start in range(0, count, chunk_rows):
+            if not np.isfinite(vectors[start:start + chunk_rows]).all():
+                problems.append(f"non-finite values in vectors {start}-{min(start + chunk_rows, count) - 1}")
+
+        if count or os.path.exists(os.path.join(self.path, DOCS_FILE)):
+            conn = self._connect_docs()
+            try:
+                result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+                if result != 'ok':
+                    problems.append(f"docstore integrity check failed: {result}")
+                committed = conn.execute('SELECT COUNT(*) FROM documents WHERE id >= 0 AND id < ?', [count]).fetchone()[0]
+                orphans = conn.execute('SELECT COUNT(*) FROM documents WHERE id >= ?', [count]).fetchone()[0]
+            finally:
+                conn.close()
+            if committed != count:
+                problems.append(f"{count - committed} committed vectors have no document")
+            if orphans:
+                problems.append(f"{orphans} uncommitted documents past the manifest count")
+
+        return problems
+
+
+def create_empty_store(path: str, dim: int, **manifest_fields) -> MmapVectorStore:
+    """Create an empty store at ``path``, replacing whatever was there."""
+    import shutil
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    store = MmapVectorStore(path)
+    manifest = {'format_version': FORMAT_VERSION, 'count': 0, 'dim': int(dim), 'generation': uuid.uuid4().hex}
+    manifest.update(manifest_fields)
+    store._write_manifest(manifest)
+    return store
+
+
+def swap_store(new_path: str, path: str):
+    """Move a fully written store into place. Readers holding the old maps keep working."""
+    import shutil
+
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(new_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(new_path + ".lock"):
+        os.remove(new_path + ".lock")
+
+
+def compact_store(path: str) -> Dict:
+    """
+    Rewrite a store without uncommitted tails or duplicate documents.
+
+    Duplicates come from the same mistake being saved by several failed quizzes;
+    only the most recent copy is kept.
+    """
+    with store_lock(path):
+        return _compact_locked(path)
+
+
+def _compact_locked(path: str) -> Dict:
+    store = MmapVectorStore(path)
+    before = store.count
+    latest_by_content = {}
+    for doc_id, doc in store.iter_documents():
+        latest_by_content[doc.page_content] = doc_id
+    keep_ids = sorted(latest_by_content.values())
+
+    tmp_path = path + ".compacting"
+    # A new generation: document ids are renumbered (see reembed_store)
+    compacted = create_empty_store(tmp_path, store.dim, **{
+        key: value for key, value in store.manifest.items()
+        if key not in ('format_version', 'count', 'dim', 'generation', 'source_generation')
+    })
+    batch_size = 1024
+    for start in range(0, len(keep_ids), batch_size):
+        batch = keep_ids[start:start + batch_size]
+        compacted.add(store.vectors()[batch], store.get_documents(batch))
+
+    conn = compacted._connect_docs()
+    try:
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    swap_store(tmp_path, path)
+    return {'before': before, 'after': len(keep_ids)}
+
+
+def reembed_store(user_dir: str, embeddings, embedding_model: str, embedding_revision: str = LEGACY_EMBEDDING_REVISION,
+                  batch_size: int = 64) -> int:
+    """
+    Rebuild a user's store with another embedding model, resumably.
+
+    Documents are re-embedded from their stored text into ``store.next``. Because the
+    copy is done in id order, the staging store's count doubles as the checkpoint, so
+    an interrupted run picks up where it stopped. That only holds while the source
+    keeps its ids: the staging manifest records the source's ``generation``, and a
+    source compacted since (a new generation) restarts the copy. The live store keeps
+    serving (with its own model) until the final catch-up and swap, which hold the
+    store lock so no mistake saved in the meantime is lost. Returns the number of
+    documents in the new store.
+    """
+    source_path = os.path.join(user_dir, NATIVE_STORE_DIR)
+    staging_path = os.path.join(user_dir, STAGING_STORE_DIR)
+    source = MmapVectorStore(source_path)
+
+    staging = MmapVectorStore(staging_path) if MmapVectorStore.exists(staging_path) else None
+    if staging is not None and (staging.embedding_model, staging.embedding_revision) != (embedding_model, embedding_revision):
+        staging = None  # left over from a run towards a different model
+    manifest_fields = {'embedding_model': embedding_model, 'embedding_revision': embedding_revision}
+
+    def copy_new_documents(staging):
+        source.refresh()
+        generation = source.manifest.get('generation')
+        if staging is not None and staging.manifest.get('source_generation') != generation:
+            staging = None  # copied from ids a compaction has renumbered since
+        fields = dict(manifest_fields, source_generation=generation)
+        batch = []
+        for _, doc in source.iter_documents(start=staging.count if staging else 0):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                staging = _add_embedded_batch(staging, staging_path, embeddings, batch, fields)
+                batch = []
+        if batch:
+            staging = _add_embedded_batch(staging, staging_path, embeddings, batch, fields)
+        return staging
+
+    staging = copy_new_documents(staging)
+    with store_lock(source_path):
+        # Catch up on mistakes saved while the bulk of the copy was running
+        staging = copy_new_documents(staging)
+        if staging is None:
+            staging = create_empty_store(staging_path, 0, **manifest_fields)
+        swap_store(staging_path, source_path)
+    return staging.count
+
+
+def _add_embedded_batch(store, path, embeddings, documents, manifest_fields):
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+    if store is None:
+        store = create_empty_store(path, vectors.shape[1], **manifest_fields)
+    store.add(vectors, documents)
+    return store
+
+
+def migrate_faiss_store(user_dir: str) -> Optional[int]:
+    """
+    Convert a user's legacy ``faiss_index`` directory into the native format.
+
+    The legacy pickle is read exactly once here. The placeholder document the old
+    stores were seeded with is dropped. Returns the number of migrated documents, or
+    None if there was nothing to migrate.
+    """
+    legacy_path = os.path.join(user_dir, LEGACY_INDEX_DIR)
+    store_path = os.path.join(user_dir, NATIVE_STORE_DIR)
+    if not os.path.exists(os.path.join(legacy_path, "index.faiss")) or MmapVectorStore.exists(store_path):
+        return None
+
+    import pickle
+    import faiss
+
+    index = faiss.read_index(os.path.join(legacy_path, "index.faiss"))
+    with open(os.path.join(legacy_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype=np.float32)
+    keep_rows, documents = [], []
+    for row in range(index.ntotal):
+        doc = docstore.search(index_to_docstore_id[row])
+        if not isinstance(doc, Document) or doc.page_content == LEGACY_DUMMY_TEXT:
+            continue
+        keep_rows.append(row)
+        documents.append(Document(page_content=doc.page_content, metadata=dict(doc.metadata or {})))
+
+    # Build next to the final location and rename, so a crash never leaves a half-written store
+    tmp_path = store_path + ".migrating"
+    try:
+        store = create_empty_store(
+            tmp_path, index.d, embedding_model=LEGACY_EMBEDDING_MODEL, embedding_revision=LEGACY_EMBEDDING_REVISION
+        )
+        store.add(vectors[keep_rows], documents)
+        os.replace(tmp_path, store_path)
+    finally:
+        if os.path.exists(tmp_path + ".lock"):
+            os.remove(tmp_path + ".lock")
+    return len(documents)
+
+
+def migrate_all_stores(root: str = VECTOR_STORE_PATH) -> Dict[str, Optional[int]]:
+    """One-shot migration of every ``user_*`` directory under ``root``."""
+    results = {}
+    for user_dir in sorted(glob.glob(os.path.join(root, "user_*"))):
+        try:
+            results[user_dir] = migrate_faiss_store(user_dir)
+        except Exception as e:
+            print(f"Vector store migration error for {user_dir}: {e}")
+            results[user_dir] = None
+    return results
+
+
+if __name__ == "__main__":
+    for user_dir, migrated in migrate_all_stores().items():
+        status = f"migrated {migrated} documents" if migrated is not None else "nothing to migrate"
+        print(f"{user_dir}: {status}")
@@ -0,0 +1,317 @@
+"""
+Group-commit writer for one SQLite file.
+
+All sessions in a process hand their writes to a single writer thread instead of each
+taking the database write lock in turn. The writer drains the queue into batches and
+commits each batch as one transaction, then resolves the callers' futures. If a write
+in a batch fails, the batch is redone with a savepoint per write so only that write's
+future fails.
+
+Operations are named functions registered with ``@write_op``; callers submit
+``(name, payload)`` with a JSON-serialisable payload through ``Database.write``. Every
+submission is appended to a journal before it is queued, and each batch records the
+last journal sequence number it contains in the ``write_journal`` table inside the
+same transaction. A batch that cannot be committed at all fails its callers and is
+recorded as failed in the journal, so it is never applied later. On startup, journal
+entries past that number (writes that were buffered when the process died) are
+replayed exactly once; entries that fail to replay are kept in ``<journal>.failed``.
+
+The queue is opt-in (``WRITE_QUEUE_ENABLED``): benchmarks/sqlite_concurrency.py
+measured pooled inline writes as faster, and the writer thread competes for the GIL.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import importlib
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: the journal is then not guarded across processes
+    fcntl = None
+
+from src.config.settings import settings
+
+# Modules that register write operations; imported before a journal is replayed
+OP_MODULES = (
+    'src.models.sqlite_repository',
+    'src.models.simple_session',
+    'src.models.question_log',
+    'src.models.quiz_submission',
+)
+
+# Journal is truncated once everything in it is committed and it has grown past this
+JOURNAL_TRUNCATE_BYTES = 1024 * 1024
+
+_operations: Dict[str, Callable] = {}
+
+
+def write_op(name: str):
+    """Register ``fn(conn, payload)`` as a write operation runnable by the writer thread."""
+    def register(fn):
+        _operations[name] = fn
+        return fn
+    return register
+
+
+def run_write_op(conn, op: str, payload: dict):
+    return _operations[op](conn, payload)
+
+
+class _Pending:
+    __slots__ = ('seq', 'op', 'payload', 'future', 'enqueued_at')
+
+    def __init__(self, seq, op, payload):
+        self.seq, self.op, self.payload = seq, op, payload
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class WriteQueue:
+    """Writer thread plus journal for one ``Database``; created by ``Database.write``."""
+
+    def __init__(self, database, max_batch: int = None, max_latency_ms: float = None, journal: bool = True):
+        self.db = database
+        self.max_batch = max_batch or settings.WRITE_BATCH_MAX
+        self.max_latency = (settings.WRITE_BATCH_LATENCY_MS if max_latency_ms is None else max_latency_ms) / 1000
+        self.journal_name = os.path.basename(database.db_path)
+        self._queue = queue.Queue()
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        self._seq = 0
+        self._unfinished = 0
+        self._stopping = False
+
+        self._batches = 0
+        self._committed = 0
+        self._failed = 0
+        self._batch_sizes = Counter()
+        self._max_depth = 0
+        self._last_commit_ms = 0.0
+        self._commit_ms_total = 0.0
+
+        if journal:
+            self._open_journal(database.journal_path)
+
+        self._thread = threading.Thread(target=self._run, name=f"sqlite-writer-{self.journal_name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    # -- journal -------------------------------------------------------------------
+
+    def _committed_seq(self) -> int:
+        with self.db.connection() as conn:
+            row = conn.execute('SELECT committed_seq FROM write_journal WHERE name = ?', [self.journal_name]).fetchone()
+        return row['committed_seq'] if row else 0
+
+    def _open_journal(self, path: str):
+        handle = open(path, 'a+', encoding='utf-8')
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another process on this host owns the journal; its writes are still safe,
+                # ours just are not journaled
+                print(f"Write journal {path} is held by another process, writing without a journal")
+                handle.close()
+                return
+
+        try:
+            self._replay_journal(handle)
+        except Exception:
+            handle.close()
+            raise
+        handle.seek(0)
+        handle.truncate()
+        self._journal = handle
+
+    def _replay_journal(self, handle):
+        """Apply journaled writes that never reached a commit, nor failed for their caller."""
+        committed = self._committed_seq()
+        handle.seek(0)
+        entries, failed = [], set()
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break  # torn final line from a crash mid-append
+            if 'failed' in entry:
+                failed.update(entry['failed'])
+                continue
+            self._seq = max(self._seq, entry['seq'])
+            entries.append(entry)
+        self._seq = max(self._seq, committed)
+        replay = [entry for entry in entries if entry['seq'] > committed and entry['seq'] not in failed]
+        if not replay:
+            return
+
+        for module in OP_MODULES:
+            importlib.import_module(module)
+        replayed, kept = 0, []
+        for entry in replay:
+            try:
+                with self.db.transaction() as conn:
+                    run_write_op(conn, entry['op'], entry['payload'])
+                    self._mark_committed(conn, entry['seq'])
+                replayed += 1
+            except Exception as e:
+                print(f"Write journal replay error (seq {entry['seq']}, {entry['op']}): {e}")
+                kept.append(entry)
+        print(f"Replayed {replayed} of {len(replay)} journaled writes for {self.journal_name}")
+        if kept:
+            # The journal is truncated next: keep what could not be applied for a look by hand
+            failed_path = handle.name + ".failed"
+            with open(failed_path, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in kept)
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"Kept {len(kept)} journaled writes that failed to replay in {failed_path}")
+
+    def _append_journal(self, pending: _Pending):
+        self._journal.write(json.dumps({'seq': pending.seq, 'op': pending.op, 'payload': pending.payload}) + "\n")
+        self._journal.flush()
+        if settings.WRITE_JOURNAL_FSYNC:
+            os.fsync(self._journal.fileno())
+
+    def _mark_failed(self, batch):
+        """Record writes whose callers were told they failed, so a replay skips them."""
+        with self._journal_lock:
+            if self._journal:
+                self._journal.write(json.dumps({'failed': [pending.seq for pending in batch]}) + "\n")
+                self._journal.flush()
+                if settings.WRITE_JOURNAL_FSYNC:
+                    os.fsync(self._journal.fileno())
+
+    def _mark_committed(self, conn, seq: int):
+        conn.execute('''
+            INSERT INTO write_journal (name, committed_seq) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET committed_seq = MAX(committed_seq, excluded.committed_seq)
+        ''', [self.journal_name, seq])
+
+    def _maybe_truncate_journal(self):
+        with self._journal_lock:
+            if self._journal and self._unfinished == 0 and self._journal.tell() > JOURNAL_TRUNCATE_BYTES:
+                self._journal.seek(0)
+                self._journal.truncate()
+
+    # -- queue ---------------------------------------------------------------------
+
+    def submit(self, op: str, payload: dict) -> Future:
+        """Queue a registered write; the future resolves to its result once committed."""
+        if op not in _operations:
+            raise KeyError(f"Unknown write operation '{op}'")
+        with self._journal_lock:
+            if self._stopping:
+                raise RuntimeError("Write queue is stopped")
+            self._seq += 1
+            pending = _Pending(self._seq, op, payload)
+            if self._journal:
+                self._append_journal(pending)
+            self._unfinished += 1
+            self._queue.put(pending)
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+        return pending.future
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.enqueued_at + self.max_latency
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                self._queue.put(None)  # let the loop see the stop marker after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _apply(self, batch, isolate: bool):
+        results = []
+        with self.db.transaction() as conn:
+            for pending in batch:
+                if not isolate:
+                    results.append((pending, True, run_write_op(conn, pending.op, pending.payload)))
+                    continue
+                try:
+                    with self.db.transaction():  # savepoint
+                        results.append((pending, True, run_write_op(conn, pending.op, pending.payload)))
+                except Exception as e:
+                    results.append((pending, False, e))
+            self._mark_committed(conn, batch[-1].seq)
+        return results
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            results = self._apply(batch, isolate=False)
+        except Exception:
+            # Some write failed: redo the batch with a savepoint per write, so only it fails
+            try:
+                results = self._apply(batch, isolate=True)
+            except Exception as e:
+                self._mark_failed(batch)
+                results = [(pending, False, e) for pending in batch]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._batches += 1
+        self._batch_sizes[len(batch)] += 1
+        self._last_commit_ms = elapsed_ms
+        self._commit_ms_total += elapsed_ms
+        for pending, ok, value in results:
+            if ok:
+                self._committed += 1
+                pending.future.set_result(value)
+            else:
+                self._failed += 1
+                pending.future.set_exception(value)
+        with self._journal_lock:
+            self._unfinished -= len(batch)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._commit(batch)
+            self._maybe_truncate_journal()
+
+    def stop(self, timeout: float = 10.0):
+        """Commit what is queued and stop the writer thread."""
+        with self._journal_lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    def metrics(self) -> dict:
+        """Queue depth, batch sizes and commit timings since start."""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self._max_depth,
+            'batches': self._batches,
+            'committed': self._committed,
+            'failed': self._failed,
+            'avg_batch_size': (self._committed + self._failed) / self._batches if self._batches else 0.0,
+            'batch_sizes': dict(sorted(self._batch_sizes.items())),
+            'last_commit_ms': self._last_commit_ms,
+            'avg_commit_ms': self._commit_ms_total / self._batches if self._batches else 0.0,
+        }
@@ -3,7 +3,9 @@ import streamlit as st
 import pandas as pd
 from typing import Dict
 from src.generator.question_generator import QuestionGenerator
-from src.models.simple_session import SimpleSessionManager
+from src.models.quiz_submission import new_submission_id
+from src.models.repository import get_repository
+from src.models.review import REVIEW_TOPIC
 from src.models.vector_db_manager import VectorDBManager # Import the new manager
 import urllib.parse
 import time
@@ -17,7 +19,9 @@ class QuizManager:
         self.user_answers = []
         self.results = []
         self.current_session_id = None
+        self.submission_id = None
         self.question_start_times = []
+        self.review_items = []
         
         # Initialize the VectorDBManager
         if 'user' in st.session_state and st.session_state.user:
@@ -26,8 +30,8 @@ class QuizManager:
             self.vector_db_manager = None
         
         try:
-            from src.models.question_log import QuestionLogger, SmartRecommendationEngine
-            self.question_logger = QuestionLogger()
+            from src.models.question_log import SmartRecommendationEngine
+            self.question_logger = get_repository()
             self.recommendation_engine = SmartRecommendationEngine(self.question_logger)
             self.has_ai_features = True
         except ImportError:
@@ -42,7 +46,9 @@ class QuizManager:
         self.user_answers = []
         self.results = []
         self.question_start_times = []
+        self.review_items = []
         self.current_session_id = None
+        self.submission_id = None
 
         try:
             for i in range(num_questions):
@@ -72,6 +78,17 @@ class QuizManager:
         
         return True
 
+    def start_review(self, items):
+        """A quiz of logged questions due for review (from get_due_reviews); no generation needed"""
+        self.questions = [item['question'] for item in items]
+        self.review_items = list(items)
+        self.user_answers = []
+        self.results = []
+        self.question_start_times = [time.time()] * len(self.questions)
+        self.current_session_id = None
+        self.submission_id = None
+        return bool(self.questions)
+
     def attempt_quiz(self):
         for i, q in enumerate(self.questions):
             st.markdown(f"**Question {i+1}: {q['question']}**")
@@ -123,16 +140,20 @@ class QuizManager:
             self.results.append(result_dict)
 
         if 'user' in st.session_state and st.session_state.user and self.results:
-            session_manager = SimpleSessionManager()
+            # One id per attempt: re-running evaluate_quiz for the same quiz must not log it twice
+            if not self.submission_id:
+                self.submission_id = new_submission_id()
             
             correct_count = sum(1 for result in self.results if result["is_correct"])
             score_percentage = (correct_count / len(self.results)) * 100
             
             quiz_data = {
-                'topic': st.session_state.get('current_topic', ''),
-                'sub_topic': st.session_state.get('current_sub_topic', ''),
+                # Review quizzes span topics: the session stays out of the per-topic rollups, its answers keep theirs
+                'is_review': bool(self.review_items),
+                'topic': REVIEW_TOPIC if self.review_items else st.session_state.get('current_topic', ''),
+                'sub_topic': '' if self.review_items else st.session_state.get('current_sub_topic', ''),
                 'question_type': self.questions[0]['type'] if self.questions else '',
-                'difficulty': st.session_state.get('current_difficulty', ''),
+                'difficulty': '' if self.review_items else st.session_state.get('current_difficulty', ''),
                 'num_questions': len(self.questions),
                 'score': score_percentage,
                 'questions_data': self.questions,
@@ -140,15 +161,24 @@ class QuizManager:
                 'results_data': self.results
             }
             
-            self.current_session_id = session_manager.save_quiz_session(
-                st.session_state.user['id'], quiz_data
+            questions = self._question_log_entries() if self.has_ai_features else []
+            self.current_session_id, created = get_repository().submit_quiz(
+                st.session_state.user['id'], self.submission_id, quiz_data, questions
             )
             
             # --- RAG FEATURE LOGIC ---
             # Check if score is below the user's pass score
             pass_score = st.session_state.get('pass_score', 70)
-            if score_percentage < pass_score:
-                if self.vector_db_manager:
+            if created and score_percentage < pass_score:
+                if self.vector_db_manager and self.review_items:
+                    # Mistakes go under the topic each reviewed question was asked on
+                    by_topic = {}
+                    for item, result in zip(self.review_items, self.results):
+                        topic_str = f"{item['topic']} - {item['sub_topic']}" if item['sub_topic'] else item['topic']
+                        by_topic.setdefault((topic_str or 'General', item['difficulty']), []).append(result)
+                    for (topic_str, difficulty), results in by_topic.items():
+                        self.vector_db_manager.add_quiz_results_to_db(results, topic_str, difficulty)
+                elif self.vector_db_manager:
                     topic_str = st.session_state.get('current_topic', 'General')
                     if st.session_state.get('current_sub_topic'):
                         topic_str += f" - {st.session_state.get('current_sub_topic')}"
@@ -156,25 +186,21 @@ class QuizManager:
                     # Add the results of this failed quiz to the vector DB
                     self.vector_db_manager.add_quiz_results_to_db(self.results, topic_str)
             # --- END RAG FEATURE LOGIC ---
-
-            if self.has_ai_features:
-                self._log_individual_questions()
     
-    def _log_individual_questions(self):
-        """Log each question with user performance for AI analysis"""
-        if not self.has_ai_features or not self.current_session_id or not self.results:
-            return
-        
-        user_id = st.session_state.user['id']
+    def _question_log_entries(self):
+        """Each question with user performance, as logged for AI analysis"""
         main_topic = st.session_state.get('current_topic', '')
         sub_topic = st.session_state.get('current_sub_topic', '')
         difficulty = st.session_state.get('current_difficulty', '')
         
+        entries = []
         for i, (question, result) in enumerate(zip(self.questions, self.results)):
-            question_data = {
-                'topic': main_topic,
-                'sub_topic': sub_topic,
-                'difficulty': difficulty,
+            # Reviewed questions stay under the topic their review item was logged with
+            item = self.review_items[i] if i < len(self.review_items) else {}
+            entries.append({
+                'topic': item.get('topic', main_topic),
+                'sub_topic': item.get('sub_topic', sub_topic),
+                'difficulty': item.get('difficulty', difficulty),
                 'question_type': question['type'],
                 'question_text': question['question'],
                 'options': question.get('options', []),
@@ -183,12 +209,8 @@ class QuizManager:
                 'is_correct': result['is_correct'],
                 'time_taken': result.get('time_taken', 0),
                 'explanation': question.get('explanation', '')
-            }
-            
-            try:
-                self.question_logger.log_question(user_id, self.current_session_id, question_data)
-            except Exception as e:
-                print(f"Error logging question: {e}")
+            })
+        return entries
     
     def get_smart_recommendations(self, user_id: int) -> Dict:
         """Get AI-powered quiz recommendations based on user history"""
@@ -219,30 +241,6 @@ class QuizManager:
             return pd.DataFrame()
         return pd.DataFrame(self.results)
 
-    def save_to_csv(self, filename_prefix="quiz_results"):
-        """Save quiz results to CSV file"""
-        if not self.results:
-            st.warning("No results to save !!")
-            return None
-        
-        df = self.generate_result_dataframe()
-
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_filename = f"{filename_prefix}_{timestamp}.csv"
-
-        os.makedirs('results', exist_ok=True)
-        full_path = os.path.join('results', unique_filename)
-
-        try:
-            df.to_csv(full_path, index=False)
-            st.success("Results saved successfully....")
-            return full_path
-        
-        except Exception as e:
-            st.error(f"Failed to save results {e}")
-            return None
-
     def generate_ai_links(self, question: str, correct_answer: str, topic: str, user_answer: str = ""):
         """Generate AI assistance links"""
         if user_answer and user_answer != correct_answer:
@@ -0,0 +1,166 @@
+"""
+The question_log archive: old rows move to Parquet files while the rollups, the
+analysis and the history readers return exactly what they did before.
+
+    python -m pytest -q test_archive.py
+"""
+import os
+import json
+
+import pytest
+
+from src.config.settings import settings
+from src.models import archive
+from src.models import database
+from src.models import export
+from src.models import shards
+from src.models.rollups import rebuild_user
+from src.models.sqlite_repository import SQLiteRepository
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    monkeypatch.setattr(settings, 'ARCHIVE_DIR', '')
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def _seed(db_path, users=4, sessions=6):
+    """Quizzes spread over the last ~300 days, with rollups rebuilt to match."""
+    repository = SQLiteRepository(db_path)
+    user_ids = []
+    for u in range(users):
+        repository.create_user(f'user{u}', f'user{u}@example.com', 'hash')
+        user_ids.append(repository.find_user(f'user{u}')['id'])
+    for user_id in user_ids:
+        for i in range(sessions):
+            questions = [{'type': 'MCQ', 'question': f'Q{user_id}.{i}.{n}?', 'options': ['a', 'b'],
+                          'correct_answer': 'a', 'explanation': f'Because {n}.'} for n in range(3)]
+            answers = ['a', 'b', 'a' if i % 2 else 'b']
+            results = [{'is_correct': a == 'a', 'time_taken': 10 + n} for n, a in enumerate(answers)]
+            quiz_data = {'topic': 'DSA', 'sub_topic': ['Graphs', 'Trees'][i % 2], 'question_type': 'MCQ',
+                         'difficulty': ['Easy', 'Hard'][i % 2], 'num_questions': 3,
+                         'score': 100.0 * sum(r['is_correct'] for r in results) / 3,
+                         'questions_data': questions, 'user_answers': answers, 'results_data': results}
+            entries = [{'topic': 'DSA', 'sub_topic': quiz_data['sub_topic'], 'difficulty': quiz_data['difficulty'],
+                        'question_type': 'MCQ', 'question_text': q['question'], 'options': q['options'],
+                        'correct_answer': 'a', 'user_answer': a, 'is_correct': r['is_correct'],
+                        'time_taken': r['time_taken'], 'explanation': q['explanation']}
+                       for q, a, r in zip(questions, answers, results)]
+            session_id, _ = repository.submit_quiz(user_id, f'{user_id}-{i}', quiz_data, entries)
+            days_ago = 50 * i  # 0, 50, ..., 250 days old
+            db = shards.get_router(db_path).for_user(user_id)
+            with db.transaction() as conn:
+                for table, key in (('quiz_sessions', 'id'), ('question_log', 'session_id')):
+                    conn.execute(f"UPDATE {table} SET created_at = datetime(created_at, ?) WHERE {key} = ?",
+                                 [f'-{days_ago} days', session_id])
+    for user_id in user_ids:
+        with shards.get_router(db_path).for_user(user_id).transaction() as conn:
+            rebuild_user(conn, user_id)
+    return repository, user_ids
+
+
+def _snapshot(repository, user_ids):
+    return {user_id: {
+        'overview': repository.get_overview(user_id, days=3650),
+        'analysis': repository.analyze_weak_topics(user_id, days=3650),
+        'recent': repository.get_recent_questions(user_id, 100),
+        'outcomes': repository.get_recent_outcomes(user_id),
+        'history': repository.questions.get_question_history(user_id),
+        'since': repository.questions.get_question_history(user_id, since='2000-01-01'),
+    } for user_id in user_ids}
+
+
+def _without_ids(snapshot):
+    """A snapshot as it must survive a reshard, which renumbers rows and sessions."""
+    return {user_id: {key: [{k: v for k, v in row.items() if k not in ('id', 'session_id')} for row in value]
+                      if isinstance(value, list) else value for key, value in readers.items()}
+            for user_id, readers in snapshot.items()}
+
+
+def _hot_rows(db_path):
+    total = 0
+    for db in shards.get_router(db_path).shards:
+        with db.connection() as conn:
+            total += conn.execute('SELECT COUNT(*) FROM question_log').fetchone()[0]
+    return total
+
+
+def _archived_rows(db_path):
+    return sum(len(archive.archived_questions(db_path, user_id)) for user_id in range(1, 10))
+
+
+def test_archive_keeps_every_reader_unchanged(db_path):
+    repository, user_ids = _seed(db_path)
+    before = _snapshot(repository, user_ids)
+    assert len(before[user_ids[0]]['history']) == 18
+
+    counts = archive.archive_question_log(db_path, horizon_days=120)
+    assert 0 < counts['rows'] < 4 * 18
+    assert _hot_rows(db_path) == 4 * 18 - counts['rows']
+    assert os.path.isdir(os.path.join(archive.archive_dir(db_path), 'question_log'))
+    assert _snapshot(repository, user_ids) == before
+
+    # Rebuilding the rollups recounts only the hot days and keeps the archived ones
+    for user_id in user_ids:
+        with shards.get_router(db_path).for_user(user_id).transaction() as conn:
+            rebuild_user(conn, user_id)
+    assert _snapshot(repository, user_ids) == before
+
+    # Only rows the horizon reaches; a later cutoff picks up the next months
+    since = repository.questions.get_question_history(user_ids[0], since=counts['cutoff'])
+    assert all(q['created_at'] >= counts['cutoff'] for q in since)
+    assert archive.archive_question_log(db_path, horizon_days=120)['rows'] == 0
+    assert archive.archive_question_log(db_path, horizon_days=0)['rows'] > 0
+    assert _snapshot(repository, user_ids) == before
+
+
+def test_archive_rerun_after_crash_replaces_partial_files(db_path):
+    repository, user_ids = _seed(db_path)
+    before = _snapshot(repository, user_ids)
+
+    # A run that wrote its files but died before deleting the rows
+    cutoff = archive.archive_cutoff(120)
+    with database.get_database(db_path).connection() as conn:
+        rows = conn.execute(archive.LOGGED_QUESTION_SQL + 'WHERE l.created_at < ? ORDER BY l.id', [cutoff]).fetchall()
+    entries = [archive.logged_question(row) for row in rows]
+    months = {}
+    for entry in entries:
+        months.setdefault(entry['created_at'][:7], []).append(entry)
+    for month, month_entries in months.items():
+        archive._write_part(os.path.join(archive.archive_dir(db_path), 'question_log', f'month={month}', 'shard=0'),
+                            month_entries)
+
+    assert archive.archive_question_log(db_path, horizon_days=120)['rows'] == len(entries)
+    assert _archived_rows(db_path) == len(entries)
+    assert _snapshot(repository, user_ids) == before
+
+
+def test_reshard_after_archive(db_path, monkeypatch):
+    repository, user_ids = _seed(db_path)
+    before = _snapshot(repository, user_ids)
+    archive.archive_question_log(db_path, horizon_days=120)
+
+    shards.reshard(db_path, 3)
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 3)
+    repository = SQLiteRepository(db_path)
+    assert _without_ids(_snapshot(repository, user_ids)) == _without_ids(before)
+    for user_id in user_ids:
+        with shards.get_router(db_path).for_user(user_id).transaction() as conn:
+            rebuild_user(conn, user_id)
+    assert _without_ids(_snapshot(repository, user_ids)) == _without_ids(before)
+
+
+def test_export_includes_archived_questions(db_path):
+    repository, user_ids = _seed(db_path)
+    archive.archive_question_log(db_path, horizon_days=120)
+    history = repository.questions.get_question_history(user_ids[0])
+    assert len(history) == 18
+
+    chunks = list(export.export_history(repository, user_ids[0], 'questions', 'jsonl', chunk_size=4))
+    assert len(chunks) > 1
+    assert [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()] == history
@@ -0,0 +1,153 @@
+"""
+Online backups: a backup taken while quizzes are being submitted restores to a
+consistent database, archive and vector stores, and later backups only add what changed.
+
+    python -m pytest -q test_backup.py
+"""
+import os
+import threading
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from src.config.settings import settings
+from src.models import archive
+from src.models import backup
+from src.models import database
+from src.models import shards
+from src.models.sqlite_repository import SQLiteRepository
+from src.models.vector_store import NATIVE_STORE_DIR, MmapVectorStore
+from test_archive import _seed, _snapshot
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 2)
+    monkeypatch.setattr(settings, 'ARCHIVE_DIR', '')
+    monkeypatch.setattr(settings, 'BACKUP_DIR', '')
+    db_path, vector_root = str(tmp_path / 'live' / 'studyai.db'), str(tmp_path / 'live' / 'vector_store')
+    os.makedirs(os.path.dirname(db_path))
+    yield db_path, vector_root, str(tmp_path / 'restored')
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def _add_mistakes(vector_root, user_id, count):
+    store = MmapVectorStore(os.path.join(vector_root, f'user_{user_id}', NATIVE_STORE_DIR))
+    start = store.count
+    store.add(np.random.default_rng(start).random((count, 8), dtype=np.float32),
+              [Document(page_content=f'Mistake {start + i}', metadata={'topic': 'DSA'}) for i in range(count)])
+
+
+def _documents(vector_root, user_id):
+    store = MmapVectorStore(os.path.join(vector_root, f'user_{user_id}', NATIVE_STORE_DIR))
+    return [doc.page_content for _, doc in store.iter_documents()], np.array(store.vectors())
+
+
+def _restored(db_path, restored_root):
+    target = os.path.join(restored_root, 'studyai.db')
+    return target, os.path.join(restored_root, 'vector_store')
+
+
+def test_restore_matches_the_backed_up_state(paths):
+    db_path, vector_root, restored_root = paths
+    repository, user_ids = _seed(db_path)
+    archive.archive_question_log(db_path, horizon_days=120)
+    _add_mistakes(vector_root, user_ids[0], 5)
+    before, documents = _snapshot(repository, user_ids), _documents(vector_root, user_ids[0])
+
+    first = backup.create_backup(db_path, vector_root)
+    assert first['new_bytes'] == first['bytes'] > 0
+
+    # Changes after the backup are not in it, and the next backup only stores what changed
+    repository.submit_quiz(user_ids[0], 'later', {'topic': 'DSA', 'score': 10.0, 'num_questions': 0}, [])
+    _add_mistakes(vector_root, user_ids[0], 3)
+    second = backup.create_backup(db_path, vector_root)
+    assert 0 < second['new_bytes'] < second['bytes']
+    assert [b['name'] for b in backup.list_backups(backup.backup_dir(db_path))] == [first['name'], second['name']]
+
+    target, target_vectors = _restored(db_path, restored_root)
+    result = backup.restore_backup(first['name'], target, target_vectors, backup.backup_dir(db_path))
+    assert result['databases'] == 2
+    assert _snapshot(SQLiteRepository(target), user_ids) == before
+    restored_documents = _documents(target_vectors, user_ids[0])
+    assert restored_documents[0] == documents[0] and np.array_equal(restored_documents[1], documents[1])
+
+
+def test_backup_during_writes_is_consistent(paths, monkeypatch):
+    db_path, vector_root, restored_root = paths
+    monkeypatch.setattr(settings, 'BACKUP_STEP_PAGES', 1)
+    monkeypatch.setattr(settings, 'BACKUP_STEP_SLEEP_MS', 1)
+    repository, user_ids = _seed(db_path, users=4, sessions=10)
+
+    stop, submitted = threading.Event(), []
+
+    def submit():
+        while not stop.is_set():
+            n = len(submitted)
+            quiz = {'topic': 'DSA', 'sub_topic': 'Graphs', 'score': 50.0, 'num_questions': 1,
+                    'questions_data': [{'question': f'Live {n}?'}], 'user_answers': ['a'], 'results_data': []}
+            entry = {'topic': 'DSA', 'sub_topic': 'Graphs', 'question_text': f'Live {n}?', 'correct_answer': 'a',
+                     'user_answer': 'a', 'is_correct': True, 'time_taken': 5}
+            submitted.append(repository.submit_quiz(user_ids[n % len(user_ids)], f'live-{n}', quiz, [entry])[0])
+
+    writer = threading.Thread(target=submit)
+    writer.start()
+    try:
+        name = backup.create_backup(db_path, vector_root)['name']
+    finally:
+        stop.set()
+        writer.join()
+    assert submitted
+
+    target, target_vectors = _restored(db_path, restored_root)
+    backup.restore_backup(name, target, target_vectors, backup.backup_dir(db_path))
+    restored = SQLiteRepository(target)
+    for db in shards.get_router(target).shards:
+        with db.connection() as conn:
+            # Whole submissions only: every logged question has its session and the rollups add up
+            assert not conn.execute('''
+                SELECT 1 FROM question_log l LEFT JOIN quiz_sessions s ON s.id = l.session_id WHERE s.id IS NULL
+            ''').fetchone()
+            for user_id, quizzes in conn.execute('SELECT user_id, COUNT(*) FROM quiz_sessions GROUP BY user_id'):
+                assert restored.get_overview(user_id)['total_quizzes'] == quizzes
+
+
+def test_restore_keeps_what_it_replaces(paths):
+    db_path, vector_root, _ = paths
+    repository, user_ids = _seed(db_path, users=1, sessions=2)
+    name = backup.create_backup(db_path, vector_root)['name']
+    directory = backup.backup_dir(db_path)
+    before = _snapshot(repository, user_ids)
+    repository.submit_quiz(user_ids[0], 'after-backup', {'topic': 'DSA', 'score': 0.0, 'num_questions': 0}, [])
+
+    with pytest.raises(RuntimeError, match='already exist'):
+        backup.restore_backup(name, db_path, vector_root, directory)
+
+    for db in list(database._databases.values()):
+        db.close_all()
+    database._databases.clear()
+    backup.restore_backup(name, db_path, vector_root, directory, force=True)
+    assert os.path.exists(db_path + '.pre-restore')
+    assert _snapshot(SQLiteRepository(db_path), user_ids) == before
+
+
+def test_prune_keeps_the_latest_backups_restorable(paths):
+    db_path, vector_root, restored_root = paths
+    repository, user_ids = _seed(db_path, users=2, sessions=2)
+    directory = backup.backup_dir(db_path)
+    names = []
+    for i in range(3):
+        repository.submit_quiz(user_ids[0], f'extra-{i}', {'topic': 'DSA', 'score': 0.0, 'num_questions': 0}, [])
+        names.append(backup.create_backup(db_path, vector_root)['name'])
+    before = _snapshot(repository, user_ids)
+
+    pruned = backup.prune_backups(directory, keep=1)
+    assert pruned['backups'] == 2 and pruned['chunks'] > 0
+    assert [b['name'] for b in backup.list_backups(directory)] == names[-1:]
+
+    target, target_vectors = _restored(db_path, restored_root)
+    backup.restore_backup(names[-1], target, target_vectors, directory)
+    assert _snapshot(SQLiteRepository(target), user_ids) == before
@@ -0,0 +1,187 @@
+"""
+Item difficulty and user ability calibration: the batch fit recovers simulated
+parameters, Elo steps keep abilities current between fits, and recommendations pick
+the difficulty the calibrated ability suggests.
+
+    python -m pytest -q test_calibration.py
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.config.settings import settings
+from src.models import calibration
+from src.models import database
+from src.models import shards
+from src.models.question_log import QuestionLogger, SmartRecommendationEngine
+from src.models.sqlite_repository import SQLiteRepository
+from test_storage_backends import _submit, _user
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def _simulated(users=300, seed=3):
+    """Answer counts from known abilities and item difficulties"""
+    rng = np.random.default_rng(seed)
+    betas = {('DSA', 'Easy'): -1.4, ('DSA', 'Medium'): 0.2, ('DSA', 'Hard'): 1.1,
+             ('SQL', 'Easy'): -0.3, ('SQL', 'Medium'): 0.6, ('SQL', 'Hard'): 2.0}
+    thetas, rows = {}, []
+    for user_id in range(1, users + 1):
+        for topic in ('DSA', 'SQL'):
+            thetas[(user_id, topic)] = theta = rng.normal()
+            for difficulty in calibration.LABEL_PRIOR:
+                n = int(rng.integers(5, 30))
+                k = int(rng.binomial(n, calibration.sigmoid(theta - betas[(topic, difficulty)])))
+                rows.append((user_id, topic, difficulty, n, k))
+    return pd.DataFrame(rows, columns=calibration.COUNT_COLUMNS), thetas, betas
+
+
+def test_fit_recovers_simulated_parameters():
+    counts, thetas, betas = _simulated()
+    abilities, items = calibration.fit(counts)
+
+    fitted = {(row.topic, row.difficulty): row.beta for row in items.itertuples()}
+    for key, beta in betas.items():
+        assert fitted[key] == pytest.approx(beta, abs=0.25)
+    theta = abilities.set_index(['user_id', 'topic'])['theta']
+    truth = np.array([thetas[key] for key in theta.index])
+    assert np.corrcoef(theta.to_numpy(), truth)[0, 1] > 0.85
+    assert int(items['answers'].sum()) == int(counts['questions'].sum())
+
+    # An item nobody answered yet stays at its label's prior; so does a topic with no answers
+    few = pd.DataFrame([(1, 'OS', 'Hard', 0, 0), (1, 'DSA', 'Easy', 4, 4)], columns=calibration.COUNT_COLUMNS)
+    abilities, items = calibration.fit(few)
+    assert list(items['difficulty']) == ['Easy'] and items['beta'][0] < calibration.LABEL_PRIOR['Easy']
+    assert list(abilities['topic']) == ['DSA'] and abilities['theta'][0] > 0
+
+
+def test_elo_steps_settle():
+    theta = calibration.elo_step(0.0, 0, 0.0, True)
+    assert theta == pytest.approx(calibration.ELO_A / 2)
+    assert calibration.elo_step(theta, 1, 0.0, False) < theta
+    # Steps shrink as answers add up, and an expected answer moves ability less
+    assert (calibration.elo_step(0.0, 100, 0.0, True) - 0.0) < (calibration.elo_step(0.0, 10, 0.0, True) - 0.0)
+    assert (calibration.elo_step(0.0, 0, -2.0, True) - 0.0) < (calibration.elo_step(0.0, 0, 2.0, True) - 0.0)
+
+
+def test_recommended_difficulty():
+    items = {'Easy': -1.0, 'Medium': 0.0, 'Hard': 1.0}
+    assert calibration.recommended_difficulty(None) is None
+    assert calibration.recommended_difficulty({'theta': 3.0, 'answers': 9, 'items': items}) is None
+    assert calibration.recommended_difficulty({'theta': 1.9, 'answers': 10, 'items': items}) == 'Hard'
+    assert calibration.recommended_difficulty({'theta': 0.8, 'answers': 10, 'items': items}) == 'Medium'
+    assert calibration.recommended_difficulty({'theta': -0.5, 'answers': 10, 'items': items}) == 'Easy'
+    # Hard DSA turned out easier than its label: a weaker user gets it already
+    assert calibration.recommended_difficulty({'theta': 0.9, 'answers': 10,
+                                               'items': {'Medium': -0.5, 'Hard': 0.0}}) == 'Hard'
+
+
+def test_calibrate_across_shards(db_path, monkeypatch):
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 3)
+    repository = SQLiteRepository(db_path)
+    user_ids = [_user(repository, f'user{i}') for i in range(8)]
+    for user_id in user_ids:
+        for attempt in range(user_id % 3 + 1):
+            _submit(repository, user_id, f'{user_id}-{attempt}')
+
+    counts = calibration.calibrate(db_path)
+    assert counts['users'] == counts['abilities'] == len(user_ids)
+    assert counts['items'] == 1 and counts['answers'] == 2 * sum(user_id % 3 + 1 for user_id in user_ids)
+
+    router = shards.get_router(db_path)
+    for db in router.shards:
+        with db.connection() as conn:
+            assert [tuple(row) for row in conn.execute('SELECT topic, difficulty FROM item_calibration')] == [
+                ('DSA', 'Medium')]
+            for row in conn.execute('SELECT user_id, answers FROM user_ability'):
+                assert router.for_user(row['user_id']) is db
+                assert row['answers'] == 2 * (row['user_id'] % 3 + 1)
+    kept = repository.get_topic_calibration(user_ids[0], 'DSA')
+    assert set(kept['items']) == {'Medium'} and kept['answers'] == 2 * (user_ids[0] % 3 + 1)
+
+    # Abilities move on from the fitted values as answers are logged
+    _submit(repository, user_ids[0], 'after-fit')
+    assert repository.get_topic_calibration(user_ids[0], 'DSA')['answers'] == kept['answers'] + 2
+
+    # Abilities move with their users when resharding
+    abilities = {user_id: repository.get_topic_calibration(user_id, 'DSA')['theta'] for user_id in user_ids}
+    assert shards.reshard(db_path, 2)['moved'] > 0
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 2)
+    repository = SQLiteRepository(db_path)
+    assert {user_id: repository.get_topic_calibration(user_id, 'DSA')['theta'] for user_id in user_ids} == abilities
+
+
+def test_answers_logged_during_a_fit_are_kept(db_path, monkeypatch):
+    repository = SQLiteRepository(db_path)
+    user_ids = [_user(repository, f'user{i}') for i in range(3)]
+    for user_id in user_ids:
+        _submit(repository, user_id, f'{user_id}-0')
+    moved, fit = user_ids[0], calibration.fit
+
+    def fit_while_answering(counts, iterations):
+        _submit(repository, moved, 'during-fit')
+        during.update(repository.get_topic_calibration(moved, 'DSA'))
+        return fit(counts, iterations)
+
+    during = {}
+    monkeypatch.setattr(calibration, 'fit', fit_while_answering)
+    assert calibration.calibrate(db_path)['answers'] == 2 * len(user_ids)
+    with database.get_database(db_path).connection() as conn:
+        kept = {row['user_id']: (row['theta'], row['answers']) for row in conn.execute('SELECT * FROM user_ability')}
+    # Fitted abilities rest on the answers fitted; the one Elo moved meanwhile keeps its steps
+    assert {user_id: answers for user_id, (_, answers) in kept.items()} == {moved: 4, user_ids[1]: 2, user_ids[2]: 2}
+    assert kept[moved] == (during['theta'], during['answers'])
+
+    # The next fit takes them in
+    monkeypatch.setattr(calibration, 'fit', fit)
+    assert calibration.calibrate(db_path)['answers'] == 2 * len(user_ids) + 2
+
+
+def test_reading_for_a_fit_leaves_writers_alone(db_path, monkeypatch):
+    repository = SQLiteRepository(db_path)
+    user_id = _user(repository)
+    _submit(repository, user_id, 'a0')
+    load_abilities = calibration.load_abilities
+
+    def write_then_load(conn):
+        # Another connection writes between the two reads of the snapshot, without waiting
+        writer = sqlite3.connect(db_path, isolation_level=None, timeout=0.1)
+        writer.execute("INSERT INTO user_ability (user_id, topic, theta, answers) VALUES (?, 'SQL', 0.5, 1)", [user_id])
+        writer.close()
+        loaded.update(load_abilities(conn))
+        return loaded
+
+    loaded = {}
+    monkeypatch.setattr(calibration, 'load_abilities', write_then_load)
+    calibration.calibrate(db_path)
+    assert list(loaded) == [(user_id, 'DSA')]
+
+
+def test_recommendations_use_calibrated_difficulty(db_path):
+    repository = SQLiteRepository(db_path)
+    user_id = _user(repository)
+    engine = SmartRecommendationEngine(QuestionLogger(db_path))
+    _submit(repository, user_id, 'r0')
+    before = engine.get_personalized_recommendations(user_id)['suggested_quiz']
+    assert before['main_topic'] == 'DSA'
+
+    # A strong ability on a topic whose Hard questions turned out easy: recommend Hard
+    with shards.get_router(db_path).for_user(user_id).transaction() as conn:
+        conn.execute("UPDATE user_ability SET theta = 2.5, answers = 40 WHERE user_id = ?", [user_id])
+        conn.execute("INSERT INTO item_calibration (topic, difficulty, beta, answers) VALUES ('DSA', 'Hard', 1.6, 500)")
+    suggested = engine.get_personalized_recommendations(user_id)['suggested_quiz']
+    assert suggested['difficulty'] == 'Hard' and before['difficulty'] != 'Hard'
+    assert {k: v for k, v in suggested.items() if k != 'difficulty'} == {
+        k: v for k, v in before.items() if k != 'difficulty'}
+    # The kept state itself is not changed
+    assert repository.get_recommendation_state(user_id)['recommendations']['suggested_quiz'] == before
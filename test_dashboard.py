@@ -0,0 +1,82 @@
+"""
+Dashboard frames over the rollups: the weak-topic table and the bounded score-over-time series.
+
+    python -m pytest -q test_dashboard.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.config.settings import settings
+from src.models import dashboard
+from src.models import database
+from src.models import shards
+from test_archive import _seed
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def test_topic_frames(db_path):
+    repository, user_ids = _seed(db_path, users=1, sessions=8)
+    repository.submit_quiz(user_ids[0], 'untitled', {'score': 40.0, 'num_questions': 0}, [])
+    scores = repository.get_topic_scores(user_ids[0])
+    topics = dashboard.topic_frame(scores)
+    assert topics['topic'].dtype == 'category' and list(topics['display_title']) == [r['display_title'] for r in scores]
+    # The untitled quiz counts under "Quiz"
+    assert 'Quiz' in set(topics['topic'])
+
+    weak = dashboard.weak_topics(topics, 50)
+    assert list(weak['display_title']) == [r['display_title'] for r in sorted(scores, key=lambda r: r['avg_score'])
+                                           if r['avg_score'] < 50]
+    averages = dashboard.topic_averages(topics)
+    assert averages['score'].is_monotonic_decreasing and set(averages['topic']) == set(topics['topic'])
+
+
+def test_frames_of_empty_histories():
+    topics = dashboard.topic_frame([])
+    assert topics.empty and dashboard.weak_topics(topics, 70).empty and dashboard.topic_averages(topics).empty
+
+
+def test_lttb_keeps_the_shape_within_the_budget():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50) * 40 + 50
+    y[437] = 100.0  # a spike must survive
+    kept = dashboard.lttb(x, y, 60)
+    assert len(kept) == 60 and kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0) and 437 in kept
+    assert list(dashboard.lttb(x[:10], y[:10], 60)) == list(range(10))
+
+
+def test_score_series_is_bounded_however_long_the_history(db_path):
+    repository, user_ids = _seed(db_path, users=1, sessions=8)
+    user_id = user_ids[0]
+    db = shards.get_router(db_path).for_user(user_id)
+    with db.transaction() as conn:
+        # Three years of daily rollups on top of the seeded quizzes
+        conn.executemany('''
+            INSERT INTO session_stats_daily (user_id, day, topic, sub_topic, quizzes, score_sum)
+            VALUES (?, date('now', ?), 'DSA', 'Old', 2, ?)
+        ''', [(user_id, f'-{400 + d} days', 2.0 * (d % 100)) for d in range(1100)])
+
+    # ~1500 days, ~215 weeks, ~50 months: the finest that fits, downsampled past months
+    assert dashboard.score_series(repository, user_id, points=300)[1] == 'week'
+    months, _ = dashboard.score_series(repository, user_id, points=100)
+    frame, bucket = dashboard.score_series(repository, user_id, points=30)
+    assert bucket == 'month' and len(frame) == 30 < len(months)
+    assert frame['period'].is_monotonic_increasing and (frame['quizzes'] > 0).all()
+    assert frame['period'].iloc[0] == months['period'].iloc[0] and frame['period'].iloc[-1] == months['period'].iloc[-1]
+
+    frame, bucket = dashboard.score_series(repository, user_id, points=2000)
+    assert bucket == 'day' and frame['quizzes'].sum() == 8 + 2 * 1100
+
+    weeks = repository.get_score_series(user_id, 'week')
+    assert all(pd.Timestamp(row['period']).dayofweek == 0 for row in weeks)
+    assert sum(row['quizzes'] for row in weeks) == 8 + 2 * 1100
@@ -0,0 +1,102 @@
+"""
+Pooled SQLite connections: tuned on open, returned to the pool and reused, nested
+transactions as savepoints, and one Database per file.
+
+    python -m pytest -q test_database.py
+"""
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.models import database
+from src.models.database import PRAGMAS, Database
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def test_connections_are_tuned(db_path):
+    db = Database(db_path)
+    with db.connection() as conn:
+        pragma = lambda name: conn.execute(f'PRAGMA {name}').fetchone()[0]
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1  # NORMAL
+        assert pragma('cache_size') == PRAGMAS['cache_size'] and pragma('mmap_size') == PRAGMAS['mmap_size']
+        assert pragma('busy_timeout') == PRAGMAS['busy_timeout'] and pragma('temp_store') == 2  # MEMORY
+        assert conn.isolation_level is None and conn.row_factory is sqlite3.Row
+    db.close_all()
+
+
+def test_connections_return_to_the_pool(db_path):
+    db = Database(db_path, max_idle=2)
+    with db.connection() as conn:
+        with db.connection() as nested:
+            assert nested is conn  # the same thread reuses its checked-out connection
+    with db.connection() as again:
+        assert again is conn
+
+    # Four threads at once open four connections; two are kept idle, the others closed
+    barrier, seen = threading.Barrier(4), []
+
+    def hold():
+        with db.connection() as held:
+            seen.append(held)
+            barrier.wait()
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: hold(), range(4)))
+    assert len({id(held) for held in seen}) == 4 and db._idle.qsize() == 2
+    closed = 0
+    for held in seen:
+        try:
+            held.execute('SELECT 1')
+        except sqlite3.ProgrammingError:
+            closed += 1
+    assert closed == 2
+    with db.connection() as reused:
+        assert any(reused is held for held in seen)
+    db.close_all()
+    assert db._idle.qsize() == 0
+
+
+def test_nested_transaction_is_a_savepoint(db_path):
+    db = Database(db_path)
+    with db.transaction() as conn:
+        conn.execute('CREATE TABLE items (name TEXT)')
+
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO items VALUES ('outer')")
+        with pytest.raises(RuntimeError):
+            with db.transaction() as nested:
+                nested.execute("INSERT INTO items VALUES ('inner')")
+                raise RuntimeError("inner block fails")
+        with db.transaction() as nested:
+            nested.execute("INSERT INTO items VALUES ('kept')")
+    with db.connection() as conn:
+        assert [row['name'] for row in conn.execute('SELECT name FROM items ORDER BY rowid')] == ['outer', 'kept']
+        assert not conn.in_transaction
+
+    # A failing outer block rolls everything back, its savepoints included
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            with db.transaction() as nested:
+                nested.execute("INSERT INTO items VALUES ('lost')")
+            raise RuntimeError("outer block fails")
+    with db.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 2
+    db.close_all()
+
+
+def test_one_database_per_path(db_path, tmp_path):
+    with ThreadPoolExecutor(8) as pool:
+        found = list(pool.map(lambda _: database.get_database(db_path), range(32)))
+    assert all(db is found[0] for db in found)
+    assert database.get_database(str(tmp_path / 'other.db')) is not found[0]
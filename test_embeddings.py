@@ -0,0 +1,71 @@
+"""
+The ONNX embedding backends agree with sentence-transformers: a tiny BERT is built
+locally (no download), exported with ``export_onnx_model`` and served by
+``OnnxEmbeddings``, in float32 and int8.
+
+    python -m pytest -q test_embeddings.py
+"""
+import os
+
+import numpy as np
+import pytest
+
+from src.config.settings import settings
+from src.models import embeddings
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('transformers')
+
+TEXTS = ['the graph on a tree', 'mistake question answer', 'page cache process thread memory heap stack',
+         'a question on the heap']
+VOCAB = ('[PAD] [UNK] [CLS] [SEP] [MASK] the a on graph tree heap stack page cache process thread memory '
+         'mistake question answer').split()
+
+
+@pytest.fixture(scope='module')
+def exported(tmp_path_factory):
+    """(model directory, ONNX export directory) of a randomly initialised two-layer BERT"""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    model_dir = str(tmp_path_factory.mktemp('tiny-bert'))
+    with open(os.path.join(model_dir, 'vocab.txt'), 'w') as f:
+        f.write('\n'.join(VOCAB))
+    torch.manual_seed(0)
+    BertModel(BertConfig(vocab_size=len(VOCAB), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                         intermediate_size=64, max_position_embeddings=64)).save_pretrained(model_dir)
+    BertTokenizerFast(os.path.join(model_dir, 'vocab.txt')).save_pretrained(model_dir)
+
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(settings, 'ONNX_MODEL_DIR', str(tmp_path_factory.mktemp('onnx')))
+    yield model_dir, embeddings.export_onnx_model(model_dir, 'main')
+    monkeypatch.undo()
+
+
+def _cosines(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return (a * b).sum(axis=1) / np.linalg.norm(a, axis=1) / np.linalg.norm(b, axis=1)
+
+
+@pytest.mark.parametrize('quantized, tolerance', [(False, 1e-5), (True, 1e-2)])
+def test_onnx_matches_sentence_transformers(exported, quantized, tolerance):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model_dir, onnx_dir = exported
+    reference = HuggingFaceEmbeddings(model_name=model_dir).embed_documents(TEXTS)
+    onnx = embeddings.OnnxEmbeddings(onnx_dir, quantized=quantized, batch_size=3)
+    vectors = onnx.embed_documents(TEXTS)
+    assert np.asarray(vectors).shape == np.asarray(reference).shape
+    assert _cosines(vectors, reference) == pytest.approx(1.0, abs=tolerance)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)  # normalized like the store expects
+    # int8 activations are scaled per batch, so a query alone only agrees up to the tolerance
+    assert _cosines([onnx.embed_query(TEXTS[1])], [vectors[1]]) == pytest.approx(1.0, abs=tolerance)
+
+
+def test_exports_are_kept_per_revision(exported):
+    model_dir, onnx_dir = exported
+    assert onnx_dir == embeddings.onnx_model_dir(model_dir, 'main') != embeddings.onnx_model_dir(model_dir, 'v2')
+    assert sorted(os.listdir(onnx_dir)) == sorted([embeddings.ONNX_MODEL_FILE, embeddings.ONNX_INT8_MODEL_FILE,
+                                                   embeddings.TOKENIZER_FILE, 'tokenizer_config.json'])
+    with pytest.raises(FileNotFoundError):
+        embeddings.OnnxEmbeddings(embeddings.onnx_model_dir(model_dir, 'v2'))
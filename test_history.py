@@ -0,0 +1,127 @@
+"""
+Quiz history: a submitted quiz and its question log are written as one unit, and
+the history list is paged by keyset and searched through FTS5.
+
+    python -m pytest -q test_history.py
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.models import database
+from src.models.auth import AuthManager
+from src.models.quiz_submission import QuizSubmissionManager
+from src.models.simple_session import SimpleSessionManager
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    database.get_database(path).close_all()
+
+
+def _user(db_path, name='alice') -> int:
+    auth = AuthManager(db_path)
+    auth.register_user(name, f'{name}@example.com', 'secret')
+    return auth.login_user(name, 'secret')['id']
+
+
+def _quiz(topic='DSA', sub_topic='Graphs', score=50.0, question='What does BFS visit first?'):
+    return {
+        'topic': topic, 'sub_topic': sub_topic, 'question_type': 'MCQ', 'difficulty': 'Medium',
+        'num_questions': 2, 'score': score,
+        'questions_data': [{'question': question}, {'question': 'A ___ has no cycles.'}],
+        'user_answers': ['Neighbours', 'forest'], 'results_data': [],
+    }
+
+
+def _log_entries(quiz_data, time_taken=12):
+    return [{
+        'topic': quiz_data['topic'], 'sub_topic': quiz_data['sub_topic'], 'difficulty': 'Medium',
+        'question_type': 'MCQ', 'question_text': q['question'], 'options': [],
+        'correct_answer': 'Neighbours', 'user_answer': answer, 'is_correct': answer == 'Neighbours',
+        'time_taken': time_taken, 'explanation': '',
+    } for q, answer in zip(quiz_data['questions_data'], quiz_data['user_answers'])]
+
+
+def _submit(db_path, user_id, submission_id, **quiz):
+    quiz_data = _quiz(**quiz)
+    return QuizSubmissionManager(db_path).submit_quiz(user_id, submission_id, quiz_data, _log_entries(quiz_data))
+
+
+def _counts(db_path):
+    with database.get_database(db_path).connection() as conn:
+        return tuple(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                     for table in ('quiz_sessions', 'question_log'))
+
+
+def test_submit_is_idempotent(db_path):
+    user_id = _user(db_path)
+    session_id, created = _submit(db_path, user_id, 'attempt-1')
+    assert created and _counts(db_path) == (1, 2)
+    assert _submit(db_path, user_id, 'attempt-1') == (session_id, False)
+    assert _counts(db_path) == (1, 2)
+    assert SimpleSessionManager(db_path).get_complete_session(session_id)['user_answers'] == ['Neighbours', 'forest']
+
+    # Retries racing each other still save the attempt once
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: _submit(db_path, user_id, 'attempt-2'), range(8)))
+    assert sum(created for _, created in results) == 1 and len({sid for sid, _ in results}) == 1
+    assert _counts(db_path) == (2, 4)
+
+
+def test_failed_submit_writes_nothing(db_path):
+    user_id = _user(db_path)
+    quiz_data = _quiz()
+    entries = _log_entries(quiz_data)
+    entries[1]['time_taken'] = 'twelve'  # the second question row fails after the session row is in
+    assert QuizSubmissionManager(db_path).submit_quiz(user_id, 'attempt-1', quiz_data, entries) == (None, False)
+    assert _counts(db_path) == (0, 0)
+
+    # The attempt was not recorded, so its retry goes through
+    assert _submit(db_path, user_id, 'attempt-1')[1]
+    assert _counts(db_path) == (1, 2)
+
+
+def test_session_pages(db_path):
+    user_id, other_id = _user(db_path), _user(db_path, 'bob')
+    ids = [_submit(db_path, user_id, f'a{i}', score=float(i))[0] for i in range(7)]
+    _submit(db_path, other_id, 'b0')
+    sessions = SimpleSessionManager(db_path)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = sessions.get_session_page(user_id, 3, cursor)
+        seen.append([session['id'] for session in page])
+        if cursor is None:
+            break
+        # A session saved between pages does not shift them
+        if len(seen) == 1:
+            newest = _submit(db_path, user_id, 'a7')[0]
+    assert seen == [ids[::-1][0:3], ids[::-1][3:6], ids[::-1][6:]]
+    assert [s['id'] for s in sessions.get_user_sessions(user_id, 2)] == [newest, ids[-1]]
+    assert sessions.get_user_sessions(user_id, 1)[0]['display_title'] == 'DSA - Graphs'
+    assert sessions.get_session_page(other_id, 3) == (sessions.get_session_page(other_id, 1)[0], None)
+
+
+def test_search(db_path):
+    user_id, other_id = _user(db_path), _user(db_path, 'bob')
+    graphs, _ = _submit(db_path, user_id, 'a1', question='What does Dijkstra compute?')
+    paging, _ = _submit(db_path, user_id, 'a2', topic='Operating Systems', sub_topic='Paging', question='What is a TLB?')
+    _submit(db_path, other_id, 'b1', question='What does Dijkstra compute?')
+    sessions = SimpleSessionManager(db_path)
+
+    found, has_more = sessions.search_sessions(user_id, 'dijkstra')
+    assert [s['id'] for s in found] == [graphs] and not has_more
+    assert '**Dijkstra**' in found[0]['match']
+    assert [s['id'] for s in sessions.search_sessions(user_id, 'pag')[0]] == [paging]
+    assert [s['id'] for s in sessions.search_sessions(user_id, 'operating tlb')[0]] == [paging]
+    assert sessions.search_sessions(user_id, 'graph')[0][0]['display_title'] == 'DSA - Graphs'
+    assert sessions.search_sessions(user_id, 'zeppelin') == ([], False)
+    assert sessions.search_sessions(user_id, '  ') == ([], False)
+
+    first, has_more = sessions.search_sessions(user_id, 'cycles', limit=1)
+    second, last = sessions.search_sessions(user_id, 'cycles', limit=1, offset=1)
+    assert has_more and not last and {first[0]['id'], second[0]['id']} == {graphs, paging}
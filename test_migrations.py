@@ -0,0 +1,121 @@
+"""
+Upgrading a database created before the later migrations, with quiz history in it.
+
+    python -m pytest -q test_migrations.py
+"""
+import sqlite3
+
+import pytest
+
+from src.config.settings import settings
+from src.models import database
+from src.models import migrations
+from src.models import recommendations
+from src.models import rollups
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def _legacy_database(path, version=1):
+    """A database at schema ``version`` with two users' history, written the way the app did then"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    for number, _, migrate in migrations.MIGRATIONS[:version]:
+        migrate(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+    conn.executemany("INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, 'hash')",
+                     [(1, 'alice', 'alice@example.com'), (2, 'bob', 'bob@example.com')])
+    for session_id, (user_id, topic, score) in enumerate([(1, 'DSA', 50.0), (1, 'SQL', 100.0), (2, 'DSA', 0.0)], 1):
+        conn.execute('''
+            INSERT INTO quiz_sessions (id, user_id, topic, sub_topic, question_type, difficulty, num_questions, score,
+                                       created_at)
+            VALUES (?, ?, ?, '', 'MCQ', 'Medium', 2, ?, datetime('now', '-2 days'))
+        ''', [session_id, user_id, topic, score])
+        conn.executemany('''
+            INSERT INTO question_log (user_id, session_id, topic, sub_topic, difficulty, question_type, question_text,
+                                      options, correct_answer, user_answer, is_correct, time_taken, explanation,
+                                      created_at)
+            VALUES (?, ?, ?, '', 'Medium', 'MCQ', ?, '["a", "b"]', 'a', ?, ?, 10, 'Because.', datetime('now', '-2 days'))
+        ''', [(user_id, session_id, topic, f'{topic} question {i}?', answer, answer == 'a')
+              for i, answer in enumerate(('a', 'b') if score == 50.0 else ('a', 'a') if score else ('b', 'b'))])
+    conn.close()
+
+
+def _rollups(conn):
+    return {table: [tuple(row) for row in conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3')]
+            for table in ('user_stats', 'session_stats', 'session_stats_daily', 'question_stats_daily')}
+
+
+def test_upgrade_backfills_the_rollups(db_path):
+    _legacy_database(db_path)
+    with database.get_database(db_path).transaction() as conn:
+        assert migrations.schema_version(conn) == migrations.LATEST_VERSION
+        upgraded = _rollups(conn)
+        assert [row[:5] for row in upgraded['user_stats']] == [(1, 2, 150.0, 4, 3), (2, 1, 0.0, 2, 0)]
+        rollups.rebuild_all(conn)
+        assert _rollups(conn) == upgraded
+
+
+def test_upgrade_backfills_the_recommendation_state(db_path):
+    _legacy_database(db_path)
+    with database.get_database(db_path).connection() as conn:
+        kept = {row['user_id']: row['state'] for row in conn.execute('SELECT * FROM recommendation_state')}
+        assert sorted(kept) == [1, 2]
+        for user_id in kept:
+            assert recommendations.load_state(conn, user_id) == recommendations._state_from_rollups(
+                conn, user_id, recommendations._today(conn))
+
+
+def test_state_backfilled_after_migration_13(db_path):
+    # Upgraded past migration 13 before the backfill: rollups in place, state built lazily
+    _legacy_database(db_path, version=1)
+    database.get_database(db_path)
+    database.close_database(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('DELETE FROM recommendation_state')
+    conn.execute('PRAGMA user_version = 16')
+    conn.close()
+    with database.get_database(db_path).connection() as conn:
+        assert sorted(row[0] for row in conn.execute('SELECT user_id FROM recommendation_state')) == [1, 2]
+
+
+def test_upgrade_reviews_answers_logged_before_the_question_bank(db_path):
+    _legacy_database(db_path)
+    with database.get_database(db_path).connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM question_log WHERE question_id IS NULL').fetchone()[0] == 0
+        items = conn.execute('SELECT user_id, topic FROM review_items ORDER BY 1, 2').fetchall()
+        assert [tuple(row) for row in items] == [(1, 'DSA'), (1, 'DSA'), (1, 'SQL'), (1, 'SQL'), (2, 'DSA'), (2, 'DSA')]
+
+
+def test_review_items_migration_leaves_legacy_answers_to_migration_18(db_path):
+    # Migration 14 only replays answers that already have a bank id; banking is migration 18's
+    _legacy_database(db_path, version=13)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    migrations._m014_review_items(conn)
+    assert conn.execute('SELECT COUNT(*) FROM question_log WHERE question_id IS NULL').fetchone()[0] == 6
+    assert conn.execute('SELECT COUNT(*) FROM review_items').fetchone()[0] == 0
+    conn.close()
+
+
+def test_upgrade_flags_review_sessions(db_path):
+    _legacy_database(db_path, version=18)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # A review quiz as it used to be saved, and a quiz of the user's own on a topic of the same name
+    conn.executemany('''
+        INSERT INTO quiz_sessions (id, user_id, topic, sub_topic, question_type, difficulty, num_questions, score)
+        VALUES (?, 1, 'Review', '', 'MCQ', ?, 2, ?)
+    ''', [(4, '', 100.0), (5, 'Medium', 40.0)])
+    conn.close()
+    with database.get_database(db_path).connection() as conn:
+        flagged = conn.execute('SELECT id FROM quiz_sessions WHERE is_review = 1').fetchall()
+        assert [row[0] for row in flagged] == [4]
+        stats = conn.execute("SELECT quizzes, score_sum FROM session_stats WHERE user_id = 1 AND topic = 'Review'")
+        assert [tuple(row) for row in stats] == [(1, 40.0)]
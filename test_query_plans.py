@@ -0,0 +1,185 @@
+"""
+Query-plan regression tests for every query issued from src/models/.
+
+Each manager method is run against a small database while a trace callback records
+the SQL it executes; every recorded query is then put through EXPLAIN QUERY PLAN and
+must not fall back to a full table scan or sort its rows for an ORDER BY (sorting the
+groups of an aggregate is fine). Statements SQLite runs internally, such as FTS5 reading
+its shadow tables, are skipped. When you add a query to src/models/, exercise it in
+``QUERIES`` below.
+
+    python -m pytest -q test_query_plans.py
+"""
+import re
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from src.models import database
+from src.models.auth import AuthManager
+from src.models.question_log import QuestionLogger, SmartRecommendationEngine
+from src.models.quiz_submission import QuizSubmissionManager
+from src.models import review
+from src.models import rollups
+from src.models import session_storage
+from src.models.simple_session import SimpleSessionManager
+from src.models.vector_store import MmapVectorStore
+
+CHECKED_STATEMENTS = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH|INSERT\s+INTO\s+\S+\s*(\([^)]*\))?\s*SELECT)', re.I)
+# A table-less SELECT (such as SELECT date('now')) scans its one constant row
+FULL_SCAN = re.compile(r'^SCAN (?!.*VIRTUAL TABLE|CONSTANT ROW)')
+SORT = re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+GROUPED = re.compile(r'USE TEMP B-TREE FOR GROUP BY')
+INTERNAL = re.compile(r"'main'\.")
+
+
+def _quiz(topic='DSA', sub_topic='Graphs', score=60.0):
+    return {
+        'topic': topic, 'sub_topic': sub_topic, 'question_type': 'Multiple Choice',
+        'difficulty': 'Medium', 'num_questions': 1, 'score': score,
+        'questions_data': [{'question': 'What is BFS?'}], 'user_answers': ['A'], 'results_data': [],
+    }
+
+
+def _question(is_correct):
+    return {
+        'topic': 'DSA', 'sub_topic': 'Graphs', 'difficulty': 'Medium', 'question_type': 'Multiple Choice',
+        'question_text': 'What is BFS?', 'options': ['A', 'B'], 'correct_answer': 'A',
+        'user_answer': 'A' if is_correct else 'B', 'is_correct': is_correct, 'time_taken': 10,
+    }
+
+
+@pytest.fixture
+def traced(tmp_path, monkeypatch):
+    """A fresh database plus the list every statement run on it is appended to."""
+    statements = []
+
+    def traced_connect(original):
+        def connect(self, *args, **kwargs):
+            conn = original(self, *args, **kwargs)
+            conn.set_trace_callback(statements.append)
+            return conn
+        return connect
+
+    monkeypatch.setattr(database.Database, '_connect', traced_connect(database.Database._connect))
+    monkeypatch.setattr(MmapVectorStore, '_connect_docs', traced_connect(MmapVectorStore._connect_docs))
+    monkeypatch.setattr(database, '_databases', {})
+
+    db_path = str(tmp_path / 'studyai.db')
+    yield db_path, str(tmp_path / 'store'), statements
+    database.get_database(db_path).close_all()
+
+
+def _seed(db_path):
+    auth = AuthManager(db_path)
+    auth.register_user('alice', 'alice@example.com', 'secret')
+    user_id = auth.login_user('alice', 'secret')['id']
+    sessions, logger = SimpleSessionManager(db_path), QuestionLogger(db_path)
+    for i in range(5):
+        session_id = sessions.save_quiz_session(user_id, _quiz(score=20.0 * i))
+        logger.log_question(user_id, session_id, _question(i % 2 == 0))
+    return user_id, session_id
+
+
+def _run_vector_store(store_path):
+    store = MmapVectorStore(store_path)
+    docs = [Document(page_content=f"Topic: DSA\nQuestion: q{i}", metadata={'topic': 'DSA'}) for i in range(4)]
+    store.add(np.random.default_rng(0).random((4, 8), dtype=np.float32), docs)
+    store.topic_documents('DSA', k=2)
+    store.lexical_search('DSA', k=2)
+    store.lexical_search('Graph traversal', k=2)
+    store.get_documents([0, 2])
+    list(store.iter_documents(batch_size=2))
+    store.check_integrity()
+
+
+QUERIES = {
+    'AuthManager': lambda db, user_id, session_id: (
+        AuthManager(db).login_user('alice', 'secret'),
+        AuthManager(db).mark_rag_trial_as_used(user_id),
+    ),
+    'QuizSubmissionManager': lambda db, user_id, session_id: (
+        QuizSubmissionManager(db).submit_quiz(user_id, 'attempt-1', _quiz(), [_question(True), _question(False)]),
+        QuizSubmissionManager(db).submit_quiz(user_id, 'attempt-1', _quiz(), [_question(True), _question(False)]),
+    ),
+    'session_storage.migrate': lambda db, user_id, session_id: session_storage.migrate(db, batch_size=2),
+    'SimpleSessionManager': lambda db, user_id, session_id: (
+        SimpleSessionManager(db).get_user_sessions(user_id, 15),
+        SimpleSessionManager(db).get_session_page(user_id, 2, SimpleSessionManager(db).get_session_page(user_id, 2)[1]),
+        SimpleSessionManager(db).get_complete_session(session_id),
+        SimpleSessionManager(db).search_sessions(user_id, 'graphs BFS', limit=2, offset=2),
+        list(SimpleSessionManager(db).iter_session_history(user_id, chunk_size=2)),
+    ),
+    'QuestionLogger': lambda db, user_id, session_id: (
+        QuestionLogger(db).get_recent_questions(user_id, 10),
+        QuestionLogger(db).analyze_weak_topics(user_id, days=7),
+        SmartRecommendationEngine(QuestionLogger(db)).get_personalized_recommendations(user_id),
+        QuestionLogger(db).get_recent_outcomes(user_id),
+        QuestionLogger(db).get_recommendation_state(user_id),
+        QuestionLogger(db).get_topic_calibration(user_id, 'DSA'),
+        QuestionLogger(db).get_question_history(user_id, since='2000-01-01'),
+        list(QuestionLogger(db).iter_question_history(user_id, chunk_size=2)),
+    ),
+    'PerformanceStats': lambda db, user_id, session_id: (
+        rollups.PerformanceStats(db).get_overview(user_id),
+        rollups.PerformanceStats(db).get_topic_scores(user_id),
+        rollups.PerformanceStats(db).get_score_series(user_id, 'day'),
+        rollups.PerformanceStats(db).get_score_series(user_id, 'week'),
+        rollups.PerformanceStats(db).get_data_version(user_id),
+    ),
+    'rollups.rebuild_user': lambda db, user_id, session_id: _rebuild_user(db, user_id),
+    'ReviewQueue': lambda db, user_id, session_id: review.ReviewQueue(db).get_due_reviews(user_id, 10),
+    'review.rebuild_items': lambda db, user_id, session_id: _rebuild_review_items(db, user_id),
+}
+
+
+def _rebuild_user(db_path, user_id):
+    with database.get_database(db_path).transaction() as conn:
+        rollups.rebuild_user(conn, user_id)
+
+
+def _rebuild_review_items(db_path, user_id):
+    with database.get_database(db_path).transaction() as conn:
+        review.rebuild_items(conn, user_id)
+
+
+def _checked(statements):
+    return [sql for sql in statements if CHECKED_STATEMENTS.match(sql) and not INTERNAL.search(sql)]
+
+
+def _plan_problems(conn, sql):
+    plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+    grouped = any(GROUPED.search(detail) for detail in plan)
+    return [detail for detail in plan if FULL_SCAN.match(detail) or (SORT.search(detail) and not grouped)]
+
+
+@pytest.mark.parametrize('name', sorted(QUERIES))
+def test_manager_queries_use_indices(traced, name):
+    db_path, _, statements = traced
+    user_id, session_id = _seed(db_path)
+
+    del statements[:]
+    QUERIES[name](db_path, user_id, session_id)
+    checked = _checked(statements)
+    assert checked, f"{name} ran no queries"
+
+    with database.get_database(db_path).connection() as conn:
+        for sql in checked:
+            problems = _plan_problems(conn, sql)
+            assert not problems, f"{name}: {' '.join(sql.split())}\n  -> {problems}"
+
+
+def test_vector_store_queries_use_indices(traced):
+    _, store_path, statements = traced
+    _run_vector_store(store_path)
+    checked = _checked(statements)
+    assert checked
+
+    conn = MmapVectorStore(store_path)._connect_docs()
+    try:
+        for sql in checked:
+            problems = _plan_problems(conn, sql)
+            assert not problems, f"{' '.join(sql.split())}\n  -> {problems}"
+    finally:
+        conn.close()
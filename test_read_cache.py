@@ -0,0 +1,109 @@
+"""
+The per-user read cache: reruns with no new data do no SQL, and any write to the
+user's history, from this process or another, is seen.
+
+    python -m pytest -q test_read_cache.py
+"""
+import pytest
+
+from src.config.settings import settings
+from src.models import database
+from src.models.read_cache import CachedRepository
+from src.models.repository import get_repository
+from src.models.sqlite_repository import SQLiteRepository
+from test_storage_backends import _submit, _user
+
+
+@pytest.fixture
+def traced(tmp_path, monkeypatch):
+    """A cached repository on a fresh database, plus the list of statements run on it."""
+    statements = []
+    connect = database.Database._connect
+
+    def traced_connect(self, *args, **kwargs):
+        conn = connect(self, *args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(database.Database, '_connect', traced_connect)
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    db_path = str(tmp_path / 'studyai.db')
+    yield db_path, statements
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def _dashboard_reads(repository, user_id):
+    """What a dashboard rerun reads"""
+    return (
+        repository.get_overview(user_id),
+        repository.get_topic_scores(user_id),
+        repository.get_user_sessions(user_id, 100),
+        repository.get_session_page(user_id, 15),
+        repository.get_recent_outcomes(user_id),
+        repository.analyze_weak_topics(user_id, days=14),
+        repository.memoize(user_id, 'frames', lambda: len(repository.get_user_sessions(user_id, 100))),
+    )
+
+
+def test_reruns_without_new_data_do_no_sql(traced):
+    db_path, statements = traced
+    repository = CachedRepository(SQLiteRepository(db_path), recheck_seconds=3600)
+    user_id = _user(repository)
+    _submit(repository, user_id, 'a1', score=40.0)
+
+    first = _dashboard_reads(repository, user_id)
+    del statements[:]
+    assert _dashboard_reads(repository, user_id) == first
+    assert statements == []
+
+    # A quiz saved through the repository is on the next rerun
+    _submit(repository, user_id, 'a2', score=80.0)
+    del statements[:]
+    second = _dashboard_reads(repository, user_id)
+    assert statements
+    assert second[0]['total_quizzes'] == 2 and second[-1] == 2
+    assert second == _dashboard_reads(SQLiteRepository(db_path), user_id)[:-1] + (2,)
+
+
+def test_writes_from_other_processes_are_seen_after_a_recheck(traced):
+    db_path, statements = traced
+    repository = CachedRepository(SQLiteRepository(db_path), recheck_seconds=0)
+    other = SQLiteRepository(db_path)  # stands in for another process or replica
+    user_id = _user(repository)
+    _submit(other, user_id, 'a1')
+    assert repository.get_overview(user_id)['total_quizzes'] == 1
+
+    # Rechecked every time here: one version lookup, and nothing else while unchanged
+    del statements[:]
+    repository.get_overview(user_id)
+    assert [sql for sql in statements if 'user_data_version' not in sql] == []
+
+    _submit(other, user_id, 'a2')
+    assert repository.get_overview(user_id)['total_quizzes'] == 2
+
+
+def test_value_computed_across_a_write_is_not_cached(traced):
+    db_path, _ = traced
+    repository = CachedRepository(SQLiteRepository(db_path), recheck_seconds=3600)
+    user_id = _user(repository)
+
+    def stale_read():
+        value = repository.backend.get_overview(user_id)
+        _submit(repository, user_id, 'during')
+        return value
+
+    assert repository.memoize(user_id, 'overview', stale_read)['total_quizzes'] == 0
+    assert repository.memoize(user_id, 'overview', lambda: repository.get_overview(user_id))['total_quizzes'] == 1
+
+
+def test_get_repository_caches_unless_disabled(traced, monkeypatch):
+    db_path, _ = traced
+    monkeypatch.setattr('src.models.repository._repositories', {})
+    assert isinstance(get_repository(db_path), CachedRepository)
+    assert get_repository(db_path).db_path == db_path
+
+    monkeypatch.setattr('src.models.repository._repositories', {})
+    monkeypatch.setattr(settings, 'READ_CACHE_USERS', 0)
+    assert isinstance(get_repository(db_path), SQLiteRepository)
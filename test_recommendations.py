@@ -0,0 +1,120 @@
+"""
+The recommendation state kept as answers are logged gives the same recommendations and
+alerts as computing them from the rollups on every read.
+
+    python -m pytest -q test_recommendations.py
+"""
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pytest
+
+from src.config.settings import settings
+from src.models import database
+from src.models import recommendations
+from src.models import rollups
+from src.models import shards
+from src.models.recommendations import WINDOW_DAYS, performance_alerts, recommend, summarize_weak_topics
+from src.models.sqlite_repository import SQLiteRepository
+from test_storage_backends import _user
+
+TOPICS = [('DSA', 'Graphs'), ('DSA', 'Trees'), ('DSA', ''), ('Python', 'Decorators'), ('SQL', '')]
+DIFFICULTIES = ['Easy', 'Medium', 'Hard']
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def _answers(rng, count):
+    entries = []
+    for _ in range(count):
+        topic, sub_topic = rng.choice(TOPICS)
+        entries.append({
+            'topic': topic, 'sub_topic': sub_topic, 'difficulty': rng.choice(DIFFICULTIES),
+            'question_type': 'MCQ', 'question_text': f'Q{rng.randrange(50)}', 'options': ['a', 'b'],
+            'correct_answer': 'a', 'user_answer': 'a', 'is_correct': rng.random() < 0.55, 'time_taken': 5,
+        })
+    return entries
+
+
+def _batch(repository, user_id):
+    """Recommendations and alerts computed from the rollups, as before the state was kept"""
+    return {
+        'recommendations': recommend(repository.analyze_weak_topics(user_id, days=WINDOW_DAYS)),
+        'alerts': performance_alerts(repository.get_recent_outcomes(user_id)),
+    }
+
+
+def _kept(repository, user_id):
+    state = repository.get_recommendation_state(user_id)
+    return {'recommendations': state['recommendations'], 'alerts': state['alerts']}
+
+
+def test_state_matches_the_batch_computation(db_path):
+    rng = random.Random(7)
+    repository = SQLiteRepository(db_path)
+    user_id = _user(repository)
+    db = shards.get_router(db_path).for_user(user_id)
+    with db.transaction() as conn:
+        # Answers from before the state existed, some of them out of the window
+        conn.executemany('''
+            INSERT INTO question_stats_daily (user_id, day, topic, sub_topic, difficulty, questions, correct, time_sum)
+            VALUES (?, date('now', ?), ?, ?, ?, ?, ?, 0)
+        ''', [(user_id, f'-{days} days', *rng.choice(TOPICS), rng.choice(DIFFICULTIES), 4, rng.randrange(5))
+              for days in range(1, 25)])
+    assert _kept(repository, user_id) == _batch(repository, user_id)
+    with db.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM recommendation_state').fetchone()[0] == 0
+
+    seen = set()
+    for attempt in range(40):
+        quiz_data = {'topic': 'DSA', 'sub_topic': 'Graphs', 'difficulty': 'Medium', 'num_questions': 3, 'score': 50.0}
+        repository.submit_quiz(user_id, f'attempt-{attempt}', quiz_data, _answers(rng, rng.randrange(1, 6)))
+        kept = _kept(repository, user_id)
+        assert kept == _batch(repository, user_id)
+        seen.add(bool(kept['alerts']))
+    assert seen == {False, True}  # alerts came and went as answers were logged
+
+    with db.transaction() as conn:
+        rollups.rebuild_user(conn, user_id)
+    assert _kept(repository, user_id) == _batch(repository, user_id)
+
+
+def test_state_rolls_forward_day_by_day():
+    rng = random.Random(11)
+    first = date(2026, 1, 1)
+    logged, recent, state = [], [], None
+    for offset in range(60):
+        today = (first + timedelta(days=offset)).isoformat()
+        if rng.random() < 0.3:
+            continue  # days without answers still move the window
+
+        for _ in range(rng.randrange(1, 4)):
+            entries = _answers(rng, rng.randrange(1, 6))
+            logged += [(today, entry) for entry in entries]
+            recent = rollups.merge_recent(recent, entries)
+            state = (recommendations.state_from_rollups([], recent, today) if state is None
+                     else recommendations.current_state(state, today))
+            state = recommendations.advance_state(state, entries, recent, today)
+
+        for read_on in (today, (first + timedelta(days=offset + rng.randrange(1, 20))).isoformat()):
+            totals = defaultdict(lambda: [0, 0])
+            for day, entry in logged:
+                if day >= recommendations.window_start(read_on):
+                    counts = totals[(entry['topic'], entry['sub_topic'], entry['difficulty'])]
+                    counts[0] += 1
+                    counts[1] += int(entry['is_correct'])
+            rows = [{'topic': t, 'sub_topic': s, 'difficulty': d, 'questions': q, 'correct': c}
+                    for (t, s, d), (q, c) in sorted(totals.items())]
+            kept = recommendations.current_state(state, read_on)
+            assert kept['recommendations'] == recommend(summarize_weak_topics(rows, WINDOW_DAYS))
+            assert kept['alerts'] == performance_alerts(recommendations.recent_outcomes(recent))
+            assert all(day >= recommendations.window_start(read_on) for day in kept['window'])
@@ -0,0 +1,108 @@
+"""
+Spaced repetition over logged questions: SM-2 scheduling, the items kept as answers
+are logged against a replay of question_log, and the due queue across reshards.
+
+    python -m pytest -q test_review.py
+"""
+import pytest
+
+from src.config.settings import settings
+from src.models import database
+from src.models import review
+from src.models import rollups
+from src.models import shards
+from src.models.sqlite_repository import SQLiteRepository
+from test_storage_backends import _log_entries, _quiz, _submit, _user
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    path = str(tmp_path / 'studyai.db')
+    yield path
+    for db in list(database._databases.values()):
+        db.close_all()
+
+
+def _items(db_path, user_id):
+    with shards.get_router(db_path).for_user(user_id).connection() as conn:
+        return {row['question_id']: dict(row) for row in conn.execute(
+            'SELECT * FROM review_items WHERE user_id = ?', [user_id])}
+
+
+def test_schedule_follows_sm2():
+    item, intervals = None, []
+    for correct in (True, True, True, True, False, True):
+        item = review.schedule(item, correct, '2026-03-01 08:00:00')
+        intervals.append(item['interval_days'])
+    assert intervals == [1, 6, 15, 38, 1, 1]
+    assert item['lapses'] == 1 and item['repetitions'] == 1
+    assert item['ease'] == pytest.approx(2.5 - 0.54)
+    assert item['due_at'] == '2026-03-02 08:00:00'
+
+    # Wrong answers lower the ease down to its floor; intervals stop growing at the cap
+    for _ in range(5):
+        item = review.schedule(item, False, '2026-03-01 08:00:00')
+    assert item['ease'] == review.MIN_EASE and item['lapses'] == 2
+    for _ in range(30):
+        item = review.schedule(item, True, '2026-03-01 08:00:00')
+    assert item['interval_days'] == review.MAX_INTERVAL_DAYS
+
+
+def test_items_match_a_replay_of_the_log(db_path):
+    repository = SQLiteRepository(db_path)
+    user_id, other = _user(repository), _user(repository, 'bob')
+    for i in range(6):
+        _submit(repository, user_id, f'a{i}', question=f'Question {i % 3}?')
+    _submit(repository, other, 'b0')
+
+    kept = _items(db_path, user_id)
+    assert len(kept) == 4  # three first questions and the shared fill-in-the-blank
+    with database.get_database(db_path).transaction() as conn:
+        review.rebuild_items(conn, user_id)
+    replayed = _items(db_path, user_id)
+    # Both schedule from the same second, unless the write crossed into the next one
+    timing = ('reviewed_at', 'due_at')
+    strip = lambda items: {q: {k: v for k, v in item.items() if k not in timing} for q, item in items.items()}
+    assert strip(replayed) == strip(kept)
+    assert {item['repetitions'] for item in kept.values()} == {0, 2}
+    assert len(_items(db_path, other)) == 2
+
+
+def test_reshard_keeps_review_items(db_path, monkeypatch):
+    repository = SQLiteRepository(db_path)
+    user_ids = [_user(repository, f'user{i}') for i in range(6)]
+    for user_id in user_ids:
+        _submit(repository, user_id, f'{user_id}-a', question=f'Question {user_id}?')
+        _submit(repository, user_id, f'{user_id}-b', question=f'Question {user_id}?')
+        with shards.get_router(db_path).for_user(user_id).transaction() as conn:
+            conn.execute("UPDATE review_items SET due_at = datetime('now', '-7 days') WHERE user_id = ?", [user_id])
+
+    def queues():
+        return {user_id: sorted((item['question']['question'], item['repetitions'])
+                                for item in repository.get_due_reviews(user_id)) for user_id in user_ids}
+
+    before = queues()
+    assert all(len(queue) == 2 for queue in before.values())
+    for shard_count in (3, 1):
+        assert shards.reshard(db_path, shard_count)['moved'] > 0
+        monkeypatch.setattr(settings, 'SHARD_COUNT', shard_count)
+        repository = SQLiteRepository(db_path)
+        assert queues() == before
+
+
+def test_review_quizzes_stay_out_of_topic_scores(db_path):
+    repository = SQLiteRepository(db_path)
+    user_id = _user(repository)
+    _submit(repository, user_id, 'a0', topic='DSA', score=50.0)
+    review_quiz = dict(_quiz(topic=review.REVIEW_TOPIC, sub_topic='', score=100.0), is_review=True)
+    repository.submit_quiz(user_id, 'r0', review_quiz, _log_entries(review_quiz))
+    # A topic of the user's own that happens to share the review quizzes' name still counts
+    _submit(repository, user_id, 'a1', topic=review.REVIEW_TOPIC, sub_topic='Basics', score=30.0)
+    scores = {(row['topic'], row['count']) for row in repository.get_topic_scores(user_id)}
+    assert scores == {('DSA', 1), (review.REVIEW_TOPIC, 1)}
+    with database.get_database(db_path).transaction() as conn:
+        kept = [tuple(row) for row in conn.execute('SELECT * FROM session_stats ORDER BY 1, 2, 3')]
+        rollups.rebuild_user(conn, user_id)
+        assert [tuple(row) for row in conn.execute('SELECT * FROM session_stats ORDER BY 1, 2, 3')] == kept
@@ -0,0 +1,399 @@
+"""
+The same behaviour tests against every storage backend (SQLite in one file and split
+over three shard files, PostgreSQL), plus a submit throughput comparison between them
+and a round trip through the offline reshard tool.
+
+PostgreSQL runs against STUDYAI_TEST_POSTGRES_URL if set, otherwise against a
+throwaway cluster started with the ``initdb`` / ``pg_ctl`` found on PATH; without
+either (or without psycopg installed) its cases are skipped.
+
+    python -m pytest -q -s test_storage_backends.py
+"""
+import io
+import os
+import csv
+import json
+import time
+import shutil
+import socket
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.models import database
+from src.models import export
+from src.models import postgres_repository
+from src.models import shards
+from src.models.recommendations import performance_alerts, recommend
+from src.config.settings import settings
+from src.models.sqlite_repository import SQLiteRepository
+
+PG_TABLES = ('question_log', 'quiz_sessions', 'question_bank', 'user_stats', 'session_stats',
+             'session_stats_daily', 'question_stats_daily', 'user_data_version', 'recommendation_state',
+             'review_items', 'item_calibration', 'user_ability', 'users')
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    if postgres_repository.ConnectionPool is None:
+        pytest.skip("psycopg / psycopg_pool not installed")
+    url = os.getenv('STUDYAI_TEST_POSTGRES_URL')
+    if url:
+        yield url
+        return
+    if not (shutil.which('initdb') and shutil.which('pg_ctl')):
+        pytest.skip("no STUDYAI_TEST_POSTGRES_URL and no initdb/pg_ctl on PATH")
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        pytest.skip("initdb refuses to run as root; set STUDYAI_TEST_POSTGRES_URL instead")
+
+    root = tmp_path_factory.mktemp('postgres')
+    data, port = str(root / 'data'), _free_port()
+    subprocess.run(['initdb', '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync'],
+                   check=True, capture_output=True)
+    subprocess.run(['pg_ctl', '-D', data, '-w', '-l', str(root / 'log'),
+                    '-o', f"-p {port} -k {root} -c listen_addresses=127.0.0.1 -c fsync=off", 'start'],
+                   check=True, capture_output=True)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run(['pg_ctl', '-D', data, '-m', 'immediate', 'stop'], capture_output=True)
+
+
+@pytest.fixture(params=['sqlite', 'sqlite-sharded', 'postgres'])
+def repository(request, tmp_path, monkeypatch):
+    if request.param.startswith('sqlite'):
+        monkeypatch.setattr(database, '_databases', {})
+        monkeypatch.setattr(settings, 'SHARD_COUNT', 3 if request.param == 'sqlite-sharded' else 1)
+        db_path = str(tmp_path / 'studyai.db')
+        yield SQLiteRepository(db_path)
+        shards.get_router(db_path).close_all()
+        return
+
+    repository = postgres_repository.PostgresRepository(request.getfixturevalue('postgres_url'))
+    try:
+        yield repository
+    finally:
+        with repository.pool.connection() as conn:
+            conn.execute(f"TRUNCATE {', '.join(PG_TABLES)} RESTART IDENTITY CASCADE")
+        repository.close()
+
+
+def _user(repository, name='alice') -> int:
+    repository.create_user(name, f'{name}@example.com', 'hash')
+    return repository.find_user(name)['id']
+
+
+def _quiz(topic='DSA', sub_topic='Graphs', score=50.0, question='What does BFS visit first?'):
+    questions = [
+        {'type': 'MCQ', 'question': question, 'options': ['Neighbours', 'Leaves'],
+         'correct_answer': 'Neighbours', 'explanation': 'Breadth-first explores level by level.'},
+        {'type': 'Fill in the blank', 'question': 'A ___ has no cycles.', 'correct_answer': 'tree',
+         'explanation': 'Acyclic connected graphs are trees.'},
+    ]
+    answers = ['Neighbours', 'forest']
+    results = [{
+        'question_number': i + 1, 'question': q['question'], 'question_type': q['type'], 'user_answer': a,
+        'correct_answer': q['correct_answer'], 'explanation': q['explanation'], 'options': q.get('options', []),
+        'is_correct': a == q['correct_answer'], 'time_taken': 12,
+    } for i, (q, a) in enumerate(zip(questions, answers))]
+    return {
+        'topic': topic, 'sub_topic': sub_topic, 'question_type': 'MCQ', 'difficulty': 'Medium',
+        'num_questions': 2, 'score': score,
+        'questions_data': questions, 'user_answers': answers, 'results_data': results,
+    }
+
+
+def _log_entries(quiz_data):
+    return [{
+        'topic': quiz_data['topic'], 'sub_topic': quiz_data['sub_topic'], 'difficulty': 'Medium',
+        'question_type': q['type'], 'question_text': q['question'], 'options': q.get('options', []),
+        'correct_answer': q['correct_answer'], 'user_answer': r['user_answer'], 'is_correct': r['is_correct'],
+        'time_taken': r['time_taken'], 'explanation': q['explanation'],
+    } for q, r in zip(quiz_data['questions_data'], quiz_data['results_data'])]
+
+
+def _submit(repository, user_id, submission_id, **quiz):
+    quiz_data = _quiz(**quiz)
+    return repository.submit_quiz(user_id, submission_id, quiz_data, _log_entries(quiz_data))
+
+
+def test_users(repository):
+    user_id = _user(repository)
+    user = repository.find_user('alice')
+    assert user['email'] == 'alice@example.com' and user['password_hash'] == 'hash'
+    assert not user['has_used_rag_trial']
+    with pytest.raises(Exception):
+        repository.create_user('alice', 'other@example.com', 'hash')
+    repository.mark_rag_trial_used(user_id)
+    assert repository.find_user('alice')['has_used_rag_trial']
+    assert repository.find_user('bob') is None
+
+
+def test_submit_is_idempotent_and_round_trips(repository):
+    user_id = _user(repository)
+    session_id, created = _submit(repository, user_id, 'attempt-1')
+    assert created
+    assert _submit(repository, user_id, 'attempt-1') == (session_id, False)
+
+    session = repository.get_complete_session(session_id)
+    quiz_data = _quiz()
+    assert session['user_id'] == user_id and session['topic'] == 'DSA' and session['score'] == 50.0
+    for key in ('questions_data', 'user_answers', 'results_data'):
+        assert session[key] == quiz_data[key]
+    assert repository.get_overview(user_id)['total_quizzes'] == 1
+    assert len(repository.get_recent_questions(user_id, 10)) == 2
+
+
+def test_session_pages(repository):
+    user_id, other_id = _user(repository), _user(repository, 'bob')
+    ids = [_submit(repository, user_id, f'a{i}', score=float(i))[0] for i in range(7)]
+    _submit(repository, other_id, 'b0')
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = repository.get_session_page(user_id, 3, cursor)
+        seen.append([session['id'] for session in page])
+        if cursor is None:
+            break
+    assert seen == [ids[::-1][0:3], ids[::-1][3:6], ids[::-1][6:]]
+    assert [s['id'] for s in repository.get_user_sessions(user_id, 2)] == ids[::-1][:2]
+    assert repository.get_user_sessions(user_id, 1)[0]['display_title'] == 'DSA - Graphs'
+
+
+def test_analysis(repository):
+    user_id = _user(repository)
+    _submit(repository, user_id, 'a1', score=40.0)
+    _submit(repository, user_id, 'a2', score=80.0)
+    _submit(repository, user_id, 'a3', topic='OS', sub_topic='', score=90.0)
+
+    overview = repository.get_overview(user_id)
+    assert overview == {'total_quizzes': 3, 'avg_score': pytest.approx(70.0), 'recent_quizzes': 3}
+    scores = {t['display_title']: (t['avg_score'], t['count']) for t in repository.get_topic_scores(user_id)}
+    assert scores == {'DSA - Graphs': (pytest.approx(60.0), 2), 'OS': (pytest.approx(90.0), 1)}
+
+    analysis = repository.analyze_weak_topics(user_id, days=7)
+    graphs = analysis['all_topics']['DSA - Graphs']
+    assert (graphs['total_questions'], graphs['correct_answers']) == (4, 2)
+    assert graphs['difficulty_breakdown'] == {'Medium': {'correct': 2, 'total': 4}}
+    assert set(analysis['weak_topics']) == {'DSA - Graphs', 'OS'}
+
+    outcomes = repository.get_recent_outcomes(user_id)
+    assert len(outcomes) == 6 and outcomes[0] == {'topic': 'OS', 'sub_topic': '', 'is_correct': False}
+    assert repository.get_recent_questions(user_id, 1)[0]['question_text'] == 'A ___ has no cycles.'
+
+
+def test_score_series(repository):
+    user_id = _user(repository)
+    _submit(repository, user_id, 's1', score=40.0)
+    _submit(repository, user_id, 's2', topic='OS', sub_topic='', score=90.0)
+    today = repository.get_user_sessions(user_id, 1)[0]['short_date']
+    for bucket in ('day', 'week', 'month'):
+        [row] = repository.get_score_series(user_id, bucket)
+        assert row['quizzes'] == 2 and row['avg_score'] == pytest.approx(65.0)
+        assert row['period'] <= today and row['period'][:7] in (today[:7], row['period'][:7])
+    assert repository.get_score_series(user_id, 'day')[0]['period'] == today
+    assert repository.get_score_series(user_id, 'month')[0]['period'] == today[:8] + '01'
+
+
+def test_recommendation_state(repository):
+    user_id = _user(repository)
+    assert not repository.get_recommendation_state(user_id)['recommendations']['has_recommendations']
+    for attempt in range(3):
+        _submit(repository, user_id, f'r{attempt}')
+    state = repository.get_recommendation_state(user_id)
+    assert state['recommendations'] == recommend(repository.analyze_weak_topics(user_id, days=14))
+    assert state['alerts'] == performance_alerts(repository.get_recent_outcomes(user_id))
+    assert state['recommendations']['suggested_quiz']['main_topic'] == 'DSA'
+
+
+def _backdate_reviews(repository, user_id, days):
+    """Move the user's review items ``days`` days into the past, as if that time had gone by"""
+    if isinstance(repository, postgres_repository.PostgresRepository):
+        with repository.pool.connection() as conn:
+            conn.execute("UPDATE review_items SET due_at = due_at - make_interval(days => %s) WHERE user_id = %s",
+                         [days, user_id])
+        return
+    with shards.get_router(repository.db_path).for_user(user_id).transaction() as conn:
+        conn.execute("UPDATE review_items SET due_at = datetime(due_at, ?) WHERE user_id = ?", [f'-{days} days', user_id])
+
+
+def test_due_reviews(repository):
+    user_id = _user(repository)
+    _submit(repository, user_id, 'd1')
+    _submit(repository, user_id, 'd2', topic='OS', sub_topic='', question='What does a TLB cache?')
+    assert repository.get_due_reviews(user_id) == []
+
+    # Everything answered is due the next day, the two right answers included (first repetition)
+    _backdate_reviews(repository, user_id, 1)
+    due = repository.get_due_reviews(user_id)
+    assert len(due) == 3 and repository.get_due_reviews(user_id, limit=2) == due[:2]
+    questions = {item['question']['question']: item for item in due}
+    assert set(questions) == {'What does BFS visit first?', 'A ___ has no cycles.', 'What does a TLB cache?'}
+    assert questions['What does a TLB cache?']['topic'] == 'OS'
+    assert questions['What does BFS visit first?']['question']['options'] == ['Neighbours', 'Leaves']
+
+    # Answered right, they are rescheduled from now: 6 days out on a second repetition, the
+    # question answered wrong before starts over at one day
+    repository.submit_quiz(user_id, 'review-1', {'topic': 'Review', 'num_questions': 3, 'score': 50.0}, [{
+        'topic': item['topic'], 'sub_topic': item['sub_topic'], 'difficulty': item['difficulty'],
+        'question_type': item['question']['type'], 'question_text': item['question']['question'],
+        'options': item['question'].get('options', []), 'correct_answer': item['question']['correct_answer'],
+        'explanation': item['question']['explanation'], 'user_answer': 'x', 'is_correct': True, 'time_taken': 3,
+    } for item in due])
+    assert repository.get_due_reviews(user_id) == []
+    _backdate_reviews(repository, user_id, 1)
+    assert [item['question']['question'] for item in repository.get_due_reviews(user_id)] == ['A ___ has no cycles.']
+    _backdate_reviews(repository, user_id, 5)
+    assert len(repository.get_due_reviews(user_id)) == 3
+
+
+def test_topic_calibration(repository):
+    user_id = _user(repository)
+    assert repository.get_topic_calibration(user_id, 'DSA') is None
+    _submit(repository, user_id, 'c1')
+    first = repository.get_topic_calibration(user_id, 'DSA')
+    # One right and one wrong Medium answer, both against the label's prior difficulty
+    assert first['answers'] == 2 and first['items'] == {}
+    assert first['theta'] < 0  # right then wrong: the wrong one was expected less, so it weighs more
+    _submit(repository, user_id, 'c2')
+    assert repository.get_topic_calibration(user_id, 'DSA')['answers'] == 4
+    assert repository.get_topic_calibration(user_id, 'OS') is None
+
+
+def test_data_version(repository):
+    user_id = _user(repository)
+    assert repository.get_data_version(user_id) == 0
+    _submit(repository, user_id, 'v1')
+    first = repository.get_data_version(user_id)
+    _submit(repository, user_id, 'v1')  # a resubmit writes nothing
+    assert repository.get_data_version(user_id) == first > 0
+    _submit(repository, user_id, 'v2')
+    assert repository.get_data_version(user_id) > first
+
+
+@pytest.mark.parametrize('fmt', sorted(export.FORMATS))
+def test_export(repository, fmt):
+    user_id, other_id = _user(repository), _user(repository, 'bob')
+    ids = [_submit(repository, user_id, f'a{i}', score=float(i))[0] for i in range(4)]
+    _submit(repository, other_id, 'b0')
+
+    def rows(kind):
+        data = b''.join(export.export_history(repository, user_id, kind, fmt, chunk_size=3))
+        if fmt == 'csv':
+            return list(csv.DictReader(io.StringIO(data.decode())))
+        if fmt == 'jsonl':
+            return [json.loads(line) for line in data.decode().splitlines()]
+        pq = pytest.importorskip('pyarrow.parquet')
+        return pq.read_table(io.BytesIO(data)).to_pylist()
+
+    sessions, questions = rows('sessions'), rows('questions')
+    assert [int(s['id']) for s in sessions] == ids
+    assert [float(s['score']) for s in sessions] == [0.0, 1.0, 2.0, 3.0]
+    assert len(questions) == 8 and {int(q['session_id']) for q in questions} == set(ids)
+    first = questions[0]
+    options = json.loads(first['options']) if fmt == 'csv' else first['options']
+    assert (first['question_text'], options, first['user_answer']) == (
+        'What does BFS visit first?', ['Neighbours', 'Leaves'], 'Neighbours')
+    assert list(sessions[0]) == export.SESSION_COLUMNS and list(first) == export.QUESTION_COLUMNS
+
+    # The dashboard's in-memory export gives up past its cap
+    data = b''.join(export.export_history(repository, user_id, 'questions', fmt))
+    assert export.export_bytes(repository, user_id, 'questions', fmt, max_bytes=len(data)) == data
+    assert export.export_bytes(repository, user_id, 'questions', fmt, max_bytes=len(data) - 1) is None
+
+
+def test_review_sessions_are_flagged(repository):
+    user_id = _user(repository)
+    review_quiz = dict(_quiz(topic='Review', sub_topic='', score=100.0), is_review=True)
+    repository.submit_quiz(user_id, 'r0', review_quiz, _log_entries(review_quiz))
+    _submit(repository, user_id, 'a0', topic='Review', sub_topic='', score=40.0)
+    # Only the flag keeps a session out of the topic scores, not its topic's name
+    scores = [(t['display_title'], t['avg_score'], t['count']) for t in repository.get_topic_scores(user_id)]
+    assert scores == [('Review', pytest.approx(40.0), 1)]
+    assert repository.get_overview(user_id)['total_quizzes'] == 2
+
+
+def test_search(repository):
+    user_id, other_id = _user(repository), _user(repository, 'bob')
+    graphs, _ = _submit(repository, user_id, 'a1', question='What does Dijkstra compute?')
+    paging, _ = _submit(repository, user_id, 'a2', topic='Operating Systems', sub_topic='Paging', question='What is a TLB?')
+    _submit(repository, other_id, 'b1', question='What does Dijkstra compute?')
+
+    assert [s['id'] for s in repository.search_sessions(user_id, 'dijkstra')[0]] == [graphs]
+    assert [s['id'] for s in repository.search_sessions(user_id, 'pag')[0]] == [paging]
+    assert repository.search_sessions(user_id, 'graph')[0][0]['display_title'] == 'DSA - Graphs'
+    assert repository.search_sessions(user_id, 'zeppelin') == ([], False)
+
+    first, has_more = repository.search_sessions(user_id, 'cycles', limit=1)
+    second, last = repository.search_sessions(user_id, 'cycles', limit=1, offset=1)
+    assert has_more and not last and {first[0]['id'], second[0]['id']} == {graphs, paging}
+
+
+def test_submit_throughput(repository, capsys):
+    """Concurrent submits from 8 threads; prints quizzes/s so the backends can be compared."""
+    user_ids = [_user(repository, f'user{i}') for i in range(8)]
+    per_thread = 25
+
+    def submit_many(user_id):
+        return [_submit(repository, user_id, f'{user_id}-{i}', score=float(i))[1] for i in range(per_thread)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(user_ids)) as pool:
+        created = [ok for oks in pool.map(submit_many, user_ids) for ok in oks]
+    elapsed = time.perf_counter() - started
+
+    assert all(created) and len(created) == len(user_ids) * per_thread
+    assert sum(repository.get_overview(user_id)['total_quizzes'] for user_id in user_ids) == len(created)
+    with capsys.disabled():
+        print(f"\n{type(repository).__name__}: {len(created) / elapsed:.0f} quiz submits/s "
+              f"({len(user_ids)} threads, {len(created)} submits)")
+
+
+def test_reshard_moves_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_databases', {})
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 1)
+    db_path = str(tmp_path / 'studyai.db')
+    repository = SQLiteRepository(db_path)
+    user_ids = [_user(repository, f'user{i}') for i in range(12)]
+    for user_id in user_ids:
+        for i in range(3):
+            _submit(repository, user_id, f'{user_id}-{i}', score=float(10 * i), question=f'Question {user_id}?')
+
+    def history(repository):
+        return {user_id: (
+            [(s['topic'], s['score'], s['created_at']) for s in repository.get_user_sessions(user_id, 10)],
+            repository.get_overview(user_id), repository.get_recent_outcomes(user_id),
+            [q['question_text'] for q in repository.get_recent_questions(user_id, 10)],
+            [s['score'] for s in repository.search_sessions(user_id, f'question {user_id}')[0]],
+        ) for user_id in user_ids}
+
+    before = history(repository)
+    for shard_count in (4, 2, 1):
+        counts = shards.reshard(db_path, shard_count)
+        assert counts['moved'] > 0 and counts['to'] == shard_count
+        monkeypatch.setattr(settings, 'SHARD_COUNT', shard_count)
+        repository = SQLiteRepository(db_path)
+        assert history(repository) == before
+
+        router = shards.get_router(db_path)
+        for user_id in user_ids:
+            session = repository.get_user_sessions(user_id, 1)[0]
+            assert router.for_session(session['id']) is router.for_user(user_id)
+            assert repository.get_complete_session(session['id'])['questions_data'][0]['question'] == f'Question {user_id}?'
+        # Submitting an attempt again after its session moved is still a no-op
+        assert _submit(repository, user_ids[0], f'{user_ids[0]}-0')[1] is False
+
+    assert shards.reshard(db_path, 1)['moved'] == 0
+    assert not os.path.exists(shards.shard_path(db_path, 1))
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 2)
+    with pytest.raises(RuntimeError):
+        SQLiteRepository(db_path)
+    for db in list(database._databases.values()):
+        db.close_all()
@@ -0,0 +1,293 @@
+"""
+The memory-mapped vector store: appends commit through the manifest, and legacy
+FAISS stores migrate into it once, manage_vector_store.py checks and compacts them, and
+re-embedding resumes and swaps a new store in under readers that stay open, and
+topic lookups are answered from the lexical index without embedding the query.
+
+    python -m pytest -q test_vector_store.py
+"""
+import os
+import zlib
+import sqlite3
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+
+import manage_vector_store
+from src.models import vector_store
+from src.models.vector_db_manager import VectorDBManager
+from src.models.vector_store import (DOCS_FILE, LEGACY_DUMMY_TEXT, LEGACY_INDEX_DIR, NATIVE_STORE_DIR, VECTORS_FILE,
+                                     STAGING_STORE_DIR, MmapVectorStore, compact_store, migrate_faiss_store,
+                                     reembed_store)
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic vectors from the text, no model download"""
+
+    def __init__(self, dim=8, seed=0):
+        self.dim, self.seed, self.calls = dim, seed, 0
+
+    def _embed(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode()) + self.seed)
+        return rng.random(self.dim, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _mistakes(start, count, topic='DSA'):
+    return [Document(page_content=f'Mistake {i} on {topic}', metadata={'topic': topic}) for i in range(start, start + count)]
+
+
+def _add(store, documents, embeddings=None):
+    embeddings = embeddings or FakeEmbeddings()
+    return store.add(embeddings.embed_documents([doc.page_content for doc in documents]), documents)
+
+
+def test_append_commits_through_the_manifest(tmp_path):
+    path = str(tmp_path / NATIVE_STORE_DIR)
+    store = MmapVectorStore(path)
+    assert store.count == 0 and len(store.vectors()) == 0 and store.search([0.0] * 8) == []
+
+    assert _add(store, _mistakes(0, 5)) == 5
+    assert _add(store, _mistakes(5, 3)) == 8
+    reader = MmapVectorStore(path)
+    assert reader.count == 8 and reader.dim == 8 and isinstance(reader.vectors(), np.memmap)
+    assert [doc.page_content for doc in reader.get_documents([6, 1])] == ['Mistake 6 on DSA', 'Mistake 1 on DSA']
+    query = FakeEmbeddings().embed_query('Mistake 4 on DSA')
+    assert reader.search(query, k=1) == [(4, pytest.approx(0.0, abs=1e-5))]
+    assert reader.check_integrity() == []
+
+    # A write that died before the manifest was replaced leaves a tail nobody reads
+    with open(os.path.join(path, VECTORS_FILE), 'ab') as f:
+        f.write(np.ones((2, 8), dtype=np.float32).tobytes())
+    assert MmapVectorStore(path).count == 8
+    assert MmapVectorStore(path).check_integrity() == ["vector file has 64 uncommitted trailing bytes"]
+    assert _add(store, _mistakes(8, 1)) == 9  # the next append writes over it
+    assert MmapVectorStore(path).check_integrity() == []
+
+    with pytest.raises(ValueError):
+        store.add(np.zeros((1, 4), dtype=np.float32), _mistakes(9, 1))
+    assert MmapVectorStore(path).count == 9
+
+
+def test_migrate_legacy_faiss_store(tmp_path):
+    from langchain_community.vectorstores import FAISS
+
+    user_dir = str(tmp_path / 'user_1')
+    texts = [LEGACY_DUMMY_TEXT] + [doc.page_content for doc in _mistakes(0, 4)]
+    FAISS.from_texts(texts, FakeEmbeddings(), metadatas=[{'topic': 'DSA'}] * len(texts)).save_local(
+        os.path.join(user_dir, LEGACY_INDEX_DIR))
+
+    assert migrate_faiss_store(user_dir) == 4
+    store = MmapVectorStore(os.path.join(user_dir, NATIVE_STORE_DIR))
+    assert [doc.page_content for _, doc in store.iter_documents()] == texts[1:]
+    assert store.embedding_model == vector_store.LEGACY_EMBEDDING_MODEL
+    np.testing.assert_allclose(store.vectors(), FakeEmbeddings().embed_documents(texts[1:]), rtol=1e-6)
+    assert store.check_integrity() == []
+    assert sorted(os.listdir(user_dir)) == [LEGACY_INDEX_DIR, NATIVE_STORE_DIR]  # no temporary files left
+
+    assert migrate_faiss_store(user_dir) is None  # already migrated
+
+
+def test_cli_checks_and_compacts(tmp_path, capsys):
+    root = str(tmp_path)
+    first = MmapVectorStore(os.path.join(root, 'user_1', NATIVE_STORE_DIR))
+    _add(first, _mistakes(0, 4))
+    _add(first, _mistakes(1, 2))  # the same mistakes saved again by a later quiz
+    second = MmapVectorStore(os.path.join(root, 'user_2', NATIVE_STORE_DIR))
+    _add(second, _mistakes(0, 3, topic='SQL'))
+    with open(os.path.join(second.path, VECTORS_FILE), 'ab') as f:
+        f.write(b'\0' * 12)
+
+    assert manage_vector_store.main(['check', '--all', '--root', root, '-j', '1']) == 1
+    assert 'user 2: vector file has 12 uncommitted trailing bytes' in capsys.readouterr().out
+    assert manage_vector_store.main(['compact', '--all', '--root', root, '-j', '1']) == 0
+    out = capsys.readouterr().out
+    assert 'user 1: 6 -> 4 documents' in out and 'user 2: 3 -> 3 documents' in out
+    assert manage_vector_store.main(['check', '--all', '--root', root, '-j', '1']) == 0
+
+    # The latest copy of each duplicate is kept, with its own vector
+    compacted = MmapVectorStore(first.path)
+    assert [doc.page_content for _, doc in compacted.iter_documents()] == [
+        'Mistake 0 on DSA', 'Mistake 3 on DSA', 'Mistake 1 on DSA', 'Mistake 2 on DSA']
+    np.testing.assert_allclose(compacted.vectors()[2], FakeEmbeddings().embed_query('Mistake 1 on DSA'))
+    assert sorted(os.listdir(os.path.dirname(first.path))) == [NATIVE_STORE_DIR, NATIVE_STORE_DIR + '.lock']
+
+    assert manage_vector_store.main(['stats', '--root', root]) == 0
+    assert '2 users, 7 documents' in capsys.readouterr().out
+    assert manage_vector_store.main(['list', '--user', '3', '--root', root]) == 1
+
+
+class FailingEmbeddings(FakeEmbeddings):
+    """Stops after ``batches`` calls, like a re-embedding job killed midway"""
+
+    def __init__(self, batches, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = batches
+
+    def embed_documents(self, texts):
+        if self.calls >= self.batches:
+            raise RuntimeError("interrupted")
+        return super().embed_documents(texts)
+
+
+class CompactingEmbeddings(FakeEmbeddings):
+    """Compacts the store at ``path`` after the first batch, like maintenance racing the job"""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def embed_documents(self, texts):
+        if self.calls == 1:
+            compact_store(self.path)
+        return super().embed_documents(texts)
+
+
+def test_reembed_resumes_from_the_staging_store(tmp_path):
+    user_dir = str(tmp_path / 'user_1')
+    live = MmapVectorStore(os.path.join(user_dir, NATIVE_STORE_DIR))
+    _add(live, _mistakes(0, 10))
+
+    with pytest.raises(RuntimeError):
+        reembed_store(user_dir, FailingEmbeddings(2, dim=4, seed=1), 'new-model', 'v2', batch_size=3)
+    assert MmapVectorStore(os.path.join(user_dir, STAGING_STORE_DIR)).count == 6
+    assert MmapVectorStore(live.path).embedding_model == vector_store.LEGACY_EMBEDDING_MODEL  # still serving
+
+    _add(live, _mistakes(10, 2))  # saved while the job was down
+    resumed = FakeEmbeddings(dim=4, seed=1)
+    assert reembed_store(user_dir, resumed, 'new-model', 'v2', batch_size=3) == 12
+    assert resumed.calls == 2  # only the six documents not embedded yet
+    store = MmapVectorStore(live.path)
+    assert (store.embedding_model, store.embedding_revision, store.dim) == ('new-model', 'v2', 4)
+    assert [doc.page_content for _, doc in store.iter_documents()] == [
+        doc.page_content for doc in _mistakes(0, 12)]
+    np.testing.assert_allclose(store.vectors(), resumed.embed_documents([doc.page_content for doc in _mistakes(0, 12)]))
+    assert sorted(os.listdir(user_dir)) == [NATIVE_STORE_DIR, NATIVE_STORE_DIR + '.lock']
+
+
+def _contents(path):
+    return [doc.page_content for _, doc in MmapVectorStore(path).iter_documents()]
+
+
+def test_reembed_restarts_after_a_compaction(tmp_path):
+    user_dir = str(tmp_path / 'user_1')
+    live = MmapVectorStore(os.path.join(user_dir, NATIVE_STORE_DIR))
+    _add(live, _mistakes(0, 10))
+    _add(live, _mistakes(2, 3))  # duplicates, so compacting renumbers the documents
+
+    with pytest.raises(RuntimeError):
+        reembed_store(user_dir, FailingEmbeddings(2, dim=4, seed=1), 'new-model', 'v2', batch_size=3)
+    assert compact_store(live.path) == {'before': 13, 'after': 10}
+    expected = _contents(live.path)
+
+    resumed = FakeEmbeddings(dim=4, seed=1)
+    assert reembed_store(user_dir, resumed, 'new-model', 'v2', batch_size=3) == 10
+    assert _contents(live.path) == expected
+    np.testing.assert_allclose(MmapVectorStore(live.path).vectors(), resumed.embed_documents(expected))
+
+
+def test_compaction_during_a_reembed(tmp_path):
+    user_dir = str(tmp_path / 'user_1')
+    live = MmapVectorStore(os.path.join(user_dir, NATIVE_STORE_DIR))
+    _add(live, _mistakes(0, 10))
+    _add(live, _mistakes(2, 3))
+
+    embeddings = CompactingEmbeddings(live.path, dim=4, seed=1)
+    assert reembed_store(user_dir, embeddings, 'new-model', 'v2', batch_size=3) == 10
+    assert _contents(live.path) == [f'Mistake {i} on DSA' for i in (0, 1, 5, 6, 7, 8, 9, 2, 3, 4)]
+    np.testing.assert_allclose(MmapVectorStore(live.path).vectors(),
+                               FakeEmbeddings(dim=4, seed=1).embed_documents(_contents(live.path)))
+
+
+@pytest.mark.parametrize('dim', [4, 8])
+def test_swap_under_a_live_store(tmp_path, dim):
+    user_dir = str(tmp_path / 'user_1')
+    live = MmapVectorStore(os.path.join(user_dir, NATIVE_STORE_DIR))
+    _add(live, _mistakes(0, 6))
+    old_query = FakeEmbeddings().embed_query('Mistake 2 on DSA')
+    assert live.search(old_query, k=1)[0][0] == 2
+
+    # Same document count; a new dimension, or the same one from another model
+    new_model = FakeEmbeddings(dim=dim, seed=7)
+    reembed_store(user_dir, new_model, 'new-model', 'v2')
+    live.refresh()
+    assert (live.embedding_model, live.dim) == ('new-model', dim)
+    assert np.array_equal(live.vectors(), new_model.embed_documents([doc.page_content for doc in _mistakes(0, 6)]))
+    assert live.search(new_model.embed_query('Mistake 2 on DSA'), k=1) == [(2, pytest.approx(0.0, abs=1e-5))]
+
+
+def test_lexical_search(tmp_path):
+    store = MmapVectorStore(str(tmp_path / NATIVE_STORE_DIR))
+    _add(store, _mistakes(0, 3, topic='Graphs'))
+    _add(store, _mistakes(3, 2, topic='Dynamic Programming'))
+    _add(store, _mistakes(5, 2, topic='Graph Theory'))
+    _add(store, _mistakes(7, 2, topic='Theory of Computation'))
+
+    # Exact topic, most recent first
+    assert store.topic_documents('Graphs', k=2) == [2, 1]
+    assert store.topic_documents('Graphs', k=4) == [2, 1, 0]
+    assert store.topic_documents('Graph', k=4) == []
+
+    # BM25 needs every word but the stopwords, so one shared word ("theory", "of") is not enough
+    assert sorted(store.lexical_search('Graph Theory', k=4)) == [5, 6]
+    assert sorted(store.lexical_search('Theory of Computation', k=4)) == [7, 8]
+    assert sorted(store.lexical_search('Programming', k=5)) == [3, 4]
+    assert store.lexical_search('Operating Systems', k=3) == []
+    assert store.lexical_search('Theory of the Mind', k=3) == []
+    assert store.lexical_search('of the', k=3) == []
+    assert store.lexical_search('Graphs', k=0) == store.topic_documents('Graphs', k=0) == []
+
+    # Rows past the manifest count are never returned
+    store.manifest['count'] = 2
+    assert store.topic_documents('Graphs', k=3) == [1, 0]
+    assert sorted(store.lexical_search('Graphs', k=3)) == [0, 1]
+
+
+def test_lexical_index_added_to_older_stores(tmp_path):
+    store = MmapVectorStore(str(tmp_path / NATIVE_STORE_DIR))
+    _add(store, _mistakes(0, 3, topic='Graphs'))
+    conn = sqlite3.connect(os.path.join(store.path, DOCS_FILE))
+    conn.executescript('''
+        DROP TRIGGER documents_fts_insert; DROP TRIGGER documents_fts_delete; DROP TABLE documents_fts;
+        DROP INDEX idx_documents_topic; PRAGMA user_version = 0;
+    ''')
+    conn.close()
+    assert MmapVectorStore(store.path).topic_documents('Graphs', k=3) == [2, 1, 0]
+    assert sorted(MmapVectorStore(store.path).lexical_search('Graphs', k=3)) == [0, 1, 2]
+    assert MmapVectorStore(store.path).check_integrity() == []
+
+
+def test_topic_lookups_skip_the_query_embedding(tmp_path, monkeypatch):
+    store = MmapVectorStore(str(tmp_path / NATIVE_STORE_DIR))
+    _add(store, _mistakes(0, 3, topic='Graphs'))
+    _add(store, _mistakes(3, 3, topic='Trees'))
+    _add(store, _mistakes(6, 1, topic='Theory of Computation'))
+    embeddings = FakeEmbeddings()
+    queries = []
+    monkeypatch.setattr(embeddings, 'embed_query', lambda text: queries.append(text) or FakeEmbeddings().embed_query(text))
+    monkeypatch.setattr(VectorDBManager, 'embeddings', property(lambda self: embeddings))
+    manager = VectorDBManager.__new__(VectorDBManager)
+    manager.vector_store = store
+
+    assert [doc.page_content for doc in manager.retrieve_relevant_documents('Graphs', k=2)] == [
+        'Mistake 2 on Graphs', 'Mistake 1 on Graphs']
+    assert queries == []
+    # Too few exact hits: dense search fills up, without repeating a document
+    found = manager.retrieve_relevant_documents('Graphs', k=5)
+    assert len(queries) == 1 and len(found) == len({doc.page_content for doc in found}) == 5
+    assert [doc.page_content for doc in found[:3]] == ['Mistake 2 on Graphs', 'Mistake 1 on Graphs', 'Mistake 0 on Graphs']
+    # Word matches never stand in for the dense results
+    query = FakeEmbeddings().embed_query('Questions and explanations about Theory of Graphs')
+    dense = store.get_documents([doc_id for doc_id, _ in store.search(query, 2)])
+    assert manager.retrieve_relevant_documents('Theory of Graphs', k=2) == dense and len(queries) == 2
+    # Re-ranking embeds the query and keeps to the topic and its word matches
+    reranked = manager.retrieve_relevant_documents('Graphs', k=2, rerank=True)
+    assert len(queries) == 3 and all(doc.metadata['topic'] == 'Graphs' for doc in reranked)
@@ -0,0 +1,121 @@
+"""
+The opt-in write queue: writes are group-committed, a failing write only fails its own
+caller, and the journal replays exactly the writes that neither committed nor failed.
+
+    python -m pytest -q test_write_queue.py
+"""
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from src.config.settings import settings
+from src.models.database import Database
+from src.models.migrations import apply_migrations
+from src.models.write_queue import WriteQueue, write_op
+
+
+@write_op('test_insert_item')
+def _insert_item(conn, payload):
+    conn.execute('INSERT INTO items (name) VALUES (?)', [payload['name']])
+    return payload['name']
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'WRITE_QUEUE_ENABLED', True)
+    db = Database(str(tmp_path / 'studyai.db'))
+    with db.connection() as conn:
+        apply_migrations(conn)
+        conn.execute('CREATE TABLE items (name TEXT UNIQUE NOT NULL)')
+    yield db
+    db.close_all()
+
+
+def _names(db):
+    with db.connection() as conn:
+        return sorted(row[0] for row in conn.execute('SELECT name FROM items'))
+
+
+def _journal(db):
+    with open(db.journal_path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_writes_are_batched(db, monkeypatch):
+    queue = WriteQueue(db, max_batch=16, max_latency_ms=200)
+    futures = []
+    threads = [threading.Thread(target=lambda i=i: futures.append(queue.submit('test_insert_item', {'name': f'n{i}'})))
+               for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(future.result(5) for future in futures) == sorted(f'n{i}' for i in range(40))
+    metrics = queue.metrics()
+    queue.stop()
+    assert metrics['committed'] == 40 and metrics['failed'] == 0
+    assert metrics['batches'] < 40 and max(metrics['batch_sizes']) <= 16
+    assert _names(db) == sorted(f'n{i}' for i in range(40))
+
+    # Database.write goes through the queue only when it is turned on
+    assert db.write('test_insert_item', {'name': 'queued'}).result(5) == 'queued'
+    assert db.write_metrics()['committed'] == 1
+    monkeypatch.setattr(settings, 'WRITE_QUEUE_ENABLED', False)
+    assert db.write('test_insert_item', {'name': 'inline'}).result() == 'inline'
+    assert db.write_metrics()['committed'] == 1
+
+
+def test_a_failing_write_only_fails_its_caller(db):
+    queue = WriteQueue(db, max_batch=8, max_latency_ms=200)
+    futures = [queue.submit('test_insert_item', {'name': name}) for name in ('a', 'b', 'a', 'c')]
+    assert [future.result(5) for future in (futures[0], futures[1], futures[3])] == ['a', 'b', 'c']
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[2].result(5)
+    metrics = queue.metrics()
+    queue.stop()
+    assert metrics['batches'] == 1 and metrics['failed'] == 1
+    assert _names(db) == ['a', 'b', 'c']
+
+
+def test_failed_batches_are_never_replayed(db, monkeypatch):
+    queue = WriteQueue(db, max_batch=8, max_latency_ms=200)
+    assert queue.submit('test_insert_item', {'name': 'kept'}).result(5) == 'kept'
+
+    # The batch cannot commit at all, isolated or not: every caller is told it failed
+    def broken(conn, seq):
+        raise sqlite3.OperationalError('disk I/O error')
+    monkeypatch.setattr(queue, '_mark_committed', broken)
+    futures = [queue.submit('test_insert_item', {'name': name}) for name in ('lost-1', 'lost-2')]
+    for future in futures:
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(5)
+    assert _journal(db)[-1] == {'failed': [2, 3]}
+    queue.stop()
+
+    # A restart (the journal is still there) must not apply them behind the callers' backs
+    WriteQueue(db).stop()
+    assert _names(db) == ['kept']
+    assert _journal(db) == []
+
+
+def test_journal_replay_keeps_what_fails(db):
+    # Writes journaled by a process that died before committing them
+    with open(db.journal_path, 'w', encoding='utf-8') as f:
+        for seq, name in enumerate(('x', 'y', 'x', 'z'), start=1):
+            f.write(json.dumps({'seq': seq, 'op': 'test_insert_item', 'payload': {'name': name}}) + "\n")
+        f.write('{"seq": 5, "op": "test_ins')  # torn by the crash
+
+    queue = WriteQueue(db)
+    assert _names(db) == ['x', 'y', 'z']
+    assert _journal(db) == []
+    with open(db.journal_path + '.failed', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [{'seq': 3, 'op': 'test_insert_item', 'payload': {'name': 'x'}}]
+
+    # Sequence numbers carry on past the replayed ones, and nothing replays twice
+    assert queue.submit('test_insert_item', {'name': 'w'}).result(5) == 'w'
+    assert _journal(db)[0]['seq'] == 5
+    queue.stop()
+    WriteQueue(db).stop()
+    assert _names(db) == ['w', 'x', 'y', 'z']